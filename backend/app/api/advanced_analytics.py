@@ -1,48 +1,28 @@
-from fastapi import APIRouter
-from app.core.database import get_transactions_collection
+from fastapi import APIRouter, Depends
+from app.services.aggregate_cache import hourly_sales
+from app.core.coalesce import coalesce
+from app.core.stores import get_store_id
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/advanced-analytics", tags=["advanced-analytics"])
 
 @router.get("/sales-data")
-async def get_sales_analytics(days: int = 7):
+@coalesce()
+async def get_sales_analytics(days: int = 7, store_id: str = Depends(get_store_id)):
     """Get sales data for charts and analytics"""
-    collection = get_transactions_collection()
-    
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
-    pipeline = [
-        {
-            "$match": {
-                "timestamp": {"$gte": start_date, "$lte": end_date}
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-                    "hour": {"$hour": "$timestamp"}
-                },
-                "total_sales": {"$sum": "$total_amount"},
-                "transaction_count": {"$sum": 1}
-            }
-        },
-        {
-            "$sort": {"_id.date": 1, "_id.hour": 1}
-        }
-    ]
-    
-    results = list(collection.aggregate(pipeline))
+    # Closed hours come from the aggregate cache, only the current one is recomputed
+    results = hourly_sales(store_id, start_date, end_date)
     
     # Process for charts
     daily_data = {}
     hourly_data = [{"hour": i, "sales": 0} for i in range(24)]
     
-    for result in results:
-        date = result["_id"]["date"]
-        hour = result["_id"]["hour"]
-        sales = result["total_sales"]
+    for bucket_hour, (sales, _) in results:
+        date = bucket_hour.strftime("%Y-%m-%d")
+        hour = bucket_hour.hour
         
         # Daily data
         daily_data[date] = daily_data.get(date, 0) + sales
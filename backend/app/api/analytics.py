@@ -1,51 +1,66 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from app.ml.local_models import MLModels  # USE LOCAL ML MODELS
+from app.core.coalesce import coalesce
+from app.core.stores import get_store_id
+from app.services.ml_executor import ml_executor, MLQueueFull
 import json
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
 @router.get("/ml/predict-demand")
-async def ml_predict_demand(item_name: str = None):
+@coalesce()
+async def ml_predict_demand(item_name: str = None, store_id: str = Depends(get_store_id)):
     """Local ML demand prediction - 100% reliable"""
-    ml_models = MLModels()
+    ml_models = MLModels(store_id)
     
     try:
         if item_name:
             prediction = ml_models.predict_demand_simple(item_name)
             return prediction
         else:
-            predictions = ml_models.predict_all_items()
+            predictions = await ml_models.predict_all_items_async()
             return predictions
+    except MLQueueFull:
+        raise HTTPException(status_code=503, detail="ML workers are busy, try again shortly", headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ML prediction failed: {str(e)}")
 
 @router.get("/ml/peak-hours")
-async def ml_peak_hours():
+@coalesce()
+async def ml_peak_hours(store_id: str = Depends(get_store_id)):
     """Local ML peak hours analysis"""
-    ml_models = MLModels()
+    ml_models = MLModels(store_id)
     return ml_models.get_peak_hours_analysis()
 
 @router.get("/ml/waste-reduction")
-async def ml_waste_reduction():
+@coalesce()
+async def ml_waste_reduction(store_id: str = Depends(get_store_id)):
     """Local ML waste reduction tips"""
-    ml_models = MLModels()
+    ml_models = MLModels(store_id)
     return ml_models.get_waste_reduction_tips()
 
 @router.get("/ml/advanced-prediction")
-async def ml_advanced_prediction(item_name: str):
+@coalesce()
+async def ml_advanced_prediction(item_name: str, store_id: str = Depends(get_store_id)):
     """Advanced ML prediction with more features"""
-    ml_models = MLModels()
+    ml_models = MLModels(store_id)
     
     try:
-        prediction = ml_models.predict_demand_advanced(item_name)
+        prediction = await ml_models.predict_demand_advanced_async(item_name)
         return prediction
     except Exception as e:
         # Fallback to simple prediction
         return ml_models.predict_demand_simple(item_name)
 
+@router.get("/ml/executor")
+async def ml_executor_status():
+    """Queue depth and counters of the ML process pool"""
+    return ml_executor.status()
+
 @router.get("/ml/sales-data")
-async def ml_sales_data(days_back: int = 30):
+@coalesce()
+async def ml_sales_data(days_back: int = 30, store_id: str = Depends(get_store_id)):
     """Get raw sales data for analysis"""
-    ml_models = MLModels()
+    ml_models = MLModels(store_id)
     data = ml_models.get_historical_data(days_back)
     return data
\ No newline at end of file
@@ -0,0 +1,34 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from app.services.archive_service import transaction_archive, PYARROW_AVAILABLE
+
+router = APIRouter(prefix="/archive", tags=["archive"])
+
+@router.post("/run")
+async def run_archive(older_than_days: int = None):
+    """Move old transactions from MongoDB into the Parquet cold tier"""
+    if not PYARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="pyarrow is not installed on this server")
+    if older_than_days is not None and older_than_days < 1:
+        raise HTTPException(status_code=400, detail="older_than_days must be at least 1")
+    
+    result = await asyncio.to_thread(transaction_archive.run_exclusive, older_than_days)
+    if result is None:
+        raise HTTPException(status_code=409, detail="An archive run is already in progress")
+    return result
+
+@router.get("/manifest")
+async def get_archive_manifest():
+    """List archived partitions and the hot/cold boundary"""
+    manifest = transaction_archive.get_manifest()
+    partitions = transaction_archive.partitions()
+    
+    return {
+        "archived_through": manifest.get("archived_through"),
+        "partitions": partitions,
+        "summary": {
+            "partition_count": len(partitions),
+            "transactions": sum(p["transactions"] for p in partitions),
+            "total_amount": sum(p["total_amount"] for p in partitions)
+        }
+    }
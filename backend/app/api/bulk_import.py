@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from app.core.database import get_items_collection
+from app.core.stores import get_store_id, store_filter
+from app.core.http_cache import collection_versions
+from app.services.stock_alerts import stock_alerts
 from bson import ObjectId
 import re
 
 router = APIRouter(prefix="/bulk-import", tags=["bulk-import"])
 
 @router.post("/items")
-async def bulk_import_items(items_data: str):
+async def bulk_import_items(items_data: str, store_id: str = Depends(get_store_id)):
     """
     Import multiple items from text format:
     "Item Name - Price - Category" per line
@@ -34,11 +37,12 @@ async def bulk_import_items(items_data: str):
                 "name": parts[0],
                 "price": float(parts[1]),
                 "category": parts[2] if len(parts) > 2 else "General",
-                "is_active": True
+                "is_active": True,
+                "store_id": store_id
             }
             
             # Check if item already exists
-            existing = collection.find_one({"name": item_data["name"]})
+            existing = collection.find_one(store_filter(store_id, {"name": item_data["name"]}))
             if existing:
                 result = collection.update_one(
                     {"_id": existing["_id"]},
@@ -48,6 +52,8 @@ async def bulk_import_items(items_data: str):
             else:
                 result = collection.insert_one(item_data)
                 action = "created"
+                # New items start with no stock
+                stock_alerts.observe(store_id, [(str(result.inserted_id), item_data["name"], 0)])
                 
             imported_items.append({
                 "name": item_data["name"],
@@ -61,6 +67,9 @@ async def bulk_import_items(items_data: str):
         except Exception as e:
             errors.append(f"Line {i}: Error - {str(e)}")
     
+    if imported_items:
+        collection_versions.bump("items")
+    
     return {
         "imported": len(imported_items),
         "errors": len(errors),
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Optional
 from app.models.customer import Customer, CustomerInDB, CustomerUpdate
 from app.core.database import get_customers_collection
+from app.services.customer_search import customer_search_index
+from app.services.customer_segments import customer_segmentation
+from app.core.http_cache import collection_versions
+from app.core.fields import FieldSelection, projection, sparse_response
 from bson import ObjectId
 
 router = APIRouter(prefix="/customers", tags=["customers"])
 
+customer_fields = FieldSelection(summary=("name", "phone", "email"), allowed=CustomerInDB.model_fields)
+
 @router.post("/", response_model=CustomerInDB)
 async def create_customer(customer: Customer):
     collection = get_customers_collection()
@@ -16,16 +23,36 @@ async def create_customer(customer: Customer):
     
     result = collection.insert_one(customer.dict())
     created_customer = collection.find_one({"_id": result.inserted_id})
+    customer_search_index.upsert(created_customer)
+    customer_segmentation.invalidate()
+    collection_versions.bump("customers")
     
     return {**created_customer, "id": str(created_customer["_id"])}
 
 @router.get("/", response_model=list[CustomerInDB])
-async def get_all_customers():
+async def get_all_customers(fields: Optional[tuple] = Depends(customer_fields)):
     collection = get_customers_collection()
-    customers = list(collection.find().sort("join_date", -1))
+    customers = list(collection.find({}, projection(fields)).sort("join_date", -1))
+    if fields is not None:
+        return sparse_response(customers, fields)
     
     return [{**customer, "id": str(customer["_id"])} for customer in customers]
 
+@router.get("/search")
+async def search_customers(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    offset: int = Query(0, ge=0)
+):
+    """Search customers by phone prefix or name fragment"""
+    collection = get_customers_collection()
+    customer_search_index.ensure_built(
+        lambda: collection.find({}, {field: 1 for field in ("name", "phone", "email")})
+    )
+    
+    results = customer_search_index.search(q, limit=limit, offset=offset)
+    return {**results, "query": q, "limit": limit, "offset": offset}
+
 @router.get("/{customer_id}", response_model=CustomerInDB)
 async def get_customer(customer_id: str):
     collection = get_customers_collection()
@@ -57,4 +84,7 @@ async def update_customer(customer_id: str, update: CustomerUpdate):
         raise HTTPException(status_code=404, detail="Customer not found")
     
     updated_customer = collection.find_one({"_id": ObjectId(customer_id)})
+    customer_search_index.upsert(updated_customer)
+    customer_segmentation.invalidate()
+    collection_versions.bump("customers")
     return {**updated_customer, "id": str(updated_customer["_id"])}
\ No newline at end of file
@@ -1,17 +1,22 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from app.models.inventory import InventoryItem, InventoryItemResponse, InventoryUpdate, InventoryAlert
 from app.core.database import get_inventory_collection, get_items_collection
+from app.core.stores import get_store_id, store_filter
+from app.core.http_cache import collection_versions
+from app.services.stock_ledger import stock_ledger, RESTOCK, ADJUSTMENT
+from app.services.stock_alerts import stock_alerts
+from pymongo import ReturnDocument
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
 @router.get("/", response_model=list[InventoryItemResponse])
-async def get_inventory():
+async def get_inventory(store_id: str = Depends(get_store_id)):
     collection = get_inventory_collection()
     items_collection = get_items_collection()
     
-    inventory = list(collection.find())
+    inventory = list(collection.find(store_filter(store_id)))
     result = []
     
     for item in inventory:
@@ -29,6 +34,7 @@ async def get_inventory():
                 "maximum_stock": item.get("maximum_stock"),
                 "cost_price": item.get("cost_price"),
                 "supplier": item.get("supplier"),
+                "lead_time_days": item.get("lead_time_days"),
                 "last_restocked": item.get("last_restocked"),
                 "alert_enabled": item.get("alert_enabled", True)
             })
@@ -45,6 +51,7 @@ async def get_inventory():
                 "maximum_stock": item.get("maximum_stock"),
                 "cost_price": item.get("cost_price"),
                 "supplier": item.get("supplier"),
+                "lead_time_days": item.get("lead_time_days"),
                 "last_restocked": item.get("last_restocked"),
                 "alert_enabled": item.get("alert_enabled", True)
             })
@@ -52,7 +59,7 @@ async def get_inventory():
     return result
 
 @router.post("/{item_id}")
-async def update_inventory(item_id: str, update: InventoryUpdate):
+async def update_inventory(item_id: str, update: InventoryUpdate, store_id: str = Depends(get_store_id)):
     inventory_collection = get_inventory_collection()
     items_collection = get_items_collection()
     
@@ -60,29 +67,46 @@ async def update_inventory(item_id: str, update: InventoryUpdate):
         raise HTTPException(status_code=400, detail="Invalid item ID")
     
     # Check if item exists
-    item = items_collection.find_one({"_id": ObjectId(item_id)})
+    item = items_collection.find_one(store_filter(store_id, {"_id": ObjectId(item_id)}))
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
     # Update or create inventory record
     update_data = {k: v for k, v in update.dict().items() if v is not None}
     update_data["last_restocked"] = datetime.now()
+    update_data["store_id"] = store_id
     
-    result = inventory_collection.update_one(
-        {"item_id": item_id},
-        {"$set": update_data},
-        upsert=True
-    )
+    inventory_collection.update_one({"item_id": item_id}, {"$set": update_data}, upsert=True)
+    if update.current_stock is not None:
+        # items.stock is what checkout decrements and the ledger snapshots,
+        # so the count lands there and the movement is measured against it
+        previous = items_collection.find_one_and_update(
+            {"_id": item["_id"]},
+            {"$set": {"stock": update.current_stock}},
+            projection={"stock": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        delta = update.current_stock - (previous or {}).get("stock", 0)
+        stock_ledger.record([stock_ledger.movement(
+            store_id, item_id, RESTOCK if delta > 0 else ADJUSTMENT, delta, item["name"], note="inventory update"
+        )])
+        item["stock"] = update.current_stock
+        collection_versions.bump("items")
+    if update.minimum_stock is not None:
+        stock_alerts.set_threshold(store_id, item_id, update.minimum_stock)
+    if update.current_stock is not None or update.minimum_stock is not None:
+        stock_alerts.observe(store_id, [(item_id, item["name"], item.get("stock", 0))])
+    collection_versions.bump("inventory")
     
     return {"message": "Inventory updated successfully", "item_id": item_id}
 
 @router.get("/alerts", response_model=list[InventoryAlert])
-async def get_inventory_alerts():
+async def get_inventory_alerts(store_id: str = Depends(get_store_id)):
     inventory_collection = get_inventory_collection()
     items_collection = get_items_collection()
     
     alerts = []
-    inventory_items = list(inventory_collection.find())
+    inventory_items = list(inventory_collection.find(store_filter(store_id)))
     
     for item in inventory_items:
         item_details = items_collection.find_one({"_id": ObjectId(item["item_id"])})
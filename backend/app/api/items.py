@@ -1,45 +1,54 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
 from app.models.item import Item, ItemInDB, ItemUpdate
 from app.core.database import get_items_collection
+from app.core.stores import get_store_id, store_filter
+from app.core.http_cache import collection_versions
+from app.core.fields import FieldSelection, projection, sparse_response
 from bson import ObjectId
 
 router = APIRouter(prefix="/items", tags=["items"])
 
+item_fields = FieldSelection(summary=("name", "price", "category"), allowed=ItemInDB.model_fields)
+
 @router.post("/", response_model=ItemInDB)
-async def create_item(item: Item):
+async def create_item(item: Item, store_id: str = Depends(get_store_id)):
     collection = get_items_collection()
     
     # Check if item already exists
-    if collection.find_one({"name": item.name}):
+    if collection.find_one(store_filter(store_id, {"name": item.name})):
         raise HTTPException(status_code=400, detail="Item already exists")
     
-    result = collection.insert_one(item.dict())
+    result = collection.insert_one({**item.dict(), "store_id": store_id})
+    collection_versions.bump("items")
     new_item = collection.find_one({"_id": result.inserted_id})
     
     return {**new_item, "id": str(new_item["_id"])}
 
 @router.get("/", response_model=list[ItemInDB])
-async def get_all_items():
+async def get_all_items(store_id: str = Depends(get_store_id), fields: Optional[tuple] = Depends(item_fields)):
     collection = get_items_collection()
-    items = list(collection.find({"is_active": True}))
+    items = list(collection.find(store_filter(store_id, {"is_active": True}), projection(fields)))
+    if fields is not None:
+        return sparse_response(items, fields)
     
     return [{**item, "id": str(item["_id"])} for item in items]
 
 @router.get("/{item_id}", response_model=ItemInDB)
-async def get_item(item_id: str):
+async def get_item(item_id: str, store_id: str = Depends(get_store_id)):
     collection = get_items_collection()
     
     if not ObjectId.is_valid(item_id):
         raise HTTPException(status_code=400, detail="Invalid item ID")
     
-    item = collection.find_one({"_id": ObjectId(item_id)})
+    item = collection.find_one(store_filter(store_id, {"_id": ObjectId(item_id)}))
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
     return {**item, "id": str(item["_id"])}
 
 @router.put("/{item_id}", response_model=ItemInDB)
-async def update_item(item_id: str, item_update: ItemUpdate):
+async def update_item(item_id: str, item_update: ItemUpdate, store_id: str = Depends(get_store_id)):
     collection = get_items_collection()
     
     if not ObjectId.is_valid(item_id):
@@ -48,29 +57,31 @@ async def update_item(item_id: str, item_update: ItemUpdate):
     update_data = {k: v for k, v in item_update.dict().items() if v is not None}
     
     result = collection.update_one(
-        {"_id": ObjectId(item_id)},
+        store_filter(store_id, {"_id": ObjectId(item_id)}),
         {"$set": update_data}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    collection_versions.bump("items")
     
     updated_item = collection.find_one({"_id": ObjectId(item_id)})
     return {**updated_item, "id": str(updated_item["_id"])}
 
 @router.delete("/{item_id}")
-async def delete_item(item_id: str):
+async def delete_item(item_id: str, store_id: str = Depends(get_store_id)):
     collection = get_items_collection()
     
     if not ObjectId.is_valid(item_id):
         raise HTTPException(status_code=400, detail="Invalid item ID")
     
     result = collection.update_one(
-        {"_id": ObjectId(item_id)},
+        store_filter(store_id, {"_id": ObjectId(item_id)}),
         {"$set": {"is_active": False}}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
+    collection_versions.bump("items")
     
     return {"message": "Item deleted successfully"}
\ No newline at end of file
@@ -1,14 +1,21 @@
-from fastapi import APIRouter
-from app.core.database import get_transactions_collection, get_items_collection
+from fastapi import APIRouter, Depends
+import pandas as pd
+from app.core.database import get_transactions_collection, get_items_collection, get_inventory_collection
+from app.core.coalesce import coalesce
+from app.core.config import settings
+from app.core.stores import get_store_id, store_filter
+from app.ml.menu_engineering import classify_menu, QUADRANT_SUGGESTIONS, QUADRANT_PERFORMANCE
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/menu-optimizer", tags=["menu-optimizer"])
 
 @router.get("/analysis")
-async def analyze_menu_performance(days: int = 7):
+@coalesce(ttl=settings.MENU_ANALYSIS_CACHE_SECONDS)
+async def analyze_menu_performance(days: int = 7, store_id: str = Depends(get_store_id)):
     """Analyze menu performance and provide optimization suggestions"""
     transactions_collection = get_transactions_collection()
     items_collection = get_items_collection()
+    inventory_collection = get_inventory_collection()
     
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
@@ -17,6 +24,7 @@ async def analyze_menu_performance(days: int = 7):
     pipeline = [
         {
             "$match": {
+                "store_id": store_id,
                 "timestamp": {"$gte": start_date, "$lte": end_date}
             }
         },
@@ -35,34 +43,35 @@ async def analyze_menu_performance(days: int = 7):
     
     sales_data = list(transactions_collection.aggregate(pipeline))
     
-    # Get all items
-    items = list(items_collection.find({"is_active": True}))
+    # Get all items and their cost prices
+    items = [
+        {"id": str(item["_id"]), "name": item["name"], "price": item.get("price", 0), "category": item.get("category", "General")}
+        for item in items_collection.find(store_filter(store_id, {"is_active": True}), {"name": 1, "price": 1, "category": 1})
+    ]
+    inventory = list(inventory_collection.find(store_filter(store_id, {"cost_price": {"$ne": None}}), {"_id": 0, "item_id": 1, "cost_price": 1}))
+    
+    # Vectorized menu-engineering matrix over the whole menu
+    matrix = classify_menu(items, sales_data, inventory, default_cost_ratio=settings.MENU_DEFAULT_COST_RATIO)
     
-    # Generate suggestions
     suggestions = []
-    for item in items:
-        item_sales = next((s for s in sales_data if s["_id"] == item["name"]), None)
-        
-        if item_sales:
-            performance = "good" if item_sales["total_quantity"] > 10 else "average" if item_sales["total_quantity"] > 5 else "poor"
-            
-            suggestion = {
-                "item": item["name"],
-                "quantity_sold": item_sales["total_quantity"],
-                "revenue": item_sales["total_revenue"],
-                "performance": performance,
-                "suggestion": generate_suggestion(item["name"], item_sales["total_quantity"], performance)
-            }
-        else:
-            suggestion = {
-                "item": item["name"],
-                "quantity_sold": 0,
-                "revenue": 0,
-                "performance": "poor",
-                "suggestion": "This item hasn't sold recently. Consider promoting it or removing from menu."
-            }
-        
-        suggestions.append(suggestion)
+    for row in matrix.to_dict("records"):
+        suggestions.append({
+            "item": row["name"],
+            "category": row["category"],
+            "quantity_sold": row["quantity_sold"],
+            "revenue": row["revenue"],
+            "unit_cost": round(row["unit_cost"], 2),
+            "cost_known": row["cost_known"],
+            "contribution_margin": round(row["contribution_margin"], 2),
+            "food_cost_pct": None if pd.isna(row["food_cost_pct"]) else round(row["food_cost_pct"], 1),
+            "menu_mix_pct": round(row["menu_mix_pct"], 2),
+            "popularity_index": round(row["popularity_index"], 2),
+            "quadrant": row["quadrant"],
+            "performance": QUADRANT_PERFORMANCE[row["quadrant"]],
+            "suggestion": QUADRANT_SUGGESTIONS[row["quadrant"]].format(name=row["name"])
+        })
+    
+    quadrant_counts = matrix["quadrant"].value_counts().to_dict() if len(matrix) else {}
     
     return {
         "analysis_period": {
@@ -73,15 +82,11 @@ async def analyze_menu_performance(days: int = 7):
         "suggestions": suggestions,
         "summary": {
             "total_items": len(items),
-            "items_sold": len([s for s in suggestions if s["quantity_sold"] > 0]),
-            "total_revenue": sum(s["revenue"] for s in suggestions)
+            "items_sold": int((matrix["quantity_sold"] > 0).sum()) if len(matrix) else 0,
+            "total_revenue": float(matrix["revenue"].sum()) if len(matrix) else 0,
+            "total_margin": float(matrix["total_margin"].sum()) if len(matrix) else 0,
+            "average_contribution_margin": round(matrix.attrs.get("average_margin", 0.0), 2),
+            "popularity_threshold_pct": round(matrix.attrs.get("popularity_threshold_pct", 0.0), 2),
+            "quadrants": {q: int(quadrant_counts.get(q, 0)) for q in ("star", "plowhorse", "puzzle", "dog")}
         }
     }
-
-def generate_suggestion(item_name, quantity, performance):
-    if performance == "good":
-        return f"✅ {item_name} is selling well. Maintain current stock levels."
-    elif performance == "average":
-        return f"⚠️ {item_name} has moderate sales. Consider slight adjustments to preparation quantities."
-    else:
-        return f"❌ {item_name} has low sales. Consider promotions, price adjustments, or removing from menu."
\ No newline at end of file
@@ -0,0 +1,39 @@
+import asyncio
+from typing import List
+from fastapi import APIRouter, HTTPException, Query
+from app.services.transaction_store import transaction_store
+from app.services.basket_engine import basket_index, transaction_baskets
+
+router = APIRouter(prefix="/recommendations", tags=["recommendations"])
+
+async def _ensure_index():
+    if not basket_index.is_built:
+        await asyncio.to_thread(basket_index.ensure_built, lambda: transaction_baskets(transaction_store))
+
+@router.get("/cart")
+async def recommend_for_cart(items: List[str] = Query(...), k: int = 5):
+    """Top-k upsell suggestions for the item names currently in the cart"""
+    if k < 1 or k > 50:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 50")
+
+    await _ensure_index()
+    return {"cart": items, "recommendations": basket_index.recommend(items, k)}
+
+@router.get("/pair")
+async def get_pair_stats(antecedent: str, consequent: str):
+    """Support, confidence and lift for one item pair"""
+    await _ensure_index()
+    return basket_index.pair_stats(antecedent, consequent)
+
+@router.post("/rebuild")
+async def rebuild_basket_index(days: int = None):
+    """Recount co-occurrences from stored transactions"""
+    if days is not None and days < 0:
+        raise HTTPException(status_code=400, detail="days must be 0 (all history) or more")
+
+    return await asyncio.to_thread(lambda: basket_index.rebuild(transaction_baskets(transaction_store, days)))
+
+@router.get("/stats")
+async def get_basket_index_stats():
+    """Size of the co-occurrence matrix"""
+    return basket_index.stats()
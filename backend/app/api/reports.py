@@ -1,39 +1,66 @@
-from fastapi import APIRouter
-from app.core.database import get_transactions_collection, get_sessions_collection, get_items_collection
+from fastapi import APIRouter, Depends
+from app.core.database import get_sessions_collection, get_items_collection
+from app.core.coalesce import coalesce
+from app.core.stores import get_store_id, store_filter
+from app.services.archive_service import transaction_archive
+from app.services.transaction_store import transaction_store
+from app.services.line_item_store import line_item_store
+from app.services.session_snapshot import get_snapshots_between
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 @router.get("/generate")
-async def generate_comprehensive_report(days: int = 30):
+@coalesce()
+async def generate_comprehensive_report(days: int = 30, store_id: str = Depends(get_store_id)):
     """Generate a comprehensive business report"""
-    transactions_collection = get_transactions_collection()
     sessions_collection = get_sessions_collection()
     items_collection = get_items_collection()
     
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
+    # Closed sessions are read from their Z-report snapshots; only sales
+    # outside those sessions (open session, legacy data) are scanned raw
+    snapshots = get_snapshots_between(start_date, end_date, store_id)
+    snapshot_session_ids = [s["session_id"] for s in snapshots]
+    
     # Get all data
-    transactions = list(transactions_collection.find({
-        "timestamp": {"$gte": start_date, "$lte": end_date}
-    }))
+    if not line_item_store.covers(start_date) or transaction_archive.needs_scan(start_date):
+        transactions = transaction_store.find(store_id, start_date, end_date, exclude_sessions=snapshot_session_ids)
+        transactions += [
+            t for t in transaction_archive.load_transactions(start_date, end_date, store_id)
+            if t["session_id"] not in snapshot_session_ids
+        ]
+        raw_sales = sum(t["total_amount"] for t in transactions)
+        raw_count = len(transactions)
+        item_sales = {}
+        for transaction in transactions:
+            for item in transaction["items"]:
+                item_sales[item["item_name"]] = item_sales.get(item["item_name"], 0) + item["quantity"]
+    else:
+        # Recent periods are summed from the in-memory line item columns
+        line_item_store.ensure_fresh(transaction_store)
+        raw_sales, raw_count = line_item_store.totals(store_id, start_date, end_date, snapshot_session_ids)
+        item_sales = {
+            name: int(round(quantity))
+            for name, (quantity, _) in line_item_store.item_totals(store_id, start_date, end_date, snapshot_session_ids).items()
+        }
     
-    sessions = list(sessions_collection.find({
+    sessions = list(sessions_collection.find(store_filter(store_id, {
         "start_time": {"$gte": start_date}
-    }))
+    })))
     
-    items = list(items_collection.find({"is_active": True}))
+    items = list(items_collection.find(store_filter(store_id, {"is_active": True})))
     
     # Calculate metrics
-    total_sales = sum(t["total_amount"] for t in transactions)
-    total_transactions = len(transactions)
+    total_sales = raw_sales + sum(s["total_sales"] for s in snapshots)
+    total_transactions = raw_count + sum(s["transaction_count"] for s in snapshots)
     avg_transaction_value = total_sales / total_transactions if total_transactions else 0
     
     # Popular items
-    item_sales = {}
-    for transaction in transactions:
-        for item in transaction["items"]:
+    for snapshot in snapshots:
+        for item in snapshot["item_mix"]:
             item_sales[item["item_name"]] = item_sales.get(item["item_name"], 0) + item["quantity"]
     
     popular_items = sorted(item_sales.items(), key=lambda x: x[1], reverse=True)[:5]
@@ -44,6 +71,7 @@ async def generate_comprehensive_report(days: int = 30):
     
     return {
         "report_metadata": {
+            "store_id": store_id,
             "generated_at": datetime.now().isoformat(),
             "period": {
                 "start_date": start_date.isoformat(),
@@ -69,7 +97,8 @@ async def generate_comprehensive_report(days: int = 30):
             "closed_sessions": len(closed_sessions)
         },
         "raw_data_counts": {
-            "transactions": len(transactions),
+            "transactions": raw_count,
+            "session_snapshots": len(snapshots),
             "sessions": len(sessions),
             "items": len(items)
         }
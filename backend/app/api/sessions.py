@@ -1,39 +1,53 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
 from app.models.session import ShopSession, ShopSessionInDB, ShopSessionUpdate
 from app.core.database import get_sessions_collection
+from app.core.stores import get_store_id, store_filter
+from app.services.session_snapshot import persist_snapshot, get_snapshot
+from app.core.fields import FieldSelection, projection, sparse_response
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
+session_fields = FieldSelection(
+    summary=("start_time", "end_time", "is_active", "total_sales"), allowed=ShopSessionInDB.model_fields
+)
+
 @router.post("/open", response_model=ShopSessionInDB)
-async def open_shop():
+async def open_shop(store_id: str = Depends(get_store_id)):
     collection = get_sessions_collection()
     
     # Check if there's already an active session
-    active_session = collection.find_one({"is_active": True})
+    active_session = collection.find_one(store_filter(store_id, {"is_active": True}))
     if active_session:
         raise HTTPException(status_code=400, detail="Shop is already open")
     
     # Create new session
     new_session = {
+        "store_id": store_id,
         "start_time": datetime.now(),
         "is_active": True,
         "total_sales": 0.0,
         "total_transactions": 0
     }
     
-    result = collection.insert_one(new_session)
+    try:
+        result = collection.insert_one(new_session)
+    except DuplicateKeyError:
+        # Lost the race against another worker opening the same store
+        raise HTTPException(status_code=400, detail="Shop is already open")
     created_session = collection.find_one({"_id": result.inserted_id})
     
     return {**created_session, "id": str(created_session["_id"])}
 
 @router.post("/close", response_model=ShopSessionInDB)
-async def close_shop():
+async def close_shop(store_id: str = Depends(get_store_id)):
     collection = get_sessions_collection()
     
     # Find active session
-    active_session = collection.find_one({"is_active": True})
+    active_session = collection.find_one(store_filter(store_id, {"is_active": True}))
     if not active_session:
         raise HTTPException(status_code=400, detail="No active shop session found")
     
@@ -58,21 +72,36 @@ async def close_shop():
         raise HTTPException(status_code=500, detail="Failed to close session")
     
     updated_session = collection.find_one({"_id": active_session["_id"]})
+    
+    # Freeze the Z-report from the counters accumulated during the session
+    persist_snapshot(updated_session, end_time)
+    
     return {**updated_session, "id": str(updated_session["_id"])}
 
 @router.get("/current", response_model=ShopSessionInDB)
-async def get_current_session():
+async def get_current_session(store_id: str = Depends(get_store_id)):
     collection = get_sessions_collection()
     
-    active_session = collection.find_one({"is_active": True})
+    active_session = collection.find_one(store_filter(store_id, {"is_active": True}))
     if not active_session:
         raise HTTPException(status_code=404, detail="No active shop session")
     
     return {**active_session, "id": str(active_session["_id"])}
 
+@router.get("/{session_id}/snapshot")
+async def get_session_snapshot(session_id: str):
+    """Get the Z-report snapshot of a closed session"""
+    snapshot = get_snapshot(session_id)
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="No snapshot for this session")
+    
+    return {**snapshot, "id": snapshot["_id"]}
+
 @router.get("/", response_model=list[ShopSessionInDB])
-async def get_all_sessions():
+async def get_all_sessions(store_id: str = Depends(get_store_id), fields: Optional[tuple] = Depends(session_fields)):
     collection = get_sessions_collection()
-    sessions = list(collection.find().sort("start_time", -1))
+    sessions = list(collection.find(store_filter(store_id), projection(fields)).sort("start_time", -1))
+    if fields is not None:
+        return sparse_response(sessions, fields)
     
     return [{**session, "id": str(session["_id"])} for session in sessions]
\ No newline at end of file
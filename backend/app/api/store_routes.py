@@ -1,77 +1,54 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 from datetime import datetime
-from app.core.database import db
+from app.core.stores import get_store_id
+from app.services.store_service import store_service
 
 store_router = APIRouter(prefix="/api/store", tags=["Store Management"])
 
 class StatusUpdate(BaseModel):
     status: str
 
-# Simple in-memory storage (we'll add MongoDB later)
-current_status = "CLOSED"
-current_session = None
-
 @store_router.get("/status")
-async def get_store_status():
+async def get_store_status(store_id: str = Depends(get_store_id)):
+    status = store_service.get_store_status(store_id)
     return {
         "success": True,
-        "status": current_status,
-        "lastUpdated": datetime.utcnow().isoformat(),
-        "session": current_session
+        "status": status["status"],
+        "lastUpdated": status.get("last_updated") or datetime.utcnow().isoformat(),
+        "session": store_service.get_current_session(store_id)
     }
 
 @store_router.post("/status")
-async def update_store_status(status_data: StatusUpdate):
-    global current_status, current_session
-    
+async def update_store_status(status_data: StatusUpdate, store_id: str = Depends(get_store_id)):
     new_status = status_data.status.upper()
     if new_status not in ["OPEN", "CLOSED", "BREAK"]:
         return {"success": False, "error": "Invalid status"}
     
-    current_status = new_status
-    
-    # If opening, create a session
-    if new_status == "OPEN" and not current_session:
-        current_session = {
-            "id": f"session_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}",
-            "opened_at": datetime.utcnow().isoformat(),
-            "status": "active"
-        }
-    
-    # If closing, clear session
-    if new_status == "CLOSED":
-        current_session = None
+    store_service.update_store_status(store_id, new_status)
     
     return {
         "success": True,
-        "status": current_status,
+        "status": new_status,
         "message": f"Store status updated to {new_status}"
     }
 
 @store_router.post("/sessions/open")
-async def open_session():
-    global current_status, current_session
-    
-    current_status = "OPEN"
-    current_session = {
-        "id": f"session_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}",
-        "opened_at": datetime.utcnow().isoformat(),
-        "status": "active"
-    }
+async def open_session(store_id: str = Depends(get_store_id)):
+    store_service.update_store_status(store_id, "OPEN")
     
     return {
         "success": True,
-        "session": current_session,
-        "status": current_status,
+        "session": store_service.get_current_session(store_id),
+        "status": "OPEN",
         "message": "Session opened successfully"
     }
 
 @store_router.get("/sessions/current")
-async def get_current_session():
+async def get_current_session(store_id: str = Depends(get_store_id)):
     return {
         "success": True,
-        "session": current_session
+        "session": store_service.get_current_session(store_id)
     }
 
 # Mock endpoints to prevent frontend errors
@@ -1,14 +1,29 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
 from app.models.transaction import Transaction, TransactionResponse, TransactionItem
-from app.core.database import get_transactions_collection, get_sessions_collection, get_items_collection
+from app.core.database import get_sessions_collection, get_items_collection
+from app.core.stores import get_store_id, store_filter
+from app.services.session_snapshot import session_counter_increments
+from app.services.basket_engine import basket_index
+from app.core.http_cache import collection_versions
+from app.core.fields import FieldSelection, sparse_response
+from app.services.receipt_numbers import receipt_numbers
+from app.services.sales_window import sales_window
+from app.services.line_item_store import line_item_store
+from app.services.transaction_store import transaction_store
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
+# Receipt lists rarely need the line items
+transaction_fields = FieldSelection(
+    summary=("receipt_number", "total_amount", "payment_mode", "timestamp"),
+    allowed=TransactionResponse.model_fields
+)
+
 @router.post("/", response_model=TransactionResponse)
-async def create_transaction(transaction: Transaction):
-    transactions_collection = get_transactions_collection()
+async def create_transaction(transaction: Transaction, store_id: str = Depends(get_store_id)):
     sessions_collection = get_sessions_collection()
     items_collection = get_items_collection()
     
@@ -16,7 +31,7 @@ async def create_transaction(transaction: Transaction):
     if not ObjectId.is_valid(transaction.session_id):
         raise HTTPException(status_code=400, detail="Invalid session ID")
     
-    session = sessions_collection.find_one({"_id": ObjectId(transaction.session_id)})
+    session = sessions_collection.find_one(store_filter(store_id, {"_id": ObjectId(transaction.session_id)}))
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     if not session.get("is_active", False):
@@ -28,7 +43,7 @@ async def create_transaction(transaction: Transaction):
         if not ObjectId.is_valid(item.item_id):
             raise HTTPException(status_code=400, detail=f"Invalid item ID: {item.item_id}")
         
-        db_item = items_collection.find_one({"_id": ObjectId(item.item_id)})
+        db_item = items_collection.find_one(store_filter(store_id, {"_id": ObjectId(item.item_id)}))
         if not db_item:
             raise HTTPException(status_code=404, detail=f"Item not found: {item.item_id}")
         if not db_item.get("is_active", True):
@@ -47,28 +62,38 @@ async def create_transaction(transaction: Transaction):
     
     # Create transaction document
     transaction_data = {
+        "store_id": store_id,
         "session_id": transaction.session_id,
         "items": validated_items,
         "total_amount": transaction.total_amount,
         "payment_mode": transaction.payment_mode,
         "timestamp": datetime.now()
     }
+    transaction_data["receipt_number"] = receipt_numbers.next(store_id, transaction_data["timestamp"])
     
-    # Insert transaction
-    result = transactions_collection.insert_one(transaction_data)
-    created_transaction = transactions_collection.find_one({"_id": result.inserted_id})
+    # Insert transaction (as a document or into its hourly bucket)
+    created_transaction = transaction_store.insert(transaction_data)
     
-    # Update session totals
+    # Update session totals and the running Z-report counters
     sessions_collection.update_one(
         {"_id": ObjectId(transaction.session_id)},
         {
             "$inc": {
                 "total_sales": transaction.total_amount,
-                "total_transactions": 1
+                "total_transactions": 1,
+                **session_counter_increments(
+                    validated_items, transaction.total_amount,
+                    transaction.payment_mode, transaction_data["timestamp"]
+                )
             }
         }
     )
     
+    basket_index.add_basket([item["item_name"] for item in validated_items])
+    sales_window.record(created_transaction)
+    line_item_store.record(created_transaction)
+    collection_versions.bump("transactions")
+    
     # Prepare response
     response = {**created_transaction, "id": str(created_transaction["_id"])}
     
@@ -80,29 +105,31 @@ async def create_transaction(transaction: Transaction):
     return response
 
 @router.get("/", response_model=list[TransactionResponse])
-async def get_all_transactions():
-    collection = get_transactions_collection()
-    transactions = list(collection.find().sort("timestamp", -1))
+async def get_all_transactions(store_id: str = Depends(get_store_id), fields: Optional[tuple] = Depends(transaction_fields)):
+    transactions = transaction_store.find(store_id, fields=fields)
+    if fields is not None:
+        return sparse_response(transactions, fields)
     
     return [{**txn, "id": str(txn["_id"])} for txn in transactions]
 
 @router.get("/session/{session_id}", response_model=list[TransactionResponse])
-async def get_session_transactions(session_id: str):
+async def get_session_transactions(session_id: str, store_id: str = Depends(get_store_id),
+                                   fields: Optional[tuple] = Depends(transaction_fields)):
     if not ObjectId.is_valid(session_id):
         raise HTTPException(status_code=400, detail="Invalid session ID")
     
-    collection = get_transactions_collection()
-    transactions = list(collection.find({"session_id": session_id}).sort("timestamp", -1))
+    transactions = transaction_store.find(store_id, session_id=session_id, fields=fields)
+    if fields is not None:
+        return sparse_response(transactions, fields)
     
     return [{**txn, "id": str(txn["_id"])} for txn in transactions]
 
 @router.get("/{transaction_id}", response_model=TransactionResponse)
-async def get_transaction(transaction_id: str):
+async def get_transaction(transaction_id: str, store_id: str = Depends(get_store_id)):
     if not ObjectId.is_valid(transaction_id):
         raise HTTPException(status_code=400, detail="Invalid transaction ID")
     
-    collection = get_transactions_collection()
-    transaction = collection.find_one({"_id": ObjectId(transaction_id)})
+    transaction = transaction_store.get(store_id, transaction_id)
     
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import time
+from collections import deque
+from app.core.config import settings
+
+# Priority classes, most important first
+CRITICAL = "critical"
+NORMAL = "normal"
+LOW = "low"
+PRIORITY_CLASSES = (CRITICAL, NORMAL, LOW)
+
+
+class PriorityClass:
+    """Concurrency limit and FIFO wait queue for one priority class"""
+
+    def __init__(self, name, limit, queue_seconds, max_queue):
+        self.name = name
+        self.limit = limit
+        self.queue_seconds = queue_seconds
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def status(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionController:
+    """Per-class concurrency limits, deadline queues and load shedding
+
+    `rules` is a list of (methods, path prefix, class); the first match
+    wins and anything unmatched is NORMAL. A class of None lets the request
+    through untracked (long-lived streams). Each class admits up to its
+    limit of requests at once; the rest wait in FIFO order for at most
+    their class's queue time and are then refused with 429 + Retry-After,
+    as are requests that find the queue full.
+
+    Latency of CRITICAL requests (checkout) is tracked over the last
+    ADMISSION_SLO_WINDOW_SECONDS. While its p99 is above
+    ADMISSION_CRITICAL_P99_MS, LOW requests are shed at once instead of
+    queued, so report and model work cannot keep checkout slow. Limits are
+    per worker process: each worker has its own event loop and pool.
+    """
+
+    def __init__(self, rules, limits=None, queue_seconds=None, max_queue=None, p99_target_ms=None,
+                 window_seconds=None, retry_after=None):
+        self.rules = [
+            (frozenset(m.upper() for m in methods) if methods else None, prefix, priority)
+            for methods, prefix, priority in rules
+        ]
+        limits = limits or {CRITICAL: settings.ADMISSION_CRITICAL_LIMIT, NORMAL: settings.ADMISSION_NORMAL_LIMIT,
+                            LOW: settings.ADMISSION_LOW_LIMIT}
+        queue_seconds = queue_seconds or {CRITICAL: settings.ADMISSION_CRITICAL_QUEUE_SECONDS,
+                                          NORMAL: settings.ADMISSION_NORMAL_QUEUE_SECONDS,
+                                          LOW: settings.ADMISSION_LOW_QUEUE_SECONDS}
+        max_queue = settings.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.classes = {
+            name: PriorityClass(name, limits[name], queue_seconds[name], max_queue) for name in PRIORITY_CLASSES
+        }
+        self.p99_target_ms = settings.ADMISSION_CRITICAL_P99_MS if p99_target_ms is None else p99_target_ms
+        self.window_seconds = window_seconds or settings.ADMISSION_SLO_WINDOW_SECONDS
+        self.retry_after = retry_after or settings.ADMISSION_RETRY_AFTER_SECONDS
+        # (finished at, latency ms) of recent CRITICAL requests
+        self._latencies = deque(maxlen=2000)
+        self._p99 = (0.0, None)
+        self.shed = 0
+
+    def classify(self, method, path):
+        for methods, prefix, priority in self.rules:
+            if path.startswith(prefix) and (methods is None or method in methods):
+                return priority
+        return NORMAL
+
+    # ------------------------------------------------------------------
+    # Latency SLO
+    # ------------------------------------------------------------------
+    def critical_p99(self):
+        """p99 latency (ms) of CRITICAL requests in the window, None with too few samples"""
+        now = time.monotonic()
+        computed_at, value = self._p99
+        if now - computed_at < 1.0:
+            return value
+        while self._latencies and self._latencies[0][0] < now - self.window_seconds:
+            self._latencies.popleft()
+        samples = sorted(latency for _, latency in self._latencies)
+        value = samples[min(len(samples) - 1, int(len(samples) * 0.99))] if len(samples) >= 20 else None
+        self._p99 = (now, value)
+        return value
+
+    def overloaded(self):
+        p99 = self.critical_p99()
+        return p99 is not None and p99 > self.p99_target_ms
+
+    # ------------------------------------------------------------------
+    # Admission
+    # ------------------------------------------------------------------
+    async def _acquire(self, priority_class):
+        """True once admitted, False if refused or the queue deadline passed"""
+        if priority_class.in_flight < priority_class.limit and not priority_class.waiters:
+            priority_class.in_flight += 1
+            return True
+        if len(priority_class.waiters) >= priority_class.max_queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        priority_class.waiters.append(waiter)
+        admitted = False
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), priority_class.queue_seconds)
+            admitted = True
+            return True
+        except asyncio.TimeoutError:
+            priority_class.timed_out += 1
+            return False
+        finally:
+            if not admitted:
+                # Timed out or cancelled (client gone); a slot handed over
+                # in the meantime goes back to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._release(priority_class)
+                else:
+                    waiter.cancel()
+            if waiter in priority_class.waiters:
+                priority_class.waiters.remove(waiter)
+
+    def _release(self, priority_class):
+        priority_class.in_flight -= 1
+        while priority_class.waiters and priority_class.in_flight < priority_class.limit:
+            waiter = priority_class.waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next waiter
+                priority_class.in_flight += 1
+                waiter.set_result(True)
+
+    async def _refuse(self, send, priority, reason):
+        body = json.dumps({"detail": reason, "priority": priority}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def handle(self, app, scope, receive, send):
+        priority = self.classify(scope["method"], scope["path"])
+        if priority is None:
+            await app(scope, receive, send)
+            return
+        priority_class = self.classes[priority]
+        if priority == LOW and self.overloaded():
+            self.shed += 1
+            priority_class.rejected += 1
+            await self._refuse(send, priority, "Server is busy with checkouts, try again shortly")
+            return
+
+        started = time.monotonic()
+        if not await self._acquire(priority_class):
+            priority_class.rejected += 1
+            await self._refuse(send, priority, "Too many requests of this kind in progress, try again shortly")
+            return
+        priority_class.admitted += 1
+        try:
+            await app(scope, receive, send)
+        finally:
+            self._release(priority_class)
+            if priority == CRITICAL:
+                finished = time.monotonic()
+                self._latencies.append((finished, (finished - started) * 1000))
+
+    def status(self):
+        return {
+            "classes": {name: priority_class.status() for name, priority_class in self.classes.items()},
+            "critical_p99_ms": self.critical_p99(),
+            "critical_p99_target_ms": self.p99_target_ms,
+            "overloaded": self.overloaded(),
+            "shed": self.shed,
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware routing HTTP requests through an AdmissionController"""
+
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        await self.controller.handle(self.app, scope, receive, send)
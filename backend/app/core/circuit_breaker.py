@@ -0,0 +1,66 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after repeated failures
+
+    closed: calls go through; `threshold` consecutive failures open it.
+    open: allow() is False, so callers take their offline path at once.
+    After `cooldown` seconds a probe (see on_open) may call close().
+    """
+
+    def __init__(self, name, threshold=3, cooldown=15.0, on_open=None):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.on_open = on_open
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        return self.state == "closed"
+
+    def record_success(self):
+        if self.state == "closed":
+            self.failures = 0
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) if error else self.last_error
+            if self.state == "open" or self.failures < self.threshold:
+                return
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        print(f"{self.name} circuit opened after {self.failures} failures: {self.last_error}")
+        if self.on_open:
+            self.on_open()
+
+    def trip(self, error=None):
+        """Open immediately, e.g. when the first connection attempt fails"""
+        self.failures = max(self.failures, self.threshold - 1)
+        self.record_failure(error)
+
+    def close(self):
+        with self._lock:
+            was_open = self.state == "open"
+            self.state = "closed"
+            self.failures = 0
+            self.opened_at = None
+        if was_open:
+            print(f"{self.name} circuit closed, dependency is back")
+
+    def status(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+            "trips": self.trips,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from pydantic import BaseModel
+from app.core.config import settings
+
+
+def _normalize(value):
+    """Hashable, order-independent form of an endpoint argument"""
+    if isinstance(value, BaseModel):
+        value = value.dict()
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class _Entry:
+    __slots__ = ("value", "created_at")
+
+    def __init__(self, value):
+        self.value = value
+        self.created_at = time.monotonic()
+
+
+class RequestCoalescer:
+    """Single-flight execution plus a short result cache for async handlers
+
+    Concurrent calls with the same key share one in-flight computation,
+    which runs in its own task: a caller that is cancelled (client gone)
+    stops waiting without cancelling it for the others. Results stay fresh for `ttl` seconds; for a further `stale_ttl` seconds
+    the stale value is served immediately while one background task
+    recomputes it (stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._inflight = {}
+
+    def clear(self, prefix=None):
+        """Drop cached results, optionally only for one endpoint"""
+        for key in list(self._results):
+            if prefix is None or key[0] == prefix:
+                del self._results[key]
+
+    def _store(self, key, value):
+        self._results[key] = _Entry(value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def _compute(self, key, func, args, kwargs):
+        try:
+            value = await func(*args, **kwargs)
+            self._store(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def _run(self, key, func, args, kwargs):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, func, args, kwargs))
+            self._inflight[key] = task
+            # Mark retrieved so an error with no waiters left isn't logged
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key, func, args, kwargs):
+        try:
+            await self._run(key, func, args, kwargs)
+        except Exception as e:
+            print(f"Background refresh failed for {key[0]}: {e}")
+
+    async def call(self, key, func, args, kwargs, ttl, stale_ttl):
+        entry = self._results.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.created_at
+            if age < ttl:
+                return entry.value
+            if age < ttl + stale_ttl:
+                if key not in self._inflight:
+                    asyncio.ensure_future(self._refresh(key, func, args, kwargs))
+                return entry.value
+        return await self._run(key, func, args, kwargs)
+
+
+coalescer = RequestCoalescer()
+
+
+def coalesce(ttl=None, stale_ttl=None, ignore=()):
+    """Decorator sharing one computation between identical concurrent requests
+
+    The key is the route function plus its normalized arguments; parameter
+    names listed in `ignore` are left out of the key.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            params = tuple(sorted((k, _normalize(v)) for k, v in kwargs.items() if k not in ignore))
+            key = (name, _normalize(args), params)
+            return await coalescer.call(
+                key, func, args, kwargs,
+                settings.COALESCE_TTL_SECONDS if ttl is None else ttl,
+                settings.COALESCE_STALE_SECONDS if stale_ttl is None else stale_ttl
+            )
+
+        wrapper.coalesce_key = name
+        return wrapper
+    return decorator
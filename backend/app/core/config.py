@@ -11,9 +11,112 @@ class Settings:
     MONGODB_URL: str = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
     MONGODB_DB_NAME: str = os.getenv("MONGODB_DB_NAME", "smartpos_ai")
     
+    # MongoDB pool, timeouts and circuit breaker (trips after N consecutive connection failures)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "2000"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "1000"))
+    MONGO_BREAKER_THRESHOLD: int = int(os.getenv("MONGO_BREAKER_THRESHOLD", "3"))
+    MONGO_BREAKER_COOLDOWN_SECONDS: float = float(os.getenv("MONGO_BREAKER_COOLDOWN_SECONDS", "15"))
+    
     # Server Configuration
     PORT: int = int(os.getenv("PORT", "5000"))
-    
+
+    # Multi-outlet Configuration (requests without a store_id use this one)
+    DEFAULT_STORE_ID: str = os.getenv("DEFAULT_STORE_ID", "main")
+
+    # Cold storage (Parquet archive) Configuration: archive job interval (0 disables)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+    ARCHIVE_SCHEDULE_HOURS: float = float(os.getenv("ARCHIVE_SCHEDULE_HOURS", "24"))
+
+    # Transaction storage layout: "documents" (one per sale) or "buckets" (one per store and hour)
+    TRANSACTION_STORAGE: str = os.getenv("TRANSACTION_STORAGE", "documents")
+    TRANSACTION_BUCKET_MAX_SALES: int = int(os.getenv("TRANSACTION_BUCKET_MAX_SALES", "200"))
+
+    # Shared state across worker processes: auto (Mongo if connected, else SQLite), mongo, sqlite or memory
+    SHARED_STATE_BACKEND: str = os.getenv("SHARED_STATE_BACKEND", "auto")
+    SHARED_STATE_PATH: str = os.getenv("SHARED_STATE_PATH", "data/shared_state.db")
+
+    # Request coalescing for expensive analytics endpoints
+    COALESCE_TTL_SECONDS: float = float(os.getenv("COALESCE_TTL_SECONDS", "15"))
+    COALESCE_STALE_SECONDS: float = float(os.getenv("COALESCE_STALE_SECONDS", "60"))
+
+    # Conditional GET / compression for polled list endpoints (brotli is used when installed)
+    COMPRESS_MIN_BYTES: int = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    RESPONSE_CACHE_SECONDS: float = float(os.getenv("RESPONSE_CACHE_SECONDS", "300"))
+
+    # Batched checkout for tills catching up after an outage (older sales skip the kitchen queue)
+    BATCH_MAX_TRANSACTIONS: int = int(os.getenv("BATCH_MAX_TRANSACTIONS", "500"))
+    BATCH_KITCHEN_WINDOW_MINUTES: int = int(os.getenv("BATCH_KITCHEN_WINDOW_MINUTES", "30"))
+
+    # Receipt numbers: each worker leases this many per store and day from the counters collection;
+    # the till id (default: host name) tells apart numbers handed out offline by different tills
+    RECEIPT_BLOCK_SIZE: int = int(os.getenv("RECEIPT_BLOCK_SIZE", "100"))
+    RECEIPT_TILL_ID: str = os.getenv("RECEIPT_TILL_ID", "")
+
+    # Real-time dashboard: per-minute sales window, top-item sketch size, cross-worker sync interval
+    REALTIME_WINDOW_MINUTES: int = int(os.getenv("REALTIME_WINDOW_MINUTES", "1440"))
+    REALTIME_TOP_ITEMS_CAPACITY: int = int(os.getenv("REALTIME_TOP_ITEMS_CAPACITY", "512"))
+    REALTIME_SYNC_SECONDS: float = float(os.getenv("REALTIME_SYNC_SECONDS", "5"))
+
+    # Columnar line item store behind the analytics helpers: days of sales kept in memory
+    LINE_ITEM_STORE_DAYS: int = int(os.getenv("LINE_ITEM_STORE_DAYS", "90"))
+
+    # Cache of per-hour aggregates for hours that have ended: seconds after an hour ends before
+    # it counts as closed (covers sales committed at the boundary)
+    AGGREGATE_CACHE_GRACE_SECONDS: float = float(os.getenv("AGGREGATE_CACHE_GRACE_SECONDS", "120"))
+
+    # Stock ledger: hours between per-SKU snapshot batches (0 disables the background job)
+    LEDGER_SNAPSHOT_HOURS: float = float(os.getenv("LEDGER_SNAPSHOT_HOURS", "24"))
+
+    # Low-stock alerts: minimum_stock for items without an inventory record, full rebuild interval
+    LOW_STOCK_DEFAULT_MINIMUM: int = int(os.getenv("LOW_STOCK_DEFAULT_MINIMUM", "10"))
+    STOCK_ALERT_RECONCILE_SECONDS: float = float(os.getenv("STOCK_ALERT_RECONCILE_SECONDS", "900"))
+
+    # Replenishment: demand history, service level, ordering/holding costs, order cap in days of
+    # demand (0 for pure EOQ), draft purchase order job interval (0 disables)
+    REPLENISHMENT_HISTORY_DAYS: int = int(os.getenv("REPLENISHMENT_HISTORY_DAYS", "28"))
+    REPLENISHMENT_SERVICE_LEVEL: float = float(os.getenv("REPLENISHMENT_SERVICE_LEVEL", "0.95"))
+    REPLENISHMENT_DEFAULT_LEAD_DAYS: float = float(os.getenv("REPLENISHMENT_DEFAULT_LEAD_DAYS", "2"))
+    REPLENISHMENT_ORDER_COST: float = float(os.getenv("REPLENISHMENT_ORDER_COST", "200"))
+    REPLENISHMENT_HOLDING_RATE: float = float(os.getenv("REPLENISHMENT_HOLDING_RATE", "0.25"))
+    REPLENISHMENT_MAX_COVER_DAYS: float = float(os.getenv("REPLENISHMENT_MAX_COVER_DAYS", "14"))
+    REPLENISHMENT_SCHEDULE_HOURS: float = float(os.getenv("REPLENISHMENT_SCHEDULE_HOURS", "24"))
+
+    # Admission control: concurrent requests per priority class (checkout / default / reports and
+    # analytics), seconds a request may queue for a slot, and the checkout p99 above which
+    # low-priority requests are refused with 429 until it recovers
+    ADMISSION_CRITICAL_LIMIT: int = int(os.getenv("ADMISSION_CRITICAL_LIMIT", "64"))
+    ADMISSION_NORMAL_LIMIT: int = int(os.getenv("ADMISSION_NORMAL_LIMIT", "32"))
+    ADMISSION_LOW_LIMIT: int = int(os.getenv("ADMISSION_LOW_LIMIT", "2"))
+    ADMISSION_CRITICAL_QUEUE_SECONDS: float = float(os.getenv("ADMISSION_CRITICAL_QUEUE_SECONDS", "5"))
+    ADMISSION_NORMAL_QUEUE_SECONDS: float = float(os.getenv("ADMISSION_NORMAL_QUEUE_SECONDS", "2"))
+    ADMISSION_LOW_QUEUE_SECONDS: float = float(os.getenv("ADMISSION_LOW_QUEUE_SECONDS", "1"))
+    ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+    ADMISSION_CRITICAL_P99_MS: float = float(os.getenv("ADMISSION_CRITICAL_P99_MS", "300"))
+    ADMISSION_SLO_WINDOW_SECONDS: float = float(os.getenv("ADMISSION_SLO_WINDOW_SECONDS", "60"))
+    ADMISSION_RETRY_AFTER_SECONDS: int = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+
+    # ML process pool (ML_WORKERS=0 runs model work in a thread instead)
+    ML_WORKERS: int = int(os.getenv("ML_WORKERS", "2"))
+    ML_MAX_PENDING: int = int(os.getenv("ML_MAX_PENDING", "8"))
+    ML_TASK_TIMEOUT_SECONDS: float = float(os.getenv("ML_TASK_TIMEOUT_SECONDS", "30"))
+
+    # Menu engineering
+    MENU_DEFAULT_COST_RATIO: float = float(os.getenv("MENU_DEFAULT_COST_RATIO", "0.35"))
+    MENU_ANALYSIS_CACHE_SECONDS: float = float(os.getenv("MENU_ANALYSIS_CACHE_SECONDS", "300"))
+
+    # Customer segments: seconds a cached segmentation is reused (recency moves with the clock)
+    CUSTOMER_SEGMENTS_CACHE_SECONDS: float = float(os.getenv("CUSTOMER_SEGMENTS_CACHE_SECONDS", "900"))
+
+    # Market basket (co-occurrence) recommendations
+    BASKET_MAX_PAIRS: int = int(os.getenv("BASKET_MAX_PAIRS", "200000"))
+    BASKET_MIN_PAIR_COUNT: int = int(os.getenv("BASKET_MIN_PAIR_COUNT", "2"))
+    BASKET_REBUILD_DAYS: int = int(os.getenv("BASKET_REBUILD_DAYS", "180"))
+
     # CORS Configuration
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:5173")
     ALLOWED_ORIGINS: list = [
@@ -1,5 +1,10 @@
+import threading
+import time
 import pymongo
+from pymongo import monitoring
 from app.core.config import settings
+from app.core.stores import backfill_store_ids
+from app.core.circuit_breaker import CircuitBreaker
 
 class MongoDB:
     client = None
@@ -10,34 +15,180 @@ class MongoDB:
     inventory = None
     customers = None
     employees = None
+    session_snapshots = None
+    kitchen_orders = None
+    counters = None
+    stock_movements = None
+    stock_snapshots = None
+    purchase_orders = None
+    transaction_buckets = None
+    aggregate_buckets = None
+    indexes_ready = False
+    connecting = False
 
 mongodb = MongoDB()
 
-def connect_to_mongo():
+# While the breaker is open, is_mongo_available() is False and callers go
+# straight to their offline path instead of waiting on server selection
+def _probe_until_healthy():
+    while mongo_breaker.state == "open" and mongodb.client is not None:
+        time.sleep(settings.MONGO_BREAKER_COOLDOWN_SECONDS)
+        try:
+            mongodb.client.admin.command("ping")
+        except Exception as e:
+            mongo_breaker.last_error = str(e)
+            continue
+        mongo_breaker.close()
+        if not mongodb.indexes_ready:
+            ensure_indexes()
+
+def _start_probe():
+    threading.Thread(target=_probe_until_healthy, name="mongo-probe", daemon=True).start()
+
+mongo_breaker = CircuitBreaker(
+    "MongoDB",
+    threshold=settings.MONGO_BREAKER_THRESHOLD,
+    cooldown=settings.MONGO_BREAKER_COOLDOWN_SECONDS,
+    on_open=_start_probe
+)
+
+class _HeartbeatListener(monitoring.ServerHeartbeatListener):
+    """The driver's background heartbeats count towards the breaker too"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_breaker.record_success()
+
+    def failed(self, event):
+        mongo_breaker.record_failure(event.reply)
+
+def is_mongo_available():
+    """Connected and the circuit breaker is closed"""
+    return mongodb.database is not None and mongo_breaker.allow()
+
+def record_mongo_error(error):
+    """Count connection-level errors towards the breaker; query errors don't"""
+    # A full pool is local overload, not an outage
+    if isinstance(error, pymongo.errors.ConnectionFailure) and not isinstance(error, pymongo.errors.WaitQueueTimeoutError):
+        mongo_breaker.record_failure(error)
+
+def _bind_collections(client):
+    mongodb.database = client[settings.MONGODB_DB_NAME]
+
+    # Initialize all collections
+    mongodb.items = mongodb.database["items"]
+    mongodb.sessions = mongodb.database["sessions"]
+    mongodb.transactions = mongodb.database["transactions"]
+    mongodb.inventory = mongodb.database["inventory"]
+    mongodb.customers = mongodb.database["customers"]
+    mongodb.employees = mongodb.database["employees"]
+    mongodb.session_snapshots = mongodb.database["session_snapshots"]
+    mongodb.kitchen_orders = mongodb.database["kitchen_orders"]
+    mongodb.counters = mongodb.database["counters"]
+    mongodb.stock_movements = mongodb.database["stock_movements"]
+    mongodb.stock_snapshots = mongodb.database["stock_snapshots"]
+    mongodb.purchase_orders = mongodb.database["purchase_orders"]
+    mongodb.transaction_buckets = mongodb.database["transaction_buckets"]
+    mongodb.aggregate_buckets = mongodb.database["aggregate_buckets"]
+
+def connect_to_mongo(background_indexes=True):
+    client = None
     try:
-        mongodb.client = pymongo.MongoClient(settings.MONGODB_URL)
-        mongodb.database = mongodb.client[settings.MONGODB_DB_NAME]
+        client = pymongo.MongoClient(
+            settings.MONGODB_URL,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+            waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            event_listeners=[_HeartbeatListener()]
+        )
         
-        # Initialize all collections
-        mongodb.items = mongodb.database["items"]
-        mongodb.sessions = mongodb.database["sessions"]
-        mongodb.transactions = mongodb.database["transactions"]
-        mongodb.inventory = mongodb.database["inventory"]
-        mongodb.customers = mongodb.database["customers"]
-        mongodb.employees = mongodb.database["employees"]
-        
-        # Create indexes
-        mongodb.items.create_index("name", unique=True)
-        mongodb.sessions.create_index("is_active")
-        mongodb.customers.create_index("phone", unique=True)
-        mongodb.inventory.create_index("item_id", unique=True)
+        # Fail fast here; index builds can take a while on big collections.
+        # The collections are bound only once Mongo answers, so requests
+        # served during the connect take the offline path
+        client.admin.command("ping")
+        mongodb.client = client
+        _bind_collections(client)
+        if background_indexes:
+            threading.Thread(target=ensure_indexes, name="mongo-indexes", daemon=True).start()
+        else:
+            ensure_indexes()
         
         print("Connected to MongoDB successfully!")
         return True
     except Exception as e:
         print(f"MongoDB connection failed: {e}")
+        if client is not None:
+            # Serve from the offline path and keep probing until Mongo is up
+            mongodb.client = client
+            mongo_breaker.trip(e)
+            _bind_collections(client)
         return False
 
+def ensure_indexes():
+    """Backfill store ids and build indexes; runs off the startup path by default"""
+    started = time.perf_counter()
+    try:
+        backfill_store_ids(mongodb.database)
+
+        # Item names are unique per outlet, not globally
+        if "name_1" in mongodb.items.index_information():
+            mongodb.items.drop_index("name_1")
+
+        # Create indexes (outlet data is led by store_id, the future shard key)
+        mongodb.items.create_index([("store_id", 1), ("name", 1)], unique=True)
+        mongodb.sessions.create_index([("store_id", 1), ("is_active", 1)])
+        try:
+            # At most one open session per store, even with several workers
+            mongodb.sessions.create_index(
+                [("store_id", 1)],
+                unique=True,
+                partialFilterExpression={"is_active": True},
+                name="one_active_session_per_store"
+            )
+        except pymongo.errors.OperationFailure as e:
+            print(f"Could not enforce one active session per store (close duplicate sessions first): {e}")
+        try:
+            mongodb.customers.create_index("phone", unique=True)
+        except pymongo.errors.OperationFailure as e:
+            print(f"Could not enforce unique customer phones (fix duplicate phones first): {e}")
+        mongodb.inventory.create_index("item_id", unique=True)
+        mongodb.inventory.create_index([("store_id", 1), ("item_id", 1)])
+        mongodb.transactions.create_index([("session_id", 1), ("timestamp", -1)])
+        mongodb.transactions.create_index([("store_id", 1), ("timestamp", -1)])
+        # Tills retry queued sales; the same idempotency key is only recorded once per store
+        mongodb.transactions.create_index(
+            [("store_id", 1), ("idempotency_key", 1)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$exists": True}},
+            name="one_sale_per_idempotency_key"
+        )
+        mongodb.kitchen_orders.create_index([("store_id", 1), ("status", 1), ("timestamp", -1)])
+        mongodb.session_snapshots.create_index([("store_id", 1), ("start_time", 1)])
+        mongodb.stock_movements.create_index([("store_id", 1), ("timestamp", 1)])
+        mongodb.stock_movements.create_index([("store_id", 1), ("item_id", 1), ("timestamp", -1)])
+        mongodb.stock_snapshots.create_index([("store_id", 1), ("at", -1), ("item_id", 1)])
+        mongodb.purchase_orders.create_index([("store_id", 1), ("status", 1), ("created_at", -1)])
+        mongodb.transaction_buckets.create_index([("store_id", 1), ("hour", 1)])
+        mongodb.transaction_buckets.create_index("sales._id")
+        mongodb.transaction_buckets.create_index([("store_id", 1), ("sales.session_id", 1)])
+        mongodb.transaction_buckets.create_index(
+            [("store_id", 1), ("idempotency_keys", 1)],
+            unique=True,
+            partialFilterExpression={"idempotency_keys": {"$exists": True}},
+            name="one_bucketed_sale_per_idempotency_key"
+        )
+        mongodb.aggregate_buckets.create_index([("store_id", 1), ("metric", 1), ("hour", 1)], unique=True)
+
+        mongodb.indexes_ready = True
+        print(f"MongoDB indexes ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"MongoDB index build failed: {e}")
+
 def close_mongo_connection():
     if mongodb.client:
         mongodb.client.close()
@@ -63,4 +214,28 @@ def get_customers_collection():
     return mongodb.customers
 
 def get_employees_collection():
-    return mongodb.employees
\ No newline at end of file
+    return mongodb.employees
+
+def get_session_snapshots_collection():
+    return mongodb.session_snapshots
+
+def get_kitchen_orders_collection():
+    return mongodb.kitchen_orders
+
+def get_counters_collection():
+    return mongodb.counters
+
+def get_stock_movements_collection():
+    return mongodb.stock_movements
+
+def get_stock_snapshots_collection():
+    return mongodb.stock_snapshots
+
+def get_purchase_orders_collection():
+    return mongodb.purchase_orders
+
+def get_transaction_buckets_collection():
+    return mongodb.transaction_buckets
+
+def get_aggregate_buckets_collection():
+    return mongodb.aggregate_buckets
@@ -0,0 +1,67 @@
+import re
+from typing import Optional
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class FieldSelection:
+    """Dependency for sparse list responses: ?fields=name,price or ?view=summary
+
+    Returns None for the full representation, else the tuple of top-level
+    fields to send (the id is always sent). `allowed` limits the names a
+    client may ask for (None accepts any plain field name); `summary` is
+    what view=summary means for the resource. Explicit fields win over view.
+    """
+
+    def __init__(self, summary, allowed=None):
+        self.summary = tuple(summary)
+        self.allowed = frozenset(allowed) if allowed is not None else None
+
+    def __call__(
+        self,
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return (id is always included)"),
+        view: Optional[str] = Query(None, description="summary for the list view fields, full (default) for everything")
+    ):
+        if fields:
+            names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip() and name.strip() != "id"))
+            unknown = [
+                name for name in names
+                if not FIELD_NAME.match(name) or (self.allowed is not None and name not in self.allowed)
+            ]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown field(s): {', '.join(unknown)}")
+            return names
+        if view in (None, "", "full"):
+            return None
+        if view == "summary":
+            return self.summary
+        raise HTTPException(status_code=400, detail="view must be 'summary' or 'full'")
+
+
+def projection(fields, always=()):
+    """Mongo projection for a selection (None keeps whole documents); _id is always returned"""
+    if fields is None:
+        return None
+    return {name: 1 for name in (*fields, *always)}
+
+
+def pick(doc, fields):
+    """The selected fields of a document, with `id` from `_id` (or `id`)"""
+    picked = {"id": str(doc["_id"]) if "_id" in doc else doc.get("id")}
+    for name in fields:
+        if name in doc:
+            picked[name] = doc[name]
+    return picked
+
+
+def sparse_response(docs, fields):
+    """JSON list of picked documents, bypassing the route's response_model
+
+    Partial documents would fail (or be padded with defaults by) the full
+    model, and validating fields that are not sent is wasted work.
+    """
+    from bson import ObjectId
+    return JSONResponse(jsonable_encoder([pick(doc, fields) for doc in docs], custom_encoder={ObjectId: str}))
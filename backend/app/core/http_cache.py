@@ -0,0 +1,171 @@
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from app.core.config import settings
+from app.core.shared_state import shared_state
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CollectionVersions:
+    """Monotonic per-collection write counters, shared by all workers
+
+    Every write path calls bump() after its write lands; readers take the
+    version before reading data, so an ETag can only be older than the
+    body it describes, never newer.
+    """
+
+    @staticmethod
+    def _key(collection):
+        return f"version:{collection}"
+
+    def current(self, *collections):
+        return tuple(shared_state.get(self._key(c), 0) for c in collections)
+
+    def bump(self, *collections):
+        for collection in collections:
+            shared_state.incr(self._key(collection))
+
+
+collection_versions = CollectionVersions()
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _pick_encoding(accept_encoding):
+    accept_encoding = accept_encoding.lower()
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return None
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" refer to the same representation
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in if_none_match.split(","))
+
+
+class ConditionalGetMiddleware:
+    """ETags, 304s and compressed, cached bodies for polled list endpoints
+
+    `paths` maps a GET path to the collections its response is built from.
+    The ETag hashes the path, query string, store header and the current
+    versions of those collections, so a matching If-None-Match is answered
+    with 304 from a shared-state lookup without running the endpoint or
+    querying the collections. Full responses are compressed once (brotli
+    when the optional `brotli` package is installed, else gzip) and kept
+    in a small LRU keyed by ETag and encoding, so other pollers at the
+    same version get the stored bytes.
+
+    `vary_on`, if given, returns a string folded into the ETag, e.g. which
+    data source served the response, so a fallback body is not reused
+    once the primary source is back.
+    """
+
+    def __init__(self, app, paths, minimum_size=None, max_entries=128, ttl=None, vary_on=None):
+        self.app = app
+        self.vary_on = vary_on
+        self.paths = {path: tuple(collections) for path, collections in paths.items()}
+        self.minimum_size = settings.COMPRESS_MIN_BYTES if minimum_size is None else minimum_size
+        self.ttl = settings.RESPONSE_CACHE_SECONDS if ttl is None else ttl
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+
+    def _etag(self, scope, headers, versions):
+        raw = "|".join([
+            scope["path"],
+            scope.get("query_string", b"").decode("latin-1"),
+            headers.get("x-store-id", ""),
+            ",".join(map(str, versions)),
+            self.vary_on() if self.vary_on else ""
+        ])
+        return 'W/"' + hashlib.blake2b(raw.encode(), digest_size=12).hexdigest() + '"'
+
+    def _cached(self, key):
+        entry = self._bodies.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._bodies[key]
+            return None
+        self._bodies.move_to_end(key)
+        return entry
+
+    def _store(self, key, body, headers):
+        self._bodies[key] = (time.monotonic(), body, headers)
+        self._bodies.move_to_end(key)
+        while len(self._bodies) > self.max_entries:
+            self._bodies.popitem(last=False)
+
+    async def _send_body(self, send, status, headers, body):
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        try:
+            versions = collection_versions.current(*self.paths[scope["path"]])
+        except Exception as e:
+            print(f"Collection versions unavailable, serving without ETag: {e}")
+            await self.app(scope, receive, send)
+            return
+
+        etag = self._etag(scope, headers, versions)
+        validators = [(b"etag", etag.encode()), (b"cache-control", b"no-cache"), (b"vary", b"Accept-Encoding, X-Store-Id")]
+
+        if _etag_matches(headers.get("if-none-match"), etag):
+            await self._send_body(send, 304, validators, b"")
+            return
+
+        encoding = _pick_encoding(headers.get("accept-encoding", ""))
+        cached = self._cached((etag, encoding))
+        if cached is not None:
+            await self._send_body(send, 200, cached[2], cached[1])
+            return
+
+        start = {}
+        chunks = []
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        body = b"".join(chunks)
+        response_headers = MutableHeaders(raw=list(start.get("headers", [])))
+        if start.get("status") != 200 or "content-encoding" in response_headers:
+            # Errors and already-encoded bodies go out untouched and uncached
+            await self._send_body(send, start.get("status", 500), response_headers.raw, body)
+            return
+
+        if encoding and len(body) >= self.minimum_size:
+            body = _compress(body, encoding)
+            response_headers["content-encoding"] = encoding
+        response_headers["content-length"] = str(len(body))
+        for name, value in validators:
+            response_headers[name.decode()] = value.decode()
+
+        self._store((etag, encoding), body, response_headers.raw)
+        await self._send_body(send, 200, response_headers.raw, body)
@@ -0,0 +1,288 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, date
+from app.core.config import settings
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class SharedState:
+    """Small key/value store shared by every worker process
+
+    Each key carries a version that changes on every write. compare_and_set
+    only writes when the caller saw the latest version (0 = key absent), so
+    read-modify-write cycles stay correct with several uvicorn workers.
+    """
+
+    def get_versioned(self, key):
+        """(value, version) for a key; expired keys read as None"""
+        raise NotImplementedError
+
+    def compare_and_set(self, key, value, expected_version, ttl=None):
+        """Write `value` only if the key is still at `expected_version`"""
+        raise NotImplementedError
+
+    def incr(self, key, amount=1):
+        """Atomically add to a numeric key and return the new value"""
+        raise NotImplementedError
+
+    def pop(self, key):
+        """Atomically delete a key and return its value"""
+        raise NotImplementedError
+
+    def get(self, key, default=None):
+        value, _ = self.get_versioned(key)
+        return default if value is None else value
+
+    def update(self, key, fn, ttl=None, retries=20):
+        """Apply fn(current_value) -> new_value with optimistic retries"""
+        for _ in range(retries):
+            value, version = self.get_versioned(key)
+            new_value = fn(value)
+            if self.compare_and_set(key, new_value, version, ttl):
+                return new_value
+        raise RuntimeError(f"Shared state key '{key}' is too contended to update")
+
+    def set(self, key, value, ttl=None):
+        return self.update(key, lambda _: value, ttl)
+
+    def delete(self, key):
+        self.pop(key)
+
+
+class MemorySharedState(SharedState):
+    """Process-local implementation for single worker setups and scripts"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get_versioned(self, key):
+        with self._lock:
+            value, version, expires_at = self._data.get(key, (None, 0, None))
+        if expires_at is not None and expires_at <= time.time():
+            return None, version
+        return value, version
+
+    def compare_and_set(self, key, value, expected_version, ttl=None):
+        with self._lock:
+            version = self._data.get(key, (None, 0, None))[1]
+            if version != expected_version:
+                return False
+            self._data[key] = (value, version + 1, time.time() + ttl if ttl else None)
+            return True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value, version, _ = self._data.get(key, (0, 0, None))
+            value = (value or 0) + amount
+            self._data[key] = (value, version + 1, None)
+            return value
+
+    def pop(self, key):
+        with self._lock:
+            value, _, expires_at = self._data.pop(key, (None, 0, None))
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+
+class MongoSharedState(SharedState):
+    """Shared state in a Mongo collection; works across workers and hosts"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        # Expired documents are removed by Mongo's TTL monitor; reads also
+        # check expires_at because the monitor only runs once a minute
+        self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _check(self):
+        # Fail fast during an outage instead of waiting on server selection
+        from app.core.database import mongo_breaker
+        if not mongo_breaker.allow():
+            from pymongo.errors import ConnectionFailure
+            raise ConnectionFailure("MongoDB circuit is open")
+
+    def get_versioned(self, key):
+        self._check()
+        doc = self.collection.find_one({"_id": key})
+        if not doc:
+            return None, 0
+        if doc.get("expires_at") and doc["expires_at"] <= datetime.utcnow():
+            return None, doc["version"]
+        return doc.get("value"), doc["version"]
+
+    def compare_and_set(self, key, value, expected_version, ttl=None):
+        from pymongo.errors import DuplicateKeyError
+        self._check()
+        # BSON dates are UTC; the TTL monitor and the reads above compare in UTC
+        expires_at = datetime.utcfromtimestamp(time.time() + ttl) if ttl else None
+        if expected_version == 0:
+            try:
+                self.collection.insert_one({"_id": key, "value": value, "version": 1, "expires_at": expires_at})
+                return True
+            except DuplicateKeyError:
+                return False
+        result = self.collection.update_one(
+            {"_id": key, "version": expected_version},
+            {"$set": {"value": value, "expires_at": expires_at}, "$inc": {"version": 1}}
+        )
+        return result.matched_count == 1
+
+    def incr(self, key, amount=1):
+        from pymongo import ReturnDocument
+        self._check()
+        doc = self.collection.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": amount, "version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["value"]
+
+    def pop(self, key):
+        self._check()
+        doc = self.collection.find_one_and_delete({"_id": key})
+        if not doc or (doc.get("expires_at") and doc["expires_at"] <= datetime.utcnow()):
+            return None
+        return doc.get("value")
+
+
+class SQLiteSharedState(SharedState):
+    """Shared state in a local SQLite file; works across workers on one host"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state ("
+                "key TEXT PRIMARY KEY, value TEXT, version INTEGER NOT NULL, expires_at REAL)"
+            )
+
+    def get_versioned(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, version, expires_at FROM shared_state WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None, 0
+        value, version, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None, version
+        return json.loads(value), version
+
+    def compare_and_set(self, key, value, expected_version, ttl=None):
+        payload = json.dumps(value, default=_json_default)
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            if expected_version == 0:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO shared_state (key, value, version, expires_at) VALUES (?, ?, 1, ?)",
+                    (key, payload, expires_at)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE shared_state SET value = ?, version = version + 1, expires_at = ? "
+                    "WHERE key = ? AND version = ?",
+                    (payload, expires_at, key, expected_version)
+                )
+        return cursor.rowcount == 1
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            # IMMEDIATE takes the write lock up front so other processes wait
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM shared_state WHERE key = ?", (key,)).fetchone()
+                value = (json.loads(row[0]) if row else 0) + amount
+                self._conn.execute(
+                    "INSERT INTO shared_state (key, value, version, expires_at) VALUES (?, ?, 1, NULL) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1",
+                    (key, json.dumps(value))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if not row or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+
+def create_shared_state(backend=None):
+    """Build the configured backend; "auto" prefers Mongo when it is connected"""
+    backend = (backend or settings.SHARED_STATE_BACKEND).lower()
+    if backend in ("auto", "mongo"):
+        from app.core.database import mongodb, is_mongo_available
+        if is_mongo_available():
+            return MongoSharedState(mongodb.database["shared_state"])
+        if backend == "mongo":
+            raise RuntimeError("SHARED_STATE_BACKEND=mongo but MongoDB is not connected")
+    if backend in ("auto", "sqlite"):
+        return SQLiteSharedState(settings.SHARED_STATE_PATH)
+    if backend == "memory":
+        return MemorySharedState()
+    raise ValueError(f"Unknown shared state backend: {backend}")
+
+
+def create_local_state():
+    """Host-local backend for state that has to outlive a MongoDB outage
+
+    SQLite, so every worker on the host sees it (memory when the shared
+    state is configured as memory, as in scripts and tests).
+    """
+    if settings.SHARED_STATE_BACKEND.lower() == "memory":
+        return MemorySharedState()
+    return SQLiteSharedState(settings.SHARED_STATE_PATH)
+
+
+class _LazySharedState:
+    """Resolves the backend on first use, after the app has connected to Mongo"""
+
+    def __init__(self, factory=create_shared_state, label="Shared state"):
+        self._factory = factory
+        self._label = label
+        self._backend = None
+        self._lock = threading.Lock()
+
+    def reset(self, backend=None):
+        """Switch backend, e.g. after MongoDB connects or in scripts"""
+        self._backend = backend
+
+    def __getattr__(self, name):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._factory()
+                    print(f"{self._label} backend: {type(self._backend).__name__}")
+        return getattr(self._backend, name)
+
+
+shared_state = _LazySharedState()
+# Never Mongo: reads and writes here keep working while Mongo is down
+local_state = _LazySharedState(create_local_state, "Local state")
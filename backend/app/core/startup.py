@@ -0,0 +1,38 @@
+import time
+
+
+class StartupReport:
+    """Records how long each boot step takes, from first import to ready
+
+    main.py calls mark() after each group of imports and startup steps and
+    ready() at the end of the startup event, which logs one line such as:
+
+        Startup: fastapi 120 ms, database 40 ms, ... -> ready in 310 ms
+    """
+
+    def __init__(self, target_ms=500):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.target_ms = target_ms
+        self.steps = []
+        self.ready_ms = None
+
+    def mark(self, step):
+        now = time.perf_counter()
+        self.steps.append((step, round((now - self._last) * 1000, 1)))
+        self._last = now
+
+    def ready(self):
+        self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        steps = ", ".join(f"{step} {ms:.0f} ms" for step, ms in self.steps)
+        print(f"Startup: {steps} -> ready in {self.ready_ms:.0f} ms")
+        if self.ready_ms > self.target_ms:
+            slowest = max(self.steps, key=lambda s: s[1])[0] if self.steps else "unknown"
+            print(f"Startup exceeded the {self.target_ms} ms target (slowest step: {slowest})")
+        return self.ready_ms
+
+    def as_dict(self):
+        return {"steps": dict(self.steps), "ready_ms": self.ready_ms, "target_ms": self.target_ms}
+
+
+startup_report = StartupReport()
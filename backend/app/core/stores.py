@@ -0,0 +1,37 @@
+from typing import Optional
+from fastapi import Header, Query
+from app.core.config import settings
+
+# Collections partitioned by outlet. Every compound index on them is led by
+# store_id so they can later be sharded on {"store_id": 1, ...} unchanged.
+STORE_SCOPED_COLLECTIONS = ["items", "sessions", "transactions", "inventory", "kitchen_orders", "session_snapshots"]
+
+
+def get_store_id(
+    store_id: Optional[str] = Query(None, description="Outlet to scope the request to"),
+    x_store_id: Optional[str] = Header(None)
+) -> str:
+    """Outlet for a request: ?store_id=, then the X-Store-Id header, then the default store"""
+    value = (store_id or x_store_id or "").strip()
+    return value or settings.DEFAULT_STORE_ID
+
+
+def store_filter(store_id, query=None):
+    """Mongo filter restricted to one outlet"""
+    return {"store_id": store_id, **(query or {})}
+
+
+def in_store(doc, store_id):
+    """Whether an in-memory document belongs to an outlet (untagged docs belong to the default store)"""
+    return doc.get("store_id", settings.DEFAULT_STORE_ID) == store_id
+
+
+def backfill_store_ids(database):
+    """Tag documents written before multi-store support with the default store"""
+    for name in STORE_SCOPED_COLLECTIONS:
+        result = database[name].update_many(
+            {"store_id": {"$exists": False}},
+            {"$set": {"store_id": settings.DEFAULT_STORE_ID}}
+        )
+        if result.modified_count:
+            print(f"Assigned {result.modified_count} {name} documents to store '{settings.DEFAULT_STORE_ID}'")
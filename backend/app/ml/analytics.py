@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
 import pandas as pd
-from app.core.database import get_transactions_collection, get_items_collection
+from app.core.config import settings
+from app.core.database import get_items_collection
+from app.services.aggregate_cache import hourly_item_lines, regroup_item_lines
 
 class SalesAnalytics:
-    def __init__(self):
-        self.transactions_collection = get_transactions_collection()
+    def __init__(self, store_id=None):
+        self.store_id = store_id or settings.DEFAULT_STORE_ID
         self.items_collection = get_items_collection()
     
     def get_hourly_sales(self, days_back=7):
@@ -12,32 +14,11 @@ class SalesAnalytics:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days_back)
         
-        # Aggregate hourly sales data
-        pipeline = [
-            {
-                "$match": {
-                    "timestamp": {"$gte": start_date, "$lte": end_date}
-                }
-            },
-            {
-                "$unwind": "$items"
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "hour": {"$hour": "$timestamp"},
-                        "item_name": "$items.item_name"
-                    },
-                    "total_quantity": {"$sum": "$items.quantity"},
-                    "total_revenue": {"$sum": "$items.total"}
-                }
-            },
-            {
-                "$sort": {"_id.hour": 1, "total_quantity": -1}
-            }
-        ]
-        
-        results = list(self.transactions_collection.aggregate(pipeline))
+        # Closed hours come from the aggregate cache, only the current one is recomputed
+        results = regroup_item_lines(
+            hourly_item_lines(self.store_id, start_date, end_date), keys=("hour", "item_name"),
+            quantity_field="total_quantity", revenue_field="total_revenue"
+        )
         
         # Format results
         hourly_data = {}
@@ -80,33 +61,18 @@ class SalesAnalytics:
         
         return peak_hours
     
-    def get_daily_trends(self, item_name=None):
-        """Get daily sales trends (day of week patterns)"""
-        pipeline = [
-            {
-                "$unwind": "$items"
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "day_of_week": {"$dayOfWeek": "$timestamp"},
-                        "item_name": "$items.item_name"
-                    },
-                    "total_quantity": {"$sum": "$items.quantity"},
-                    "total_revenue": {"$sum": "$items.total"}
-                }
-            },
-            {
-                "$sort": {"_id.day_of_week": 1, "total_quantity": -1}
-            }
-        ]
+    def get_daily_trends(self, item_name=None, days_back=28):
+        """Get daily sales trends (day of week patterns) over the past N days"""
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days_back)
         
+        # Same per-hour cache as get_hourly_sales; the archive is only read for old ranges
+        results = regroup_item_lines(
+            hourly_item_lines(self.store_id, start_date, end_date), keys=("day_of_week", "item_name"),
+            quantity_field="total_quantity", revenue_field="total_revenue"
+        )
         if item_name:
-            pipeline.insert(0, {
-                "$match": {"items.item_name": item_name}
-            })
-        
-        results = list(self.transactions_collection.aggregate(pipeline))
+            results = [r for r in results if r["_id"]["item_name"] == item_name]
         
         # Map day numbers to names
         day_names = {
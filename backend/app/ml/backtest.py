@@ -0,0 +1,428 @@
+import argparse
+import json
+import math
+import pickle
+import random
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+import numpy as np
+from app.ml.local_models import MLModels, BASELINE_DEMAND
+from app.ml.tasks import batch_linear_fit, batch_linear_predict, fit_forest
+
+# Rolling-origin backtests for the demand models.
+#
+# History (synthetic or real transactions) is replayed day by day: at each
+# origin every model is fitted on the days before it and scored on the day
+# `horizon` days ahead, exactly as the API would have served it. Per-item
+# daily quantity is the target for the LocalMLModels forecasters, per-hour
+# item volume for MLEngine.predict_demand. Run it with:
+#
+#     python -m app.ml.backtest                     # synthetic history
+#     python -m app.ml.backtest --input txns.json   # exported transactions
+#     python -m app.ml.backtest --store main        # live MongoDB history
+
+# Hours MLEngine.predict_demand forecasts
+ENGINE_HOURS = list(range(8, 22, 2))
+
+
+def _to_datetime(value):
+    if isinstance(value, dict):
+        # mongoexport writes {"$date": ...}
+        value = value.get("$date")
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return None
+
+
+class History:
+    """Transactions reduced to the daily/hourly matrices the models train on"""
+
+    def __init__(self, transactions):
+        lines = []
+        txn_days = []
+        txn_hours = []
+        for t in transactions:
+            dt = _to_datetime(t.get("timestamp"))
+            if dt is None:
+                continue
+            txn_days.append(dt.toordinal())
+            txn_hours.append(dt.hour)
+            for item in t.get("items", []):
+                name = item.get("item_name") or item.get("name")
+                if name:
+                    lines.append((dt.toordinal(), dt.hour, name, float(item.get("quantity", 1))))
+        if not lines:
+            raise ValueError("No transactions with line items to backtest")
+
+        self.items = sorted({line[2] for line in lines})
+        code_of = {name: code for code, name in enumerate(self.items)}
+        days = np.array([line[0] for line in lines])
+        self.first_day = int(days.min())
+        self.n_days = int(days.max()) - self.first_day + 1
+
+        day_index = days - self.first_day
+        quantities = np.array([line[3] for line in lines])
+        self.daily = np.zeros((self.n_days, len(self.items)))
+        np.add.at(self.daily, (day_index, [code_of[line[2]] for line in lines]), quantities)
+        self.hourly = np.zeros((self.n_days, 24))
+        np.add.at(self.hourly, (day_index, [line[1] for line in lines]), quantities)
+
+        self.txn_days = np.array(txn_days, dtype=np.int32)
+        self.txn_hours = np.array(txn_hours, dtype=np.int8)
+
+        # Calendar features built the way production builds them: training
+        # rows come from Mongo's $dayOfWeek (1 = Sunday), prediction rows
+        # from isoweekday (1 = Monday). The scores include that skew.
+        dates = [date.fromordinal(self.first_day + d) for d in range(self.n_days)]
+        train_dow = np.array([d.isoweekday() % 7 + 1 for d in dates])
+        serve_dow = np.array([d.isoweekday() for d in dates])
+        self.train_features = np.column_stack([train_dow, np.isin(train_dow, [6, 7])]).astype(np.float32)
+        self.serve_features = np.column_stack([serve_dow, np.isin(serve_dow, [6, 7])]).astype(np.float32)
+
+
+def synthetic_transactions(days=120, items=None, seed=7, end=None):
+    """Cafe-like history: hourly rush peaks, weekend lift, slow growth, noise"""
+    rng = random.Random(seed)
+    items = items or ["Tea", "Coffee", "Samosa", "Egg Puff", "Mojito", "Lemon Tea", "Biscuit", "Allam Tea"]
+    popularity = {name: rng.uniform(0.3, 1.0) for name in items}
+    weekend_taste = {name: rng.uniform(0.7, 1.6) for name in items}
+    hour_profile = {7: 4, 8: 9, 9: 8, 10: 5, 11: 5, 12: 9, 13: 8, 14: 5, 15: 4, 16: 6, 17: 9, 18: 10, 19: 7, 20: 4, 21: 2}
+
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    transactions = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        weekend = day.isoweekday() in (6, 7)
+        growth = 1 + 0.3 * d / days
+        for hour, rate in hour_profile.items():
+            count = max(0, int(rng.gauss(rate * growth * (1.25 if weekend else 1.0), math.sqrt(rate))))
+            for _ in range(count):
+                basket = {}
+                for _ in range(rng.choice((1, 1, 2, 3))):
+                    weights = [popularity[n] * (weekend_taste[n] if weekend else 1) for n in items]
+                    name = rng.choices(items, weights)[0]
+                    basket[name] = basket.get(name, 0) + rng.choice((1, 1, 1, 2))
+                transactions.append({
+                    "timestamp": day + timedelta(hours=hour, minutes=rng.randrange(60)),
+                    "items": [{"item_name": n, "quantity": q} for n, q in basket.items()]
+                })
+    return transactions
+
+
+# ---------------------------------------------------------------------------
+# Forecasters: fit(history, end) trains on days [0, end); predict(history, day)
+# returns one value per series. state() is what a server would keep in memory.
+# ---------------------------------------------------------------------------
+
+class MovingAverageForecaster:
+    name = "moving_average_7"
+    source = "reference"
+    track = "item_daily"
+
+    def fit(self, history, end):
+        self.level = history.daily[max(0, end - 7):end].mean(axis=0)
+
+    def predict(self, history, day):
+        return np.round(self.level)
+
+    def state(self):
+        return self.level
+
+
+class SeasonalNaiveForecaster:
+    name = "same_weekday_last_week"
+    source = "reference"
+    track = "item_daily"
+
+    def fit(self, history, end):
+        self.recent = history.daily[max(0, end - 7):end]
+        self.end = end
+
+    def predict(self, history, day):
+        weeks_back = (day - self.end) // 7 + 1
+        return self.recent[day - 7 * weeks_back - (self.end - len(self.recent))]
+
+    def state(self):
+        return self.recent
+
+
+class LinearRegressionForecaster:
+    """MLModels.predict_all_items: per-item OLS on days with sales"""
+    name = "linear_regression"
+    source = "local_models.MLModels.predict_all_items"
+    track = "item_daily"
+    days_back = 60
+    min_samples = 7
+
+    def fit(self, history, end):
+        start = max(0, end - self.days_back)
+        window = history.daily[start:end]
+        # Only days with sales exist in get_historical_data's $group output
+        day_index, codes = np.nonzero(window)
+        self.coefficients, self.counts = batch_linear_fit(
+            codes.astype(np.int32), history.train_features[start + day_index],
+            window[day_index, codes].astype(np.float32), len(history.items), self.min_samples
+        )
+        self.baseline = np.array([BASELINE_DEMAND.get(name, 10) for name in history.items], dtype=float)
+
+    def predict(self, history, day):
+        raw = batch_linear_predict(self.coefficients, history.serve_features[day])
+        return np.where(np.isnan(raw), self.baseline, np.maximum(0, np.round(raw)))
+
+    def state(self):
+        return self.coefficients
+
+
+class RandomForestForecaster:
+    """MLModels.predict_demand_advanced: a forest per item, linear fallback"""
+    name = "random_forest"
+    source = "local_models.MLModels.predict_demand_advanced"
+    track = "item_daily"
+    days_back = 90
+    min_samples = 14
+
+    def fit(self, history, end):
+        self.fallback = LinearRegressionForecaster()
+        self.fallback.fit(history, end)
+        start = max(0, end - self.days_back)
+        window = history.daily[start:end]
+        self.models = {}
+        for code in range(len(history.items)):
+            days = np.nonzero(window[:, code])[0]
+            if len(days) < self.min_samples:
+                continue
+            y = window[days, code]
+            X = MLModels.enhance_features(history.train_features[start + days], y)
+            self.models[code] = (fit_forest(X.astype(np.float32), y.astype(np.float32)), y)
+
+    def predict(self, history, day):
+        predictions = self.fallback.predict(history, day)
+        base = history.serve_features[day][np.newaxis, :]
+        for code, (model, y) in self.models.items():
+            features = MLModels.enhance_prediction_features(base, y).astype(np.float32)
+            predictions[code] = max(0, round(float(model.predict(features)[0])))
+        return predictions
+
+    def state(self):
+        return [model for model, _ in self.models.values()], self.fallback.state()
+
+
+class EngineBlendForecaster:
+    """MLEngine.predict_demand: refits its trend + hourly average per call"""
+    name = "mlengine_blend"
+    source = "ml_engine.MLEngine.predict_demand"
+    track = "hourly"
+
+    def fit(self, history, end):
+        # Nothing is trained ahead of time; the API refits on every request
+        self.cutoff = history.first_day + end
+
+    def predict(self, history, day):
+        from ml_engine import MLEngine
+        keep = history.txn_days < self.cutoff
+        rows = MLEngine.predict_demand_from_arrays(history.txn_days[keep], history.txn_hours[keep])
+        predictions = np.full(24, np.nan)
+        for row in rows:
+            predictions[int(row["hour"][:2])] = row["demand"]
+        return predictions
+
+    def state(self):
+        return None
+
+
+class HourlyMeanForecaster:
+    name = "hourly_mean_28d"
+    source = "reference"
+    track = "hourly"
+
+    def fit(self, history, end):
+        self.level = history.hourly[max(0, end - 28):end].mean(axis=0)
+
+    def predict(self, history, day):
+        return np.round(self.level)
+
+    def state(self):
+        return self.level
+
+
+FORECASTERS = [
+    LinearRegressionForecaster,
+    RandomForestForecaster,
+    MovingAverageForecaster,
+    SeasonalNaiveForecaster,
+    EngineBlendForecaster,
+    HourlyMeanForecaster,
+]
+
+
+def _scores(predicted, actual):
+    """Per-series MAPE (%, over non-zero actuals) and RMSE"""
+    error = predicted - actual
+    rmse = np.sqrt(np.mean(error ** 2, axis=0))
+    nonzero = actual > 0
+    ape = np.abs(error) / np.where(nonzero, actual, 1)
+    counts = nonzero.sum(axis=0)
+    mape = np.where(counts > 0, (ape * nonzero).sum(axis=0) / np.maximum(counts, 1) * 100, np.nan)
+    return mape, rmse
+
+
+def _footprint(forecaster, history, end, day):
+    """Peak Python/NumPy allocation while fitting+predicting, and model size"""
+    tracemalloc.start()
+    try:
+        forecaster.fit(history, end)
+        forecaster.predict(history, day)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak / 1024, len(pickle.dumps(forecaster.state())) / 1024
+
+
+def evaluate(forecaster_cls, history, origins, horizon=1):
+    """Rolling-origin evaluation of one forecaster"""
+    forecaster = forecaster_cls()
+    if forecaster.track == "hourly":
+        actual_matrix, columns, series = history.hourly, ENGINE_HOURS, [f"{h:02d}:00" for h in ENGINE_HOURS]
+    else:
+        actual_matrix, columns, series = history.daily, list(range(len(history.items))), history.items
+
+    predicted, actual = [], []
+    fit_seconds = predict_seconds = 0.0
+    for end in origins:
+        day = end + horizon - 1
+        started = time.perf_counter()
+        forecaster.fit(history, end)
+        fitted = time.perf_counter()
+        predicted.append(np.asarray(forecaster.predict(history, day), dtype=float)[columns])
+        predict_seconds += time.perf_counter() - fitted
+        fit_seconds += fitted - started
+        actual.append(actual_matrix[day, columns])
+
+    predicted, actual = np.array(predicted), np.array(actual)
+    mape, rmse = _scores(predicted, actual)
+    peak_kb, model_kb = _footprint(forecaster, history, origins[-1], origins[-1] + horizon - 1)
+
+    fit_ms = fit_seconds / len(origins) * 1000
+    predict_ms = predict_seconds / len(origins) * 1000
+    mean_mape = float(np.nanmean(mape)) if not np.all(np.isnan(mape)) else None
+    accuracy = max(0.0, 100 - mean_mape) if mean_mape is not None else 0.0
+    return {
+        "track": forecaster.track,
+        "model": forecaster.name,
+        "source": forecaster.source,
+        "mape": round(mean_mape, 2) if mean_mape is not None else None,
+        "rmse": round(float(np.sqrt(np.mean((predicted - actual) ** 2))), 3),
+        "fit_ms": round(fit_ms, 3),
+        "predict_ms": round(predict_ms, 3),
+        "peak_kb": round(peak_kb, 1),
+        "model_kb": round(model_kb, 1),
+        "accuracy_per_ms": round(accuracy / max(fit_ms + predict_ms, 1e-3), 2),
+        "per_series": {
+            name: {"mape": None if np.isnan(m) else round(float(m), 2), "rmse": round(float(r), 3)}
+            for name, m, r in zip(series, mape, rmse)
+        }
+    }
+
+
+def run_backtest(transactions, horizon=1, step=7, min_train=28, models=None):
+    """Backtest every forecaster (or those named in `models`) on the history"""
+    history = History(transactions)
+    origins = list(range(min_train, history.n_days - horizon + 1, step))
+    if not origins:
+        raise ValueError(f"Need more than {min_train + horizon} days of history, got {history.n_days}")
+
+    results = [
+        evaluate(cls, history, origins, horizon)
+        for cls in FORECASTERS if not models or cls.name in models
+    ]
+    return {
+        "days": history.n_days,
+        "items": history.items,
+        "origins": len(origins),
+        "horizon": horizon,
+        "results": results
+    }
+
+
+def format_table(report, per_series=False):
+    """Comparison table, best MAPE first within each track"""
+    header = f"{'track':<11} {'model':<23} {'MAPE %':>8} {'RMSE':>8} {'fit ms':>9} {'pred ms':>9} {'peak KB':>9} {'model KB':>9} {'acc/ms':>8}"
+    lines = [
+        f"{report['days']} days, {len(report['items'])} items, {report['origins']} origins, horizon {report['horizon']} day(s)",
+        header,
+        "-" * len(header)
+    ]
+    rows = sorted(report["results"], key=lambda r: (r["track"], r["mape"] if r["mape"] is not None else float("inf")))
+    for r in rows:
+        mape = f"{r['mape']:.1f}" if r["mape"] is not None else "n/a"
+        lines.append(
+            f"{r['track']:<11} {r['model']:<23} {mape:>8} {r['rmse']:>8.2f} {r['fit_ms']:>9.2f} "
+            f"{r['predict_ms']:>9.2f} {r['peak_kb']:>9.1f} {r['model_kb']:>9.1f} {r['accuracy_per_ms']:>8.2f}"
+        )
+        if per_series:
+            for name, s in r["per_series"].items():
+                mape = f"{s['mape']:.1f}" if s["mape"] is not None else "n/a"
+                lines.append(f"{'':<11}   {name:<21} {mape:>8} {s['rmse']:>8.2f}")
+    return "\n".join(lines)
+
+
+def load_store_transactions(store_id, days):
+    """Hot and archived transactions of one store from MongoDB"""
+    from app.core.database import connect_to_mongo
+    from app.services.archive_service import transaction_archive
+    from app.services.transaction_store import transaction_store
+
+    if not connect_to_mongo(background_indexes=False):
+        raise SystemExit("MongoDB is not reachable")
+    start = datetime.now() - timedelta(days=days)
+    hot = transaction_store.find(store_id, start)
+    return hot + transaction_archive.load_transactions(start, None, store_id=store_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the demand forecasting models")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--input", help="JSON array of transactions (API export or mongoexport --jsonArray)")
+    source.add_argument("--store", help="Read this store's history from MongoDB")
+    parser.add_argument("--days", type=int, default=120, help="Days of history (synthetic or from MongoDB)")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for synthetic history")
+    parser.add_argument("--horizon", type=int, default=1, help="Forecast this many days ahead")
+    parser.add_argument("--step", type=int, default=7, help="Days between rolling origins")
+    parser.add_argument("--min-train", type=int, default=28, help="Days of history before the first origin")
+    parser.add_argument("--models", nargs="*", help="Only run these models")
+    parser.add_argument("--per-item", action="store_true", help="Show MAPE/RMSE per item (or hour)")
+    parser.add_argument("--json", help="Also write the full report to this file")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input) as f:
+            transactions = json.load(f)
+        if isinstance(transactions, dict):
+            # GET /transactions/ wraps the list as {"success": ..., "data": [...]}
+            transactions = transactions.get("data", [])
+    elif args.store:
+        transactions = load_store_transactions(args.store, args.days)
+    else:
+        transactions = synthetic_transactions(args.days, seed=args.seed)
+
+    try:
+        report = run_backtest(transactions, args.horizon, args.step, args.min_train, args.models)
+    except ValueError as e:
+        parser.error(str(e))
+    print(format_table(report, per_series=args.per_item))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,28 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 import json
+from app.core.config import settings
 from app.core.database import get_transactions_collection, get_items_collection
+from app.services.transaction_store import transaction_store
+from app.services.line_item_store import line_item_store
+from app.services.aggregate_cache import hourly_item_lines, regroup_item_lines
+from app.services.ml_executor import ml_executor
+from app.ml.tasks import fit_forest_predict, batch_linear_forecast
+
+# Default predictions based on item type, used when data is scarce
+BASELINE_DEMAND = {
+    "Tea": 20,
+    "Coffee": 15,
+    "Samosa": 10,
+    "Biscuit": 8,
+    "Snack": 12
+}
 
 class MLModels:
-    def __init__(self):
+    def __init__(self, store_id=None):
+        self.store_id = store_id or settings.DEFAULT_STORE_ID
         self.transactions_collection = get_transactions_collection()
         self.items_collection = get_items_collection()
     
@@ -17,39 +32,12 @@ class MLModels:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days_back)
         
-        pipeline = [
-            {
-                "$match": {
-                    "timestamp": {"$gte": start_date, "$lte": end_date}
-                }
-            },
-            {
-                "$unwind": "$items"
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
-                        "item_name": "$items.item_name",
-                        "day_of_week": {"$dayOfWeek": "$timestamp"},
-                        "is_weekend": {
-                            "$cond": {
-                                "if": {"$in": [{"$dayOfWeek": "$timestamp"}, [6, 7]]},
-                                "then": 1,
-                                "else": 0
-                            }
-                        }
-                    },
-                    "quantity": {"$sum": "$items.quantity"},
-                    "revenue": {"$sum": "$items.total"}
-                }
-            },
-            {
-                "$sort": {"_id.date": 1}
-            }
-        ]
-        
-        results = list(self.transactions_collection.aggregate(pipeline))
+        # Both storage tiers, with closed hours served from the aggregate cache
+        results = regroup_item_lines(
+            hourly_item_lines(self.store_id, start_date, end_date),
+            keys=("date", "item_name", "day_of_week", "is_weekend")
+        )
+        results.sort(key=lambda r: r["_id"]["date"])
         return results
     
     def prepare_training_data(self, item_name, days_back=60):
@@ -105,20 +93,16 @@ class MLModels:
             "training_samples": len(X)
         }
     
-    def predict_demand_advanced(self, item_name, days_ahead=1):
-        """Advanced prediction with multiple features"""
+    def _forest_inputs(self, item_name, days_ahead=1):
+        """float32 training and prediction arrays for the random forest"""
         X, y = self.prepare_training_data(item_name, days_back=90)
         
         if X is None or len(X) < 14:
-            return self.predict_demand_simple(item_name, days_ahead)
+            return None
         
         # Add more features: rolling averages, trends, etc.
         X_enhanced = self.enhance_features(X, y)
         
-        # Use Random Forest for better accuracy
-        model = RandomForestRegressor(n_estimators=50, random_state=42)
-        model.fit(X_enhanced, y)
-        
         # Prepare prediction features
         tomorrow = datetime.now() + timedelta(days=days_ahead)
         tomorrow_dow = tomorrow.isoweekday()
@@ -127,17 +111,41 @@ class MLModels:
         base_features = np.array([[tomorrow_dow, tomorrow_weekend]])
         enhanced_features = self.enhance_prediction_features(base_features, y)
         
-        prediction = max(0, round(model.predict(enhanced_features)[0]))
-        
+        return (
+            X_enhanced.astype(np.float32),
+            y.astype(np.float32),
+            enhanced_features.astype(np.float32)
+        )
+    
+    def _forest_result(self, item_name, prediction, samples):
         return {
             "item": item_name,
-            "predicted_quantity": prediction,
-            "confidence": self.calculate_confidence(len(X), advanced=True),
+            "predicted_quantity": max(0, round(float(prediction[0]))),
+            "confidence": self.calculate_confidence(samples, advanced=True),
             "model": "random_forest",
-            "training_samples": len(X)
+            "training_samples": samples
         }
     
-    def enhance_features(self, X, y):
+    def predict_demand_advanced(self, item_name, days_ahead=1):
+        """Advanced prediction with multiple features"""
+        inputs = self._forest_inputs(item_name, days_ahead)
+        if inputs is None:
+            return self.predict_demand_simple(item_name, days_ahead)
+        
+        # Use Random Forest for better accuracy
+        return self._forest_result(item_name, fit_forest_predict(*inputs), len(inputs[1]))
+    
+    async def predict_demand_advanced_async(self, item_name, days_ahead=1):
+        """predict_demand_advanced with the forest trained in the ML process pool"""
+        inputs = self._forest_inputs(item_name, days_ahead)
+        if inputs is None:
+            return self.predict_demand_simple(item_name, days_ahead)
+        
+        prediction = await ml_executor.run(fit_forest_predict, *inputs)
+        return self._forest_result(item_name, prediction, len(inputs[1]))
+    
+    @staticmethod
+    def enhance_features(X, y):
         """Add advanced features to training data"""
         X_enhanced = np.copy(X)
         
@@ -150,7 +158,8 @@ class MLModels:
         
         return X_enhanced
     
-    def enhance_prediction_features(self, X, y):
+    @staticmethod
+    def enhance_prediction_features(X, y):
         """Add advanced features for prediction"""
         X_enhanced = np.copy(X)
         
@@ -174,16 +183,7 @@ class MLModels:
     
     def get_baseline_prediction(self, item_name):
         """Fallback prediction when data is scarce"""
-        # Default predictions based on item type
-        baselines = {
-            "Tea": 20,
-            "Coffee": 15,
-            "Samosa": 10,
-            "Biscuit": 8,
-            "Snack": 12
-        }
-        
-        default_qty = baselines.get(item_name, 10)
+        default_qty = BASELINE_DEMAND.get(item_name, 10)
         
         return {
             "item": item_name,
@@ -193,16 +193,51 @@ class MLModels:
             "training_samples": 0
         }
     
+    def _batch_inputs(self, days_ahead=1, days_back=60):
+        """Encode every item's history as flat arrays for batch_linear_forecast"""
+        names = [item['name'] for item in self.items_collection.find(
+            {"store_id": self.store_id, "is_active": True}, {"name": 1}
+        )]
+        code_of = {name: code for code, name in enumerate(names)}
+        rows = [r for r in self.get_historical_data(days_back) if r['_id']['item_name'] in code_of]
+        
+        codes = np.fromiter((code_of[r['_id']['item_name']] for r in rows), dtype=np.int32, count=len(rows))
+        X = np.array([[r['_id']['day_of_week'], r['_id']['is_weekend']] for r in rows], dtype=np.float32).reshape(-1, 2)
+        y = np.fromiter((r['quantity'] for r in rows), dtype=np.float32, count=len(rows))
+        
+        tomorrow_dow = (datetime.now() + timedelta(days=days_ahead)).isoweekday()
+        x_next = np.array([tomorrow_dow, 1 if tomorrow_dow in [6, 7] else 0], dtype=np.float32)
+        return names, (codes, X, y, x_next, len(names))
+    
+    def _batch_results(self, names, predictions, counts):
+        results = []
+        for code, name in enumerate(names):
+            samples = int(counts[code])
+            if samples < 7 or np.isnan(predictions[code]):
+                results.append(self.get_baseline_prediction(name))
+                continue
+            results.append({
+                "item": name,
+                "predicted_quantity": max(0, round(float(predictions[code]))),
+                "confidence": self.calculate_confidence(samples),
+                "model": "linear_regression",
+                "training_samples": samples
+            })
+        return results
+    
     def predict_all_items(self):
         """Predict demand for all items in inventory"""
-        items = list(self.items_collection.find({"is_active": True}))
-        predictions = []
-        
-        for item in items:
-            prediction = self.predict_demand_simple(item['name'])
-            predictions.append(prediction)
-        
-        return predictions
+        names, inputs = self._batch_inputs()
+        if not names:
+            return []
+        return self._batch_results(names, *batch_linear_forecast(*inputs))
+    
+    async def predict_all_items_async(self):
+        """predict_all_items scored as one batch in the ML process pool"""
+        names, inputs = self._batch_inputs()
+        if not names:
+            return []
+        return self._batch_results(names, *(await ml_executor.run(batch_linear_forecast, *inputs)))
     
     def get_peak_hours_analysis(self):
         """Analyze peak hours based on historical data"""
@@ -230,21 +265,21 @@ class MLModels:
     
     def get_waste_reduction_tips(self):
         """Generate waste reduction tips based on sales patterns"""
-        data = self.get_historical_data(7)  # Last week data
-        
         tips = []
         alerts = []
         
-        if not data:
+        # Last week's units per item
+        item_sales = {}
+        line_item_store.ensure_fresh(transaction_store)
+        for item_name, (quantity, _) in line_item_store.item_totals(self.store_id, datetime.now() - timedelta(days=7)).items():
+            item_sales[item_name] = int(round(quantity))
+        
+        if not item_sales:
             tips.append("Start tracking sales data to get personalized recommendations")
             tips.append("Typical advice: Prepare 20% less on Mondays and Tuesdays")
             return {"tips": tips, "alerts": alerts}
         
         # Analyze slow-moving items
-        item_sales = {}
-        for record in data:
-            item_name = record['_id']['item_name']
-            item_sales[item_name] = item_sales.get(item_name, 0) + record['quantity']
         
         # Identify low-performing items
         for item_name, total_sales in item_sales.items():
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+QUADRANT_SUGGESTIONS = {
+    "star": "⭐ {name} is popular and profitable. Keep quality consistent and feature it prominently.",
+    "plowhorse": "🐴 {name} sells well but earns a low margin. Consider a small price increase or a cheaper recipe.",
+    "puzzle": "🧩 {name} is profitable but rarely ordered. Promote it, rename it or move it to a better menu position.",
+    "dog": "❌ {name} is neither popular nor profitable. Consider removing it from the menu.",
+}
+
+# Legacy good/average/poor rating kept for existing clients
+QUADRANT_PERFORMANCE = {"star": "good", "plowhorse": "average", "puzzle": "average", "dog": "poor"}
+
+
+def classify_menu(items, sales, inventory, default_cost_ratio=0.35, popularity_factor=0.7):
+    """Menu-engineering matrix (Kasavana & Smith) for the whole menu in one pass
+
+    items:     [{"id", "name", "price", "category"}]
+    sales:     [{"_id": item_name, "total_quantity", "total_revenue"}]
+    inventory: [{"item_id", "cost_price"}]
+
+    An item is popular when its share of units sold reaches
+    `popularity_factor` / number of items (the 70% rule), and profitable when
+    its contribution margin is at or above the sales-weighted average.
+    Items without a cost price are costed at `default_cost_ratio` of price.
+    """
+    menu = pd.DataFrame(items, columns=["id", "name", "price", "category"])
+    if menu.empty:
+        return menu
+
+    sold = pd.DataFrame(sales, columns=["_id", "total_quantity", "total_revenue"]).rename(
+        columns={"_id": "name", "total_quantity": "quantity_sold", "total_revenue": "revenue"}
+    )
+    costs = pd.DataFrame(inventory, columns=["item_id", "cost_price"]).drop_duplicates("item_id")
+
+    df = menu.merge(sold, on="name", how="left").merge(costs, left_on="id", right_on="item_id", how="left")
+    quantity = df["quantity_sold"].fillna(0).to_numpy(dtype=float)
+    revenue = df["revenue"].fillna(0).to_numpy(dtype=float)
+    list_price = pd.to_numeric(df["price"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    cost_price = pd.to_numeric(df["cost_price"], errors="coerce").to_numpy(dtype=float)
+
+    # Realised selling price where the item sold, menu price otherwise
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unit_price = np.where(quantity > 0, revenue / quantity, list_price)
+    cost_known = ~np.isnan(cost_price)
+    unit_cost = np.where(cost_known, cost_price, unit_price * default_cost_ratio)
+    margin = unit_price - unit_cost
+
+    item_count = len(df)
+    total_quantity = quantity.sum()
+    mix_share = quantity / total_quantity if total_quantity else np.zeros(item_count)
+    popular = mix_share >= popularity_factor / item_count
+    average_margin = (margin * quantity).sum() / total_quantity if total_quantity else margin.mean()
+    profitable = margin >= average_margin
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        food_cost_pct = np.where(unit_price > 0, unit_cost / unit_price * 100, np.nan)
+
+    df["quantity_sold"] = quantity
+    df["revenue"] = revenue
+    df["unit_price"] = unit_price
+    df["unit_cost"] = unit_cost
+    df["cost_known"] = cost_known
+    df["contribution_margin"] = margin
+    df["total_margin"] = margin * quantity
+    df["food_cost_pct"] = food_cost_pct
+    df["menu_mix_pct"] = mix_share * 100
+    # 1.0 means the item sells exactly its "fair share" of units
+    df["popularity_index"] = mix_share * item_count
+    df["quadrant"] = np.select(
+        [popular & profitable, popular & ~profitable, ~popular & profitable],
+        ["star", "plowhorse", "puzzle"],
+        default="dog"
+    )
+    df.attrs["average_margin"] = float(average_margin) if item_count else 0.0
+    df.attrs["popularity_threshold_pct"] = popularity_factor / item_count * 100
+    return df
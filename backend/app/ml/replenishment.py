@@ -0,0 +1,86 @@
+from statistics import NormalDist
+import numpy as np
+
+# Replenishment maths for the whole catalogue in one pass. Like tasks.py,
+# everything here works on flat NumPy arrays (one element per SKU) and never
+# touches the database, so 20k SKUs cost a few array operations.
+
+
+def daily_demand_stats(codes, quantities, n_items, days):
+    """Mean and standard deviation of daily units sold per item code
+
+    codes:      int32 item code per (day, item) row that had sales
+    quantities: units sold in that row
+
+    Days without a row count as zero demand.
+    """
+    days = max(int(days), 1)
+    total = np.bincount(codes, weights=quantities, minlength=n_items)
+    squares = np.bincount(codes, weights=np.square(quantities, dtype=float), minlength=n_items)
+    mean = total / days
+    variance = np.maximum(squares / days - np.square(mean), 0.0)
+    return mean, np.sqrt(variance)
+
+
+def plan_replenishment(stock, daily_demand, demand_std, lead_time_days, unit_cost,
+                       minimum_stock, maximum_stock, order_cost, holding_rate, service_level=0.95,
+                       max_cover_days=None, on_order=None):
+    """Safety stock, reorder point, EOQ and suggested order quantity per SKU
+
+    stock:          units on hand
+    daily_demand:   forecast units per day
+    demand_std:     standard deviation of daily demand
+    lead_time_days: supplier lead time
+    unit_cost:      purchase cost per unit
+    minimum_stock:  floor for the reorder point
+    maximum_stock:  cap on stock after the order arrives (NaN for none)
+    order_cost:     fixed cost of placing one order
+    holding_rate:   yearly holding cost as a fraction of unit cost
+    max_cover_days: cap an order at this many days of demand above the
+                    reorder point (perishables), None for no cap
+    on_order:       units on open purchase orders, not yet received
+
+    safety stock  = z * sigma_d * sqrt(L)
+    reorder point = max(d * L + safety stock, minimum_stock)
+    EOQ           = sqrt(2 * D * S / H), D yearly demand, H = holding_rate * cost
+
+    An item is ordered once its inventory position (stock + on_order) is at
+    or below its reorder point. The order brings the position back above the
+    reorder point and is at least one EOQ, but never pushes it past
+    maximum_stock or max_cover_days. Days of cover count stock on hand only.
+    """
+    stock = np.asarray(stock, dtype=float)
+    position = stock if on_order is None else stock + np.asarray(on_order, dtype=float)
+    daily_demand = np.maximum(np.asarray(daily_demand, dtype=float), 0.0)
+    lead_time_days = np.maximum(np.asarray(lead_time_days, dtype=float), 0.0)
+    unit_cost = np.asarray(unit_cost, dtype=float)
+    maximum_stock = np.asarray(maximum_stock, dtype=float)
+
+    z = NormalDist().inv_cdf(min(max(service_level, 0.5), 0.9999))
+    safety_stock = np.ceil(z * np.asarray(demand_std, dtype=float) * np.sqrt(lead_time_days))
+    reorder_point = np.maximum(np.ceil(daily_demand * lead_time_days) + safety_stock, minimum_stock)
+
+    holding_cost = holding_rate * unit_cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eoq = np.sqrt(2 * daily_demand * 365 * order_cost / holding_cost)
+    # Items without a cost or without demand: just top up to the reorder point
+    eoq = np.where(np.isfinite(eoq), np.ceil(eoq), 0.0)
+
+    needs_order = position <= reorder_point
+    quantity = np.maximum(eoq, reorder_point - position + 1)
+    headroom = np.where(np.isnan(maximum_stock), np.inf, maximum_stock - position)
+    if max_cover_days is not None:
+        headroom = np.minimum(headroom, reorder_point + 1 + np.ceil(daily_demand * max_cover_days) - position)
+    quantity = np.where(needs_order, np.clip(np.minimum(quantity, headroom), 0, None), 0.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(daily_demand > 0, stock / daily_demand, np.inf)
+
+    return {
+        "safety_stock": safety_stock,
+        "reorder_point": reorder_point,
+        "eoq": eoq,
+        "order_quantity": quantity,
+        "order_value": quantity * np.nan_to_num(unit_cost),
+        "days_of_cover": days_of_cover,
+    }
@@ -0,0 +1,60 @@
+import numpy as np
+
+# CPU-bound model work run in the ML process pool. Everything here is a
+# top-level function over NumPy arrays so it pickles cheaply and never
+# touches the database or app state.
+
+
+def fit_forest(X, y, n_estimators=50, random_state=42):
+    """Train the random forest used for advanced per-item demand"""
+    from sklearn.ensemble import RandomForestRegressor
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state)
+    model.fit(X, y)
+    return model
+
+
+def fit_forest_predict(X, y, x_next, n_estimators=50, random_state=42):
+    """Train a random forest on (X, y) and predict the rows of x_next"""
+    return fit_forest(X, y, n_estimators, random_state).predict(x_next)
+
+
+def batch_linear_fit(codes, X, y, n_items, min_samples=7):
+    """One least-squares fit per item code
+
+    codes:  int32 item code per training row (0..n_items-1)
+    X:      float32 feature matrix, one row per training sample
+    y:      float32 target per training row
+
+    Returns (coefficients, sample_counts); coefficients has one row per item
+    (intercept first) and is NaN for items with fewer than `min_samples` rows.
+    """
+    counts = np.bincount(codes, minlength=n_items)
+    coefficients = np.full((n_items, X.shape[1] + 1), np.nan)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+
+    for code in range(n_items):
+        if counts[code] < min_samples:
+            continue
+        rows = order[bounds[code]:bounds[code + 1]]
+        # Intercept column + features, same model as sklearn's LinearRegression
+        design = np.column_stack([np.ones(len(rows)), X[rows]])
+        coefficients[code], *_ = np.linalg.lstsq(design, y[rows], rcond=None)
+    return coefficients, counts
+
+
+def batch_linear_predict(coefficients, x_next):
+    """Score the features of one period (shared by all items) with every fit"""
+    return coefficients @ np.concatenate([[1.0], np.asarray(x_next, dtype=float).ravel()])
+
+
+def batch_linear_forecast(codes, X, y, x_next, n_items, min_samples=7):
+    """batch_linear_fit + batch_linear_predict in a single pool task
+
+    x_next: float32 features of the period to forecast (shared by all items)
+
+    Returns (predictions, sample_counts); predictions are NaN for items with
+    fewer than `min_samples` rows.
+    """
+    coefficients, counts = batch_linear_fit(codes, X, y, n_items, min_samples)
+    return batch_linear_predict(coefficients, x_next), counts
@@ -9,6 +9,7 @@ class InventoryItem(BaseModel):
     maximum_stock: Optional[int] = None
     cost_price: Optional[float] = None
     supplier: Optional[str] = None
+    lead_time_days: Optional[float] = None
     last_restocked: Optional[datetime] = None
     alert_enabled: bool = True
 
@@ -24,6 +25,7 @@ class InventoryUpdate(BaseModel):
     maximum_stock: Optional[int] = None
     cost_price: Optional[float] = None
     supplier: Optional[str] = None
+    lead_time_days: Optional[float] = None
 
 class InventoryAlert(BaseModel):
     item_id: str
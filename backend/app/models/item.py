@@ -24,6 +24,7 @@ class Item(BaseModel):
 
 class ItemInDB(Item):
     id: str
+    store_id: Optional[str] = None
 
 class ItemUpdate(BaseModel):
     name: Optional[str] = None
@@ -12,6 +12,7 @@ class ShopSession(BaseModel):
 
 class ShopSessionInDB(ShopSession):
     id: str
+    store_id: Optional[str] = None
 
 class ShopSessionUpdate(BaseModel):
     end_time: Optional[datetime] = None
@@ -21,9 +21,11 @@ class TransactionInDB(Transaction):
 
 class TransactionResponse(BaseModel):
     id: str
+    store_id: Optional[str] = None
     session_id: str
     items: List[TransactionItem]
     total_amount: float
     payment_mode: str
     timestamp: datetime
+    receipt_number: Optional[str] = None
     change_given: Optional[float] = None
\ No newline at end of file
@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.core.database import get_aggregate_buckets_collection, get_transactions_collection, get_transaction_buckets_collection
+from app.services.transaction_store import transaction_store, hour_of, key_values
+
+# Metrics kept per store and hour, and the shape of their rows
+ITEM_LINES = "item_lines"  # [item_name, quantity, revenue]
+SALES = "sales"            # [total_sales, transaction_count]
+METRICS = (ITEM_LINES, SALES)
+
+HOUR = timedelta(hours=1)
+
+
+class AggregateCache:
+    """Per-hour aggregates of closed hours, computed once and kept in `aggregate_buckets`
+
+    A requested range splits into whole closed hours, read from the cache
+    (missing ones are computed with one query per run and stored), and the
+    partial first hour plus the still-open hours at the end, computed live.
+    An hour counts as closed AGGREGATE_CACHE_GRACE_SECONDS after it ends,
+    so sales committed right at the boundary are not missed.
+
+    Cache documents look like {store_id, metric, hour, rows, version}.
+    Sales written into a closed hour (batch catch-up from an offline till)
+    must call invalidate(): it clears the hour's rows and bumps its version,
+    and a computation that started before the bump is not stored, because
+    stores only match the version read before computing.
+    """
+
+    def __init__(self, grace_seconds=None, max_gap_hours=24):
+        self.grace_seconds = settings.AGGREGATE_CACHE_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        self.max_gap_hours = max_gap_hours
+        self.hits = 0
+        self.misses = 0
+
+    def closed_until(self, now=None):
+        """Start of the first hour that may still receive sales"""
+        return hour_of((now or datetime.now()) - timedelta(seconds=self.grace_seconds))
+
+    @staticmethod
+    def _within(by_hour, start, end):
+        return [(hour, row) for hour, rows in sorted(by_hour.items()) if start <= hour < end for row in rows]
+
+    def rows(self, store_id, metric, start, end, compute):
+        """[(hour, row)] for every hour in [start, end], oldest first
+
+        compute(start, end) returns {hour: [row, ...]} for the sales in that
+        range; it is called for the live edges and for missing closed hours.
+        """
+        first_full = start if start == hour_of(start) else hour_of(start) + HOUR
+        if end < first_full:
+            return self._within(compute(start, end), hour_of(start), first_full)
+        full_end = max(first_full, min(self.closed_until(), hour_of(end)))
+
+        rows = []
+        if start < first_full:
+            rows += self._within(compute(start, first_full), hour_of(start), first_full)
+        if first_full < full_end:
+            rows += self._closed_rows(store_id, metric, first_full, full_end, compute)
+        rows += self._within(compute(full_end, end), full_end, hour_of(end) + HOUR)
+        return rows
+
+    def _closed_rows(self, store_id, metric, start, end, compute):
+        collection = get_aggregate_buckets_collection()
+        cached, versions = {}, {}
+        for doc in collection.find({"store_id": store_id, "metric": metric, "hour": {"$gte": start, "$lt": end}}):
+            versions[doc["hour"]] = doc.get("version", 0)
+            if doc.get("rows") is not None:
+                cached[doc["hour"]] = doc["rows"]
+
+        missing = []
+        hour = start
+        while hour < end:
+            if hour not in cached:
+                missing.append(hour)
+            hour += HOUR
+        self.hits += len(cached)
+        self.misses += len(missing)
+
+        if missing:
+            # One query per run of missing hours; short gaps are recomputed rather than split on
+            computed = {}
+            run_start = previous = missing[0]
+            for hour in missing[1:] + [None]:
+                if hour is None or hour - previous > timedelta(hours=self.max_gap_hours):
+                    computed.update(compute(run_start, previous + HOUR))
+                    run_start = hour
+                previous = hour
+            operations = []
+            for hour in missing:
+                cached[hour] = computed.get(hour, [])
+                operations.append(UpdateOne(
+                    {"store_id": store_id, "metric": metric, "hour": hour, "version": versions.get(hour, 0)},
+                    {"$set": {"rows": cached[hour], "computed_at": datetime.now()}},
+                    upsert=True
+                ))
+            try:
+                collection.bulk_write(operations, ordered=False)
+            except BulkWriteError:
+                # Hours invalidated while computing keep their tombstone
+                pass
+        return self._within(cached, start, end)
+
+    def invalidate(self, store_id, timestamps):
+        """Drop cached hours that sales with these timestamps were written into"""
+        closed_until = self.closed_until()
+        hours = {hour_of(t) for t in timestamps if isinstance(t, datetime) and hour_of(t) < closed_until}
+        if not hours:
+            return 0
+        get_aggregate_buckets_collection().bulk_write([
+            UpdateOne(
+                {"store_id": store_id, "metric": metric, "hour": hour},
+                {"$set": {"rows": None}, "$inc": {"version": 1}},
+                upsert=True
+            )
+            for hour in sorted(hours) for metric in METRICS
+        ], ordered=False)
+        return len(hours)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "grace_seconds": self.grace_seconds}
+
+
+aggregate_cache = AggregateCache()
+
+
+def _by_hour(results, values):
+    by_hour = {}
+    for result in results:
+        hour = datetime.strptime(result["_id"]["date"], "%Y-%m-%d") + timedelta(hours=result["_id"]["hour"])
+        by_hour.setdefault(hour, []).append(values(result))
+    return by_hour
+
+
+def hourly_item_lines(store_id, start, end):
+    """[(hour, [item_name, quantity, revenue])] over both storage tiers, cached per closed hour"""
+    # archive_service brings pandas; invalidate() callers shouldn't pay for it
+    from app.services.archive_service import transaction_archive, union_grouped
+    keys = ("date", "hour", "item_name")
+
+    def compute(range_start, range_end):
+        hot = transaction_store.group_line_items(store_id, range_start, range_end, keys=keys)
+        cold = transaction_archive.group_line_items(range_start, range_end, keys=keys, store_id=store_id)
+        return _by_hour(
+            union_grouped(hot, cold, ["quantity", "revenue"]),
+            lambda r: [r["_id"]["item_name"], r["quantity"], r["revenue"]]
+        )
+
+    return aggregate_cache.rows(store_id, ITEM_LINES, start, end, compute)
+
+
+def regroup_item_lines(rows, keys, quantity_field="quantity", revenue_field="revenue"):
+    """hourly_item_lines() rows summed into group_line_items-shaped results for other keys"""
+    grouped = {}
+    for hour, (item_name, quantity, revenue) in rows:
+        values = key_values(hour, item_name)
+        key = tuple(values[k] for k in keys)
+        totals = grouped.setdefault(key, [0, 0.0])
+        totals[0] += quantity
+        totals[1] += revenue
+    return [
+        {"_id": dict(zip(keys, key)), quantity_field: quantity, revenue_field: revenue}
+        for key, (quantity, revenue) in grouped.items()
+    ]
+
+
+def _bucketed_sales(store_id, start, end):
+    """hourly_sales() results for the sales kept in hourly buckets"""
+    grouped = {}
+    for bucket in get_transaction_buckets_collection().find(
+        {"store_id": store_id, "hour": {"$gte": hour_of(start), "$lte": end}},
+        {"sales.timestamp": 1, "sales.total_amount": 1}
+    ):
+        for sale in bucket.get("sales", []):
+            if start <= sale["timestamp"] <= end:
+                totals = grouped.setdefault((sale["timestamp"].strftime("%Y-%m-%d"), sale["timestamp"].hour), [0.0, 0])
+                totals[0] += sale.get("total_amount", 0)
+                totals[1] += 1
+    return [
+        {"_id": {"date": date, "hour": hour}, "total_sales": total_sales, "transaction_count": count}
+        for (date, hour), (total_sales, count) in grouped.items()
+    ]
+
+
+def hourly_sales(store_id, start, end):
+    """[(hour, [total_sales, transaction_count])] from both hot layouts, cached per closed hour"""
+    from app.services.archive_service import union_grouped
+
+    def compute(range_start, range_end):
+        pipeline = [
+            {"$match": {"store_id": store_id, "timestamp": {"$gte": range_start, "$lte": range_end}}},
+            {
+                "$group": {
+                    "_id": {
+                        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                        "hour": {"$hour": "$timestamp"}
+                    },
+                    "total_sales": {"$sum": "$total_amount"},
+                    "transaction_count": {"$sum": 1}
+                }
+            }
+        ]
+        results = list(get_transactions_collection().aggregate(pipeline))
+        if transaction_store.bucketed:
+            results = union_grouped(results, _bucketed_sales(store_id, range_start, range_end), ["total_sales", "transaction_count"])
+        return _by_hour(results, lambda r: [r["total_sales"], r["transaction_count"]])
+
+    return aggregate_cache.rows(store_id, SALES, start, end, compute)
@@ -0,0 +1,402 @@
+import os
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import pandas as pd
+from app.core.config import settings
+from app.core.database import get_transactions_collection, is_mongo_available
+from app.core.shared_state import shared_state
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    print("Warning: pyarrow not installed. Transaction archiving is disabled.")
+
+# One row per transaction line item. Transaction level fields are repeated on
+# every line; line_no == 0 marks the row that carries the transaction total.
+ARCHIVE_COLUMNS = [
+    "transaction_id", "store_id", "session_id", "timestamp", "total_amount", "payment_mode",
+    "customer_id", "line_no", "item_id", "item_name", "quantity", "price", "total"
+]
+
+MANIFEST_FILE = "manifest.json"
+
+
+class TransactionArchive:
+    """Cold tier for old transactions, stored as date partitioned Parquet files"""
+
+    def __init__(self, base_dir=None):
+        self.base_dir = os.path.join(base_dir or settings.ARCHIVE_DIR, "transactions")
+        self._manifest = None
+        # (inode, mtime) of the manifest file the cached copy was read from;
+        # saves replace the file, so the inode changes even within one mtime tick
+        self._manifest_stamp = None
+        self._schedule_thread = None
+        self.worker_id = uuid.uuid4().hex
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+    def _manifest_path(self):
+        return os.path.join(self.base_dir, MANIFEST_FILE)
+
+    def get_manifest(self):
+        """Load the manifest, re-reading it whenever another worker has replaced the file"""
+        path = self._manifest_path()
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if self._manifest is None or stamp != self._manifest_stamp:
+            if stamp is not None:
+                with open(path) as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {"version": 1, "partitions": {}, "archived_through": None}
+            self._manifest_stamp = stamp
+        return self._manifest
+
+    def _save_manifest(self, manifest):
+        manifest["updated_at"] = datetime.now().isoformat()
+        os.makedirs(self.base_dir, exist_ok=True)
+        tmp_path = self._manifest_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+        self._manifest = manifest
+        stat = os.stat(self._manifest_path())
+        self._manifest_stamp = (stat.st_ino, stat.st_mtime_ns)
+
+    def archived_through(self):
+        """Timestamp before which all transactions live in the cold tier"""
+        value = self.get_manifest().get("archived_through")
+        return datetime.fromisoformat(value) if value else None
+
+    def partitions(self, start=None, end=None):
+        """Partitions overlapping [start, end], pruned using the manifest only"""
+        selected = []
+        for date_key, info in sorted(self.get_manifest()["partitions"].items()):
+            if start and datetime.fromisoformat(info["max_ts"]) < start:
+                continue
+            if end and datetime.fromisoformat(info["min_ts"]) > end:
+                continue
+            selected.append(info)
+        return selected
+
+    # ------------------------------------------------------------------
+    # Archiving
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _flatten(transaction):
+        """Turn one transaction document into line item rows"""
+        base = {
+            "transaction_id": str(transaction.get("_id", transaction.get("id", ""))),
+            "store_id": transaction.get("store_id", settings.DEFAULT_STORE_ID),
+            "session_id": str(transaction.get("session_id", "")),
+            "timestamp": transaction["timestamp"],
+            "total_amount": float(transaction.get("total_amount", 0)),
+            "payment_mode": transaction.get("payment_mode", ""),
+            "customer_id": str(transaction["customer_id"]) if transaction.get("customer_id") else None,
+        }
+        items = transaction.get("items") or [{}]
+        rows = []
+        for line_no, item in enumerate(items):
+            quantity = item.get("quantity", 0)
+            price = item.get("price", 0.0)
+            rows.append({
+                **base,
+                "line_no": line_no,
+                "item_id": str(item["item_id"]) if item.get("item_id") else None,
+                "item_name": item.get("item_name"),
+                "quantity": int(quantity),
+                "price": float(price),
+                "total": float(item.get("total", price * quantity)),
+            })
+        return rows
+
+    def _write_partition(self, date_key, rows):
+        """Write (or merge into) the Parquet file for a single day"""
+        manifest = self.get_manifest()
+        relative_path = os.path.join(f"date={date_key}", "data.parquet")
+        path = os.path.join(self.base_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        df = pd.DataFrame(rows, columns=ARCHIVE_COLUMNS)
+        if date_key in manifest["partitions"] and os.path.exists(path):
+            # Re-running after an interrupted archive must not duplicate rows
+            existing = pq.read_table(path).to_pandas()
+            if "store_id" not in existing:
+                existing["store_id"] = settings.DEFAULT_STORE_ID
+            df = pd.concat([existing, df]).drop_duplicates(["transaction_id", "line_no"], keep="last")
+
+        df = df.sort_values("timestamp")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, path, compression="zstd", row_group_size=50000)
+
+        first_lines = df[df["line_no"] == 0]
+        manifest["partitions"][date_key] = {
+            "date": date_key,
+            "path": relative_path,
+            "rows": int(len(df)),
+            "transactions": int(len(first_lines)),
+            "total_amount": float(first_lines["total_amount"].sum()),
+            "min_ts": df["timestamp"].min().isoformat(),
+            "max_ts": df["timestamp"].max().isoformat(),
+        }
+
+    def _write_batch(self, transactions):
+        """Write one batch of sales into their day partitions and save the manifest"""
+        rows_by_date = {}
+        for transaction in transactions:
+            date_key = transaction["timestamp"].strftime("%Y-%m-%d")
+            rows_by_date.setdefault(date_key, []).extend(self._flatten(transaction))
+        for date_key, rows in rows_by_date.items():
+            self._write_partition(date_key, rows)
+        self._save_manifest(self.get_manifest())
+        return rows_by_date.keys()
+
+    def archive(self, older_than_days=None, batch_size=5000):
+        """Move transactions older than the configured age into Parquet
+
+        Works through at most `batch_size` sales at a time: each batch is
+        written, its partitions recorded in the manifest, and only then its
+        hot copies deleted, so memory stays bounded and an interrupted run
+        can simply be re-run. Readers find cold rows through the recorded
+        partitions; archived_through is only moved once the run completes.
+        Call it through run_exclusive() so two runs never overlap.
+        """
+        if not PYARROW_AVAILABLE:
+            return {"archived": 0, "partitions": [], "message": "pyarrow is not installed"}
+
+        collection = get_transactions_collection()
+        days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+        # Only archive whole days so a partition is never split between tiers
+        cutoff = (datetime.now() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        archived = 0
+        dates = set()
+        while True:
+            # Deleted batches drop out of the query, so each find returns the next one
+            batch = list(collection.find({"timestamp": {"$lt": cutoff}}).sort("timestamp", 1).limit(batch_size))
+            if not batch:
+                break
+            dates.update(self._write_batch(batch))
+            collection.delete_many({"_id": {"$in": [transaction["_id"] for transaction in batch]}})
+            archived += len(batch)
+
+        # Sales kept in hourly buckets (TRANSACTION_STORAGE=buckets); the
+        # cutoff is midnight, so buckets are never split between tiers
+        from app.services.transaction_store import transaction_store
+        while True:
+            bucketed, drop_buckets = transaction_store.pop_before(cutoff, max(1, batch_size // transaction_store.max_sales))
+            if not bucketed:
+                break
+            dates.update(self._write_batch(bucketed))
+            drop_buckets()
+            archived += len(bucketed)
+
+        # Written last: everything before the cutoff has now left the hot tier
+        manifest = self.get_manifest()
+        previous = self.archived_through()
+        if previous is None or cutoff > previous:
+            manifest["archived_through"] = cutoff.isoformat()
+        self._save_manifest(manifest)
+
+        return {
+            "archived": archived,
+            "partitions": sorted(dates),
+            "archived_through": manifest["archived_through"]
+        }
+
+    def run_exclusive(self, older_than_days=None, max_seconds=3600):
+        """archive() under the shared "archive:running" lease; None if another run holds it
+
+        Scheduled and on-demand runs both go through here, on any worker.
+        The lease expires after max_seconds in case its holder dies.
+        """
+        holder, version = shared_state.get_versioned("archive:running")
+        if holder is not None or not shared_state.compare_and_set("archive:running", self.worker_id, version, ttl=max_seconds):
+            return None
+        try:
+            return self.archive(older_than_days)
+        finally:
+            holder, version = shared_state.get_versioned("archive:running")
+            if holder == self.worker_id:
+                shared_state.compare_and_set("archive:running", None, version)
+
+    def start_schedule(self, interval_hours=None):
+        """Archive old sales every ARCHIVE_SCHEDULE_HOURS, from one worker at a time"""
+        interval = (interval_hours or settings.ARCHIVE_SCHEDULE_HOURS) * 3600
+        if self._schedule_thread is not None or interval <= 0 or not PYARROW_AVAILABLE:
+            return
+
+        def run():
+            while True:
+                try:
+                    holder, version = shared_state.get_versioned("archive:lease")
+                    if is_mongo_available() and holder is None and shared_state.compare_and_set("archive:lease", self.worker_id, version, ttl=interval):
+                        started = time.perf_counter()
+                        result = self.run_exclusive()
+                        if result is not None:
+                            print(f"Archived {result['archived']} sales in {(time.perf_counter() - started) * 1000:.0f} ms")
+                except Exception as e:
+                    print(f"Archive job failed: {e}")
+                time.sleep(min(interval, 3600))
+
+        self._schedule_thread = threading.Thread(target=run, name="transaction-archive", daemon=True)
+        self._schedule_thread.start()
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+    def scan(self, start=None, end=None, columns=None, store_id=None):
+        """Read archived line items in [start, end] as a DataFrame, optionally for one outlet"""
+        if not PYARROW_AVAILABLE:
+            return pd.DataFrame(columns=columns or ARCHIVE_COLUMNS)
+
+        partitions = self.partitions(start, end)
+        if not partitions:
+            return pd.DataFrame(columns=columns or ARCHIVE_COLUMNS)
+
+        filters = []
+        if start:
+            filters.append(("timestamp", ">=", pd.Timestamp(start)))
+        if end:
+            filters.append(("timestamp", "<=", pd.Timestamp(end)))
+
+        frames = []
+        for info in partitions:
+            path = os.path.join(self.base_dir, info["path"])
+            # Partitions written before multi-store support have no store_id
+            # column; everything in them belongs to the default store
+            has_store = "store_id" in pq.read_schema(path).names
+            if store_id and not has_store and store_id != settings.DEFAULT_STORE_ID:
+                continue
+            partition_filters = list(filters)
+            if store_id and has_store:
+                partition_filters.append(("store_id", "==", store_id))
+            # Row group statistics let pyarrow skip blocks outside the range
+            table = pq.read_table(
+                path,
+                columns=[c for c in columns if c != "store_id" or has_store] if columns else None,
+                filters=partition_filters or None
+            )
+            df = table.to_pandas()
+            if not has_store and (columns is None or "store_id" in columns):
+                df["store_id"] = settings.DEFAULT_STORE_ID
+            frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=columns or ARCHIVE_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def needs_scan(self, start=None):
+        """Whether a query starting at `start` can touch the cold tier
+
+        Decided from the recorded partitions rather than archived_through,
+        so rows moved by a run that is still going (or died) are found.
+        """
+        return bool(self.partitions(start))
+
+    def group_line_items(self, start=None, end=None, keys=("item_name",),
+                         quantity_field="quantity", revenue_field="revenue", store_id=None):
+        """Cold equivalent of a `$unwind: $items` + `$group` pipeline
+
+        Returns documents shaped like the Mongo output, e.g.
+        {"_id": {"hour": 9, "item_name": "Tea"}, "quantity": 12, "revenue": 240.0}
+        """
+        if not self.needs_scan(start):
+            return []
+
+        df = self.scan(start, end, columns=["timestamp", "item_name", "quantity", "total"], store_id=store_id)
+        df = df[df["item_name"].notna()]
+        if df.empty:
+            return []
+
+        ts = pd.to_datetime(df["timestamp"])
+        # Mongo's $dayOfWeek: 1 = Sunday ... 7 = Saturday
+        day_of_week = (ts.dt.dayofweek + 1) % 7 + 1
+        derived = {
+            "hour": ts.dt.hour,
+            "date": ts.dt.strftime("%Y-%m-%d"),
+            "day_of_week": day_of_week,
+            "is_weekend": day_of_week.isin([6, 7]).astype(int),
+            "item_name": df["item_name"],
+        }
+        keyed = pd.DataFrame({key: derived[key] for key in keys})
+        keyed["quantity"] = df["quantity"].values
+        keyed["total"] = df["total"].values
+        grouped = keyed.groupby(list(keys), as_index=False)[["quantity", "total"]].sum()
+
+        return [
+            {
+                "_id": {key: _to_python(row[key]) for key in keys},
+                quantity_field: _to_python(row["quantity"]),
+                revenue_field: float(row["total"])
+            }
+            for row in grouped.to_dict("records")
+        ]
+
+    def load_transactions(self, start=None, end=None, store_id=None):
+        """Rebuild transaction documents from archived line items"""
+        if not self.needs_scan(start):
+            return []
+
+        df = self.scan(start, end, store_id=store_id)
+        transactions = []
+        for transaction_id, lines in df.sort_values(["timestamp", "line_no"]).groupby("transaction_id", sort=False):
+            first = lines.iloc[0]
+            transactions.append({
+                "_id": transaction_id,
+                "store_id": first["store_id"],
+                "session_id": first["session_id"],
+                "timestamp": first["timestamp"].to_pydatetime(),
+                "total_amount": float(first["total_amount"]),
+                "payment_mode": first["payment_mode"],
+                "customer_id": first["customer_id"],
+                "items": [
+                    {
+                        "item_id": line["item_id"],
+                        "item_name": line["item_name"],
+                        "quantity": int(line["quantity"]),
+                        "price": float(line["price"]),
+                        "total": float(line["total"])
+                    }
+                    for line in lines.to_dict("records") if line["item_name"] is not None
+                ],
+                "archived": True
+            })
+        return transactions
+
+
+def _to_python(value):
+    """Convert NumPy scalars so results stay JSON serialisable"""
+    return value.item() if hasattr(value, "item") else value
+
+
+def union_grouped(hot_results, cold_results, sum_fields, sort_key=None):
+    """Merge hot (Mongo) and cold (Parquet) grouped results by their `_id`"""
+    if not cold_results:
+        return hot_results
+
+    merged = {}
+    for result in list(hot_results) + list(cold_results):
+        key = tuple(sorted(result["_id"].items())) if isinstance(result["_id"], dict) else result["_id"]
+        if key not in merged:
+            merged[key] = dict(result)
+        else:
+            for field in sum_fields:
+                merged[key][field] = merged[key].get(field, 0) + result.get(field, 0)
+
+    results = list(merged.values())
+    if sort_key:
+        results.sort(key=sort_key)
+    return results
+
+
+transaction_archive = TransactionArchive()
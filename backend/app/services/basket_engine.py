@@ -0,0 +1,173 @@
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from app.core.config import settings
+
+
+class CoOccurrenceIndex:
+    """Sparse item x item co-occurrence counts for "customers also bought"
+
+    Counts are kept symmetric (pairs[a][b] == pairs[b][a]) so looking up the
+    neighbours of a cart item is a single dict access. Items are keyed by
+    name, which is unique in the catalogue and identical across tills.
+
+    Rebuilds count into a separate index (call them from a worker thread)
+    and swap the result in, so checkouts keep adding baskets meanwhile.
+    """
+
+    def __init__(self, max_pairs=None):
+        self.max_pairs = max_pairs or settings.BASKET_MAX_PAIRS
+        self.basket_count = 0
+        self.item_counts = Counter()
+        self.pairs = {}
+        self.pair_count = 0
+        self.prune_below = 1
+        self.is_built = False
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def reset(self):
+        self.basket_count = 0
+        self.item_counts = Counter()
+        self.pairs = {}
+        self.pair_count = 0
+        self.prune_below = 1
+
+    def add_basket(self, item_names):
+        """Fold one sale into the counts; O(k^2) in the basket size only"""
+        with self._lock:
+            self._add(item_names)
+
+    def _add(self, item_names):
+        basket = sorted({name for name in item_names if name})
+        if not basket:
+            return
+        self.basket_count += 1
+        self.item_counts.update(basket)
+        for i, a in enumerate(basket):
+            for b in basket[i + 1:]:
+                neighbours_a = self.pairs.setdefault(a, Counter())
+                if b not in neighbours_a:
+                    self.pair_count += 1
+                neighbours_a[b] += 1
+                self.pairs.setdefault(b, Counter())[a] += 1
+
+        if self.pair_count > self.max_pairs:
+            self.prune()
+
+    def prune(self):
+        """Drop rare pairs until the matrix is back under 80% of max_pairs
+
+        The cut-off starts at 2 (pairs seen once) and is raised only as far as
+        needed, so pruning runs once per ~20% growth rather than per sale.
+        """
+        target = int(self.max_pairs * 0.8)
+        cutoff = 1
+        while self.pair_count > target:
+            cutoff += 1
+            removed = 0
+            for a in list(self.pairs):
+                neighbours = self.pairs[a]
+                rare = [b for b, count in neighbours.items() if count < cutoff]
+                for b in rare:
+                    del neighbours[b]
+                removed += len(rare)
+                if not neighbours:
+                    del self.pairs[a]
+            # Each pair is stored in both directions
+            self.pair_count -= removed // 2
+        self.prune_below = cutoff
+        print(f"Basket index pruned pairs seen fewer than {cutoff} times ({self.pair_count} pairs kept)")
+
+    def rebuild(self, baskets):
+        """Full rebuild from an iterable of item-name lists"""
+        fresh = CoOccurrenceIndex(self.max_pairs)
+        for basket in baskets:
+            fresh._add(basket)
+        with self._lock:
+            self.basket_count = fresh.basket_count
+            self.item_counts = fresh.item_counts
+            self.pairs = fresh.pairs
+            self.pair_count = fresh.pair_count
+            self.prune_below = fresh.prune_below
+            self.is_built = True
+            self.built_at = datetime.now()
+        return self.stats()
+
+    def ensure_built(self, loader):
+        """Build once; concurrent first requests wait for a single build"""
+        if self.is_built:
+            return
+        with self._build_lock:
+            if not self.is_built:
+                self.rebuild(loader())
+
+    def pair_stats(self, a, b):
+        """Support, confidence (a -> b) and lift for one item pair"""
+        together = self.pairs.get(a, {}).get(b, 0)
+        count_a = self.item_counts.get(a, 0)
+        count_b = self.item_counts.get(b, 0)
+        n = self.basket_count
+        support = together / n if n else 0.0
+        confidence = together / count_a if count_a else 0.0
+        lift = confidence / (count_b / n) if n and count_b else 0.0
+        return {
+            "antecedent": a,
+            "consequent": b,
+            "baskets_together": together,
+            "support": round(support, 6),
+            "confidence": round(confidence, 4),
+            "lift": round(lift, 4)
+        }
+
+    def recommend(self, cart, k=5, min_count=None):
+        """Top-k items to suggest for a cart, ranked by confidence then lift"""
+        min_count = settings.BASKET_MIN_PAIR_COUNT if min_count is None else min_count
+        cart = {name for name in cart if name}
+        n = self.basket_count
+        best = {}
+        for a in cart:
+            count_a = self.item_counts.get(a, 0)
+            if not count_a:
+                continue
+            for b, together in self.pairs.get(a, {}).items():
+                if b in cart or together < min_count:
+                    continue
+                confidence = together / count_a
+                lift = confidence * n / self.item_counts[b]
+                if b not in best or (confidence, lift) > best[b][:2]:
+                    best[b] = (confidence, lift, a, together)
+
+        top = heapq.nlargest(k, best.items(), key=lambda x: (x[1][0], x[1][1]))
+        return [
+            {
+                "item_name": b,
+                "because_of": a,
+                "baskets_together": together,
+                "confidence": round(confidence, 4),
+                "lift": round(lift, 4)
+            }
+            for b, (confidence, lift, a, together) in top
+        ]
+
+    def stats(self):
+        return {
+            "baskets": self.basket_count,
+            "items": len(self.item_counts),
+            "pairs": self.pair_count,
+            "prune_below": self.prune_below,
+            "built_at": self.built_at.isoformat() if self.built_at else None
+        }
+
+
+def transaction_baskets(source, days=None):
+    """Stream item-name baskets from the TransactionStore (either storage layout)"""
+    days = settings.BASKET_REBUILD_DAYS if days is None else days
+    start = datetime.now() - timedelta(days=days) if days else None
+    for transaction in source.sales_since(start=start, fields=("items.item_name",)):
+        yield [item.get("item_name") for item in transaction.get("items", [])]
+
+
+basket_index = CoOccurrenceIndex()
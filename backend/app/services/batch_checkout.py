@@ -0,0 +1,312 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.core.database import record_mongo_error
+from app.core.stores import store_filter
+from app.services.receipt_numbers import receipt_numbers
+from app.services.session_snapshot import session_counter_increments
+from app.services.stock_ledger import stock_ledger
+from app.services.transaction_store import transaction_store
+
+# Tills that were offline upload their queued sales in one request. The
+# whole batch is validated up front and written with one insert_many per
+# collection plus one bulk_write of aggregated $incs per collection, so a
+# few hundred sales cost a handful of round trips instead of ~7 each.
+
+DUPLICATE_KEY = 11000
+# Clock skew tolerated on till timestamps before a sale counts as "future"
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def normalize_items(items):
+    """Accept both the frontend ({id, name}) and backend ({item_id, item_name}) line formats"""
+    normalized_items = []
+    for item in items:
+        if "item_id" in item:
+            normalized_items.append({
+                "item_id": item["item_id"],
+                "item_name": item.get("item_name", item.get("name", "Unknown")),
+                "quantity": item["quantity"],
+                "price": item["price"],
+                "total": item.get("total", item["price"] * item["quantity"])
+            })
+        else:
+            normalized_items.append({
+                "item_id": item.get("id", item.get("item_id", "")),
+                "item_name": item.get("name", "Unknown"),
+                "quantity": item.get("quantity", 1),
+                "price": item.get("price", 0.0),
+                "total": item.get("total", item.get("price", 0.0) * item.get("quantity", 1))
+            })
+    return normalized_items
+
+
+def _parse_timestamp(value, now):
+    if value in (None, ""):
+        return now
+    timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if timestamp.tzinfo is not None:
+        # Stored timestamps are naive local time, like datetime.now()
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise ValueError("timestamp is in the future")
+    return timestamp
+
+
+def parse_sale(sale, store_id, session_id, now=None):
+    """Validate one queued sale and build its transaction document
+
+    Raises ValueError with a message meant for the till.
+    """
+    if not isinstance(sale, dict):
+        raise ValueError("sale must be an object")
+    key = sale.get("idempotency_key")
+    if not isinstance(key, str) or not key.strip() or len(key) > 128:
+        raise ValueError("idempotency_key is required (1-128 characters)")
+
+    raw_items = sale.get("items")
+    if not isinstance(raw_items, list) or not raw_items:
+        raise ValueError("items must be a non-empty list")
+    try:
+        items = normalize_items(raw_items)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"malformed item: {e}")
+    for item in items:
+        if not item["item_id"] or not isinstance(item["item_id"], (str, int)):
+            raise ValueError("every item needs an id")
+        if not isinstance(item["quantity"], int) or isinstance(item["quantity"], bool) or item["quantity"] <= 0:
+            raise ValueError(f"quantity of {item['item_name']} must be a positive integer")
+        if not isinstance(item["price"], (int, float)) or item["price"] < 0:
+            raise ValueError(f"price of {item['item_name']} must be a non-negative number")
+
+    total_amount = sale.get("total_amount", sum(item["total"] for item in items))
+    if not isinstance(total_amount, (int, float)) or total_amount < 0:
+        raise ValueError("total_amount must be a non-negative number")
+
+    return {
+        "store_id": store_id,
+        "session_id": session_id,
+        "items": items,
+        "total_amount": total_amount,
+        "payment_mode": sale.get("payment_method") or sale.get("payment_mode", "cash"),
+        # Keep the till's sale time so hourly reports and forecasts stay right
+        "timestamp": _parse_timestamp(sale.get("timestamp"), now or datetime.now()),
+        "customer_id": sale.get("customer_id"),
+        "idempotency_key": key.strip()
+    }
+
+
+def kitchen_order_for(transaction, table, now=None):
+    """Kitchen ticket for a sale; old catch-up sales are filed as already served"""
+    now = now or datetime.now()
+    stale = now - transaction["timestamp"] > timedelta(minutes=settings.BATCH_KITCHEN_WINDOW_MINUTES)
+    return {
+        "store_id": transaction["store_id"],
+        "transaction_id": str(transaction.get("_id", transaction.get("id", "unknown"))),
+        "table": table,
+        "items": [{"name": i["item_name"], "qty": i["quantity"]} for i in transaction["items"]],
+        "status": "served" if stale else "pending",
+        "time": transaction["timestamp"].strftime("%H:%M"),
+        "priority": "normal",
+        "timestamp": transaction["timestamp"]
+    }
+
+
+def merge_increments(target, increments):
+    for field, amount in increments.items():
+        target[field] = target.get(field, 0) + amount
+    return target
+
+
+def aggregate_totals(transactions):
+    """Fold a batch of transaction documents into per-item, per-customer and session increments
+
+    Returns (stock sold per item id, {customer_id: totals}, session $inc fields).
+    """
+    stock = defaultdict(int)
+    customers = {}
+    session_inc = {"total_sales": 0, "transaction_count": 0}
+
+    for doc in transactions:
+        for item in doc["items"]:
+            stock[str(item["item_id"])] += int(item["quantity"])
+        session_inc["total_sales"] += doc["total_amount"]
+        session_inc["transaction_count"] += 1
+        merge_increments(session_inc, session_counter_increments(
+            doc["items"], doc["total_amount"], doc["payment_mode"], doc["timestamp"]
+        ))
+        customer_id = doc.get("customer_id")
+        if customer_id:
+            totals = customers.setdefault(customer_id, {"total_spent": 0, "visit_count": 0, "last_visit": doc["timestamp"]})
+            totals["total_spent"] += doc["total_amount"]
+            totals["visit_count"] += 1
+            totals["last_visit"] = max(totals["last_visit"], doc["timestamp"])
+    return stock, customers, session_inc
+
+
+def customer_filter(customer_id):
+    if isinstance(customer_id, str) and ObjectId.is_valid(customer_id):
+        return {"_id": ObjectId(customer_id)}
+    return {"id": customer_id}
+
+
+class BatchCheckout:
+    """Validate and write a batch of queued sales against MongoDB"""
+
+    def __init__(self, database):
+        self.database = database
+
+    def existing_keys(self, store_id, keys):
+        """Map idempotency keys already recorded for this store to their transaction ids"""
+        # Both layouts: documents and hourly buckets (TRANSACTION_STORAGE)
+        return transaction_store.existing_keys(store_id, keys)
+
+    def unknown_items(self, store_id, item_ids):
+        """Ids among item_ids that are not items of this store, in one query"""
+        object_ids = {item_id: ObjectId(str(item_id)) for item_id in item_ids if ObjectId.is_valid(str(item_id))}
+        found = {
+            str(doc["_id"])
+            for doc in self.database["items"].find(
+                store_filter(store_id, {"_id": {"$in": list(object_ids.values())}}), {"_id": 1}
+            )
+        } if object_ids else set()
+        return {item_id for item_id in item_ids if str(item_id) not in found}
+
+    def commit(self, store_id, session_id, sales):
+        """Write a batch of raw sales; returns (results, inserted transactions)
+
+        Every sale gets a result, in request order, with status "created",
+        "duplicate" (idempotency key already seen; id of the original) or
+        "invalid" (error says why). Only created sales touch stock, session
+        and customer totals.
+
+        Once sales are stored a retry would only report them as duplicates,
+        so failures of the totals or kitchen tickets after the insert do not
+        raise; the created results carry a `warning` instead.
+        """
+        now = datetime.now()
+        results = [None] * len(sales)
+        pending = []
+        seen = {}
+
+        for index, sale in enumerate(sales):
+            try:
+                doc = parse_sale(sale, store_id, session_id, now)
+            except ValueError as e:
+                key = sale.get("idempotency_key") if isinstance(sale, dict) else None
+                results[index] = {"index": index, "idempotency_key": key, "status": "invalid", "error": str(e)}
+                continue
+            key = doc["idempotency_key"]
+            if key in seen:
+                # Same sale queued twice by the till: keep the first
+                results[index] = {"index": index, "idempotency_key": key, "status": "duplicate", "duplicate_of": seen[key]}
+                continue
+            seen[key] = index
+            pending.append((index, sale, doc))
+
+        existing = self.existing_keys(store_id, [doc["idempotency_key"] for _, _, doc in pending])
+        unknown = self.unknown_items(store_id, {item["item_id"] for _, _, doc in pending for item in doc["items"]})
+
+        to_insert = []
+        for index, sale, doc in pending:
+            key = doc["idempotency_key"]
+            if key in existing:
+                results[index] = {"index": index, "idempotency_key": key, "status": "duplicate", "id": existing[key]}
+                continue
+            missing = [item["item_id"] for item in doc["items"] if item["item_id"] in unknown]
+            if missing:
+                results[index] = {"index": index, "idempotency_key": key, "status": "invalid", "error": f"unknown items: {', '.join(map(str, missing))}"}
+                continue
+            to_insert.append((index, sale, doc))
+
+        inserted = self._insert_transactions(store_id, to_insert, results)
+        if inserted:
+            try:
+                self._apply_totals(store_id, session_id, [doc for _, _, doc in inserted])
+            except Exception as e:
+                print(f"Batch sales stored, but applying their totals failed: {e}")
+                record_mongo_error(e)
+                self._warn(results, inserted, "stock, session or customer totals were not updated")
+            try:
+                self.database["kitchen_orders"].insert_many(
+                    [
+                        kitchen_order_for(doc, sale.get("table", sale.get("customer_id", "Takeaway")), now)
+                        for _, sale, doc in inserted
+                    ],
+                    ordered=False
+                )
+            except Exception as e:
+                print(f"Batch sales stored, but their kitchen orders failed: {e}")
+                record_mongo_error(e)
+                self._warn(results, inserted, "kitchen order was not created")
+        return results, [doc for _, _, doc in inserted]
+
+    @staticmethod
+    def _warn(results, inserted, message):
+        for index, _, _ in inserted:
+            previous = results[index].get("warning")
+            results[index]["warning"] = f"{previous}; {message}" if previous else message
+
+    def _insert_transactions(self, store_id, to_insert, results):
+        if not to_insert:
+            return []
+        for _, _, doc in to_insert:
+            # Numbers of sales that turn out to be duplicates are simply skipped
+            doc["receipt_number"] = receipt_numbers.next(store_id, doc["timestamp"])
+        failed = {}
+        try:
+            transaction_store.insert_many([doc for _, _, doc in to_insert])
+        except BulkWriteError as e:
+            failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+        # A concurrent upload of the same queue can win the unique index race
+        raced = [to_insert[i][2]["idempotency_key"] for i, error in failed.items() if error.get("code") == DUPLICATE_KEY]
+        winners = self.existing_keys(store_id, raced)
+
+        inserted = []
+        for position, (index, sale, doc) in enumerate(to_insert):
+            key = doc["idempotency_key"]
+            error = failed.get(position)
+            if error is None:
+                inserted.append((index, sale, doc))
+                results[index] = {"index": index, "idempotency_key": key, "status": "created", "id": str(doc["_id"])}
+            elif error.get("code") == DUPLICATE_KEY:
+                results[index] = {"index": index, "idempotency_key": key, "status": "duplicate", "id": winners.get(key)}
+            else:
+                results[index] = {"index": index, "idempotency_key": key, "status": "error", "error": error.get("errmsg", "write failed")}
+        return inserted
+
+    def _apply_totals(self, store_id, session_id, transactions):
+        """One aggregated $inc per item, per customer and for the session"""
+        stock, customers, session_inc = aggregate_totals(transactions)
+
+        self.database["items"].bulk_write(
+            [
+                UpdateOne(store_filter(store_id, {"_id": ObjectId(item_id)}), {"$inc": {"stock": -quantity}})
+                for item_id, quantity in stock.items()
+            ],
+            ordered=False
+        )
+        stock_ledger.record_sales(store_id, transactions)
+
+        session_query = {"_id": ObjectId(session_id)} if ObjectId.is_valid(str(session_id)) else {"_id": session_id}
+        self.database["sessions"].update_one(session_query, {"$inc": session_inc})
+
+        if customers:
+            self.database["customers"].bulk_write(
+                [
+                    UpdateOne(
+                        customer_filter(customer_id),
+                        {
+                            "$inc": {"total_spent": totals["total_spent"], "visit_count": totals["visit_count"]},
+                            # Sales arrive out of order; never move last_visit backwards
+                            "$max": {"last_visit": totals["last_visit"]}
+                        }
+                    )
+                    for customer_id, totals in customers.items()
+                ],
+                ordered=False
+            )
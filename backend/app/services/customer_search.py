@@ -0,0 +1,208 @@
+import re
+import heapq
+from app.core.shared_state import shared_state
+
+# Fields kept per customer in the index; enough for pickers and the till
+INDEXED_FIELDS = ("name", "phone", "email")
+
+# Bumped on every customer write so other workers know to rebuild
+VERSION_KEY = "customer_search:version"
+
+
+def normalize_phone(phone):
+    return re.sub(r"\D", "", str(phone or ""))
+
+
+def name_trigrams(text, partial=False):
+    """Trigrams of a lower-cased name, padded like pg_trgm
+
+    With partial=True the last word is not end-padded, so a prefix the
+    cashier is still typing matches longer names.
+    """
+    trigrams = set()
+    words = re.findall(r"\w+", str(text or "").lower())
+    for i, word in enumerate(words):
+        is_last = i == len(words) - 1
+        padded = "  " + word + ("" if partial and is_last else " ")
+        for j in range(len(padded) - 2):
+            trigrams.add(padded[j:j + 3])
+    return trigrams
+
+
+class PhoneTrie:
+    """Digit trie mapping phone prefixes to customer ids"""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, digits, customer_id):
+        node = self.root
+        for digit in digits:
+            node = node.setdefault(digit, {})
+        node.setdefault("$ids", set()).add(customer_id)
+
+    def remove(self, digits, customer_id):
+        node = self.root
+        for digit in digits:
+            node = node.get(digit)
+            if node is None:
+                return
+        node.get("$ids", set()).discard(customer_id)
+
+    def prefix(self, digits, limit):
+        """Up to `limit` ids whose phone starts with `digits`, in phone order"""
+        node = self.root
+        for digit in digits:
+            node = node.get(digit)
+            if node is None:
+                return []
+
+        found = []
+        stack = [node]
+        while stack and len(found) < limit:
+            current = stack.pop()
+            found.extend(sorted(current.get("$ids", ())))
+            stack.extend(current[key] for key in sorted(current, reverse=True) if key != "$ids")
+        return found[:limit]
+
+
+class CustomerSearchIndex:
+    """In-memory customer lookup by phone prefix and fuzzy name"""
+
+    def __init__(self):
+        self.records = {}
+        self.rank_keys = {}
+        self.trigrams = {}
+        self.phones = PhoneTrie()
+        self.is_built = False
+        # Shared change counter value this index reflects
+        self.version = None
+
+    @staticmethod
+    def _phone_keys(phone):
+        digits = normalize_phone(phone)
+        keys = {digits} if digits else set()
+        # Also index the national number so "98765" finds "+91 98765 43210"
+        if len(digits) > 10:
+            keys.add(digits[-10:])
+        return keys
+
+    def build(self, customers):
+        """(Re)build the whole index from an iterable of customer documents"""
+        self.records = {}
+        self.rank_keys = {}
+        self.trigrams = {}
+        self.phones = PhoneTrie()
+        for customer in customers:
+            self._apply(customer)
+        self.is_built = True
+        return len(self.records)
+
+    def ensure_built(self, loader):
+        """Build on first use, and rebuild when another worker changed customers"""
+        version = shared_state.get(VERSION_KEY, 0)
+        if not self.is_built or version != self.version:
+            self.build(loader())
+            self.version = version
+
+    def upsert(self, customer):
+        """Add or refresh one customer; call after every create/update"""
+        self._apply(customer)
+        version = shared_state.incr(VERSION_KEY)
+        # Stay current without a rebuild unless other workers also wrote
+        if self.version == version - 1:
+            self.version = version
+
+    def _apply(self, customer):
+        customer_id = str(customer.get("id", customer.get("_id", "")))
+        if not customer_id:
+            return
+        self.remove(customer_id)
+
+        record = {"id": customer_id}
+        for field in INDEXED_FIELDS:
+            record[field] = customer.get(field)
+        self.records[customer_id] = record
+        # Shorter names rank first among equally good matches
+        self.rank_keys[customer_id] = (len(record["name"] or ""), customer_id)
+
+        for trigram in name_trigrams(record["name"]):
+            self.trigrams.setdefault(trigram, set()).add(customer_id)
+        for key in self._phone_keys(record["phone"]):
+            self.phones.insert(key, customer_id)
+
+    def remove(self, customer_id):
+        record = self.records.pop(str(customer_id), None)
+        if not record:
+            return
+        del self.rank_keys[record["id"]]
+        for trigram in name_trigrams(record["name"]):
+            postings = self.trigrams.get(trigram)
+            if postings:
+                postings.discard(record["id"])
+                if not postings:
+                    del self.trigrams[trigram]
+        for key in self._phone_keys(record["phone"]):
+            self.phones.remove(key, record["id"])
+
+    def _search_phone(self, digits, limit):
+        return {customer_id: 2.0 for customer_id in self.phones.prefix(digits, limit)}
+
+    def _search_name(self, query, limit):
+        query_trigrams = name_trigrams(query, partial=True)
+        if not query_trigrams:
+            return {}
+
+        # Rarest trigrams first so intersections and seeding stay small
+        postings = sorted((self.trigrams.get(trigram, set()) for trigram in query_trigrams), key=len)
+        total = len(postings)
+
+        rank_key = self.rank_keys.__getitem__
+
+        # Names containing every trigram of the query
+        exact = set.intersection(*postings) if postings[0] else set()
+        matches = {
+            customer_id: 1.0 - rank_key(customer_id)[0] / 1000.0
+            for customer_id in heapq.nsmallest(limit, exact, key=rank_key)
+        }
+        if len(matches) >= limit:
+            return matches
+
+        # Fuzzy fallback (typos): a name sharing at least `threshold` trigrams
+        # must appear in one of the rarest (total - threshold + 1) postings
+        threshold = max(1, total // 2)
+        seeds = set().union(*postings[:total - threshold + 1]) - exact
+        scored = []
+        for customer_id in seeds:
+            count = sum(customer_id in posting for posting in postings)
+            if count >= threshold:
+                scored.append((count / total - rank_key(customer_id)[0] / 1000.0, customer_id))
+        for score, customer_id in heapq.nlargest(limit - len(matches), scored):
+            matches[customer_id] = score
+        return matches
+
+    def search(self, query, limit=10, offset=0):
+        """Top matches for a phone prefix and/or a name fragment"""
+        query = str(query or "").strip()
+        if not query:
+            return {"results": [], "has_more": False}
+
+        # One extra match tells the caller whether another page exists
+        wanted = offset + limit + 1
+        scores = {}
+        digits = normalize_phone(query)
+        if digits and len(digits) >= 2:
+            scores.update(self._search_phone(digits, wanted))
+        if re.search(r"[^\d\s+\-()]", query):
+            for customer_id, score in self._search_name(query, wanted).items():
+                scores[customer_id] = max(score, scores.get(customer_id, 0))
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        page = ranked[offset:offset + limit]
+        return {
+            "results": [{**self.records[customer_id], "score": round(score, 3)} for customer_id, score in page],
+            "has_more": len(ranked) > offset + limit
+        }
+
+
+customer_search_index = CustomerSearchIndex()
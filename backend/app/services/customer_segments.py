@@ -0,0 +1,265 @@
+import asyncio
+import time
+from datetime import datetime
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.shared_state import shared_state
+
+# Spend histogram buckets (lower bounds); everything above the last is "5000+"
+SPEND_BUCKETS = [0, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# (recency score, frequency score) -> segment name; scores are 1 (worst) to 3
+RFM_SEGMENT_NAMES = {
+    (3, 3): "champions",
+    (3, 2): "loyal",
+    (3, 1): "new",
+    (2, 3): "needs_attention",
+    (2, 2): "needs_attention",
+    (2, 1): "promising",
+    (1, 3): "at_risk",
+    (1, 2): "at_risk",
+    (1, 1): "hibernating",
+}
+
+
+class SegmentConfig(BaseModel):
+    """Thresholds for RFM scoring
+
+    In "percentile" mode the monetary and frequency thresholds are derived
+    from the customer base (e.g. high value = top 10% by spend) using
+    MongoDB's $percentile operator (server 7.0+).
+    """
+    mode: str = "fixed"  # "fixed" or "percentile"
+    high_value: float = 500.0
+    medium_value: float = 100.0
+    frequent_visits: int = 10
+    repeat_visits: int = 3
+    recent_days: int = 30
+    lapsed_days: int = 90
+    high_percentile: float = 0.9
+    medium_percentile: float = 0.5
+
+    def cache_key(self):
+        return tuple(sorted(self.dict().items()))
+
+
+def _score(expression, high, medium, inclusive_high=False):
+    """$switch returning 3/2/1 for an expression against two thresholds"""
+    return {
+        "$switch": {
+            "branches": [
+                {"case": {"$gte" if inclusive_high else "$gt": [expression, high]}, "then": 3},
+                {"case": {"$gte": [expression, medium]}, "then": 2},
+            ],
+            "default": 1
+        }
+    }
+
+
+def build_segment_pipeline(config, now):
+    """One aggregation computing RFM groups, spend histogram and totals
+
+    `now` is the reference time for recency; pass the current time on every
+    run rather than reusing a built pipeline.
+    """
+    # Older records store dates as ISO strings; $convert handles both
+    last_seen = {
+        "$convert": {
+            "input": {"$ifNull": ["$last_visit", {"$ifNull": ["$join_date", "$created_at"]}]},
+            "to": "date",
+            "onError": None,
+            "onNull": None
+        }
+    }
+    days_since = {
+        "$cond": [
+            {"$eq": ["$_last_seen", None]},
+            None,
+            {"$divide": [{"$subtract": [now, "$_last_seen"]}, 86400000]}
+        ]
+    }
+
+    return [
+        {"$project": {
+            "_spent": {"$ifNull": ["$total_spent", 0]},
+            "_visits": {"$ifNull": ["$visit_count", 0]},
+            "_last_seen": last_seen
+        }},
+        {"$addFields": {"_days_since": days_since}},
+        {"$addFields": {
+            "r": {
+                "$switch": {
+                    "branches": [
+                        {"case": {"$eq": ["$_days_since", None]}, "then": 1},
+                        {"case": {"$lte": ["$_days_since", config.recent_days]}, "then": 3},
+                        {"case": {"$lte": ["$_days_since", config.lapsed_days]}, "then": 2},
+                    ],
+                    "default": 1
+                }
+            },
+            "f": _score("$_visits", config.frequent_visits, config.repeat_visits, inclusive_high=True),
+            "m": _score("$_spent", config.high_value, config.medium_value)
+        }},
+        {"$facet": {
+            "rfm": [
+                {"$group": {
+                    "_id": {"r": "$r", "f": "$f", "m": "$m"},
+                    "count": {"$sum": 1},
+                    "total_spent": {"$sum": "$_spent"}
+                }}
+            ],
+            "spend_distribution": [
+                {"$bucket": {
+                    "groupBy": "$_spent",
+                    "boundaries": SPEND_BUCKETS,
+                    "default": f"{SPEND_BUCKETS[-1]}+",
+                    "output": {"count": {"$sum": 1}, "total_spent": {"$sum": "$_spent"}}
+                }}
+            ],
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "customers": {"$sum": 1},
+                    "total_spent": {"$sum": "$_spent"},
+                    "avg_spent": {"$avg": "$_spent"},
+                    "avg_visits": {"$avg": "$_visits"}
+                }}
+            ]
+        }}
+    ]
+
+
+def build_percentile_pipeline(config):
+    """Pipeline returning spend and visit cutoffs for percentile mode"""
+    percentiles = [config.medium_percentile, config.high_percentile]
+    return [
+        {"$group": {
+            "_id": None,
+            "spent": {"$percentile": {"input": {"$ifNull": ["$total_spent", 0]}, "p": percentiles, "method": "approximate"}},
+            "visits": {"$percentile": {"input": {"$ifNull": ["$visit_count", 0]}, "p": percentiles, "method": "approximate"}}
+        }}
+    ]
+
+
+def apply_percentiles(config, results):
+    """Turn percentile cutoffs into a fixed-threshold config"""
+    if not results:
+        return config
+    cutoffs = results[0]
+    return config.copy(update={
+        "mode": "fixed",
+        "medium_value": float(cutoffs["spent"][0]),
+        "high_value": float(cutoffs["spent"][1]),
+        "repeat_visits": int(cutoffs["visits"][0]),
+        "frequent_visits": int(cutoffs["visits"][1]),
+    })
+
+
+def summarize(results, config, now):
+    """Shape the $facet output for the analytics page"""
+    facet = results[0] if results else {"rfm": [], "spend_distribution": [], "totals": []}
+    value_names = {3: "high_value", 2: "medium_value", 1: "low_value"}
+    value_segments = {name: 0 for name in value_names.values()}
+    recency = {"recent": 0, "lapsing": 0, "lapsed": 0}
+    frequency = {"frequent": 0, "repeat": 0, "one_time": 0}
+    rfm_segments = {name: {"count": 0, "total_spent": 0.0} for name in set(RFM_SEGMENT_NAMES.values())}
+
+    for group in facet["rfm"]:
+        r, f, m = group["_id"]["r"], group["_id"]["f"], group["_id"]["m"]
+        value_segments[value_names[m]] += group["count"]
+        recency[{3: "recent", 2: "lapsing", 1: "lapsed"}[r]] += group["count"]
+        frequency[{3: "frequent", 2: "repeat", 1: "one_time"}[f]] += group["count"]
+        segment = rfm_segments[RFM_SEGMENT_NAMES[(r, f)]]
+        segment["count"] += group["count"]
+        segment["total_spent"] += group["total_spent"]
+
+    totals = facet["totals"][0] if facet["totals"] else {}
+    return {
+        **value_segments,
+        "total_customers": totals.get("customers", 0),
+        "total_spent": totals.get("total_spent", 0.0),
+        "avg_spent": totals.get("avg_spent") or 0.0,
+        "avg_visits": totals.get("avg_visits") or 0.0,
+        "rfm_segments": rfm_segments,
+        "recency": recency,
+        "frequency": frequency,
+        "spend_distribution": [
+            {"bucket": bucket["_id"], "count": bucket["count"], "total_spent": bucket["total_spent"]}
+            for bucket in facet["spend_distribution"]
+        ],
+        "thresholds": config.dict(),
+        "computed_at": now.isoformat()
+    }
+
+
+class CustomerSegmentation:
+    """Cached RFM segmentation; call invalidate() whenever a customer changes
+
+    The cache version is a shared counter, so an invalidation on one worker
+    also expires the cached results held by the others. Results also expire
+    after CUSTOMER_SEGMENTS_CACHE_SECONDS, since recency changes as time
+    passes even when no customer does.
+    """
+
+    VERSION_KEY = "customer_segments:version"
+
+    def __init__(self, ttl_seconds=None):
+        self.ttl_seconds = settings.CUSTOMER_SEGMENTS_CACHE_SECONDS if ttl_seconds is None else ttl_seconds
+        self._cache = {}
+
+    def _version(self):
+        return shared_state.get(self.VERSION_KEY, 0)
+
+    def invalidate(self):
+        shared_state.incr(self.VERSION_KEY)
+        self._cache.clear()
+
+    def _cached(self, config, version):
+        entry = self._cache.get(config.cache_key())
+        if entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl_seconds:
+            return entry[2]
+        return None
+
+    def _store(self, config, version, result):
+        # Skip results computed while a customer update invalidated the cache
+        if version == self._version():
+            self._cache[config.cache_key()] = (version, time.monotonic(), result)
+        return result
+
+    def get_segments(self, collection, config=None):
+        """Segments from a pymongo collection"""
+        config = config or SegmentConfig()
+        version = self._version()
+        cached = self._cached(config, version)
+        if cached is not None:
+            return cached
+
+        now = datetime.now()
+        effective = config
+        if config.mode == "percentile":
+            effective = apply_percentiles(config, list(collection.aggregate(build_percentile_pipeline(config))))
+        results = list(collection.aggregate(build_segment_pipeline(effective, now)))
+        return self._store(config, version, summarize(results, effective, now))
+
+    async def get_segments_async(self, collection, config=None):
+        """Segments from a motor collection
+
+        The version counter lives in shared state (SQLite or pymongo), so it
+        is read and written from a thread to keep the event loop free.
+        """
+        config = config or SegmentConfig()
+        version = await asyncio.to_thread(self._version)
+        cached = self._cached(config, version)
+        if cached is not None:
+            return cached
+
+        now = datetime.now()
+        effective = config
+        if config.mode == "percentile":
+            cutoffs = await collection.aggregate(build_percentile_pipeline(config)).to_list(length=1)
+            effective = apply_percentiles(config, cutoffs)
+        results = await collection.aggregate(build_segment_pipeline(effective, now)).to_list(length=1)
+        return await asyncio.to_thread(self._store, config, version, summarize(results, effective, now))
+
+
+customer_segmentation = CustomerSegmentation()
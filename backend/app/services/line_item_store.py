@@ -0,0 +1,294 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from app.core.config import settings
+from app.services.sales_window import minute_of
+
+# Initial rows allocated per column; columns double when full
+INITIAL_CAPACITY = 4096
+
+
+class LineItemStore:
+    """Recent line items of every store as NumPy columns (struct of arrays)
+
+    One row per line item, LINE_ITEM_STORE_DAYS deep:
+
+        item     int32    code into the item table (item id + name)
+        quantity float32
+        total    float32  line total as charged (after discounts)
+        minute   int64    minutes since the epoch of the sale
+        session  int32    code into the session table
+        store    int16    code into the store table
+        amount   float32  total_amount of the sale, on its first line only
+                          (0 on the others), so sales can be summed per line
+        first    bool     marks that first line, for counting sales
+
+    Strings are dictionary-encoded once, so a line costs 32 bytes instead of
+    a dict per line plus one per sale, and analytics helpers are a boolean
+    mask plus np.bincount. Checkout paths append with record(); reads call
+    ensure_fresh() first, which loads the window from MongoDB on first use
+    and then folds in sales written by other workers since the last read,
+    reading both storage layouts through the TransactionStore it is given.
+    """
+
+    COLUMNS = (("item", "int32"), ("quantity", "float32"), ("total", "float32"),
+               ("minute", "int64"), ("session", "int32"), ("store", "int16"), ("amount", "float32"),
+               ("first", "bool"))
+
+    def __init__(self, days=None, min_sync_seconds=2.0, sync_overlap=30):
+        self.np = None
+        self.columns = None
+        self.days = days or settings.LINE_ITEM_STORE_DAYS
+        self.min_sync_seconds = min_sync_seconds
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        self.size = 0
+        # Dictionary tables: value -> code, and code -> value
+        self.item_codes, self.item_ids, self.item_names = {}, [], []
+        self.session_codes, self.sessions = {}, []
+        self.store_codes, self.stores = {}, []
+        # Sale id -> unix time seen, so a sale both recorded and synced counts once
+        self._seen = {}
+        self._synced_at = None
+        self._expired_at = 0.0
+        self.warm = False
+
+    # ------------------------------------------------------------------
+    # Encoding and appending
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _code(codes, values, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def _item_code(self, item):
+        item_id = str(item.get("item_id") or item.get("id") or "")
+        name = item.get("item_name", item.get("name", "Unknown"))
+        key = (item_id, name)
+        code = self.item_codes.get(key)
+        if code is None:
+            code = self.item_codes[key] = len(self.item_ids)
+            self.item_ids.append(item_id)
+            self.item_names.append(name)
+        return code
+
+    def _allocate(self):
+        # numpy is imported with the first sale, not with main.py (cold start)
+        if self.columns is None:
+            import numpy as np
+            self.np = np
+            self.columns = {name: np.empty(INITIAL_CAPACITY, dtype=dtype) for name, dtype in self.COLUMNS}
+
+    def _reserve(self, rows):
+        self._allocate()
+        needed = self.size + rows
+        capacity = len(self.columns["item"])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = self.np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def _append(self, transaction, created_at=None):
+        key = str(transaction.get("_id", transaction.get("id", "")))
+        if key and key in self._seen:
+            return False
+        timestamp = transaction.get("timestamp")
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        if not isinstance(timestamp, datetime):
+            return False
+        minute = minute_of(timestamp)
+        if minute < minute_of(datetime.now() - timedelta(days=self.days)):
+            return False
+        if key:
+            self._seen[key] = created_at or time.time()
+
+        items = transaction.get("items") or [{}]
+        rows = len(items)
+        self._reserve(rows)
+        start, end = self.size, self.size + rows
+        columns = self.columns
+        columns["item"][start:end] = [self._item_code(item) if item else -1 for item in items]
+        columns["quantity"][start:end] = [item.get("quantity", 0) for item in items]
+        columns["total"][start:end] = [
+            item.get("total", (item.get("price", 0.0) or 0.0) * (item.get("quantity", 0) or 0)) for item in items
+        ]
+        columns["minute"][start:end] = minute
+        columns["session"][start:end] = self._code(self.session_codes, self.sessions, str(transaction.get("session_id", "")))
+        columns["store"][start:end] = self._code(
+            self.store_codes, self.stores, transaction.get("store_id") or settings.DEFAULT_STORE_ID
+        )
+        columns["amount"][start:end] = 0.0
+        columns["amount"][start] = transaction.get("total_amount", 0) or 0
+        columns["first"][start:end] = False
+        columns["first"][start] = True
+        self.size = end
+        return True
+
+    def record(self, transaction):
+        """Append one written sale (with its id, store_id, session_id, timestamp, items)"""
+        with self._lock:
+            self._append(transaction)
+            self._expire()
+
+    def record_many(self, transactions):
+        with self._lock:
+            for transaction in transactions:
+                self._append(transaction)
+            self._expire()
+
+    def _expire(self):
+        """At most once a minute: forget old sale ids, drop old lines once they are a tenth of the store
+
+        Runs on writes as well as reads, so a worker that records sales but
+        is rarely read from does not grow without bound.
+        """
+        now = time.time()
+        if now - self._expired_at < 60:
+            return
+        self._expired_at = now
+        window_start = datetime.now() - timedelta(days=self.days)
+        # Ids are kept until no sync can fetch their sale again; sales older
+        # than the window are refused by _append anyway
+        forget_before = window_start.timestamp()
+        if self._synced_at is not None:
+            forget_before = max(forget_before, self._synced_at - 2 * self.sync_overlap)
+        self._seen = {key: at for key, at in self._seen.items() if at >= forget_before}
+
+        self._allocate()
+        cutoff = minute_of(window_start)
+        keep = self.columns["minute"][:self.size] >= cutoff
+        if self.size - int(keep.sum()) <= self.size // 10:
+            return
+        kept = int(keep.sum())
+        for name, column in self.columns.items():
+            column[:kept] = column[:self.size][keep]
+        self.size = kept
+
+    # ------------------------------------------------------------------
+    # Loading from MongoDB
+    # ------------------------------------------------------------------
+    _FIELDS = ("session_id", "total_amount", "items.item_id", "items.item_name", "items.quantity", "items.price", "items.total")
+
+    def _load(self, cursor, chunk_size=5000):
+        """Append sales from a cursor a chunk at a time, so a warm start never holds them all as dicts"""
+        loaded = 0
+        chunk = []
+        for doc in cursor:
+            chunk.append(doc)
+            if len(chunk) >= chunk_size:
+                loaded += self._append_chunk(chunk)
+                chunk = []
+        return loaded + self._append_chunk(chunk)
+
+    def _append_chunk(self, docs):
+        with self._lock:
+            for doc in docs:
+                created_at = doc["_id"].generation_time.timestamp() if hasattr(doc["_id"], "generation_time") else None
+                self._append(doc, created_at)
+        return len(docs)
+
+    def warm_start(self, source):
+        """Load the last LINE_ITEM_STORE_DAYS of sales in one query"""
+        started = time.perf_counter()
+        self._synced_at = time.time()
+        loaded = self._load(source.sales_since(start=datetime.now() - timedelta(days=self.days), fields=self._FIELDS))
+        self.warm = True
+        print(f"Line item store loaded {loaded} sales ({self.size} lines) in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return loaded
+
+    def sync(self, source):
+        """Fold in sales written since the last sync, by ObjectId time (catches back-dated sales)"""
+        started = time.time()
+        since = (self._synced_at or started) - self.sync_overlap
+        loaded = self._load(source.sales_since(created_after=since, fields=self._FIELDS))
+        with self._lock:
+            self._seen = {key: at for key, at in self._seen.items() if at >= since - self.sync_overlap}
+        self._synced_at = started
+        return loaded
+
+    def ensure_fresh(self, source):
+        """Warm start on first use, then sync at most every min_sync_seconds"""
+        if not self.warm:
+            self.warm_start(source)
+        elif time.time() - self._synced_at >= self.min_sync_seconds:
+            self.sync(source)
+
+    def covers(self, start):
+        """Whether a period starting at `start` lies within the window (after ensure_fresh)"""
+        return start is not None and start >= datetime.now() - timedelta(days=self.days)
+
+    # ------------------------------------------------------------------
+    # Vectorised group-bys
+    # ------------------------------------------------------------------
+    def _mask(self, store_id, start=None, end=None, exclude_sessions=None):
+        np = self.np
+        store = self.store_codes.get(store_id)
+        if store is None:
+            return np.zeros(self.size, dtype=bool)
+        columns = self.columns
+        mask = columns["store"][:self.size] == store
+        if start is not None:
+            mask &= columns["minute"][:self.size] >= minute_of(start)
+        if end is not None:
+            mask &= columns["minute"][:self.size] <= minute_of(end)
+        if exclude_sessions:
+            codes = [self.session_codes[s] for s in map(str, exclude_sessions) if s in self.session_codes]
+            if codes:
+                mask &= ~np.isin(columns["session"][:self.size], codes)
+        return mask
+
+    def item_totals(self, store_id, start=None, end=None, exclude_sessions=None, by="name"):
+        """{item name (or id with by="id"): (quantity, revenue)} for the store and period"""
+        np = self.np
+        with self._lock:
+            self._expire()
+            mask = self._mask(store_id, start, end, exclude_sessions)
+            mask &= self.columns["item"][:self.size] >= 0
+            items = self.columns["item"][:self.size][mask]
+            quantity = self.columns["quantity"][:self.size][mask].astype(np.float64)
+            revenue = self.columns["total"][:self.size][mask].astype(np.float64)
+            labels = self.item_names if by == "name" else self.item_ids
+
+        # Several item codes can share a name (or id): group by the label
+        label_codes = {}
+        code_to_label = np.fromiter(
+            (label_codes.setdefault(label, len(label_codes)) for label in labels), dtype=np.int32, count=len(labels)
+        )
+        grouped = code_to_label[items] if len(items) else items
+        quantities = np.bincount(grouped, weights=quantity, minlength=len(label_codes))
+        revenues = np.bincount(grouped, weights=revenue, minlength=len(label_codes))
+        counts = np.bincount(grouped, minlength=len(label_codes))
+        return {
+            label: (float(quantities[code]), float(revenues[code]))
+            for label, code in label_codes.items() if counts[code]
+        }
+
+    def totals(self, store_id, start=None, end=None, exclude_sessions=None):
+        """(total sales, number of sales) for the store and period"""
+        with self._lock:
+            self._expire()
+            mask = self._mask(store_id, start, end, exclude_sessions)
+            amounts = self.columns["amount"][:self.size][mask]
+            sales = int(self.columns["first"][:self.size][mask].sum())
+        return float(amounts.sum(dtype=self.np.float64)), sales
+
+    def status(self):
+        return {
+            "warm": self.warm,
+            "days": self.days,
+            "lines": self.size,
+            "items": len(self.item_ids),
+            "sessions": len(self.sessions),
+            "bytes": int(sum(column[:self.size].nbytes for column in (self.columns or {}).values())),
+        }
+
+
+line_item_store = LineItemStore()
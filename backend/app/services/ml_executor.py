@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config import settings
+
+
+class MLQueueFull(Exception):
+    """Too many ML tasks are already queued or running"""
+
+
+class MLTaskTimeout(Exception):
+    """An ML task did not finish within its time budget"""
+
+
+class MLExecutor:
+    """Runs CPU-bound training and scoring outside the event loop
+
+    Tasks go to a ProcessPoolExecutor so a training forest never blocks
+    checkouts on the same worker. At most `max_pending` tasks may be queued
+    or running; beyond that submit() fails fast with MLQueueFull. A task that
+    exceeds its timeout is cancelled if it has not started yet; if it is
+    already running the pool is recycled, since a worker process cannot be
+    interrupted any other way.
+
+    With ML_WORKERS=0 tasks run in a thread instead (no extra processes).
+    """
+
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        self.workers = settings.ML_WORKERS if workers is None else workers
+        self.max_pending = max_pending or settings.ML_MAX_PENDING
+        self.timeout = timeout or settings.ML_TASK_TIMEOUT_SECONDS
+        self._pool = None
+        self._pending = 0
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0, "recycled": 0}
+
+    def _get_pool(self):
+        if self._pool is None and self.workers > 0:
+            # spawn: forking a process that holds Mongo sockets and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _recycle(self):
+        """Kill the worker processes and start a fresh pool on next submit"""
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.stats["recycled"] += 1
+
+    async def run(self, fn, *args, timeout=None):
+        """Run fn(*args) in the pool and await its result"""
+        if self._pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise MLQueueFull(f"{self._pending} ML tasks already pending")
+
+        task = None
+        pool = self._get_pool()
+        if pool is None:
+            future = asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        else:
+            try:
+                task = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                self._pool = None
+                pool = self._get_pool()
+                task = pool.submit(fn, *args)
+            future = asyncio.wrap_future(task)
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            # shield so a timeout leaves the decision about the task to us
+            result = await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+            self.stats["completed"] += 1
+            return result
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            # cancel() only succeeds while the task is still queued
+            if task is not None and not task.cancel():
+                # Nobody awaits the abandoned future; swallow its BrokenProcessPool
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._recycle()
+            raise MLTaskTimeout(f"{getattr(fn, '__name__', fn)} exceeded {timeout or self.timeout}s")
+        except asyncio.CancelledError:
+            # Client went away: drop the task if it is still queued
+            if task is not None:
+                task.cancel()
+            raise
+        except BrokenProcessPool:
+            # A worker died (or the pool was recycled); start fresh next time
+            self.stats["failed"] += 1
+            if self._pool is pool:
+                self._pool = None
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+            elapsed = time.perf_counter() - started
+            if elapsed > 1:
+                print(f"ML task {getattr(fn, '__name__', fn)} took {elapsed:.2f}s")
+
+    def status(self):
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "timeout_seconds": self.timeout,
+            **self.stats
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+ml_executor = MLExecutor()
@@ -0,0 +1,94 @@
+import re
+import socket
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.core.database import get_counters_collection, is_mongo_available, record_mongo_error
+from app.core.shared_state import SQLiteSharedState
+
+
+class ReceiptNumberAllocator:
+    """Sequential receipt numbers per store and day, without a round trip per sale
+
+    Numbers come from blocks (hi/lo): a worker reserves `block_size` numbers
+    with one $inc on the store/day document in `counters`, then hands them
+    out from memory. Workers hold different blocks, so numbers are unique
+    and increase within each worker; a restart abandons the rest of a block,
+    so the sequence can have gaps but never repeats.
+
+    While MongoDB is down, blocks are leased from the host's SQLite shared
+    state file under a separate counter and the numbers carry an "L" marker
+    plus the till id (RECEIPT_TILL_ID, default the host name), so they
+    collide neither with numbers handed out before or after the outage nor
+    with those of other tills that were offline at the same time.
+
+        main-20261019-00042      main-20261019-LTILL2-00003
+    """
+
+    def __init__(self, block_size=None, max_open_blocks=256, till_id=None):
+        self.block_size = block_size or settings.RECEIPT_BLOCK_SIZE
+        till_id = till_id or settings.RECEIPT_TILL_ID or socket.gethostname()
+        # Kept to letters and digits so receipt numbers still split on "-"
+        self.till_id = re.sub(r"[^A-Za-z0-9]", "", till_id).upper()[:16] or "LOCAL"
+        self.max_open_blocks = max_open_blocks
+        # counter key -> [next number, last number of the block]
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self.leases = 0
+        self._local_state = None
+
+    def _lease(self, key, offline):
+        """Reserve the next block; returns the last number in it"""
+        self.leases += 1
+        if offline:
+            # Not the app's shared_state: that may live in the MongoDB that is down
+            if self._local_state is None:
+                self._local_state = SQLiteSharedState(settings.SHARED_STATE_PATH)
+            return self._local_state.incr(f"counter:{key}", self.block_size)
+        doc = get_counters_collection().find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": self.block_size}, "$setOnInsert": {"created_at": datetime.now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["value"]
+
+    def _take(self, key, offline):
+        block = self._blocks.get(key)
+        if block is None or block[0] > block[1]:
+            hi = self._lease(key, offline)
+            block = [hi - self.block_size + 1, hi]
+            self._blocks[key] = block
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_open_blocks:
+                # Blocks of past days are only touched by late catch-up sales
+                self._blocks.popitem(last=False)
+        number = block[0]
+        block[0] += 1
+        return number
+
+    def next(self, store_id, when=None):
+        """Allocate the next receipt number for a sale made at `when` (default now)"""
+        day = (when or datetime.now()).strftime("%Y%m%d")
+        key = f"receipt:{store_id}:{day}"
+        with self._lock:
+            if is_mongo_available():
+                try:
+                    return f"{store_id}-{day}-{self._take(key, offline=False):05d}"
+                except Exception as e:
+                    print(f"Could not lease receipt numbers from MongoDB: {e}")
+                    record_mongo_error(e)
+            return f"{store_id}-{day}-L{self.till_id}-{self._take(key + ':offline', offline=True):05d}"
+
+    def status(self):
+        return {
+            "block_size": self.block_size,
+            "till_id": self.till_id,
+            "open_blocks": len(self._blocks),
+            "leases": self.leases
+        }
+
+
+receipt_numbers = ReceiptNumberAllocator()
@@ -0,0 +1,211 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from app.core.config import settings
+from app.core.database import (
+    get_items_collection, get_inventory_collection, get_purchase_orders_collection, is_mongo_available
+)
+from app.core.shared_state import shared_state
+
+UNASSIGNED_SUPPLIER = "Unassigned"
+# Purchase orders whose stock is on its way; it counts towards the inventory position
+OPEN_ORDER_STATUSES = ("approved", "sent")
+
+
+class ReplenishmentPlanner:
+    """Turn sales velocity into reorder points and draft purchase orders
+
+    plan() loads the catalogue, inventory settings, open purchase orders and
+    daily demand for a store with four queries, then computes safety stock,
+    reorder point and EOQ for every SKU in one vectorised pass
+    (app.ml.replenishment). Stock on approved or sent orders counts towards
+    the inventory position, so it is not ordered again.
+    Daily demand is the per-item linear forecast from MLModels where an item
+    has enough history, else its mean over REPLENISHMENT_HISTORY_DAYS.
+
+    create_drafts() replaces the store's previous generated drafts with one
+    draft purchase order per supplier, leaving out items that are on another
+    draft; start_schedule() does that for every
+    store each REPLENISHMENT_SCHEDULE_HOURS from one worker at a time.
+    """
+
+    def __init__(self):
+        self._schedule_thread = None
+        self.worker_id = uuid.uuid4().hex
+
+    def _demand(self, store_id, names):
+        """(forecast per day, std per day) aligned with `names`"""
+        import numpy as np
+        from app.ml.local_models import MLModels
+        from app.ml.replenishment import daily_demand_stats
+        from app.ml.tasks import batch_linear_forecast
+
+        days = settings.REPLENISHMENT_HISTORY_DAYS
+        code_of = {name: code for code, name in enumerate(names)}
+        rows = [r for r in MLModels(store_id).get_historical_data(days) if r["_id"]["item_name"] in code_of]
+        codes = np.fromiter((code_of[r["_id"]["item_name"]] for r in rows), dtype=np.int32, count=len(rows))
+        quantities = np.fromiter((r["quantity"] for r in rows), dtype=float, count=len(rows))
+        mean, std = daily_demand_stats(codes, quantities, len(names), days)
+
+        X = np.array([[r["_id"]["day_of_week"], r["_id"]["is_weekend"]] for r in rows], dtype=np.float32).reshape(-1, 2)
+        tomorrow_dow = (datetime.now() + timedelta(days=1)).isoweekday()
+        x_next = np.array([tomorrow_dow, 1 if tomorrow_dow in [6, 7] else 0], dtype=np.float32)
+        forecast, _ = batch_linear_forecast(codes, X, quantities.astype(np.float32), x_next, len(names))
+        return np.where(np.isnan(forecast), mean, np.maximum(forecast, 0.0)), std
+
+    @staticmethod
+    def on_order(store_id):
+        """Units per item id on the store's approved or sent purchase orders"""
+        quantities = {}
+        for order in get_purchase_orders_collection().find(
+            {"store_id": store_id, "status": {"$in": list(OPEN_ORDER_STATUSES)}}, {"lines.item_id": 1, "lines.quantity": 1}
+        ):
+            for line in order.get("lines", []):
+                quantities[str(line["item_id"])] = quantities.get(str(line["item_id"]), 0) + line.get("quantity", 0)
+        return quantities
+
+    def plan(self, store_id):
+        """Replenishment figures for every active item of the store, most urgent first"""
+        # NumPy loads with the first plan, not at startup
+        import numpy as np
+        from app.ml.replenishment import plan_replenishment
+
+        started = time.perf_counter()
+        items = list(get_items_collection().find(
+            {"store_id": store_id, "is_active": {"$ne": False}}, {"name": 1, "price": 1, "stock": 1}
+        ))
+        if not items:
+            return {"store_id": store_id, "items": [], "generated_at": datetime.now().isoformat(), "elapsed_ms": 0.0}
+        inventory = {
+            str(doc["item_id"]): doc
+            for doc in get_inventory_collection().find(
+                {"store_id": store_id},
+                {"item_id": 1, "cost_price": 1, "supplier": 1, "lead_time_days": 1, "minimum_stock": 1, "maximum_stock": 1}
+            )
+        }
+        ids = [str(item["_id"]) for item in items]
+        names = [item.get("name", "Unknown") for item in items]
+        settings_of = [inventory.get(item_id, {}) for item_id in ids]
+        ordered = self.on_order(store_id)
+        on_order = [ordered.get(item_id, 0) for item_id in ids]
+
+        def column(values, default):
+            return np.array([default if v is None else v for v in values], dtype=float)
+
+        price = column((item.get("price") for item in items), 0.0)
+        unit_cost = column((s.get("cost_price") for s in settings_of), np.nan)
+        unit_cost = np.where(np.isnan(unit_cost), price * settings.MENU_DEFAULT_COST_RATIO, unit_cost)
+        daily_demand, demand_std = self._demand(store_id, names)
+
+        plan = plan_replenishment(
+            stock=column((item.get("stock") for item in items), 0.0),
+            daily_demand=daily_demand,
+            demand_std=demand_std,
+            lead_time_days=column((s.get("lead_time_days") for s in settings_of), settings.REPLENISHMENT_DEFAULT_LEAD_DAYS),
+            unit_cost=unit_cost,
+            minimum_stock=column((s.get("minimum_stock") for s in settings_of), settings.LOW_STOCK_DEFAULT_MINIMUM),
+            maximum_stock=column((s.get("maximum_stock") for s in settings_of), np.nan),
+            order_cost=settings.REPLENISHMENT_ORDER_COST,
+            holding_rate=settings.REPLENISHMENT_HOLDING_RATE,
+            service_level=settings.REPLENISHMENT_SERVICE_LEVEL,
+            max_cover_days=settings.REPLENISHMENT_MAX_COVER_DAYS or None,
+            on_order=column(on_order, 0.0)
+        )
+
+        rows = []
+        for i in np.argsort(plan["days_of_cover"], kind="stable"):
+            cover = plan["days_of_cover"][i]
+            rows.append({
+                "item_id": ids[i],
+                "item_name": names[i],
+                "supplier": settings_of[i].get("supplier") or UNASSIGNED_SUPPLIER,
+                "stock": items[i].get("stock", 0),
+                "on_order": on_order[i],
+                "daily_demand": round(float(daily_demand[i]), 2),
+                "demand_std": round(float(demand_std[i]), 2),
+                "unit_cost": round(float(unit_cost[i]), 2),
+                "safety_stock": int(plan["safety_stock"][i]),
+                "reorder_point": int(plan["reorder_point"][i]),
+                "eoq": int(plan["eoq"][i]),
+                "order_quantity": int(plan["order_quantity"][i]),
+                "order_value": round(float(plan["order_value"][i]), 2),
+                "days_of_cover": None if np.isinf(cover) else round(float(cover), 1)
+            })
+        return {
+            "store_id": store_id,
+            "items": rows,
+            "generated_at": datetime.now().isoformat(),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    @staticmethod
+    def draft_orders(store_id, plan_rows):
+        """Group the items to order into one draft purchase order per supplier"""
+        orders = {}
+        now = datetime.now()
+        for row in plan_rows:
+            if row["order_quantity"] <= 0:
+                continue
+            order = orders.setdefault(row["supplier"], {
+                "store_id": store_id,
+                "supplier": row["supplier"],
+                "status": "draft",
+                "source": "replenishment",
+                "lines": [],
+                "total_value": 0.0,
+                "created_at": now
+            })
+            order["lines"].append({
+                "item_id": row["item_id"],
+                "item_name": row["item_name"],
+                "quantity": row["order_quantity"],
+                "unit_cost": row["unit_cost"],
+                "line_total": row["order_value"],
+                "stock": row["stock"],
+                "reorder_point": row["reorder_point"]
+            })
+            order["total_value"] = round(order["total_value"] + row["order_value"], 2)
+        return sorted(orders.values(), key=lambda order: order["supplier"])
+
+    def create_drafts(self, store_id):
+        """Replace the store's generated drafts with fresh ones; returns the new drafts"""
+        collection = get_purchase_orders_collection()
+        # Items already on a draft someone else raised are left to that draft
+        drafted = {
+            str(line["item_id"])
+            for order in collection.find(
+                {"store_id": store_id, "status": "draft", "source": {"$ne": "replenishment"}}, {"lines.item_id": 1}
+            )
+            for line in order.get("lines", [])
+        }
+        orders = self.draft_orders(store_id, [row for row in self.plan(store_id)["items"] if row["item_id"] not in drafted])
+        # Drafts a manager already approved or sent are left alone
+        collection.delete_many({"store_id": store_id, "status": "draft", "source": "replenishment"})
+        if orders:
+            collection.insert_many(orders)
+        return orders
+
+    def start_schedule(self, interval_hours=None):
+        """Draft purchase orders for every store each REPLENISHMENT_SCHEDULE_HOURS, from one worker"""
+        interval = (interval_hours or settings.REPLENISHMENT_SCHEDULE_HOURS) * 3600
+        if self._schedule_thread is not None or interval <= 0:
+            return
+
+        def run():
+            while True:
+                try:
+                    holder, version = shared_state.get_versioned("replenishment:lease")
+                    if is_mongo_available() and holder is None and shared_state.compare_and_set("replenishment:lease", self.worker_id, version, ttl=interval):
+                        started = time.perf_counter()
+                        drafts = sum(len(self.create_drafts(store_id)) for store_id in get_items_collection().distinct("store_id"))
+                        print(f"Replenishment drafted {drafts} purchase orders in {(time.perf_counter() - started) * 1000:.0f} ms")
+                except Exception as e:
+                    print(f"Replenishment job failed: {e}")
+                time.sleep(min(interval, 3600))
+
+        self._schedule_thread = threading.Thread(target=run, name="replenishment", daemon=True)
+        self._schedule_thread.start()
+
+
+replenishment = ReplenishmentPlanner()
@@ -0,0 +1,263 @@
+import heapq
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from operator import itemgetter
+from app.core.config import settings
+
+
+def minute_of(timestamp):
+    """Minutes since the epoch for a naive local timestamp (how sales are stored)"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return int(timestamp.timestamp() // 60)
+
+
+class TopKSketch:
+    """Item quantities over the window, bounded to `capacity` distinct items
+
+    Exact while the window holds at most `capacity` distinct items (a menu
+    is usually far smaller). Past that, a new item replaces the smallest one
+    and inherits its count, as in Space-Saving, so heavy hitters survive.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, name, quantity):
+        if name in self.counts or len(self.counts) < self.capacity:
+            self.counts[name] = self.counts.get(name, 0) + quantity
+            return
+        smallest = min(self.counts, key=self.counts.get)
+        self.counts[name] = self.counts.pop(smallest) + quantity
+
+    def remove(self, name, quantity):
+        if name not in self.counts:
+            return
+        remaining = self.counts[name] - quantity
+        if remaining > 0:
+            self.counts[name] = remaining
+        else:
+            del self.counts[name]
+
+    def top(self, k):
+        return heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+
+
+class MinuteRing:
+    """One store's sales in `size` per-minute slots; slot = minute % size
+
+    Each slot remembers which minute it holds, so a slot left over from a
+    previous lap is recognised as stale and recycled instead of summed.
+    """
+
+    def __init__(self, size, sketch_capacity):
+        # numpy is imported with the first ring, not with main.py (cold start)
+        import numpy as np
+        self.np = np
+        self.size = size
+        self.minutes = np.full(size, -1, dtype=np.int64)
+        self.sales = np.zeros(size)
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.items = [None] * size
+        self.sketch = TopKSketch(sketch_capacity)
+
+    def _clear(self, slot):
+        for name, quantity in (self.items[slot] or {}).items():
+            self.sketch.remove(name, quantity)
+        self.minutes[slot] = -1
+        self.sales[slot] = 0.0
+        self.counts[slot] = 0
+        self.items[slot] = None
+
+    def advance(self, now_minute):
+        """Expire minutes that have left the window, so the sketch forgets them too"""
+        stale = self.np.flatnonzero((self.minutes >= 0) & (self.minutes <= now_minute - self.size))
+        for slot in stale:
+            self._clear(slot)
+
+    def add(self, minute, amount, items):
+        slot = minute % self.size
+        if self.minutes[slot] != minute:
+            self._clear(slot)
+            self.minutes[slot] = minute
+        self.sales[slot] += amount
+        self.counts[slot] += 1
+        bucket = self.items[slot]
+        if bucket is None:
+            bucket = self.items[slot] = {}
+        for name, quantity in items:
+            bucket[name] = bucket.get(name, 0) + quantity
+            self.sketch.add(name, quantity)
+
+    def totals(self, start_minute, end_minute):
+        mask = (self.minutes >= start_minute) & (self.minutes <= end_minute)
+        return float(self.sales[mask].sum()), int(self.counts[mask].sum())
+
+    def top_items(self, k, start_minute, now_minute):
+        if start_minute <= now_minute - self.size + 1:
+            return self.sketch.top(k)
+        # Shorter windows merge the per-minute buckets they cover
+        merged = Counter()
+        for slot in self.np.flatnonzero(self.minutes >= start_minute):
+            merged.update(self.items[slot])
+        return merged.most_common(k)
+
+
+class SalesWindow:
+    """Sliding 24 h of per-minute sales per store, for the real-time dashboard
+
+    Checkout paths call record() after a sale is written, warm_start() loads
+    the last window from MongoDB at boot, and a background thread folds in
+    sales written by other workers every REALTIME_SYNC_SECONDS. Reads are a
+    few vectorised sums over 1440 slots and never touch the database.
+    """
+
+    def __init__(self, size=None, sketch_capacity=None, sync_seconds=None, sync_overlap=30):
+        self.size = size or settings.REALTIME_WINDOW_MINUTES
+        self.sketch_capacity = sketch_capacity or settings.REALTIME_TOP_ITEMS_CAPACITY
+        self.sync_seconds = settings.REALTIME_SYNC_SECONDS if sync_seconds is None else sync_seconds
+        self.sync_overlap = sync_overlap
+        self._rings = {}
+        # transaction id -> unix time it was created, so a sale seen by both
+        # record() and the Mongo sync is only counted once
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._sync_thread = None
+        self.warm = False
+
+    def _ring(self, store_id):
+        ring = self._rings.get(store_id)
+        if ring is None:
+            ring = self._rings[store_id] = MinuteRing(self.size, self.sketch_capacity)
+        return ring
+
+    def _ingest(self, transaction, now_minute, created_at=None):
+        key = str(transaction.get("_id", transaction.get("id", "")))
+        if key and key in self._seen:
+            return False
+        minute = min(minute_of(transaction["timestamp"]), now_minute)
+        if minute <= now_minute - self.size:
+            return False
+        if key:
+            self._seen[key] = created_at or time.time()
+            if len(self._seen) > 50000:
+                self._forget_seen(time.time() - 2 * self.sync_overlap - self.sync_seconds)
+        ring = self._ring(transaction.get("store_id") or settings.DEFAULT_STORE_ID)
+        ring.advance(now_minute)
+        ring.add(minute, transaction.get("total_amount", 0) or 0, [
+            (item.get("item_name", "Unknown"), item.get("quantity", 0)) for item in transaction.get("items", [])
+        ])
+        return True
+
+    def _forget_seen(self, before):
+        # Ids older than the sync overlap can no longer be fetched twice
+        self._seen = {key: at for key, at in self._seen.items() if at >= before}
+
+    def record(self, transaction):
+        """Fold one written sale (with its id, store_id, timestamp, items) into the window"""
+        with self._lock:
+            self._ingest(transaction, minute_of(datetime.now()))
+
+    def record_many(self, transactions):
+        with self._lock:
+            now_minute = minute_of(datetime.now())
+            for transaction in transactions:
+                self._ingest(transaction, now_minute)
+
+    def _load(self, cursor):
+        # Read outside the lock; record() and snapshot() run on the event loop
+        docs = list(cursor)
+        now_minute = minute_of(datetime.now())
+        loaded = 0
+        with self._lock:
+            for doc in docs:
+                created_at = doc["_id"].generation_time.timestamp() if hasattr(doc["_id"], "generation_time") else None
+                loaded += self._ingest(doc, now_minute, created_at)
+        return loaded
+
+    _FIELDS = ("total_amount", "items.item_name", "items.quantity")
+
+    def warm_start(self, source):
+        """Load the last window of sales from MongoDB, one indexed query per store
+
+        `source` is the TransactionStore, so both storage layouts are read.
+        """
+        started = time.perf_counter()
+        self._synced_at = time.time()
+        since = datetime.now() - timedelta(minutes=self.size)
+        loaded = 0
+        for store_id in source.stores():
+            loaded += self._load(source.sales_since(start=since, store_id=store_id, fields=self._FIELDS))
+        self.warm = True
+        print(f"Real-time window warmed with {loaded} sales in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return loaded
+
+    def sync(self, source):
+        """Fold in sales other workers wrote since the last sync
+
+        Selects by ObjectId creation time rather than sale timestamp, so
+        back-dated catch-up sales are picked up too.
+        """
+        started = time.time()
+        since = (self._synced_at or started) - self.sync_overlap
+        loaded = self._load(source.sales_since(created_after=since, fields=self._FIELDS))
+        with self._lock:
+            self._forget_seen(since - self.sync_overlap)
+        self._synced_at = started
+        return loaded
+
+    def start_sync(self, get_source, is_available):
+        """Warm start, then keep syncing in a daemon thread while MongoDB is up"""
+        if self._sync_thread is not None or not self.sync_seconds:
+            return
+
+        def run():
+            while True:
+                try:
+                    if is_available():
+                        if not self.warm:
+                            self.warm_start(get_source())
+                        else:
+                            self.sync(get_source())
+                except Exception as e:
+                    print(f"Real-time window sync failed: {e}")
+                time.sleep(self.sync_seconds)
+
+        self._sync_thread = threading.Thread(target=run, name="sales-window-sync", daemon=True)
+        self._sync_thread.start()
+
+    def snapshot(self, store_id, hours=24, top_k=5, now=None):
+        """Today, current hour, last `hours` hours and top items for one store"""
+        now = now or datetime.now()
+        now_minute = minute_of(now)
+        hours = max(1, min(hours, self.size // 60))
+        day_start = minute_of(now.replace(hour=0, minute=0, second=0, microsecond=0))
+        hour_start = minute_of(now.replace(minute=0, second=0, microsecond=0))
+        window_start = now_minute - hours * 60 + 1
+
+        with self._lock:
+            ring = self._ring(store_id)
+            ring.advance(now_minute)
+            today_sales, today_count = ring.totals(day_start, now_minute)
+            hour_sales, hour_count = ring.totals(hour_start, now_minute)
+            window_sales, window_count = ring.totals(window_start, now_minute)
+            top_items = ring.top_items(top_k, window_start, now_minute)
+
+        return {
+            "current_hour_sales": hour_sales,
+            "current_hour_transactions": hour_count,
+            "today_sales": today_sales,
+            "today_transactions": today_count,
+            "window_hours": hours,
+            "window_sales": window_sales,
+            "total_transactions": window_count,
+            "popular_items": [{"name": name, "count": count} for name, count in top_items],
+            "warm": self.warm
+        }
+
+
+sales_window = SalesWindow()
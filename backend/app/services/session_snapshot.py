@@ -0,0 +1,131 @@
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from app.core.config import settings
+from app.core.database import get_session_snapshots_collection
+
+# Running counters live on the session document under this field and are
+# maintained with $inc on every sale, so closing never rescans transactions.
+COUNTERS_FIELD = "zcounters"
+
+
+def _counter_key(value):
+    """Make a value safe to use as a MongoDB field name"""
+    key = str(value or "unknown").strip() or "unknown"
+    return key.replace(".", "_").replace("$", "_")
+
+
+def session_counter_increments(items, total_amount, payment_mode, timestamp=None):
+    """Build the $inc fields that fold one sale into the session counters"""
+    timestamp = timestamp or datetime.now()
+    hour = f"{timestamp.hour:02d}"
+    payment = _counter_key(payment_mode or "cash")
+
+    increments = {
+        f"{COUNTERS_FIELD}.payments.{payment}.amount": total_amount,
+        f"{COUNTERS_FIELD}.payments.{payment}.count": 1,
+        f"{COUNTERS_FIELD}.hours.{hour}.sales": total_amount,
+        f"{COUNTERS_FIELD}.hours.{hour}.count": 1,
+    }
+    for item in items:
+        key = _counter_key(item.get("item_name"))
+        quantity = item.get("quantity", 0)
+        revenue = item.get("total", item.get("price", 0) * quantity)
+        increments[f"{COUNTERS_FIELD}.items.{key}.quantity"] = increments.get(f"{COUNTERS_FIELD}.items.{key}.quantity", 0) + quantity
+        increments[f"{COUNTERS_FIELD}.items.{key}.revenue"] = increments.get(f"{COUNTERS_FIELD}.items.{key}.revenue", 0) + revenue
+    return increments
+
+
+def apply_increments(document, increments):
+    """Apply dotted $inc fields to an in-memory session dict (fallback mode)"""
+    for path, amount in increments.items():
+        target = document
+        parts = path.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = target.get(parts[-1], 0) + amount
+    return document
+
+
+def build_snapshot(session, end_time=None):
+    """Compute the Z-report for a session from its accumulated counters"""
+    counters = session.get(COUNTERS_FIELD, {})
+    session_id = str(session.get("_id", session.get("id", "")))
+    end_time = end_time or session.get("end_time") or datetime.now()
+    start_time = session.get("start_time")
+    if isinstance(start_time, str):
+        start_time = datetime.fromisoformat(start_time)
+
+    transaction_count = session.get("transaction_count", session.get("total_transactions", 0))
+    total_sales = session.get("total_sales", 0.0)
+
+    payment_totals = {
+        mode: {"amount": values.get("amount", 0.0), "count": values.get("count", 0)}
+        for mode, values in counters.get("payments", {}).items()
+    }
+
+    item_mix = sorted(
+        [
+            {"item_name": name, "quantity": values.get("quantity", 0), "revenue": values.get("revenue", 0.0)}
+            for name, values in counters.get("items", {}).items()
+        ],
+        key=lambda x: x["revenue"],
+        reverse=True
+    )
+
+    hours = counters.get("hours", {})
+    hourly_sales = [
+        {
+            "hour": hour,
+            "sales": hours.get(f"{hour:02d}", {}).get("sales", 0.0),
+            "transactions": hours.get(f"{hour:02d}", {}).get("count", 0)
+        }
+        for hour in range(24)
+    ]
+
+    return {
+        "_id": session_id,
+        "session_id": session_id,
+        "store_id": session.get("store_id", settings.DEFAULT_STORE_ID),
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration_minutes": round((end_time - start_time).total_seconds() / 60, 2) if start_time else None,
+        "transaction_count": transaction_count,
+        "total_sales": total_sales,
+        "average_ticket": round(total_sales / transaction_count, 2) if transaction_count else 0.0,
+        "payment_totals": payment_totals,
+        "item_mix": item_mix,
+        "hourly_sales": hourly_sales,
+        "created_at": datetime.now()
+    }
+
+
+def persist_snapshot(session, end_time=None):
+    """Store the Z-report for a closed session; existing snapshots are never rewritten"""
+    snapshot = build_snapshot(session, end_time)
+    collection = get_session_snapshots_collection()
+    if collection is None:
+        return snapshot
+    try:
+        collection.insert_one(snapshot)
+    except DuplicateKeyError:
+        snapshot = collection.find_one({"_id": snapshot["_id"]})
+    return snapshot
+
+
+def get_snapshot(session_id):
+    collection = get_session_snapshots_collection()
+    if collection is None:
+        return None
+    return collection.find_one({"_id": str(session_id)})
+
+
+def get_snapshots_between(start_date, end_date, store_id=None):
+    """Snapshots of sessions that opened and closed inside [start_date, end_date]"""
+    collection = get_session_snapshots_collection()
+    if collection is None:
+        return []
+    return list(collection.find({
+        "store_id": store_id or settings.DEFAULT_STORE_ID,
+        "start_time": {"$gte": start_date},
+        "end_time": {"$lte": end_date}
+    }).sort("start_time", 1))
@@ -0,0 +1,203 @@
+import threading
+import time
+from datetime import datetime
+from app.core.config import settings
+from app.core.shared_state import shared_state
+
+OUT_OF_STOCK = "out_of_stock"
+LOW_STOCK = "low_stock"
+RESTORED = "restored"
+
+
+def alert_type(stock, minimum_stock):
+    if stock <= 0:
+        return OUT_OF_STOCK
+    if stock <= minimum_stock:
+        return LOW_STOCK
+    return None
+
+
+class StockAlertEngine:
+    """The set of below-threshold SKUs per store, kept up to date as stock changes
+
+    Checkout, restock, stock-take and import paths call observe() with the
+    stock levels they just wrote. Only a threshold crossing touches the
+    shared alert set (one compare-and-set on `stock_alerts:{store}`), so
+    every worker reads the same set and alerts() costs O(alerts).
+
+    Each crossing is also published to in-process subscribers and appended
+    to a short shared event log that pollers can read with events(since).
+    reconcile() rebuilds a store's set from a full scan, as a safety net for
+    races between workers and stock changed outside the app. alerts() runs
+    it inline on a store's first read (call that off the event loop), then
+    in a background thread every STOCK_ALERT_RECONCILE_SECONDS while it
+    answers from the current set.
+    """
+
+    def __init__(self, default_minimum=None, threshold_ttl=60, cache_ttl=2.0, max_events=100):
+        self.default_minimum = settings.LOW_STOCK_DEFAULT_MINIMUM if default_minimum is None else default_minimum
+        self.threshold_ttl = threshold_ttl
+        self.cache_ttl = cache_ttl
+        self.max_events = max_events
+        self.subscribers = []
+        self.threshold_loader = None
+        # levels_loader(store_id) -> [(item_id, item_name, stock)] for reconcile()
+        self.levels_loader = None
+        self.reconcile_seconds = settings.STOCK_ALERT_RECONCILE_SECONDS
+        self._reconciled_at = {}
+        # store_id -> (loaded_at, {item_id: minimum_stock})
+        self._thresholds = {}
+        # store_id -> (read_at, alert dict) local mirror of the shared set
+        self._cache = {}
+
+    @staticmethod
+    def _key(store_id):
+        return f"stock_alerts:{store_id}"
+
+    @staticmethod
+    def _events_key(store_id):
+        return f"stock_alert_events:{store_id}"
+
+    def subscribe(self, callback):
+        """callback(event) is called for every crossing seen by this worker"""
+        self.subscribers.append(callback)
+
+    # ------------------------------------------------------------------
+    # Thresholds
+    # ------------------------------------------------------------------
+    def minimum_for(self, store_id, item_id):
+        loaded = self._thresholds.get(store_id)
+        if (loaded is None or time.monotonic() - loaded[0] > self.threshold_ttl) and self.threshold_loader:
+            try:
+                loaded = (time.monotonic(), self.threshold_loader(store_id))
+            except Exception as e:
+                print(f"Could not load stock thresholds for {store_id}: {e}")
+                loaded = (time.monotonic(), loaded[1] if loaded else {})
+            self._thresholds[store_id] = loaded
+        minimum = loaded[1].get(str(item_id)) if loaded else None
+        return self.default_minimum if minimum is None else minimum
+
+    def set_threshold(self, store_id, item_id, minimum_stock):
+        loaded = self._thresholds.setdefault(store_id, (time.monotonic(), {}))
+        loaded[1][str(item_id)] = minimum_stock
+
+    # ------------------------------------------------------------------
+    # Alert set
+    # ------------------------------------------------------------------
+    def _current(self, store_id, fresh=False):
+        cached = self._cache.get(store_id)
+        if fresh or cached is None or time.monotonic() - cached[0] > self.cache_ttl:
+            cached = (time.monotonic(), shared_state.get(self._key(store_id), {}) or {})
+            self._cache[store_id] = cached
+        return cached[1]
+
+    def observe(self, store_id, levels):
+        """Check (item_id, item_name, stock) tuples just written for threshold crossings"""
+        current = self._current(store_id)
+        changes = {}
+        for item_id, item_name, stock in levels:
+            item_id = str(item_id)
+            minimum = self.minimum_for(store_id, item_id)
+            kind = alert_type(stock, minimum)
+            known = current.get(item_id)
+            if kind is None and known is None:
+                continue
+            if kind is not None and known is not None and known["alert_type"] == kind and known["stock"] == stock:
+                continue
+            changes[item_id] = (item_name, stock, minimum, kind)
+        if changes:
+            self._apply(store_id, changes)
+
+    def _apply(self, store_id, changes, replace=False):
+        events = []
+
+        def update(alerts):
+            alerts = dict(alerts or {})
+            events.clear()
+            now = datetime.now().isoformat()
+            if replace:
+                # Items missing from a full rebuild (e.g. deleted) drop out of the set
+                for item_id in [i for i in alerts if i not in changes]:
+                    previous = alerts.pop(item_id)
+                    events.append({"item_id": item_id, "item_name": previous["item_name"], "stock": None,
+                                   "minimum_stock": previous["minimum_stock"], "alert_type": RESTORED,
+                                   "previous": previous["alert_type"], "at": now})
+            for item_id, (item_name, stock, minimum, kind) in changes.items():
+                previous = alerts.get(item_id)
+                if kind is None:
+                    if previous is not None:
+                        del alerts[item_id]
+                        events.append({"item_id": item_id, "item_name": item_name, "stock": stock,
+                                       "minimum_stock": minimum, "alert_type": RESTORED, "previous": previous["alert_type"], "at": now})
+                    continue
+                alerts[item_id] = {
+                    "item_id": item_id,
+                    "item_name": item_name,
+                    "stock": stock,
+                    "minimum_stock": minimum,
+                    "alert_type": kind,
+                    "since": previous["since"] if previous and previous["alert_type"] == kind else now
+                }
+                if previous is None or previous["alert_type"] != kind:
+                    events.append({"item_id": item_id, "item_name": item_name, "stock": stock, "minimum_stock": minimum,
+                                   "alert_type": kind, "previous": previous["alert_type"] if previous else None, "at": now})
+            return alerts
+
+        try:
+            alerts = shared_state.update(self._key(store_id), update)
+        except Exception as e:
+            print(f"Could not update stock alerts for {store_id}: {e}")
+            return
+        self._cache[store_id] = (time.monotonic(), alerts)
+        if events:
+            self._publish(store_id, events)
+
+    def _publish(self, store_id, events):
+        for event in events:
+            event["store_id"] = store_id
+        try:
+            shared_state.update(self._events_key(store_id), lambda log: ((log or []) + events)[-self.max_events:])
+        except Exception as e:
+            print(f"Could not log stock alert events: {e}")
+        for event in events:
+            for callback in self.subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Stock alert subscriber failed: {e}")
+
+    def alerts(self, store_id):
+        """Current alerts, out of stock first; O(alerts) apart from the first read"""
+        last = self._reconciled_at.get(store_id)
+        if self.levels_loader and (last is None or time.monotonic() - last > self.reconcile_seconds):
+            self._reconciled_at[store_id] = time.monotonic()
+            if last is None:
+                # Nothing to answer from yet
+                self._reconcile_from_loader(store_id)
+            else:
+                threading.Thread(
+                    target=self._reconcile_from_loader, args=(store_id,), name="stock-alerts-reconcile", daemon=True
+                ).start()
+        alerts = self._current(store_id, fresh=True)
+        return sorted(alerts.values(), key=lambda a: (a["alert_type"] != OUT_OF_STOCK, a["stock"]))
+
+    def events(self, store_id, since=None):
+        log = shared_state.get(self._events_key(store_id), []) or []
+        return [e for e in log if not since or e["at"] > since]
+
+    def _reconcile_from_loader(self, store_id):
+        try:
+            self.reconcile(store_id, self.levels_loader(store_id))
+        except Exception as e:
+            print(f"Could not reconcile stock alerts for {store_id}: {e}")
+
+    def reconcile(self, store_id, levels):
+        """Rebuild a store's alert set from a full list of (item_id, item_name, stock)"""
+        changes = {}
+        for item_id, item_name, stock in levels:
+            minimum = self.minimum_for(store_id, item_id)
+            changes[str(item_id)] = (item_name, stock, minimum, alert_type(stock, minimum))
+        self._apply(store_id, changes, replace=True)
+
+
+stock_alerts = StockAlertEngine()
@@ -0,0 +1,332 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.core.config import settings
+from app.core.database import (
+    get_stock_movements_collection, get_stock_snapshots_collection,
+    get_items_collection, get_inventory_collection, is_mongo_available
+)
+from app.core.shared_state import shared_state
+
+# Movement kinds. Quantities are signed: sales are negative, restocks positive.
+SALE = "sale"
+RESTOCK = "restock"
+ADJUSTMENT = "adjustment"
+WASTE = "waste"
+STOCKTAKE = "stocktake"
+OPENING = "opening"
+MOVEMENT_KINDS = (SALE, RESTOCK, ADJUSTMENT, WASTE, STOCKTAKE, OPENING)
+# Kinds that mean stock went missing rather than being sold
+SHRINKAGE_KINDS = (WASTE, STOCKTAKE, ADJUSTMENT)
+
+
+def _to_millis(when):
+    """BSON dates keep milliseconds; batch times are compared at that precision"""
+    return when.replace(microsecond=when.microsecond // 1000 * 1000)
+
+
+class StockLedger:
+    """Append-only stock movements with periodic per-SKU snapshots
+
+    Every change to an item's stock is also written as a movement
+    {store_id, item_id, kind, quantity, timestamp}; movements are never
+    updated or deleted. take_snapshots() folds the movements since the
+    previous snapshot batch into one {item_id: stock} document per item, so
+    stock at any time t is the nearest snapshot batch plus (or minus) the
+    movements between it and t, instead of a replay from the beginning.
+
+    The first batch of a store is seeded from the live `items.stock` values;
+    later batches are computed from the ledger alone. Movements are stamped
+    when they are recorded (a back-dated batch sale keeps its sale time in
+    `occurred_at`), so nothing is ever appended behind a snapshot.
+    """
+
+    def __init__(self):
+        self._snapshot_thread = None
+        self.worker_id = uuid.uuid4().hex
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def movement(self, store_id, item_id, kind, quantity, item_name=None, reference=None, note=None, occurred_at=None):
+        now = datetime.now()
+        return {
+            "store_id": store_id,
+            "item_id": str(item_id),
+            "item_name": item_name,
+            "kind": kind,
+            "quantity": quantity,
+            "reference": reference,
+            "note": note,
+            "timestamp": now,
+            "occurred_at": occurred_at or now
+        }
+
+    def record(self, movements):
+        """Append movements (dicts from movement()); no-op while MongoDB is down"""
+        movements = [m for m in movements if m["quantity"]]
+        if not movements or not is_mongo_available():
+            return 0
+        try:
+            get_stock_movements_collection().insert_many(movements, ordered=False)
+            return len(movements)
+        except Exception as e:
+            print(f"Could not record stock movements: {e}")
+            return 0
+
+    def record_sale(self, store_id, transaction_id, items, timestamp=None):
+        """Movements for the lines of one sale"""
+        return self.record([
+            self.movement(store_id, item["item_id"], SALE, -int(item["quantity"]),
+                          item.get("item_name"), str(transaction_id), occurred_at=timestamp)
+            for item in items
+        ])
+
+    def record_sales(self, store_id, transactions):
+        """Movements for a batch of sales, in one insert_many"""
+        return self.record([
+            self.movement(store_id, item["item_id"], SALE, -int(item["quantity"]), item.get("item_name"),
+                          str(doc.get("_id", doc.get("id"))), occurred_at=doc["timestamp"])
+            for doc in transactions
+            for item in doc["items"]
+        ])
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+    def _latest_batch(self, store_id, at=None, before=True):
+        query = {"store_id": store_id}
+        if at is not None:
+            query["at"] = {"$lte": at} if before else {"$gt": at}
+        doc = get_stock_snapshots_collection().find_one(query, {"at": 1}, sort=[("at", -1 if before else 1)])
+        return doc["at"] if doc else None
+
+    def _batch(self, store_id, at):
+        return {
+            doc["item_id"]: doc["stock"]
+            for doc in get_stock_snapshots_collection().find({"store_id": store_id, "at": at}, {"item_id": 1, "stock": 1})
+        }
+
+    def _movement_totals(self, store_id, start, end, by_kind=False):
+        """Sum of movements per item (and kind) with start < timestamp <= end"""
+        group_id = {"item_id": "$item_id", "kind": "$kind"} if by_kind else "$item_id"
+        pipeline = [
+            {"$match": {"store_id": store_id, "timestamp": {"$gt": start, "$lte": end}}},
+            {"$group": {"_id": group_id, "quantity": {"$sum": "$quantity"}, "item_name": {"$last": "$item_name"}}}
+        ]
+        return list(get_stock_movements_collection().aggregate(pipeline))
+
+    def _live_stock(self, store_id):
+        return {
+            str(doc["_id"]): doc.get("stock", 0)
+            for doc in get_items_collection().find({"store_id": store_id}, {"stock": 1})
+        }
+
+    def take_snapshots(self, store_id, at=None):
+        """Write a snapshot batch for every item of the store at `at`
+
+        Defaults to a minute ago so writes still in flight are not missed.
+        """
+        previous_at = self._latest_batch(store_id)
+        if previous_at is None:
+            # Seed batch: the live values as of this moment
+            at = _to_millis(datetime.now())
+            stock = self._live_stock(store_id)
+        else:
+            at = _to_millis(at or datetime.now() - timedelta(minutes=1))
+            if at <= previous_at:
+                return 0
+            stock = self._batch(store_id, previous_at)
+            for row in self._movement_totals(store_id, previous_at, at):
+                stock[row["_id"]] = stock.get(row["_id"], 0) + row["quantity"]
+        if not stock:
+            return 0
+        get_stock_snapshots_collection().insert_many(
+            [{"store_id": store_id, "item_id": item_id, "stock": value, "at": at} for item_id, value in stock.items()],
+            ordered=False
+        )
+        return len(stock)
+
+    def take_all_snapshots(self):
+        stores = get_items_collection().distinct("store_id")
+        return {store_id: self.take_snapshots(store_id) for store_id in stores}
+
+    def start_snapshots(self, interval_hours=None):
+        """Snapshot every store each LEDGER_SNAPSHOT_HOURS, from one worker at a time"""
+        interval = (interval_hours or settings.LEDGER_SNAPSHOT_HOURS) * 3600
+        if self._snapshot_thread is not None or interval <= 0:
+            return
+
+        def run():
+            while True:
+                try:
+                    # The lease expires with the interval, so only one worker snapshots per period
+                    holder, version = shared_state.get_versioned("ledger:snapshot_lease")
+                    if is_mongo_available() and holder is None and shared_state.compare_and_set("ledger:snapshot_lease", self.worker_id, version, ttl=interval):
+                        started = time.perf_counter()
+                        counts = self.take_all_snapshots()
+                        print(f"Stock snapshots taken for {sum(counts.values())} items in {(time.perf_counter() - started) * 1000:.0f} ms")
+                except Exception as e:
+                    print(f"Stock snapshot job failed: {e}")
+                time.sleep(min(interval, 3600))
+
+        self._snapshot_thread = threading.Thread(target=run, name="stock-snapshots", daemon=True)
+        self._snapshot_thread.start()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def stock_at(self, store_id, at=None):
+        """{item_id: stock} at time `at`: nearest snapshot batch +/- movements in between"""
+        at = at or datetime.now()
+        base_at = self._latest_batch(store_id, at)
+        if base_at is not None:
+            stock = self._batch(store_id, base_at)
+            for row in self._movement_totals(store_id, base_at, at):
+                stock[row["_id"]] = stock.get(row["_id"], 0) + row["quantity"]
+            return stock
+
+        # Before the first batch: walk back from the earliest one
+        base_at = self._latest_batch(store_id, at, before=False)
+        if base_at is None:
+            self.take_snapshots(store_id)
+            return self.stock_at(store_id, at) if self._latest_batch(store_id) else {}
+        stock = self._batch(store_id, base_at)
+        for row in self._movement_totals(store_id, at, base_at):
+            stock[row["_id"]] = stock.get(row["_id"], 0) - row["quantity"]
+        return stock
+
+    def _unit_costs(self, store_id):
+        """cost_price from inventory, else price x MENU_DEFAULT_COST_RATIO"""
+        costs = {
+            str(doc["_id"]): (doc.get("name"), doc.get("price", 0) * settings.MENU_DEFAULT_COST_RATIO)
+            for doc in get_items_collection().find({"store_id": store_id}, {"name": 1, "price": 1})
+        }
+        for doc in get_inventory_collection().find(
+            {"store_id": store_id, "cost_price": {"$ne": None}}, {"item_id": 1, "cost_price": 1}
+        ):
+            name = costs.get(str(doc["item_id"]), (None, 0))[0]
+            costs[str(doc["item_id"])] = (name, doc["cost_price"])
+        return costs
+
+    def movements_summary(self, store_id, start, end):
+        """{item_id: {kind: quantity}} for start < timestamp <= end, plus item names"""
+        summary, names = {}, {}
+        for row in self._movement_totals(store_id, start, end, by_kind=True):
+            item_id = row["_id"]["item_id"]
+            summary.setdefault(item_id, {})[row["_id"]["kind"]] = row["quantity"]
+            names[item_id] = row.get("item_name") or names.get(item_id)
+        return summary, names
+
+    def shrinkage(self, store_id, start, end):
+        """Stock lost to waste, stock-take differences and negative adjustments"""
+        summary, names = self.movements_summary(store_id, start, end)
+        costs = self._unit_costs(store_id)
+        rows = []
+        for item_id, kinds in summary.items():
+            lost = -sum(min(kinds.get(kind, 0), 0) for kind in SHRINKAGE_KINDS)
+            if lost <= 0:
+                continue
+            name, unit_cost = costs.get(item_id, (names.get(item_id), 0))
+            rows.append({
+                "item_id": item_id,
+                "item_name": name or names.get(item_id),
+                "quantity": lost,
+                "sold": -kinds.get(SALE, 0),
+                "shrinkage_rate": round(lost / (lost - kinds.get(SALE, 0)), 4),
+                "value": round(lost * unit_cost, 2)
+            })
+        rows.sort(key=lambda r: r["value"], reverse=True)
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "items": rows,
+            "total_quantity": sum(r["quantity"] for r in rows),
+            "total_value": round(sum(r["value"] for r in rows), 2)
+        }
+
+    def turnover(self, store_id, start, end):
+        """Units sold / average of opening and closing stock, per item"""
+        opening = self.stock_at(store_id, start)
+        closing = self.stock_at(store_id, end)
+        summary, names = self.movements_summary(store_id, start, end)
+        costs = self._unit_costs(store_id)
+        days = max((end - start).total_seconds() / 86400, 1e-9)
+        rows = []
+        for item_id in set(opening) | set(closing) | set(summary):
+            sold = -summary.get(item_id, {}).get(SALE, 0)
+            average = (opening.get(item_id, 0) + closing.get(item_id, 0)) / 2
+            turns = sold / average if average > 0 else None
+            rows.append({
+                "item_id": item_id,
+                "item_name": costs.get(item_id, (None, 0))[0] or names.get(item_id),
+                "opening_stock": opening.get(item_id, 0),
+                "closing_stock": closing.get(item_id, 0),
+                "sold": sold,
+                "turnover": round(turns, 3) if turns is not None else None,
+                "days_on_hand": round(days / turns, 1) if turns else None
+            })
+        rows.sort(key=lambda r: r["turnover"] if r["turnover"] is not None else -1, reverse=True)
+        return {"start": start.isoformat(), "end": end.isoformat(), "days": round(days, 2), "items": rows}
+
+    def stock_take(self, store_id, counts, note=None):
+        """Set counted quantities on items.stock, book the differences and return the variance report
+
+        counts: {item_id: counted quantity}. Each item's stock is replaced by
+        its count atomically, and the variance is the count minus the stock
+        it replaced, so the ledger moves exactly as items.stock did. Unlike
+        record(), failures raise: a count must not be half booked silently.
+        Ids that match no item of the store are returned in `unknown_items`.
+        """
+        at = datetime.now()
+        costs = self._unit_costs(store_id)
+        items = get_items_collection()
+        rows, movements, unknown = [], [], []
+        for item_id, counted in counts.items():
+            item_id = str(item_id)
+            previous = items.find_one_and_update(
+                {"_id": ObjectId(item_id), "store_id": store_id},
+                {"$set": {"stock": counted}},
+                projection={"stock": 1},
+                return_document=ReturnDocument.BEFORE
+            ) if ObjectId.is_valid(item_id) else None
+            if previous is None:
+                unknown.append(item_id)
+                continue
+            expected = previous.get("stock", 0)
+            variance = counted - expected
+            name, unit_cost = costs.get(item_id, (None, 0))
+            rows.append({
+                "item_id": item_id,
+                "item_name": name,
+                "expected": expected,
+                "counted": counted,
+                "variance": variance,
+                "variance_value": round(variance * unit_cost, 2)
+            })
+            if variance:
+                movements.append(self.movement(store_id, item_id, STOCKTAKE, variance, name, note=note))
+        if movements:
+            get_stock_movements_collection().insert_many(movements, ordered=False)
+        rows.sort(key=lambda r: abs(r["variance_value"]), reverse=True)
+        return {
+            "at": at.isoformat(),
+            "items": rows,
+            "items_counted": len(rows),
+            "items_with_variance": sum(1 for r in rows if r["variance"]),
+            "total_variance_value": round(sum(r["variance_value"] for r in rows), 2),
+            "unknown_items": unknown
+        }
+
+    def item_movements(self, store_id, item_id, start=None, end=None, limit=200):
+        query = {"store_id": store_id, "item_id": str(item_id)}
+        if start or end:
+            query["timestamp"] = {**({"$gt": start} if start else {}), **({"$lte": end} if end else {})}
+        cursor = get_stock_movements_collection().find(query, {"_id": 0}).sort("timestamp", -1).limit(limit)
+        return list(cursor)
+
+
+stock_ledger = StockLedger()
@@ -1,52 +1,65 @@
 from datetime import datetime
-from app.core.database import db
+from app.core.shared_state import shared_state
 from app.models.store_models import StoreStatus, Session
 
+
 class StoreService:
+    """Store status and till session, kept in shared state so all workers agree"""
+
+    @staticmethod
+    def _status_key(store_id):
+        return f"store:{store_id}:status"
+
     @staticmethod
-    async def get_store_status():
-        collection = db.store_status
-        status = await collection.find_one()
+    def _session_key(store_id):
+        return f"store:{store_id}:session"
+
+    def get_store_status(self, store_id):
+        status = shared_state.get(self._status_key(store_id))
         if not status:
-            # Create default
-            default_status = StoreStatus()
-            await collection.insert_one(default_status.dict())
-            status = await collection.find_one()
+            status = StoreStatus().dict()
         return status
 
-    @staticmethod
-    async def update_store_status(new_status: str):
-        collection = db.store_status
-        await collection.update_one(
-            {},
-            {"$set": {
-                "status": new_status,
-                "last_updated": datetime.utcnow(),
-                "updated_by": "user"
-            }},
-            upsert=True
-        )
-        return await collection.find_one()
+    def update_store_status(self, store_id, new_status, updated_by="user"):
+        status = {
+            **StoreStatus().dict(),
+            **(shared_state.get(self._status_key(store_id)) or {}),
+            "status": new_status,
+            "last_updated": datetime.utcnow().isoformat(),
+            "updated_by": updated_by
+        }
+        shared_state.set(self._status_key(store_id), status)
 
-    @staticmethod
-    async def create_session():
-        collection = db.sessions
-        session_id = f"session_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-        session = Session(session_id=session_id)
-        await collection.insert_one(session.dict())
-        return await collection.find_one({"session_id": session_id})
+        if new_status == "OPEN":
+            self.create_session(store_id)
+        elif new_status == "CLOSED":
+            self.close_current_session(store_id)
+        return status
 
-    @staticmethod
-    async def get_current_session():
-        collection = db.sessions
-        return await collection.find_one({"status": "active"})
+    def create_session(self, store_id):
+        """Open a session unless one is already open; safe when workers race"""
+        key = self._session_key(store_id)
+        current, version = shared_state.get_versioned(key)
+        if current:
+            return current
 
-    @staticmethod
-    async def close_current_session():
-        collection = db.sessions
-        await collection.update_one(
-            {"status": "active"},
-            {"$set": {"status": "closed", "closed_at": datetime.utcnow()}}
-        )
-
-store_service = StoreService()
\ No newline at end of file
+        session = Session(session_id=f"session_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}").dict()
+        session["id"] = session["session_id"]
+        session["opened_at"] = session["opened_at"].isoformat()
+        if shared_state.compare_and_set(key, session, version):
+            return session
+        # Another worker opened it between our read and write
+        return shared_state.get(key)
+
+    def get_current_session(self, store_id):
+        return shared_state.get(self._session_key(store_id))
+
+    def close_current_session(self, store_id):
+        session = shared_state.pop(self._session_key(store_id))
+        if session:
+            session["status"] = "closed"
+            session["closed_at"] = datetime.utcnow().isoformat()
+        return session
+
+
+store_service = StoreService()
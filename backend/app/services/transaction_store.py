@@ -0,0 +1,510 @@
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.core.database import get_transactions_collection, get_transaction_buckets_collection
+from app.core.stores import store_filter
+
+# Transaction storage layouts (TRANSACTION_STORAGE)
+DOCUMENTS = "documents"
+BUCKETS = "buckets"
+
+# Group keys understood by group_line_items, as Mongo expressions over a
+# timestamp field. $dayOfWeek: 1 = Sunday ... 7 = Saturday.
+def _key_expressions(time_field, name_field):
+    return {
+        "hour": {"$hour": time_field},
+        "date": {"$dateToString": {"format": "%Y-%m-%d", "date": time_field}},
+        "day_of_week": {"$dayOfWeek": time_field},
+        "is_weekend": {"$cond": {"if": {"$in": [{"$dayOfWeek": time_field}, [6, 7]]}, "then": 1, "else": 0}},
+        "item_name": name_field,
+    }
+
+
+def key_values(timestamp, item_name):
+    day_of_week = timestamp.isoweekday() % 7 + 1
+    return {
+        "hour": timestamp.hour,
+        "date": timestamp.strftime("%Y-%m-%d"),
+        "day_of_week": day_of_week,
+        "is_weekend": 1 if day_of_week in [6, 7] else 0,
+        "item_name": item_name,
+    }
+
+
+def hour_of(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def summary_key(item):
+    """Field name for an item in a bucket's `items` summary (no dots or leading $)"""
+    return str(item.get("item_id") or item.get("item_name") or "unknown").replace(".", "_").lstrip("$") or "unknown"
+
+
+class TransactionStore:
+    """Read/write adapter over the two transaction storage layouts
+
+    documents: one document per sale in `transactions` (the original layout).
+    buckets:   sales grouped into one `transaction_buckets` document per store
+               and hour (split every TRANSACTION_BUCKET_MAX_SALES sales), with
+               running totals kept next to the sales:
+
+        {store_id, hour, count, total_amount,
+         items: {<item id>: {name, quantity, revenue}},
+         idempotency_keys: [<till idempotency key>, ...],
+         sales: [{_id, session_id, timestamp, items, total_amount, ...}]}
+
+    A sale is added with one upsert ($push + $inc), so grouped reads over
+    whole hours come from the totals without unwinding sales at all, and
+    the (store_id, hour) index has one entry per bucket instead of per sale.
+
+    Idempotency keys stay unique per store in both layouts: documents have
+    a unique index, buckets a unique multikey index on idempotency_keys, and
+    a sale is never pushed into a bucket already holding its key. Sales
+    written as documents before switching to buckets are read alongside the
+    buckets until migrate() folds them in.
+    """
+
+    def __init__(self, layout=None, max_sales=None):
+        self.layout = layout or settings.TRANSACTION_STORAGE
+        self.max_sales = max_sales or settings.TRANSACTION_BUCKET_MAX_SALES
+
+    @property
+    def bucketed(self):
+        return self.layout == BUCKETS
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+    def _bucket_write(self, transaction):
+        """(filter, update) of the upsert that appends one sale to its store/hour bucket"""
+        sale = {k: v for k, v in transaction.items() if k != "store_id"}
+        sale.setdefault("_id", ObjectId())
+        inc = {"count": 1, "total_amount": transaction.get("total_amount", 0)}
+        names = {}
+        for item in transaction.get("items", []):
+            key = summary_key(item)
+            inc[f"items.{key}.quantity"] = inc.get(f"items.{key}.quantity", 0) + item.get("quantity", 0)
+            inc[f"items.{key}.revenue"] = inc.get(f"items.{key}.revenue", 0) + item.get("total", 0)
+            names[f"items.{key}.name"] = item.get("item_name")
+        update = {"$push": {"sales": sale}, "$inc": inc}
+        if names:
+            update["$set"] = names
+        # A full bucket no longer matches, so the upsert opens the next one
+        query = {"store_id": transaction["store_id"], "hour": hour_of(transaction["timestamp"]), "count": {"$lt": self.max_sales}}
+        key = transaction.get("idempotency_key")
+        if key:
+            # A bucket holding the key doesn't match either; the new bucket then
+            # collides with it on the unique index (DuplicateKeyError)
+            query["idempotency_keys"] = {"$ne": key}
+            update["$push"]["idempotency_keys"] = key
+        return query, update
+
+    def bucket_update(self, transaction):
+        """The upsert that appends one sale to its store/hour bucket"""
+        return UpdateOne(*self._bucket_write(transaction), upsert=True)
+
+    def insert(self, transaction):
+        """Write one sale in the configured layout; returns it with its _id
+
+        Raises DuplicateKeyError when its idempotency key is already recorded.
+        """
+        if not self.bucketed:
+            transaction["_id"] = get_transactions_collection().insert_one(transaction).inserted_id
+            return transaction
+        transaction.setdefault("_id", ObjectId())
+        get_transaction_buckets_collection().update_one(*self._bucket_write(transaction), upsert=True)
+        return transaction
+
+    def insert_many(self, transactions):
+        """Write sales unordered; raises BulkWriteError with per-sale writeErrors (index = position)"""
+        if not transactions:
+            return transactions
+        if not self.bucketed:
+            get_transactions_collection().insert_many(transactions, ordered=False)
+            return transactions
+        for transaction in transactions:
+            transaction.setdefault("_id", ObjectId())
+        get_transaction_buckets_collection().bulk_write(
+            [self.bucket_update(transaction) for transaction in transactions], ordered=False
+        )
+        return transactions
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _unpack(bucket, start=None, end=None, session_id=None, exclude_sessions=None):
+        for sale in bucket.get("sales", []):
+            if (start and sale["timestamp"] < start) or (end and sale["timestamp"] > end):
+                continue
+            if session_id is not None and sale.get("session_id") != session_id:
+                continue
+            if exclude_sessions and sale.get("session_id") in exclude_sessions:
+                continue
+            yield {**sale, "store_id": bucket["store_id"]}
+
+    @staticmethod
+    def _hour_range(start=None, end=None):
+        query = {}
+        if start:
+            query["$gte"] = hour_of(start)
+        if end:
+            query["$lte"] = end
+        return query
+
+    def find(self, store_id, start=None, end=None, session_id=None, exclude_sessions=None, limit=None, fields=None):
+        """Sales of a store, newest first, from whichever layouts hold them
+
+        `fields` limits the sale fields loaded (plus _id, timestamp and
+        session_id, which filtering and ordering need).
+        """
+        query = {}
+        if start or end:
+            query["timestamp"] = {k: v for k, v in (("$gte", start), ("$lte", end)) if v}
+        if session_id is not None:
+            query["session_id"] = session_id
+        if exclude_sessions:
+            query["session_id"] = {"$nin": list(exclude_sessions)}
+        wanted = None if fields is None else {"timestamp": 1, "session_id": 1, **{name: 1 for name in fields}}
+        cursor = get_transactions_collection().find(store_filter(store_id, query), wanted).sort("timestamp", -1)
+        if not self.bucketed:
+            return list(cursor.limit(limit) if limit else cursor)
+
+        bucket_query = {"store_id": store_id}
+        if start or end:
+            bucket_query["hour"] = self._hour_range(start, end)
+        if session_id is not None:
+            bucket_query["sales.session_id"] = session_id
+        sales = list(cursor.limit(limit) if limit else cursor)
+        bucket_fields = None if wanted is None else {
+            "store_id": 1, "hour": 1, "sales._id": 1, **{f"sales.{name}": 1 for name in wanted}
+        }
+        for bucket in get_transaction_buckets_collection().find(bucket_query, bucket_fields).sort("hour", -1):
+            if limit and len(sales) >= limit:
+                sales.sort(key=lambda sale: sale["timestamp"], reverse=True)
+                if bucket["hour"] + timedelta(hours=1) <= sales[limit - 1]["timestamp"]:
+                    break
+            sales.extend(self._unpack(bucket, start, end, session_id, exclude_sessions))
+        sales.sort(key=lambda sale: sale["timestamp"], reverse=True)
+        return sales[:limit] if limit else sales
+
+    def get(self, store_id, transaction_id):
+        """One sale by id, or None"""
+        object_id = ObjectId(transaction_id)
+        transaction = get_transactions_collection().find_one(store_filter(store_id, {"_id": object_id}))
+        if transaction or not self.bucketed:
+            return transaction
+        bucket = get_transaction_buckets_collection().find_one({"store_id": store_id, "sales._id": object_id})
+        if not bucket:
+            return None
+        return next((sale for sale in self._unpack(bucket) if sale["_id"] == object_id), None)
+
+    def existing_keys(self, store_id, keys):
+        """Map idempotency keys already recorded for this store to their transaction ids"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        found = {
+            doc["idempotency_key"]: str(doc["_id"])
+            for doc in get_transactions_collection().find(
+                store_filter(store_id, {"idempotency_key": {"$in": keys}}), {"idempotency_key": 1}
+            )
+        }
+        if self.bucketed:
+            wanted = set(keys)
+            for bucket in get_transaction_buckets_collection().find(
+                {"store_id": store_id, "idempotency_keys": {"$in": keys}}, {"sales._id": 1, "sales.idempotency_key": 1}
+            ):
+                for sale in bucket.get("sales", []):
+                    if sale.get("idempotency_key") in wanted:
+                        found[sale["idempotency_key"]] = str(sale["_id"])
+        return found
+
+    def find_by_key(self, store_id, idempotency_key):
+        """The sale recorded under a till idempotency key, or None"""
+        transaction = get_transactions_collection().find_one(store_filter(store_id, {"idempotency_key": idempotency_key}))
+        if transaction or not self.bucketed:
+            return transaction
+        bucket = get_transaction_buckets_collection().find_one({"store_id": store_id, "idempotency_keys": idempotency_key})
+        if not bucket:
+            return None
+        return next((sale for sale in self._unpack(bucket) if sale.get("idempotency_key") == idempotency_key), None)
+
+    def sales_since(self, start=None, created_after=None, store_id=None, fields=None):
+        """Sales of both layouts with a timestamp from `start`, or written after `created_after`
+
+        created_after is a unix time compared with the ObjectId creation time,
+        so back-dated catch-up sales are found too. `fields` limits the sale
+        fields loaded (store_id and timestamp always come back).
+        """
+        query = {} if store_id is None else {"store_id": store_id}
+        object_id = None
+        if start is not None:
+            query["timestamp"] = {"$gte": start}
+        if created_after is not None:
+            object_id = ObjectId.from_datetime(datetime.fromtimestamp(created_after, timezone.utc))
+            query["_id"] = {"$gte": object_id}
+        wanted = None if fields is None else {name: 1 for name in ("store_id", "timestamp", *fields)}
+        yield from get_transactions_collection().find(query, wanted).batch_size(5000)
+        if not self.bucketed:
+            return
+
+        bucket_query = {} if store_id is None else {"store_id": store_id}
+        if start is not None:
+            bucket_query["hour"] = {"$gte": hour_of(start)}
+        if object_id is not None:
+            bucket_query["sales._id"] = {"$gte": object_id}
+        bucket_fields = None if wanted is None else {
+            "store_id": 1, "sales._id": 1, **{f"sales.{name}": 1 for name in wanted if name != "store_id"}
+        }
+        for bucket in get_transaction_buckets_collection().find(bucket_query, bucket_fields).batch_size(500):
+            for sale in self._unpack(bucket, start):
+                if object_id is None or sale["_id"] >= object_id:
+                    yield sale
+
+    def stores(self):
+        """Ids of the stores that have sales in either layout"""
+        store_ids = set(get_transactions_collection().distinct("store_id"))
+        if self.bucketed:
+            store_ids.update(get_transaction_buckets_collection().distinct("store_id"))
+        return sorted(store_id for store_id in store_ids if store_id)
+
+    def group_line_items(self, store_id, start=None, end=None, keys=("item_name",),
+                         quantity_field="quantity", revenue_field="revenue"):
+        """`$unwind: $items` + `$group` over the hot layouts
+
+        Same output as TransactionArchive.group_line_items, e.g.
+        {"_id": {"hour": 9, "item_name": "Tea"}, "quantity": 12, "revenue": 240.0}
+        Keys: hour, date, day_of_week, is_weekend, item_name.
+        """
+        match = {"store_id": store_id}
+        if start or end:
+            match["timestamp"] = {k: v for k, v in (("$gte", start), ("$lte", end)) if v}
+        expressions = _key_expressions("$timestamp", "$items.item_name")
+        results = list(get_transactions_collection().aggregate([
+            {"$match": match},
+            {"$unwind": "$items"},
+            {"$group": {
+                "_id": {key: expressions[key] for key in keys},
+                quantity_field: {"$sum": "$items.quantity"},
+                revenue_field: {"$sum": "$items.total"}
+            }}
+        ]))
+        if not self.bucketed:
+            return results
+        # archive_service brings pandas; main.py imports this module at startup
+        from app.services.archive_service import union_grouped
+        return union_grouped(results, self._group_buckets(store_id, start, end, keys, quantity_field, revenue_field),
+                             [quantity_field, revenue_field])
+
+    def _group_buckets(self, store_id, start, end, keys, quantity_field, revenue_field):
+        collection = get_transaction_buckets_collection()
+        # Hours wholly inside [start, end] are answered from the bucket totals;
+        # the partial hours at either end are summed from their sales
+        full = {}
+        edge_hours = []
+        if start:
+            full["$gte"] = start if start == hour_of(start) else hour_of(start) + timedelta(hours=1)
+            if start != hour_of(start):
+                edge_hours.append(hour_of(start))
+        if end:
+            full["$lt"] = hour_of(end)
+            edge_hours.append(hour_of(end))
+        match = {"store_id": store_id}
+        if full:
+            match["hour"] = full
+        expressions = _key_expressions("$hour", "$items.v.name")
+        results = list(collection.aggregate([
+            {"$match": match},
+            {"$project": {"hour": 1, "items": {"$objectToArray": "$items"}}},
+            {"$unwind": "$items"},
+            {"$group": {
+                "_id": {key: expressions[key] for key in keys},
+                quantity_field: {"$sum": "$items.v.quantity"},
+                revenue_field: {"$sum": "$items.v.revenue"}
+            }}
+        ]))
+
+        edges = {}
+        for bucket in collection.find({"store_id": store_id, "hour": {"$in": edge_hours}}) if edge_hours else []:
+            for sale in self._unpack(bucket, start, end):
+                for item in sale.get("items", []):
+                    values = key_values(sale["timestamp"], item.get("item_name"))
+                    key = tuple(values[k] for k in keys)
+                    totals = edges.setdefault(key, [0, 0.0])
+                    totals[0] += item.get("quantity", 0)
+                    totals[1] += item.get("total", 0)
+        edge_results = [
+            {"_id": dict(zip(keys, key)), quantity_field: quantity, revenue_field: revenue}
+            for key, (quantity, revenue) in edges.items()
+        ]
+        from app.services.archive_service import union_grouped
+        return union_grouped(results, edge_results, [quantity_field, revenue_field])
+
+    # ------------------------------------------------------------------
+    # Migration and archiving
+    # ------------------------------------------------------------------
+    def migrate(self, older_than_hours=0, batch_size=1000, store_id=None):
+        """Move sale documents older than `older_than_hours` into buckets
+
+        Safe to re-run after an interruption: sales already present in a
+        bucket are skipped, and documents are deleted only once their
+        bucket writes succeeded. Refuses to run unless TRANSACTION_STORAGE
+        is "buckets": with the document layout nothing would read the moved
+        sales any more.
+        """
+        if not self.bucketed:
+            raise RuntimeError("Set TRANSACTION_STORAGE=buckets (on every worker) before migrating to buckets")
+        documents = get_transactions_collection()
+        buckets = get_transaction_buckets_collection()
+        query = {"timestamp": {"$lt": datetime.now() - timedelta(hours=older_than_hours)}}
+        if store_id:
+            query = store_filter(store_id, query)
+        moved = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(documents.find(query).sort("timestamp", 1).limit(batch_size))
+            if not batch:
+                break
+            ids = [doc["_id"] for doc in batch]
+            already = {
+                sale["_id"]
+                for bucket in buckets.find({"sales._id": {"$in": ids}}, {"sales._id": 1})
+                for sale in bucket["sales"]
+            }
+            operations = [
+                self.bucket_update({**doc, "store_id": doc.get("store_id") or settings.DEFAULT_STORE_ID})
+                for doc in batch if doc["_id"] not in already and isinstance(doc.get("timestamp"), datetime)
+            ]
+            if operations:
+                # Ordered, so consecutive sales fill a bucket before the next one opens
+                buckets.bulk_write(operations, ordered=True)
+            documents.delete_many({"_id": {"$in": ids}})
+            moved += len(operations)
+        return {"migrated": moved, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def pop_before(self, cutoff, limit=None):
+        """Sales in (up to `limit`) buckets of hours before `cutoff`, and a callback that deletes those buckets"""
+        collection = get_transaction_buckets_collection()
+        cursor = collection.find({"hour": {"$lt": cutoff}}).sort("hour", 1)
+        buckets = list(cursor.limit(limit) if limit else cursor)
+        sales = [sale for bucket in buckets for sale in self._unpack(bucket)]
+        return sales, lambda: collection.delete_many({"_id": {"$in": [bucket["_id"] for bucket in buckets]}})
+
+    def stats(self):
+        """Data and index sizes of both layouts"""
+        database = get_transactions_collection().database
+        report = {"layout": self.layout}
+        for name in ("transactions", "transaction_buckets"):
+            try:
+                stats = database.command("collStats", name)
+                report[name] = {
+                    "documents": stats.get("count", 0),
+                    "size_bytes": stats.get("size", 0),
+                    "storage_bytes": stats.get("storageSize", 0),
+                    "index_bytes": stats.get("totalIndexSize", 0),
+                }
+            except Exception as e:
+                report[name] = {"error": str(e)}
+        return report
+
+
+def benchmark(store_id, days=30, repeat=3):
+    """Scan time and storage of both layouts for the same sales
+
+    Copies the store's sale documents of the last `days` days into a scratch
+    bucket collection, times a per-hour, per-item grouping on each layout and
+    reports collStats for both. The scratch collection is dropped afterwards.
+    """
+    documents = get_transactions_collection()
+    database = documents.database
+    scratch = database["transaction_buckets_benchmark"]
+    scratch.drop()
+    scratch.create_index([("store_id", 1), ("hour", 1)])
+    end = datetime.now()
+    start = end - timedelta(days=days)
+
+    store = TransactionStore(BUCKETS)
+    sales = list(documents.find(store_filter(store_id, {"timestamp": {"$gte": start, "$lte": end}})))
+    for i in range(0, len(sales), 1000):
+        scratch.bulk_write([store.bucket_update({**sale, "store_id": store_id}) for sale in sales[i:i + 1000]], ordered=True)
+
+    def timed(pipeline, collection):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = list(collection.aggregate(pipeline))
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return round(best, 1), len(rows)
+
+    document_ms, document_groups = timed([
+        {"$match": {"store_id": store_id, "timestamp": {"$gte": start, "$lte": end}}},
+        {"$unwind": "$items"},
+        {"$group": {"_id": {"hour": {"$hour": "$timestamp"}, "item_name": "$items.item_name"},
+                    "quantity": {"$sum": "$items.quantity"}, "revenue": {"$sum": "$items.total"}}}
+    ], documents)
+    bucket_ms, bucket_groups = timed([
+        {"$match": {"store_id": store_id, "hour": {"$gte": hour_of(start), "$lte": end}}},
+        {"$project": {"hour": 1, "items": {"$objectToArray": "$items"}}},
+        {"$unwind": "$items"},
+        {"$group": {"_id": {"hour": {"$hour": "$hour"}, "item_name": "$items.v.name"},
+                    "quantity": {"$sum": "$items.v.quantity"}, "revenue": {"$sum": "$items.v.revenue"}}}
+    ], scratch)
+
+    def sizes(name):
+        try:
+            stats = database.command("collStats", name)
+            return {"documents": stats.get("count", 0), "size_bytes": stats.get("size", 0),
+                    "index_bytes": stats.get("totalIndexSize", 0)}
+        except Exception as e:
+            return {"error": str(e)}
+
+    report = {
+        "store_id": store_id,
+        "days": days,
+        "sales": len(sales),
+        "documents": {"scan_ms": document_ms, "groups": document_groups, **sizes(documents.name)},
+        "buckets": {"scan_ms": bucket_ms, "groups": bucket_groups, **sizes(scratch.name)},
+    }
+    scratch.drop()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bucketed transaction storage: migrate or benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Fold sale documents into hourly buckets")
+    migrate.add_argument("--older-than-hours", type=float, default=0, help="Leave the most recent sales as documents")
+    migrate.add_argument("--store", help="Only this store")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    bench = commands.add_parser("benchmark", help="Compare scan time and storage of both layouts")
+    bench.add_argument("--store", default=settings.DEFAULT_STORE_ID)
+    bench.add_argument("--days", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    from app.core.database import connect_to_mongo
+    if not connect_to_mongo(background_indexes=False):
+        raise SystemExit("MongoDB is not reachable")
+    if args.command == "migrate":
+        if not transaction_store.bucketed:
+            raise SystemExit("TRANSACTION_STORAGE is not 'buckets'; migrating would hide the moved sales")
+        print(transaction_store.migrate(args.older_than_hours, args.batch_size, args.store))
+        print(transaction_store.stats())
+    else:
+        report = benchmark(args.store, args.days)
+        print(f"{report['sales']} sales of {report['store_id']} over {report['days']} days")
+        for layout in ("documents", "buckets"):
+            row = report[layout]
+            print(f"{layout:<10} scan {row['scan_ms']:>8} ms  {row.get('documents', '?'):>8} docs  "
+                  f"{row.get('size_bytes', 0) / 1024:>10.0f} KiB data  {row.get('index_bytes', 0) / 1024:>8.0f} KiB indexes")
+
+
+transaction_store = TransactionStore()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,50 @@
-from fastapi import FastAPI, HTTPException
+from app.core.startup import startup_report
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import time
 import uvicorn
 import os
 from dotenv import load_dotenv
+startup_report.mark("fastapi")
 
 # Load environment variables
 load_dotenv()
 
 # Import MongoDB connection
 try:
-    from app.core.database import connect_to_mongo, close_mongo_connection, mongodb
+    from app.core.database import connect_to_mongo, close_mongo_connection, mongodb, mongo_breaker, is_mongo_available, record_mongo_error
     from app.core.config import settings
+    from app.services.session_snapshot import session_counter_increments, apply_increments, persist_snapshot, build_snapshot
+    from app.services.customer_search import customer_search_index, INDEXED_FIELDS
+    from app.services.receipt_numbers import receipt_numbers
+    from app.services.stock_ledger import stock_ledger, RESTOCK, WASTE, ADJUSTMENT, OPENING, SALE
+    from app.services.transaction_store import transaction_store
+    from app.services.batch_checkout import BatchCheckout, normalize_items, parse_sale, aggregate_totals, kitchen_order_for
     MONGODB_AVAILABLE = True
 except ImportError:
     MONGODB_AVAILABLE = False
     print("MongoDB modules not available, using in-memory storage")
     settings = None
+startup_report.mark("database")
+
+from app.services.customer_segments import customer_segmentation, SegmentConfig
+from app.core.coalesce import coalesce
+from app.services.basket_engine import basket_index, transaction_baskets
+from app.services.sales_window import sales_window
+from app.services.line_item_store import line_item_store
+from app.services.stock_alerts import stock_alerts
+from app.core.stores import get_store_id, store_filter, in_store
+from app.core.shared_state import shared_state, local_state
+from app.services.ml_executor import ml_executor
+from app.core.http_cache import ConditionalGetMiddleware, collection_versions
+from app.core.admission import AdmissionController, AdmissionMiddleware, CRITICAL, LOW
+from app.core.fields import FieldSelection, projection, pick
+startup_report.mark("services")
 
 app = FastAPI(title="SmartPOS AI API", version="2.0.0")
 
@@ -42,6 +68,36 @@ else:
     if vercel_url:
         allowed_origins.append(f"https://{vercel_url}")
 
+# Polled list endpoints answer If-None-Match with 304 and reuse compressed
+# bodies until one of the collections they read is written (see bump_version)
+app.add_middleware(
+    ConditionalGetMiddleware,
+    paths={
+        "/items/": ["items"],
+        "/inventory/": ["items"],
+        "/inventory/alerts": ["items", "inventory"],
+        "/customers/": ["customers"],
+        "/transactions/": ["transactions"],
+    },
+    vary_on=lambda: "mongo" if mongo_ready() else "fallback"
+)
+app.add_middleware(GZipMiddleware, minimum_size=settings.COMPRESS_MIN_BYTES if settings else 1024)
+
+# Checkout keeps its own slots; reports and analytics share a few and are
+# shed with 429 + Retry-After while checkout p99 is over target
+admission = AdmissionController(rules=[
+    (["POST"], "/transactions/", CRITICAL),
+    (None, "/sessions/", CRITICAL),
+    (None, "/reports/", LOW),
+    (None, "/analytics/", LOW),
+    (None, "/inventory/replenishment", LOW),
+    (None, "/inventory/ledger/shrinkage", LOW),
+    (None, "/inventory/ledger/turnover", LOW),
+    (["POST"], "/recommendations/rebuild", LOW),
+])
+# Inside CORS so browsers can read the 429
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -113,37 +169,97 @@ fallback_data = {
     "customers": [
         {"id": "1", "name": "John Doe", "email": "john@email.com", "total_spent": 235.0, "visit_count": 5},
         {"id": "2", "name": "Jane Smith", "email": "jane@email.com", "total_spent": 150.0, "visit_count": 3}
-    ],
-    "current_session": None
+    ]
 }
 
+# The open session of each store is mirrored in local state (a SQLite file
+# shared by the host's workers, never Mongo) so tills keep selling and can
+# still close the session while Mongo is down
+def current_session_key(store_id):
+    return f"current_session:{store_id}"
+
+def remember_session(store_id, session):
+    """Mirror a session found in Mongo (with a string id) for use during an outage"""
+    try:
+        mirrored = local_state.get(current_session_key(store_id))
+        if not mirrored or mirrored.get("id") != session["id"]:
+            local_state.set(current_session_key(store_id), session)
+    except Exception as e:
+        print(f"Could not mirror the current session: {e}")
+
 # Database helper functions
-def get_collection_data(collection_name, fallback_key):
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+def mongo_ready():
+    """Use Mongo only when it is connected and its circuit breaker is closed"""
+    return MONGODB_AVAILABLE and is_mongo_available()
+
+def bump_version(*collection_names):
+    """Invalidate ETags of list endpoints built from these collections"""
+    try:
+        collection_versions.bump(*collection_names)
+    except Exception as e:
+        print(f"Could not bump collection version for {collection_names}: {e}")
+
+def string_ids(data):
+    """Replace _id with a string id, and other ObjectIds (one level deep) with strings"""
+    from bson import ObjectId
+    for item in data:
+        if '_id' in item:
+            item['id'] = str(item['_id'])
+            del item['_id']
+        # Convert any nested ObjectIds
+        for key, value in item.items():
+            if isinstance(value, ObjectId):
+                item[key] = str(value)
+            elif isinstance(value, dict):
+                for k, v in value.items():
+                    if isinstance(v, ObjectId):
+                        item[key][k] = str(v)
+    return data
+
+def get_collection_data(collection_name, fallback_key, store_id=None, fields=None):
+    """Documents of a collection; `fields` (plus _id) limits what Mongo sends back"""
+    if mongo_ready():
         try:
             collection = mongodb.database[collection_name]
-            data = list(collection.find({}))
-            # Convert ObjectId to string
-            from bson import ObjectId
-            for item in data:
-                if '_id' in item:
-                    item['id'] = str(item['_id'])
-                    del item['_id']
-                # Convert any nested ObjectIds
-                for key, value in item.items():
-                    if isinstance(value, ObjectId):
-                        item[key] = str(value)
-                    elif isinstance(value, dict):
-                        for k, v in value.items():
-                            if isinstance(v, ObjectId):
-                                item[key][k] = str(v)
-            return data
+            return string_ids(list(collection.find(store_filter(store_id) if store_id else {}, projection(fields))))
         except Exception as e:
             print(f"MongoDB error for {collection_name}: {e}")
+            record_mongo_error(e)
+    if store_id:
+        return [doc for doc in fallback_data[fallback_key] if in_store(doc, store_id)]
     return fallback_data[fallback_key]
 
+def get_transactions_data(store_id, fields=None):
+    """A store's sales from whichever layout holds them (TRANSACTION_STORAGE), newest first"""
+    if mongo_ready():
+        try:
+            return string_ids(transaction_store.find(store_id, fields=fields))
+        except Exception as e:
+            print(f"MongoDB error for transactions: {e}")
+            record_mongo_error(e)
+    return [doc for doc in fallback_data["transactions"] if in_store(doc, store_id)]
+
+def insert_transaction(transaction_doc):
+    """Write a sale in the configured layout; None when its idempotency key was recorded meanwhile"""
+    if mongo_ready():
+        try:
+            from pymongo.errors import DuplicateKeyError
+            try:
+                doc = transaction_store.insert(dict(transaction_doc))
+            except DuplicateKeyError:
+                return None
+            doc = string_ids([doc])[0]
+            doc["timestamp"] = doc["timestamp"].isoformat()
+            return doc
+        except Exception as e:
+            print(f"MongoDB insert error for transactions: {e}")
+            record_mongo_error(e)
+    transaction_doc["id"] = str(len(fallback_data["transactions"]) + 1)
+    fallback_data["transactions"].append(transaction_doc)
+    return transaction_doc
+
 def insert_to_collection(collection_name, data):
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+    if mongo_ready():
         try:
             collection = mongodb.database[collection_name]
             # datetime is already imported at top of file
@@ -181,6 +297,7 @@ def insert_to_collection(collection_name, data):
             return data
         except Exception as e:
             print(f"MongoDB insert error for {collection_name}: {e}")
+            record_mongo_error(e)
     
     # Fallback to in-memory
     new_id = str(len(fallback_data.get(collection_name, [])) + 1)
@@ -190,20 +307,22 @@ def insert_to_collection(collection_name, data):
     fallback_data[collection_name].append(data)
     return data
 
-def update_collection_item(collection_name, item_id, update_data):
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+def update_collection_item(collection_name, item_id, update_data, store_id=None):
+    if mongo_ready():
         try:
             from bson import ObjectId
             collection = mongodb.database[collection_name]
-            collection.update_one({"_id": ObjectId(item_id)}, {"$set": update_data})
+            query = {"_id": ObjectId(item_id)}
+            collection.update_one(store_filter(store_id, query) if store_id else query, {"$set": update_data})
             return True
         except Exception as e:
             print(f"MongoDB update error for {collection_name}: {e}")
+            record_mongo_error(e)
     
     # Fallback to in-memory
     items = fallback_data.get(collection_name, [])
     for item in items:
-        if item.get('id') == item_id:
+        if item.get('id') == item_id and (not store_id or in_store(item, store_id)):
             item.update(update_data)
             return True
     return False
@@ -211,44 +330,85 @@ def update_collection_item(collection_name, item_id, update_data):
 # Startup event
 @app.on_event("startup")
 async def startup_event():
+    startup_report.mark("app setup")
     if MONGODB_AVAILABLE:
+        # Connecting can take the whole server selection timeout when Mongo is
+        # down; until it finishes requests are served from the fallback data
+        mongodb.connecting = True
+        asyncio.get_running_loop().run_in_executor(None, start_mongo)
+    startup_report.ready()
+
+def start_mongo():
+    """Connect, seed and start the Mongo-backed jobs; runs off the startup path"""
+    started = time.perf_counter()
+    try:
         connect_to_mongo()
+        # Pick the shared state backend now that we know whether Mongo is up
+        shared_state.reset()
         # Initialize with sample data if collections are empty
         try:
-            if mongodb.database is not None:
-                items_count = mongodb.database["items"].count_documents({})
-                if items_count == 0:
+            if is_mongo_available():
+                # find_one stops at the first document; count_documents scans
+                if mongodb.database["items"].find_one({}, {"_id": 1}) is None:
                     # Insert sample items
-                    for item in fallback_data["items"]:
-                        item_copy = item.copy()
-                        if 'id' in item_copy:
-                            del item_copy['id']
-                        mongodb.database["items"].insert_one(item_copy)
+                    items = [
+                        {**{k: v for k, v in item.items() if k != "id"}, "store_id": settings.DEFAULT_STORE_ID}
+                        for item in fallback_data["items"]
+                    ]
+                    mongodb.database["items"].insert_many(items)
                     print("Inserted sample items to MongoDB")
                 
-                customers_count = mongodb.database["customers"].count_documents({})
-                if customers_count == 0:
+                if mongodb.database["customers"].find_one({}, {"_id": 1}) is None:
                     # Insert sample customers
-                    for customer in fallback_data["customers"]:
-                        customer_copy = customer.copy()
-                        if 'id' in customer_copy:
-                            del customer_copy['id']
-                        mongodb.database["customers"].insert_one(customer_copy)
+                    customers = [
+                        {k: v for k, v in customer.items() if k != "id"}
+                        for customer in fallback_data["customers"]
+                    ]
+                    mongodb.database["customers"].insert_many(customers)
                     print("Inserted sample customers to MongoDB")
+                bump_version("items", "customers")
         except Exception as e:
             print(f"Error initializing sample data: {e}")
+        # Warm-starts from Mongo off the startup path, then syncs other workers' sales
+        sales_window.start_sync(lambda: transaction_store, is_mongo_available)
+        stock_ledger.start_snapshots()
+        from app.services.replenishment import replenishment
+        replenishment.start_schedule()
+        # archive_service loads pandas, so it is imported here rather than at startup
+        start_archive_schedule()
+    finally:
+        mongodb.connecting = False
+        print(f"MongoDB startup finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def start_archive_schedule():
+    """Move old sales into the Parquet cold tier every ARCHIVE_SCHEDULE_HOURS"""
+    try:
+        from app.services.archive_service import transaction_archive
+        transaction_archive.start_schedule()
+    except Exception as e:
+        print(f"Could not start the archive job: {e}")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
+    ml_executor.shutdown()
     if MONGODB_AVAILABLE:
         close_mongo_connection()
 
+# Sparse list responses: ?fields=a,b or ?view=summary (see app.core.fields)
+item_fields = FieldSelection(summary=("name", "price", "category", "stock"))
+transaction_fields = FieldSelection(summary=("receipt_number", "total_amount", "payment_mode", "timestamp"))
+customer_fields = FieldSelection(summary=("name", "phone", "email"))
+kitchen_order_fields = FieldSelection(summary=("table", "items", "status", "time", "priority"))
+
+def select_fields(docs, fields):
+    return docs if fields is None else [pick(doc, fields) for doc in docs]
+
 # ITEMS ENDPOINTS
 @app.get("/items/")
-async def get_items():
+async def get_items(store_id: str = Depends(get_store_id), fields: Optional[tuple] = Depends(item_fields)):
     try:
-        items = get_collection_data("items", "items")
+        items = select_fields(get_collection_data("items", "items", store_id, fields), fields)
         return {
             "success": True,
             "data": items,
@@ -259,41 +419,104 @@ async def get_items():
         # Return fallback data on error
         return {
             "success": True,
-            "data": fallback_data.get("items", []),
+            "data": select_fields(fallback_data.get("items", []), fields),
             "count": len(fallback_data.get("items", []))
         }
 
+def find_item(item_id, store_id):
+    if mongo_ready():
+        try:
+            from bson import ObjectId
+            if ObjectId.is_valid(item_id):
+                return mongodb.database["items"].find_one(store_filter(store_id, {"_id": ObjectId(item_id)}))
+        except Exception as e:
+            print(f"Error finding item {item_id}: {e}")
+            record_mongo_error(e)
+        return None
+    return next((i for i in fallback_data["items"] if str(i.get("id")) == item_id and in_store(i, store_id)), None)
+
+def stock_levels(store_id, item_ids=None):
+    """(item_id, name, stock) for some or all items of a store"""
+    if mongo_ready():
+        try:
+            from bson import ObjectId
+            query = {} if item_ids is None else {"_id": {"$in": [ObjectId(str(i)) for i in item_ids if ObjectId.is_valid(str(i))]}}
+            return [
+                (str(doc["_id"]), doc.get("name"), doc.get("stock", 0))
+                for doc in mongodb.database["items"].find(store_filter(store_id, query), {"name": 1, "stock": 1, "is_active": 1})
+                if doc.get("is_active", True)
+            ]
+        except Exception as e:
+            print(f"Error reading stock levels: {e}")
+            record_mongo_error(e)
+    wanted = None if item_ids is None else {str(i) for i in item_ids}
+    return [
+        (str(item["id"]), item.get("name"), item.get("stock", 0))
+        for item in fallback_data["items"]
+        if in_store(item, store_id) and item.get("is_active", True) and (wanted is None or str(item["id"]) in wanted)
+    ]
+
+def load_stock_thresholds(store_id):
+    """Per-item minimum_stock from the inventory collection"""
+    if not mongo_ready():
+        return {}
+    return {
+        str(doc["item_id"]): doc["minimum_stock"]
+        for doc in mongodb.database["inventory"].find(
+            store_filter(store_id, {"minimum_stock": {"$ne": None}}), {"item_id": 1, "minimum_stock": 1}
+        )
+    }
+
+stock_alerts.threshold_loader = load_stock_thresholds
+stock_alerts.levels_loader = stock_levels
+
 @app.post("/items/")
-async def create_item(item: ItemCreate):
+async def create_item(item: ItemCreate, store_id: str = Depends(get_store_id)):
     item_data = item.dict()
+    item_data["store_id"] = store_id
     item_data["created_at"] = datetime.now()
     new_item = insert_to_collection("items", item_data)
+    if mongo_ready() and item.stock:
+        stock_ledger.record([stock_ledger.movement(store_id, new_item["id"], OPENING, item.stock, item.name)])
+    stock_alerts.observe(store_id, [(new_item["id"], item.name, item.stock)])
+    bump_version("items")
     return {"success": True, "data": new_item}
 
 @app.put("/items/{item_id}")
-async def update_item(item_id: str, item: ItemCreate):
-    success = update_collection_item("items", item_id, item.dict())
+async def update_item(item_id: str, item: ItemCreate, store_id: str = Depends(get_store_id)):
+    previous = find_item(item_id, store_id)
+    success = update_collection_item("items", item_id, item.dict(), store_id)
+    if success and previous and mongo_ready():
+        # Editing the stock field is a manual adjustment in the ledger
+        stock_ledger.record([stock_ledger.movement(
+            store_id, item_id, ADJUSTMENT, item.stock - previous.get("stock", 0), item.name, note="item edited"
+        )])
+    if success:
+        stock_alerts.observe(store_id, [(item_id, item.name, item.stock)])
+    bump_version("items")
     if success:
         return {"success": True, "message": "Item updated successfully"}
     raise HTTPException(status_code=404, detail="Item not found")
 
 @app.delete("/items/{item_id}")
-async def delete_item(item_id: str):
-    success = update_collection_item("items", item_id, {"is_active": False})
+async def delete_item(item_id: str, store_id: str = Depends(get_store_id)):
+    success = update_collection_item("items", item_id, {"is_active": False}, store_id)
+    bump_version("items")
     if success:
         return {"success": True, "message": "Item deleted successfully"}
     raise HTTPException(status_code=404, detail="Item not found")
 
 # SESSIONS ENDPOINTS
 @app.get("/sessions/current")
-async def get_current_session():
+async def get_current_session(store_id: str = Depends(get_store_id)):
     try:
-        if MONGODB_AVAILABLE and mongodb.database is not None:
+        if mongo_ready():
             try:
-                session = mongodb.database["sessions"].find_one({"is_active": True})
+                session = mongodb.database["sessions"].find_one(store_filter(store_id, {"is_active": True}))
                 if session:
                     session['id'] = str(session['_id'])
                     del session['_id']
+                    remember_session(store_id, session)
                     return {
                         "success": True,
                         "data": session,
@@ -303,7 +526,7 @@ async def get_current_session():
                 print(f"MongoDB error getting current session: {e}")
         
         # Check fallback
-        current_session = fallback_data.get("current_session")
+        current_session = local_state.get(current_session_key(store_id))
         return {
             "success": True,
             "data": current_session,
@@ -318,8 +541,8 @@ async def get_current_session():
         }
 
 @app.get("/sessions/")
-async def get_sessions():
-    sessions = get_collection_data("sessions", "sessions")
+async def get_sessions(store_id: str = Depends(get_store_id)):
+    sessions = get_collection_data("sessions", "sessions", store_id)
     return {
         "success": True,
         "data": sessions,
@@ -327,28 +550,48 @@ async def get_sessions():
     }
 
 @app.post("/sessions/open")
-async def open_session():
-    # Close any existing active session first
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+async def open_session(store_id: str = Depends(get_store_id)):
+    # Close this store's active session first
+    if mongo_ready():
         try:
+            end_time = datetime.now()
+            stale_sessions = list(mongodb.database["sessions"].find(store_filter(store_id, {"is_active": True})))
             mongodb.database["sessions"].update_many(
-                {"is_active": True}, 
-                {"$set": {"is_active": False, "end_time": datetime.now()}}
+                store_filter(store_id, {"is_active": True}), 
+                {"$set": {"is_active": False, "end_time": end_time}}
             )
+            for stale_session in stale_sessions:
+                persist_snapshot(stale_session, end_time)
         except Exception as e:
             print(f"Error closing existing sessions: {e}")
     
     # Create new session
     session_data = {
+        "store_id": store_id,
         "start_time": datetime.now(),
         "is_active": True,
         "total_sales": 0.0,
         "transaction_count": 0
     }
     
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+    if mongo_ready():
         try:
-            result = mongodb.database["sessions"].insert_one(session_data)
+            from pymongo.errors import DuplicateKeyError
+            result = None
+            for _ in range(3):
+                try:
+                    result = mongodb.database["sessions"].insert_one(session_data)
+                    break
+                except DuplicateKeyError:
+                    # Another worker opened this store's session first
+                    existing = mongodb.database["sessions"].find_one(store_filter(store_id, {"is_active": True}))
+                    if existing:
+                        existing['id'] = str(existing.pop('_id'))
+                        remember_session(store_id, existing)
+                        return {"success": True, "data": existing, "message": "Session already open"}
+                    # ...and closed it again before we could read it, so try ours again
+            if result is None:
+                raise RuntimeError("sessions kept being opened and closed concurrently")
             # Get the inserted document and convert ObjectId
             inserted_doc = mongodb.database["sessions"].find_one({"_id": result.inserted_id})
             if inserted_doc:
@@ -369,7 +612,7 @@ async def open_session():
                 session_data = convert_for_json(inserted_doc)
             else:
                 session_data['id'] = str(result.inserted_id)
-            fallback_data["current_session"] = session_data
+            local_state.set(current_session_key(store_id), session_data)
             return {
                 "success": True,
                 "data": session_data,
@@ -380,7 +623,7 @@ async def open_session():
     
     # Fallback to in-memory
     new_session = insert_to_collection("sessions", session_data)
-    fallback_data["current_session"] = new_session
+    local_state.set(current_session_key(store_id), new_session)
     
     return {
         "success": True,
@@ -389,35 +632,112 @@ async def open_session():
     }
 
 @app.post("/sessions/close")
-async def close_session():
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+async def close_session(store_id: str = Depends(get_store_id)):
+    end_time = datetime.now()
+    if mongo_ready():
         try:
-            result = mongodb.database["sessions"].update_one(
-                {"is_active": True}, 
-                {"$set": {"is_active": False, "end_time": datetime.now()}}
+            from pymongo import ReturnDocument
+            closed_session = mongodb.database["sessions"].find_one_and_update(
+                store_filter(store_id, {"is_active": True}), 
+                {"$set": {"is_active": False, "end_time": end_time}},
+                return_document=ReturnDocument.AFTER
             )
-            if result.modified_count > 0:
-                fallback_data["current_session"] = None
-                return {"success": True, "message": "Session closed successfully"}
+            if closed_session:
+                local_state.delete(current_session_key(store_id))
+                # Freeze the Z-report from the counters accumulated during the session
+                try:
+                    snapshot = persist_snapshot(closed_session, end_time)
+                except Exception as e:
+                    print(f"Could not store the snapshot of session {closed_session['_id']}: {e}")
+                    record_mongo_error(e)
+                    return {
+                        "success": True,
+                        "message": "Session closed, but its Z-report could not be stored",
+                        "snapshot": build_snapshot(closed_session, end_time)
+                    }
+                return {"success": True, "message": "Session closed successfully", "snapshot": snapshot}
         except Exception as e:
             print(f"Error closing session: {e}")
+            record_mongo_error(e)
     
     # Clear fallback session
-    fallback_data["current_session"] = None
-    return {"success": True, "message": "Session closed successfully"}
+    current_session = local_state.get(current_session_key(store_id))
+    if not current_session:
+        return {"success": True, "message": "Session closed successfully", "snapshot": None}
+    snapshot = build_snapshot(current_session, end_time) if MONGODB_AVAILABLE else None
+    if mongo_ready():
+        try:
+            snapshot = persist_snapshot(current_session, end_time)
+        except Exception as e:
+            # Keep the session so the till can close it again once the Z-report can be stored
+            print(f"Could not store the session snapshot: {e}")
+            record_mongo_error(e)
+            raise HTTPException(status_code=503, detail="Could not store the session's Z-report, try closing again")
+    # Only now drop it; with Mongo down the Z-report is returned but not stored
+    local_state.pop(current_session_key(store_id))
+    return {"success": True, "message": "Session closed successfully", "snapshot": snapshot}
 
 # TRANSACTIONS ENDPOINTS
 @app.get("/transactions/")
-async def get_transactions():
-    transactions = get_collection_data("transactions", "transactions")
+async def get_transactions(store_id: str = Depends(get_store_id), fields: Optional[tuple] = Depends(transaction_fields)):
+    transactions = select_fields(get_transactions_data(store_id, fields), fields)
     return {
         "success": True,
         "data": transactions,
         "count": len(transactions)
     }
 
+def active_session_id(store_id):
+    """Id of the store's open session; 400 when the shop is closed"""
+    session_id = None
+    if mongo_ready():
+        try:
+            active_session = mongodb.database["sessions"].find_one(store_filter(store_id, {"is_active": True}))
+            if active_session:
+                session_id = str(active_session["_id"])
+                active_session["id"] = session_id
+                del active_session["_id"]
+                remember_session(store_id, active_session)
+        except Exception as e:
+            print(f"Error finding active session: {e}")
+    
+    if not session_id:
+        # Try to use fallback session
+        current_session = local_state.get(current_session_key(store_id))
+        if current_session:
+            session_id = current_session.get("id")
+    
+    if not session_id:
+        raise HTTPException(status_code=400, detail="No active session found. Please open a shop session first.")
+    return session_id
+
+def allocate_receipt_number(store_id, when=None):
+    """Human-friendly receipt number; a sale is never refused for lack of one"""
+    try:
+        return receipt_numbers.next(store_id, when)
+    except Exception as e:
+        print(f"Could not allocate a receipt number: {e}")
+        return None
+
+def find_transaction_by_key(store_id, idempotency_key):
+    """A sale already recorded under this till idempotency key, if any"""
+    if mongo_ready():
+        try:
+            doc = transaction_store.find_by_key(store_id, idempotency_key)
+            if doc:
+                doc["id"] = str(doc.pop("_id"))
+                doc["timestamp"] = doc["timestamp"].isoformat() if isinstance(doc.get("timestamp"), datetime) else doc.get("timestamp")
+            return doc
+        except Exception as e:
+            print(f"Error looking up idempotency key: {e}")
+            record_mongo_error(e)
+    for doc in fallback_data["transactions"]:
+        if doc.get("idempotency_key") == idempotency_key and in_store(doc, store_id):
+            return doc
+    return None
+
 @app.post("/transactions/")
-async def create_transaction(transaction_data: dict):
+async def create_transaction(transaction_data: dict, store_id: str = Depends(get_store_id)):
     """
     Create a new transaction. Accepts flexible format from frontend.
     Expected format:
@@ -429,53 +749,22 @@ async def create_transaction(transaction_data: dict):
     }
     """
     try:
-        # Get current active session if session_id not provided
-        session_id = None
-        if MONGODB_AVAILABLE and mongodb.database is not None:
-            try:
-                active_session = mongodb.database["sessions"].find_one({"is_active": True})
-                if active_session:
-                    session_id = str(active_session["_id"])
-            except Exception as e:
-                print(f"Error finding active session: {e}")
+        session_id = active_session_id(store_id)
         
-        if not session_id:
-            # Try to use fallback session
-            if fallback_data.get("current_session"):
-                session_id = fallback_data["current_session"].get("id")
+        idempotency_key = transaction_data.get("idempotency_key")
+        if idempotency_key:
+            existing = find_transaction_by_key(store_id, idempotency_key)
+            if existing:
+                return {"success": True, "data": existing, "message": "Transaction already recorded"}
         
-        if not session_id:
-            raise HTTPException(status_code=400, detail="No active session found. Please open a shop session first.")
-        
-        # Normalize items format
-        items = transaction_data.get("items", [])
-        normalized_items = []
-        for item in items:
-            # Handle both formats: frontend format and backend format
-            if "item_id" in item:
-                # Already in backend format
-                normalized_items.append({
-                    "item_id": item["item_id"],
-                    "item_name": item.get("item_name", item.get("name", "Unknown")),
-                    "quantity": item["quantity"],
-                    "price": item["price"],
-                    "total": item.get("total", item["price"] * item["quantity"])
-                })
-            else:
-                # Frontend format: need to convert
-                normalized_items.append({
-                    "item_id": item.get("id", item.get("item_id", "")),
-                    "item_name": item.get("name", "Unknown"),
-                    "quantity": item.get("quantity", 1),
-                    "price": item.get("price", 0.0),
-                    "total": item.get("total", item.get("price", 0.0) * item.get("quantity", 1))
-                })
+        normalized_items = normalize_items(transaction_data.get("items", []))
         
         # Create transaction document
         total_amount = transaction_data.get("total_amount", sum(item.get("total", 0) for item in normalized_items))
         payment_mode = transaction_data.get("payment_method") or transaction_data.get("payment_mode", "cash")
         
         transaction_doc = {
+            "store_id": store_id,
             "session_id": session_id,
             "items": normalized_items,
             "total_amount": total_amount,
@@ -483,32 +772,62 @@ async def create_transaction(transaction_data: dict):
             "timestamp": datetime.now(),
             "customer_id": transaction_data.get("customer_id")
         }
+        if idempotency_key:
+            transaction_doc["idempotency_key"] = idempotency_key
+        transaction_doc["receipt_number"] = allocate_receipt_number(store_id, transaction_doc["timestamp"])
         
-        # Insert transaction
-        new_transaction = insert_to_collection("transactions", transaction_doc)
+        # Insert transaction (documents or hourly buckets, see TRANSACTION_STORAGE)
+        new_transaction = insert_transaction(transaction_doc)
+        if new_transaction is None:
+            # A retry of the same sale committed first
+            existing = find_transaction_by_key(store_id, idempotency_key)
+            return {"success": True, "data": existing, "message": "Transaction already recorded"}
         
-        try:
-            # Create transaction string ID securely
-            if isinstance(new_transaction, dict):
-                tid = str(new_transaction.get("id", new_transaction.get("_id", "unknown")))
-            else:
-                tid = str(new_transaction.inserted_id) if hasattr(new_transaction, "inserted_id") else "unknown"
+        # Create transaction string ID securely
+        if isinstance(new_transaction, dict):
+            tid = str(new_transaction.get("id", new_transaction.get("_id", "unknown")))
+        else:
+            tid = str(new_transaction.inserted_id) if hasattr(new_transaction, "inserted_id") else "unknown"
 
-            # Deduct Inventory Stock
+        # The sale is stored; each side effect below fails on its own so one
+        # broken hook cannot skip the kitchen ticket or the dashboards
+        levels = []
+        try:
+            # Deduct Inventory Stock; the new levels feed the low-stock alerts
             for item in normalized_items:
-                if MONGODB_AVAILABLE and mongodb.database is not None:
+                if mongo_ready():
                     from bson import ObjectId
-                    mongodb.database["items"].update_one(
-                        {"_id": ObjectId(item["item_id"])},
-                        {"$inc": {"stock": -int(item["quantity"])}}
+                    from pymongo import ReturnDocument
+                    updated = mongodb.database["items"].find_one_and_update(
+                        store_filter(store_id, {"_id": ObjectId(item["item_id"])}),
+                        {"$inc": {"stock": -int(item["quantity"])}},
+                        projection={"name": 1, "stock": 1},
+                        return_document=ReturnDocument.AFTER
                     )
+                    if updated:
+                        levels.append((item["item_id"], updated.get("name"), updated.get("stock", 0)))
                 else:
                     for fb_item in fallback_data["items"]:
-                        if str(fb_item.get("id")) == str(item["item_id"]):
+                        if str(fb_item.get("id")) == str(item["item_id"]) and in_store(fb_item, store_id):
                             fb_item["stock"] = max(0, fb_item.get("stock", 0) - int(item["quantity"]))
-            
+                            levels.append((item["item_id"], fb_item.get("name"), fb_item["stock"]))
+        except Exception as e:
+            print(f"Error deducting stock for transaction {tid}: {e}")
+        try:
+            stock_alerts.observe(store_id, levels)
+        except Exception as e:
+            print(f"Error updating stock alerts for transaction {tid}: {e}")
+        if mongo_ready():
+            try:
+                stock_ledger.record_sale(store_id, tid, normalized_items, transaction_doc["timestamp"])
+            except Exception as e:
+                print(f"Error recording stock movements for transaction {tid}: {e}")
+                record_mongo_error(e)
+
+        try:
             # Create Kitchen Order
             kitchen_order_doc = {
+                "store_id": store_id,
                 "transaction_id": tid,
                 "table": transaction_data.get("table", transaction_data.get("customer_id", "Takeaway")),
                 "items": [{"name": i["item_name"], "qty": i["quantity"]} for i in normalized_items],
@@ -519,7 +838,20 @@ async def create_transaction(transaction_data: dict):
             }
             insert_to_collection("kitchen_orders", kitchen_order_doc)
         except Exception as e:
-            print(f"Error bridging transaction: {e}")
+            print(f"Error creating kitchen order for transaction {tid}: {e}")
+
+        # Keep "frequently bought together" counts and the dashboards current
+        for name, update in (
+            ("basket index", lambda: basket_index.add_basket([i["item_name"] for i in normalized_items])),
+            ("sales window", lambda: sales_window.record({**transaction_doc, "id": tid})),
+            ("line item store", lambda: line_item_store.record({**transaction_doc, "id": tid})),
+        ):
+            try:
+                update()
+            except Exception as e:
+                print(f"Error updating the {name} for transaction {tid}: {e}")
+        # New transaction and stock deductions both change polled lists
+        bump_version("transactions", "items")
         
         # Ensure all ObjectIds and datetimes are converted to strings for JSON serialization
         if isinstance(new_transaction, dict):
@@ -541,7 +873,8 @@ async def create_transaction(transaction_data: dict):
             new_transaction = convert_objectid(new_transaction)
         
         # Update session totals
-        if MONGODB_AVAILABLE and mongodb.database is not None:
+        session_updated = False
+        if mongo_ready():
             try:
                 from bson import ObjectId
                 # Handle both string and ObjectId format
@@ -550,25 +883,48 @@ async def create_transaction(transaction_data: dict):
                 else:
                     session_obj_id = session_id
                 
+                # Running Z-report counters, snapshotted when the session closes
+                counter_increments = session_counter_increments(
+                    normalized_items, total_amount, payment_mode, transaction_doc["timestamp"]
+                )
                 mongodb.database["sessions"].update_one(
                     {"_id": session_obj_id},
                     {
                         "$inc": {
                             "total_sales": total_amount,
-                            "transaction_count": 1
+                            "transaction_count": 1,
+                            **counter_increments
                         }
                     }
                 )
-                # Update fallback session if exists
-                if fallback_data.get("current_session") and fallback_data["current_session"].get("id") == session_id:
-                    fallback_data["current_session"]["total_sales"] = fallback_data["current_session"].get("total_sales", 0) + total_amount
-                    fallback_data["current_session"]["transaction_count"] = fallback_data["current_session"].get("transaction_count", 0) + 1
+                session_updated = True
             except Exception as e:
                 print(f"Error updating session totals: {e}")
         
+        # The Mongo session document is the source of truth; the shared state
+        # copy only keeps totals while the sale could not be counted there
+        if not session_updated:
+            try:
+                counter_increments = session_counter_increments(
+                    normalized_items, total_amount, payment_mode, transaction_doc["timestamp"]
+                )
+                
+                def add_sale(current_session):
+                    if current_session and current_session.get("id") == session_id:
+                        current_session["total_sales"] = current_session.get("total_sales", 0) + total_amount
+                        current_session["transaction_count"] = current_session.get("transaction_count", 0) + 1
+                        apply_increments(current_session, counter_increments)
+                    return current_session
+                
+                # Compare-and-set loop: concurrent sales on other workers are not lost
+                if local_state.get(current_session_key(store_id)):
+                    local_state.update(current_session_key(store_id), add_sale)
+            except Exception as e:
+                print(f"Error updating fallback session totals: {e}")
+        
         # Update customer if provided
         customer_id = transaction_data.get("customer_id")
-        if customer_id and MONGODB_AVAILABLE and mongodb.database is not None:
+        if customer_id and mongo_ready():
             try:
                 from bson import ObjectId
                 # Handle both string and ObjectId format
@@ -580,7 +936,8 @@ async def create_transaction(transaction_data: dict):
                             "$inc": {
                                 "total_spent": total_amount,
                                 "visit_count": 1
-                            }
+                            },
+                            "$set": {"last_visit": transaction_doc["timestamp"]}
                         }
                     )
                 else:
@@ -590,9 +947,12 @@ async def create_transaction(transaction_data: dict):
                             "$inc": {
                                 "total_spent": total_amount,
                                 "visit_count": 1
-                            }
+                            },
+                            "$set": {"last_visit": transaction_doc["timestamp"]}
                         }
                     )
+                customer_segmentation.invalidate()
+                bump_version("customers")
             except Exception as e:
                 print(f"Error updating customer: {e}")
         
@@ -603,10 +963,124 @@ async def create_transaction(transaction_data: dict):
         print(f"Error creating transaction: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating transaction: {str(e)}")
 
+@app.post("/transactions/batch")
+async def create_transactions_batch(batch: dict, store_id: str = Depends(get_store_id)):
+    """
+    Record queued sales from a till that was offline, in one request.
+    Expected format:
+    {
+        "transactions": [{
+            "idempotency_key": str (unique per sale, reused on retry),
+            "items": [{"id": str, "name": str, "price": float, "quantity": int}],
+            "total_amount": float,
+            "payment_method": str,
+            "customer_id": str (optional),
+            "timestamp": ISO datetime of the sale (optional, defaults to now)
+        }]
+    }
+    Each sale gets a result in request order: created, duplicate or invalid.
+    A 503 means the sales could not be stored; resend with the same keys.
+    """
+    sales = batch.get("transactions")
+    if not isinstance(sales, list) or not sales:
+        raise HTTPException(status_code=400, detail="transactions must be a non-empty list")
+    if len(sales) > settings.BATCH_MAX_TRANSACTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_TRANSACTIONS} transactions per batch")
+
+    session_id = active_session_id(store_id)
+
+    in_mongo = mongo_ready()
+    if in_mongo:
+        try:
+            results, created = await asyncio.to_thread(BatchCheckout(mongodb.database).commit, store_id, session_id, sales)
+        except Exception as e:
+            print(f"Error writing transaction batch: {e}")
+            record_mongo_error(e)
+            raise HTTPException(status_code=503, detail="Could not write the batch, retry with the same idempotency keys")
+    else:
+        results, created = create_transactions_in_memory(store_id, session_id, sales)
+
+    if created:
+        stock, customers, session_inc = aggregate_totals(created)
+        if mongo_ready():
+            # Back-dated sales change hours the aggregate cache already closed
+            try:
+                from app.services.aggregate_cache import aggregate_cache
+                aggregate_cache.invalidate(store_id, [doc["timestamp"] for doc in created])
+            except Exception as e:
+                print(f"Could not invalidate cached aggregates: {e}")
+                record_mongo_error(e)
+
+        def add_sales(current_session):
+            if current_session and current_session.get("id") == session_id:
+                apply_increments(current_session, session_inc)
+            return current_session
+
+        # With Mongo, commit() already counted the batch on the session document
+        if not in_mongo and local_state.get(current_session_key(store_id)):
+            local_state.update(current_session_key(store_id), add_sales)
+
+        for doc in created:
+            basket_index.add_basket([i["item_name"] for i in doc["items"]])
+        sales_window.record_many(created)
+        line_item_store.record_many(created)
+        stock_alerts.observe(store_id, stock_levels(store_id, {i["item_id"] for doc in created for i in doc["items"]}))
+        bump_version("transactions", "items")
+        if customers:
+            customer_segmentation.invalidate()
+            bump_version("customers")
+
+    summary = {status: sum(1 for r in results if r["status"] == status) for status in ("created", "duplicate", "invalid", "error")}
+    return {"success": True, "data": {"results": results, **summary}}
+
+def create_transactions_in_memory(store_id, session_id, sales):
+    """Fallback-mode batch checkout against fallback_data"""
+    now = datetime.now()
+    results = []
+    created = []
+    known_items = {str(item.get("id")): item for item in fallback_data["items"] if in_store(item, store_id)}
+    seen = {doc["idempotency_key"]: doc["id"] for doc in fallback_data["transactions"]
+            if doc.get("idempotency_key") and in_store(doc, store_id)}
+
+    for index, sale in enumerate(sales):
+        try:
+            doc = parse_sale(sale, store_id, session_id, now)
+        except ValueError as e:
+            key = sale.get("idempotency_key") if isinstance(sale, dict) else None
+            results.append({"index": index, "idempotency_key": key, "status": "invalid", "error": str(e)})
+            continue
+        key = doc["idempotency_key"]
+        if key in seen:
+            results.append({"index": index, "idempotency_key": key, "status": "duplicate", "id": seen[key]})
+            continue
+        missing = [str(item["item_id"]) for item in doc["items"] if str(item["item_id"]) not in known_items]
+        if missing:
+            results.append({"index": index, "idempotency_key": key, "status": "invalid", "error": f"unknown items: {', '.join(missing)}"})
+            continue
+
+        doc["receipt_number"] = allocate_receipt_number(store_id, doc["timestamp"])
+        doc = insert_to_collection("transactions", doc)
+        for item in doc["items"]:
+            fb_item = known_items[str(item["item_id"])]
+            fb_item["stock"] = max(0, fb_item.get("stock", 0) - int(item["quantity"]))
+        insert_to_collection("kitchen_orders", kitchen_order_for(doc, sale.get("table", sale.get("customer_id", "Takeaway")), now))
+        seen[key] = doc["id"]
+        created.append(doc)
+        results.append({"index": index, "idempotency_key": key, "status": "created", "id": doc["id"]})
+
+    for customer_id, totals in aggregate_totals(created)[1].items():
+        for customer in fallback_data["customers"]:
+            if str(customer.get("id")) == str(customer_id):
+                customer["total_spent"] = customer.get("total_spent", 0) + totals["total_spent"]
+                customer["visit_count"] = customer.get("visit_count", 0) + totals["visit_count"]
+                last_visit = customer.get("last_visit")
+                customer["last_visit"] = max(last_visit, totals["last_visit"]) if isinstance(last_visit, datetime) else totals["last_visit"]
+    return results, created
+
 # INVENTORY ENDPOINTS
 @app.get("/inventory/")
-async def get_inventory():
-    items = get_collection_data("items", "items")
+async def get_inventory(store_id: str = Depends(get_store_id)):
+    items = get_collection_data("items", "items", store_id)
     inventory = [
         {
             "id": item["id"], 
@@ -624,46 +1098,259 @@ async def get_inventory():
     }
 
 @app.get("/inventory/alerts")
-async def get_inventory_alerts():
-    items = get_collection_data("items", "items")
-    alerts = [item for item in items if item.get("stock", 0) < 15]
+async def get_inventory_alerts(store_id: str = Depends(get_store_id)):
+    # Maintained as stock changes, so this is O(alerts) rather than a catalogue scan
+    alerts = [
+        {
+            "id": alert["item_id"],
+            "name": alert["item_name"],
+            "stock": alert["stock"],
+            "min_stock": alert["minimum_stock"],
+            "alert_type": alert["alert_type"],
+            "since": alert["since"],
+            "message": f"{alert['item_name']} is out of stock!" if alert["alert_type"] == "out_of_stock"
+            else f"{alert['item_name']} is low on stock ({alert['stock']} left)"
+        }
+        for alert in await asyncio.to_thread(stock_alerts.alerts, store_id)
+    ]
     return {
         "success": True,
         "data": alerts,
         "count": len(alerts)
     }
 
+@app.get("/inventory/alerts/events")
+async def get_inventory_alert_events(since: Optional[str] = None, store_id: str = Depends(get_store_id)):
+    """Recent threshold crossings (low, out of stock, restored), oldest first"""
+    events = stock_alerts.events(store_id, since)
+    return {"success": True, "data": events, "count": len(events)}
+
+# STOCK LEDGER ENDPOINTS
+class StockMovementCreate(BaseModel):
+    item_id: str
+    kind: str  # "restock", "waste" or "adjustment"
+    quantity: int  # units received or lost; signed for adjustments
+    note: Optional[str] = None
+
+class StockTakeCreate(BaseModel):
+    counts: dict  # {item_id: counted quantity}
+    note: Optional[str] = None
+
+def require_ledger(feature="The stock ledger"):
+    if not mongo_ready():
+        raise HTTPException(status_code=503, detail=f"{feature} needs MongoDB")
+
+def parse_time(value, name):
+    """datetime from an ISO 8601 query parameter; 400 instead of a 500 on bad input"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO 8601 date or date-time")
+
+def parse_period(start, end, default_days=30):
+    end_at = parse_time(end, "end") if end else datetime.now()
+    start_at = parse_time(start, "start") if start else end_at - timedelta(days=default_days)
+    if start_at >= end_at:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start_at, end_at
+
+@app.post("/inventory/ledger/movements")
+async def create_stock_movement(movement: StockMovementCreate, store_id: str = Depends(get_store_id)):
+    require_ledger()
+    if movement.kind not in (RESTOCK, WASTE, ADJUSTMENT):
+        raise HTTPException(status_code=400, detail="kind must be restock, waste or adjustment")
+    if movement.kind != ADJUSTMENT and movement.quantity <= 0:
+        raise HTTPException(status_code=400, detail="quantity must be positive")
+    item = find_item(movement.item_id, store_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    delta = -movement.quantity if movement.kind == WASTE else movement.quantity
+    mongodb.database["items"].update_one({"_id": item["_id"]}, {"$inc": {"stock": delta}})
+    stock_ledger.record([stock_ledger.movement(store_id, movement.item_id, movement.kind, delta, item.get("name"), note=movement.note)])
+    stock_alerts.observe(store_id, stock_levels(store_id, [movement.item_id]))
+    bump_version("items")
+    return {"success": True, "data": {"item_id": movement.item_id, "kind": movement.kind, "quantity": delta}}
+
+@app.post("/inventory/ledger/stocktake")
+async def create_stock_take(stock_take: StockTakeCreate, store_id: str = Depends(get_store_id)):
+    require_ledger()
+    try:
+        counts = {str(item_id): int(count) for item_id, count in stock_take.counts.items()}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="counts must map item ids to whole numbers")
+    try:
+        report = await asyncio.to_thread(stock_ledger.stock_take, store_id, counts, stock_take.note)
+    except Exception as e:
+        print(f"Stock take failed: {e}")
+        record_mongo_error(e)
+        raise HTTPException(status_code=503, detail="Could not book the stock take")
+    stock_alerts.observe(store_id, stock_levels(store_id, counts.keys()))
+    bump_version("items")
+    return {"success": True, "data": report}
+
+@app.get("/inventory/ledger/stock")
+async def get_stock_at(at: Optional[str] = None, store_id: str = Depends(get_store_id)):
+    """Stock of every item at a point in time (default now)"""
+    require_ledger()
+    at_time = parse_time(at, "at") if at else datetime.now()
+    stock = await asyncio.to_thread(stock_ledger.stock_at, store_id, at_time)
+    return {"success": True, "data": {"at": at_time.isoformat(), "stock": stock}}
+
+@app.get("/inventory/ledger/shrinkage")
+async def get_shrinkage(start: Optional[str] = None, end: Optional[str] = None, store_id: str = Depends(get_store_id)):
+    require_ledger()
+    start_at, end_at = parse_period(start, end)
+    return {"success": True, "data": await asyncio.to_thread(stock_ledger.shrinkage, store_id, start_at, end_at)}
+
+@app.get("/inventory/ledger/turnover")
+async def get_turnover(start: Optional[str] = None, end: Optional[str] = None, store_id: str = Depends(get_store_id)):
+    require_ledger()
+    start_at, end_at = parse_period(start, end)
+    return {"success": True, "data": await asyncio.to_thread(stock_ledger.turnover, store_id, start_at, end_at)}
+
+@app.get("/inventory/ledger/items/{item_id}/movements")
+async def get_item_movements(item_id: str, limit: int = 200, store_id: str = Depends(get_store_id)):
+    require_ledger()
+    movements = stock_ledger.item_movements(store_id, item_id, limit=min(limit, 1000))
+    return {"success": True, "data": movements, "count": len(movements)}
+
+@app.post("/inventory/ledger/snapshots")
+async def take_stock_snapshots(store_id: str = Depends(get_store_id)):
+    require_ledger()
+    count = await asyncio.to_thread(stock_ledger.take_snapshots, store_id)
+    return {"success": True, "data": {"items": count}}
+
+# REPLENISHMENT ENDPOINTS
+PURCHASE_ORDER_STATUSES = ("draft", "approved", "sent", "cancelled")
+
+class PurchaseOrderStatus(BaseModel):
+    status: str
+
+def serialize_purchase_order(order):
+    order["id"] = str(order.pop("_id"))
+    return order
+
+@app.get("/inventory/replenishment")
+async def get_replenishment_plan(store_id: str = Depends(get_store_id)):
+    """Safety stock, reorder point, EOQ and suggested order for every item"""
+    require_ledger("Replenishment")
+    from app.services.replenishment import replenishment
+    return {"success": True, "data": await asyncio.to_thread(replenishment.plan, store_id)}
+
+@app.post("/inventory/replenishment/drafts")
+async def create_replenishment_drafts(store_id: str = Depends(get_store_id)):
+    """Regenerate the draft purchase orders (one per supplier) now instead of waiting for the job"""
+    require_ledger("Replenishment")
+    from app.services.replenishment import replenishment
+    orders = await asyncio.to_thread(replenishment.create_drafts, store_id)
+    return {"success": True, "data": [serialize_purchase_order(order) for order in orders], "count": len(orders)}
+
+@app.get("/inventory/purchase-orders")
+async def get_purchase_orders(status: Optional[str] = None, store_id: str = Depends(get_store_id)):
+    require_ledger("Replenishment")
+    query = {"store_id": store_id}
+    if status:
+        query["status"] = status
+    orders = [
+        serialize_purchase_order(order)
+        for order in mongodb.database["purchase_orders"].find(query).sort("created_at", -1).limit(200)
+    ]
+    return {"success": True, "data": orders, "count": len(orders)}
+
+@app.patch("/inventory/purchase-orders/{order_id}")
+async def update_purchase_order_status(order_id: str, update: PurchaseOrderStatus, store_id: str = Depends(get_store_id)):
+    """Approve, mark as sent or cancel a purchase order; only drafts are regenerated by the job"""
+    require_ledger("Replenishment")
+    from bson import ObjectId
+    if update.status not in PURCHASE_ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(PURCHASE_ORDER_STATUSES)}")
+    if not ObjectId.is_valid(order_id):
+        raise HTTPException(status_code=400, detail="Invalid purchase order ID")
+    result = mongodb.database["purchase_orders"].update_one(
+        {"_id": ObjectId(order_id), "store_id": store_id},
+        {"$set": {"status": update.status, "updated_at": datetime.now()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Purchase order not found")
+    return {"success": True, "data": {"id": order_id, "status": update.status}}
+
 # CUSTOMERS ENDPOINTS
 @app.get("/customers/")
-async def get_customers():
-    customers = get_collection_data("customers", "customers")
+async def get_customers(fields: Optional[tuple] = Depends(customer_fields)):
+    customers = select_fields(get_collection_data("customers", "customers", fields=fields), fields)
     return {
         "success": True,
         "data": customers,
         "count": len(customers)
     }
 
+@app.get("/customers/search")
+async def search_customers(q: str, limit: int = 10, offset: int = 0):
+    """Phone-prefix / name search so tills never download the full customer list"""
+    limit = max(1, min(limit, 50))
+    offset = max(0, offset)
+    if mongo_ready():
+        try:
+            # Built from Mongo only: an index of the fallback list would be kept as if complete
+            customer_search_index.ensure_built(
+                lambda: string_ids(list(mongodb.database["customers"].find({}, projection(INDEXED_FIELDS))))
+            )
+            results = customer_search_index.search(q, limit=limit, offset=offset)
+            return {"success": True, "data": results["results"], "has_more": results["has_more"]}
+        except Exception as e:
+            print(f"MongoDB error for customers: {e}")
+            record_mongo_error(e)
+
+    # Tiny in-memory list, a linear scan is fine here
+    needle = q.strip().lower()
+    matches = [
+        c for c in fallback_data["customers"]
+        if needle in c.get("name", "").lower() or needle in str(c.get("phone", ""))
+    ]
+    return {"success": True, "data": matches[offset:offset + limit], "has_more": len(matches) > offset + limit}
+
 @app.post("/customers/")
 async def create_customer(customer: Customer):
     customer_data = customer.dict()
     customer_data["created_at"] = datetime.now()
     new_customer = insert_to_collection("customers", customer_data)
+    bump_version("customers")
+    if mongo_ready():
+        customer_search_index.upsert(new_customer)
+        customer_segmentation.invalidate()
     return {"success": True, "data": new_customer}
 
-# IMPORT ML ENGINE
-try:
-    from ml_engine import MLEngine
-except ImportError:
-    print("Warning: ml_engine.py not found. ML features will use fallback data.")
-    MLEngine = None
+# IMPORT ML ENGINE (on first use: pandas and scikit-learn take seconds to import)
+_ml_engine = None
+
+def get_ml_engine():
+    global _ml_engine
+    if _ml_engine is None:
+        try:
+            from ml_engine import MLEngine
+            _ml_engine = MLEngine
+        except ImportError:
+            print("Warning: ml_engine.py not found. ML features will use fallback data.")
+            _ml_engine = False
+    return _ml_engine or None
+
+async def load_ml_engine():
+    # Import in a thread so the first analytics call doesn't stall checkouts
+    return _ml_engine or await asyncio.to_thread(get_ml_engine)
 
 # ANALYTICS ENDPOINTS
 @app.get("/analytics/ml/predict-demand")
-async def predict_demand():
+@coalesce()
+async def predict_demand(store_id: str = Depends(get_store_id)):
     try:
+        MLEngine = await load_ml_engine()
         if MLEngine:
-            transactions = get_collection_data("transactions", "transactions")
-            predictions = MLEngine.predict_demand(transactions)
+            transactions = get_transactions_data(store_id)
+            # Regression runs in the ML process pool so checkouts aren't blocked
+            predictions = await ml_executor.run(
+                MLEngine.predict_demand_from_arrays, *MLEngine.transaction_arrays(transactions)
+            )
             return {"success": True, "data": predictions}
     except Exception as e:
         print(f"Demand prediction error: {e}")
@@ -680,11 +1367,14 @@ async def predict_demand():
     return {"success": True, "data": predictions}
 
 @app.get("/analytics/ml/peak-hours")
-async def get_peak_hours():
+@coalesce()
+async def get_peak_hours(store_id: str = Depends(get_store_id)):
     try:
+        MLEngine = await load_ml_engine()
         if MLEngine:
-            transactions = get_collection_data("transactions", "transactions")
-            peaks = MLEngine.get_peak_hours(transactions)
+            transactions = get_transactions_data(store_id)
+            _, hours = MLEngine.transaction_arrays(transactions)
+            peaks = await ml_executor.run(MLEngine.peak_hours_from_arrays, hours)
             return {"success": True, "data": peaks}
     except Exception as e:
         print(f"Peak hours error: {e}")
@@ -693,12 +1383,20 @@ async def get_peak_hours():
 
 
 @app.get("/analytics/ml/waste-reduction")
-async def get_waste_reduction():
+@coalesce()
+async def get_waste_reduction(store_id: str = Depends(get_store_id)):
     try:
+        MLEngine = await load_ml_engine()
         if MLEngine:
-            transactions = get_collection_data("transactions", "transactions")
-            items = get_collection_data("items", "items")
-            reduction_data = MLEngine.get_waste_reduction(items, transactions)
+            items = get_collection_data("items", "items", store_id)
+            if mongo_ready():
+                # Units sold per item from the in-memory columns, not every sale as dicts
+                await asyncio.to_thread(line_item_store.ensure_fresh, transaction_store)
+                sold = {item_id: quantity for item_id, (quantity, _) in line_item_store.item_totals(store_id, by="id").items()}
+                reduction_data = MLEngine.get_waste_reduction_from_sales(items, sold) if sold else MLEngine.get_waste_reduction(items, [])
+            else:
+                transactions = get_transactions_data(store_id)
+                reduction_data = MLEngine.get_waste_reduction(items, transactions)
             return {"success": True, "data": reduction_data}
     except Exception as e:
         print(f"Waste reduction error: {e}")
@@ -711,10 +1409,63 @@ async def get_waste_reduction():
         }
     }
 
+@app.get("/analytics/customer-segments")
+async def get_customer_segments(config: SegmentConfig = Depends()):
+    # Not coalesced: customer_segmentation caches per config and drops the
+    # cache on every worker when a customer changes, a TTL cache here would not
+    if mongo_ready():
+        try:
+            # Single aggregation over all customers, cached until a customer changes
+            segments = await asyncio.to_thread(customer_segmentation.get_segments, mongodb.database["customers"], config)
+            return {"success": True, "data": segments}
+        except Exception as e:
+            print(f"Customer segmentation error: {e}")
+    
+    customers = fallback_data.get("customers", [])
+    return {
+        "success": True,
+        "data": {
+            "high_value": len([c for c in customers if c.get("total_spent", 0) > config.high_value]),
+            "medium_value": len([c for c in customers if config.medium_value <= c.get("total_spent", 0) <= config.high_value]),
+            "low_value": len([c for c in customers if c.get("total_spent", 0) < config.medium_value])
+        }
+    }
+
+# RECOMMENDATION ENDPOINTS
+def load_baskets(days=None):
+    if mongo_ready():
+        return transaction_baskets(transaction_store, days)
+    return ([i.get("item_name") for i in t.get("items", [])] for t in fallback_data.get("transactions", []))
+
+async def ensure_basket_index():
+    """Build the index on first use, off the event loop (a cold build reads months of sales)"""
+    if not basket_index.is_built:
+        await asyncio.to_thread(basket_index.ensure_built, load_baskets)
+
+@app.get("/recommendations/cart")
+async def recommend_for_cart(items: List[str] = Query(...), k: int = 5):
+    """Upsell suggestions for the items currently in the cart"""
+    if k < 1 or k > 50:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 50")
+    
+    await ensure_basket_index()
+    return {"success": True, "data": basket_index.recommend(items, k)}
+
+@app.get("/recommendations/pair")
+async def get_pair_stats(antecedent: str, consequent: str):
+    await ensure_basket_index()
+    return {"success": True, "data": basket_index.pair_stats(antecedent, consequent)}
+
+@app.post("/recommendations/rebuild")
+async def rebuild_recommendations(days: Optional[int] = None):
+    if days is not None and days < 0:
+        raise HTTPException(status_code=400, detail="days must be 0 (all history) or more")
+    return {"success": True, "data": await asyncio.to_thread(lambda: basket_index.rebuild(load_baskets(days)))}
+
 # EMPLOYEES ENDPOINTS
 @app.get("/employees/")
 async def get_employees():
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+    if mongo_ready():
         try:
             employees = list(mongodb.database["employees"].find({}))
             for emp in employees:
@@ -741,7 +1492,7 @@ async def get_employees():
 
 @app.post("/employees/")
 async def create_employee(employee_data: dict):
-    if MONGODB_AVAILABLE and mongodb.database is not None:
+    if mongo_ready():
         try:
             employee_data["created_at"] = datetime.now()
             result = mongodb.database["employees"].insert_one(employee_data)
@@ -787,12 +1538,23 @@ async def get_inventory_report():
         }
     }
 
-# DASHBOARD ENDPOINT
+# DASHBOARD ENDPOINTS
+@app.get("/real-time/dashboard")
+async def get_real_time_dashboard(hours: int = 24, top: int = 5, store_id: str = Depends(get_store_id)):
+    """This hour, today, the last `hours` hours and top items from the in-memory sales window"""
+    return {
+        "success": True,
+        "data": {
+            **sales_window.snapshot(store_id, hours=hours, top_k=max(1, min(top, 50))),
+            "last_updated": datetime.now().isoformat()
+        }
+    }
+
 @app.get("/dashboard/overview")
-async def get_dashboard_overview():
+async def get_dashboard_overview(store_id: str = Depends(get_store_id)):
     try:
-        items = get_collection_data("items", "items")
-        transactions = get_collection_data("transactions", "transactions")
+        items = get_collection_data("items", "items", store_id)
+        transactions = get_transactions_data(store_id)
         customers = get_collection_data("customers", "customers")
         
         # Calculate today's sales
@@ -816,9 +1578,9 @@ async def get_dashboard_overview():
         
         # Check shop status
         current_session = None
-        if MONGODB_AVAILABLE and mongodb.database is not None:
+        if mongo_ready():
             try:
-                session = mongodb.database["sessions"].find_one({"is_active": True})
+                session = mongodb.database["sessions"].find_one(store_filter(store_id, {"is_active": True}))
                 if session:
                     # Convert ObjectId to string
                     session['id'] = str(session['_id'])
@@ -828,13 +1590,14 @@ async def get_dashboard_overview():
                 pass
         
         if not current_session:
-            current_session = fallback_data.get("current_session")
+            current_session = local_state.get(current_session_key(store_id))
         
         shop_status = "open" if current_session else "closed"
         
         return {
             "success": True,
             "data": {
+                "store_id": store_id,
                 "today_sales": today_sales,
                 "lifetime_revenue": lifetime_revenue,
                 "total_transactions": len(transactions),
@@ -864,18 +1627,21 @@ async def get_dashboard_overview():
             }
         }
 @app.get("/api/kitchen/orders")
-async def get_kitchen_orders():
-    orders = get_collection_data("kitchen_orders", "kitchen_orders")
+async def get_kitchen_orders(store_id: str = Depends(get_store_id), fields: Optional[tuple] = Depends(kitchen_order_fields)):
+    # status is always loaded: it decides which orders are active
+    orders = get_collection_data(
+        "kitchen_orders", "kitchen_orders", store_id, None if fields is None else (*fields, "status")
+    )
     active_orders = [o for o in orders if o.get("status") in ["pending", "preparing", "ready"]]
-    return {"status": "success", "data": active_orders}
+    return {"status": "success", "data": select_fields(active_orders, fields)}
 
 @app.put("/api/kitchen/orders/{order_id}/status")
-async def update_kitchen_order_status(order_id: str, update: OrderStatusUpdate):
+async def update_kitchen_order_status(order_id: str, update: OrderStatusUpdate, store_id: str = Depends(get_store_id)):
     try:
         from bson import ObjectId
-        if MONGODB_AVAILABLE and mongodb.database is not None:
+        if mongo_ready():
             result = mongodb.database["kitchen_orders"].update_one(
-                {"_id": ObjectId(order_id)},
+                store_filter(store_id, {"_id": ObjectId(order_id)}),
                 {"$set": {"status": update.status}}
             )
             if result.modified_count == 0:
@@ -883,6 +1649,8 @@ async def update_kitchen_order_status(order_id: str, update: OrderStatusUpdate):
         else:
             found = False
             for o in fallback_data.get("kitchen_orders", []):
+                if not in_store(o, store_id):
+                    continue
                 if str(o.get("id", "")) == order_id or str(o.get("_id", "")) == order_id or str(o.get("transaction_id", "")) == order_id:
                     o["status"] = update.status
                     found = True
@@ -896,11 +1664,18 @@ async def update_kitchen_order_status(order_id: str, update: OrderStatusUpdate):
 # HEALTH CHECK
 @app.get("/health")
 async def health_check():
+    breaker_open = MONGODB_AVAILABLE and not mongo_breaker.allow()
+    connecting = MONGODB_AVAILABLE and mongodb.connecting
     return {
-        "status": "healthy",
+        # Degraded: Mongo is unreachable (or still connecting) and requests are served from fallback data
+        "status": "degraded" if breaker_open or connecting else "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "2.0.0",
-        "mongodb_connected": MONGODB_AVAILABLE and mongodb.database is not None
+        "mongodb_connected": mongo_ready(),
+        "mongodb_connecting": connecting,
+        "mongodb": mongo_breaker.status() if MONGODB_AVAILABLE else None,
+        "admission": admission.status(),
+        "startup_ms": startup_report.ready_ms
     }
 
 @app.get("/")
@@ -36,10 +36,39 @@ class MLEngine:
                 
         return pd.DataFrame(records)
 
+    @staticmethod
+    def transaction_arrays(transactions_data):
+        """Day number and hour of each transaction as compact int arrays
+
+        This is all predict_demand and get_peak_hours need, and it pickles far
+        smaller than the transaction dicts when sent to the ML process pool.
+        """
+        days = []
+        hours = []
+        for t in transactions_data or []:
+            ts = t.get('timestamp')
+            try:
+                if isinstance(ts, str):
+                    dt = datetime.fromisoformat(ts.replace('Z', '+00:00'))
+                elif isinstance(ts, datetime):
+                    dt = ts
+                else:
+                    continue
+            except ValueError:
+                continue
+            days.append(dt.toordinal())
+            hours.append(dt.hour)
+        return np.array(days, dtype=np.int32), np.array(hours, dtype=np.int8)
+
     @staticmethod
     def predict_demand(transactions_data):
         """Use simple Linear Regression to forecast demand by hour based on historical trends"""
-        df = MLEngine.prepare_transaction_df(transactions_data)
+        return MLEngine.predict_demand_from_arrays(*MLEngine.transaction_arrays(transactions_data))
+
+    @staticmethod
+    def predict_demand_from_arrays(days, hours):
+        """predict_demand over the output of transaction_arrays"""
+        df = pd.DataFrame({'date': days, 'hour': hours.astype(int)})
         
         # If we don't have enough data for ML, return a smart default pattern
         if len(df) < 10:
@@ -63,7 +92,8 @@ class MLEngine:
         try:
             # Simple model: average count for each hour across all days 
             # smoothed with a linear trend if there's growth
-            X = hourly_counts[['hour']]
+            # Plain array so predict([[hour]]) below matches the fitted features
+            X = hourly_counts[['hour']].to_numpy()
             y = hourly_counts['count']
             
             model = LinearRegression()
@@ -98,7 +128,12 @@ class MLEngine:
 
     @staticmethod
     def get_peak_hours(transactions_data):
-        df = MLEngine.prepare_transaction_df(transactions_data)
+        return MLEngine.peak_hours_from_arrays(MLEngine.transaction_arrays(transactions_data)[1])
+
+    @staticmethod
+    def peak_hours_from_arrays(hours):
+        """get_peak_hours over the hour array from transaction_arrays"""
+        df = pd.DataFrame({'hour': hours.astype(int)})
         
         if len(df) < 5:
             # Default industry standard peaks
@@ -133,15 +168,25 @@ class MLEngine:
                 "suggestions": ["Need more data to generate specific insights"]
             }
             
-        try:
-            # Extract item sales frequency
-            item_sales = defaultdict(int)
-            for t in transactions_data:
-                for item in t.get('items', []):
-                    item_id = item.get('item_id', item.get('id', ''))
-                    qty = item.get('quantity', 1)
-                    item_sales[item_id] += qty
+        # Extract item sales frequency
+        item_sales = defaultdict(int)
+        for t in transactions_data:
+            for item in t.get('items', []):
+                item_id = item.get('item_id', item.get('id', ''))
+                qty = item.get('quantity', 1)
+                item_sales[item_id] += qty
+        return MLEngine.get_waste_reduction_from_sales(inventory_data, item_sales)
+
+    @staticmethod
+    def get_waste_reduction_from_sales(inventory_data, item_sales):
+        """get_waste_reduction over units sold per item id, e.g. from the line item store"""
+        if not inventory_data:
+            return {
+                "waste_reduction": "15%",
+                "suggestions": ["Need more data to generate specific insights"]
+            }
             
+        try:
             suggestions = []
             total_items_analyzed = 0
             high_risk_items = 0
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import pytest
+
+# Settings are read at import time: point every file the app writes at a
+# scratch directory and switch the background jobs off before importing it
+_scratch = tempfile.mkdtemp(prefix="smartpos-tests-")
+os.environ.update({
+    "SHARED_STATE_BACKEND": "auto",
+    "SHARED_STATE_PATH": os.path.join(_scratch, "shared_state.db"),
+    "ARCHIVE_DIR": os.path.join(_scratch, "archive"),
+    "ARCHIVE_SCHEDULE_HOURS": "0",
+    "LEDGER_SNAPSHOT_HOURS": "0",
+    "REPLENISHMENT_SCHEDULE_HOURS": "0",
+    "ML_WORKERS": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mongomock  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    """TestClient for main.app, connected to an in-memory mongomock server"""
+    with mock.patch("pymongo.MongoClient", mongomock.MongoClient):
+        from fastapi.testclient import TestClient
+        import main
+        from app.core.database import mongodb
+        with TestClient(main.app) as client:
+            # Mongo connects in the background, and index builds run in a
+            # thread of their own once it has
+            for _ in range(500):
+                if not mongodb.connecting and mongodb.indexes_ready:
+                    break
+                time.sleep(0.01)
+            yield client
+
+
+@pytest.fixture
+def client(app_client):
+    """The shared client, with the Mongo circuit closed again after each test"""
+    from app.core.database import mongo_breaker
+    yield app_client
+    if mongo_breaker.state != "closed":
+        mongo_breaker.close()
+
+
+@pytest.fixture
+def store_id(request):
+    """An outlet of its own per test, so tests do not see each other's data"""
+    return "test-" + request.node.name.replace("_", "-")
+
+
+@pytest.fixture
+def mongo_outage():
+    """Trip the Mongo circuit breaker, as after repeated connection failures"""
+    from app.core.database import mongo_breaker
+    mongo_breaker.trip(ConnectionError("simulated outage"))
+    yield mongo_breaker
+    mongo_breaker.close()
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from app.core.admission import CRITICAL, LOW, NORMAL, AdmissionController
+
+RULES = [
+    (("POST",), "/transactions", CRITICAL),
+    (None, "/analytics", LOW),
+    (None, "/stream", None),
+]
+
+
+def controller(**overrides):
+    args = dict(
+        limits={CRITICAL: 2, NORMAL: 1, LOW: 1},
+        queue_seconds={CRITICAL: 1, NORMAL: 0.05, LOW: 0.05},
+        max_queue=1, p99_target_ms=100, window_seconds=60, retry_after=2,
+    )
+    return AdmissionController(RULES, **{**args, **overrides})
+
+
+def scope(method, path):
+    return {"type": "http", "method": method, "path": path}
+
+
+class Recorder:
+    def __init__(self):
+        self.statuses = []
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.statuses.append(message["status"])
+
+
+def slow_app(seconds):
+    async def app(scope, receive, send):
+        await asyncio.sleep(seconds)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+
+def test_requests_are_classified_by_method_and_prefix():
+    admission = controller()
+    assert admission.classify("POST", "/transactions/batch") == CRITICAL
+    assert admission.classify("GET", "/transactions/") == NORMAL
+    assert admission.classify("GET", "/analytics/sales") == LOW
+    assert admission.classify("GET", "/stream/kitchen") is None
+
+
+def test_excess_requests_queue_then_time_out_with_429():
+    admission, recorder = controller(), Recorder()
+
+    async def run():
+        await asyncio.gather(*(
+            admission.handle(slow_app(0.2), scope("GET", "/items/"), None, recorder.send) for _ in range(3)
+        ))
+
+    asyncio.run(run())
+    # One runs, one waits past its 50 ms deadline, one finds the queue full
+    assert sorted(recorder.statuses) == [200, 429, 429]
+    status = admission.status()["classes"][NORMAL]
+    assert status["timed_out"] == 1 and status["rejected"] == 2 and status["in_flight"] == 0
+
+
+def test_a_queued_request_gets_the_next_free_slot():
+    admission, recorder = controller(queue_seconds={CRITICAL: 1, NORMAL: 1, LOW: 1}), Recorder()
+
+    async def run():
+        await asyncio.gather(*(
+            admission.handle(slow_app(0.05), scope("GET", "/items/"), None, recorder.send) for _ in range(2)
+        ))
+
+    asyncio.run(run())
+    assert recorder.statuses == [200, 200]
+
+
+def test_low_priority_work_is_shed_while_checkout_is_slow():
+    admission, recorder = controller(), Recorder()
+    for _ in range(20):
+        admission._latencies.append((time.monotonic(), 500.0))
+    admission._p99 = (0.0, None)
+
+    asyncio.run(admission.handle(slow_app(0), scope("GET", "/analytics/sales"), None, recorder.send))
+    asyncio.run(admission.handle(slow_app(0), scope("POST", "/transactions/"), None, recorder.send))
+    assert recorder.statuses == [429, 200]
+    assert admission.shed == 1
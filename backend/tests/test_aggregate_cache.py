@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from app.services.aggregate_cache import HOUR, AggregateCache, regroup_item_lines
+from app.services.transaction_store import hour_of
+
+
+class Compute:
+    """Stands in for the Mongo query: one row per hour, tagged with the call number"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        rows, hour = {}, hour_of(start)
+        while hour <= end:
+            rows[hour] = [["Tea", 1, float(len(self.calls))]]
+            hour += HOUR
+        return rows
+
+
+def test_closed_hours_are_computed_once(client, store_id):
+    cache, compute = AggregateCache(grace_seconds=0), Compute()
+    now = datetime.now()
+    start, this_hour = now - timedelta(hours=5, minutes=30), hour_of(now)
+
+    first = cache.rows(store_id, "item_lines", start, now, compute)
+    assert [hour for hour, _ in first] == [hour_of(start) + HOUR * i for i in range(6)]
+    calls = len(compute.calls)
+
+    second = cache.rows(store_id, "item_lines", start, now, compute)
+    # Only the partial first hour and the open hour are computed again
+    assert [c for c in compute.calls[calls:]] == [(start, hour_of(start) + HOUR), (this_hour, now)]
+    assert [row for hour, row in second if hour_of(start) < hour < this_hour] == \
+        [row for hour, row in first if hour_of(start) < hour < this_hour]
+    assert cache.hits == 4 and cache.misses == 4
+
+
+def test_invalidated_hours_are_recomputed(client, store_id):
+    cache, compute = AggregateCache(grace_seconds=0), Compute()
+    end = hour_of(datetime.now())
+    start = end - timedelta(hours=3)
+    cache.rows(store_id, "item_lines", start, end - timedelta(microseconds=1), compute)
+
+    changed = start + HOUR
+    assert cache.invalidate(store_id, [changed + timedelta(minutes=10), datetime.now()]) == 1
+    compute.calls.clear()
+    cache.rows(store_id, "item_lines", start, end - timedelta(microseconds=1), compute)
+    assert (changed, changed + HOUR) in compute.calls
+
+
+def test_a_computation_overtaken_by_an_invalidation_is_not_stored(client, store_id):
+    from app.core.database import mongodb
+    cache = AggregateCache(grace_seconds=0)
+    hour = hour_of(datetime.now()) - timedelta(hours=2)
+
+    def compute_racing_an_invalidation(start, end):
+        cache.invalidate(store_id, [hour])
+        return {hour: [["Tea", 1, 1.0]]}
+
+    cache.rows(store_id, "sales", hour, hour + HOUR - timedelta(microseconds=1), compute_racing_an_invalidation)
+    assert mongodb.aggregate_buckets.find_one({"store_id": store_id, "metric": "sales", "hour": hour})["rows"] is None
+
+
+def test_regroup_item_lines_sums_hours_into_other_keys():
+    day = datetime(2026, 5, 4)
+    rows = [(day + timedelta(hours=9), ["Tea", 2, 20.0]), (day + timedelta(hours=10), ["Tea", 1, 10.0])]
+    assert regroup_item_lines(rows, ("date", "item_name")) == [
+        {"_id": {"date": "2026-05-04", "item_name": "Tea"}, "quantity": 3, "revenue": 30.0}
+    ]
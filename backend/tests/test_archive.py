@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.archive_service import TransactionArchive, PYARROW_AVAILABLE
+
+pytestmark = pytest.mark.skipif(not PYARROW_AVAILABLE, reason="pyarrow is not installed")
+
+
+def old_sales(store_id, count, days_ago=200):
+    from app.core.database import mongodb
+    when = datetime.now() - timedelta(days=days_ago)
+    mongodb.transactions.insert_many([
+        {
+            "store_id": store_id,
+            "session_id": "s1",
+            "timestamp": when + timedelta(minutes=i),
+            "total_amount": 10.0,
+            "payment_mode": "cash",
+            "items": [{"item_id": "1", "item_name": "Tea", "quantity": 1, "price": 10.0, "total": 10.0}],
+        }
+        for i in range(count)
+    ])
+    return when
+
+
+def test_other_workers_see_a_newer_manifest(client, store_id, tmp_path):
+    worker_a, worker_b = TransactionArchive(str(tmp_path)), TransactionArchive(str(tmp_path))
+    assert worker_b.archived_through() is None
+    start = old_sales(store_id, 3)
+
+    result = worker_a.archive(older_than_days=100)
+    assert result["archived"] >= 3
+    assert worker_b.archived_through() is not None
+    sales = worker_b.load_transactions(start - timedelta(days=1), start + timedelta(days=1), store_id)
+    assert len(sales) == 3
+
+
+def test_interrupted_run_leaves_moved_sales_readable(client, store_id, tmp_path, monkeypatch):
+    from app.core.database import mongodb
+    archive = TransactionArchive(str(tmp_path))
+    start = old_sales(store_id, 2, days_ago=300)
+    write_batch = archive._write_batch
+    calls = []
+
+    def crash_on_second_batch(batch):
+        calls.append(batch)
+        if len(calls) > 1:
+            raise OSError("disk full")
+        return write_batch(batch)
+
+    monkeypatch.setattr(archive, "_write_batch", crash_on_second_batch)
+    with pytest.raises(OSError):
+        archive.archive(older_than_days=100, batch_size=1)
+
+    # The boundary only moves once a run completes...
+    assert archive.archived_through() is None
+    # ...but the batch that did move is found in the cold tier, the other is still hot
+    assert archive.needs_scan(start - timedelta(days=1))
+    cold = archive.load_transactions(start - timedelta(days=1), start + timedelta(days=1), store_id)
+    assert len(cold) == 1
+    assert mongodb.transactions.count_documents({"store_id": store_id}) == 1
+
+
+def test_runs_do_not_overlap(client, tmp_path):
+    from app.core.shared_state import shared_state
+    archive, other = TransactionArchive(str(tmp_path)), TransactionArchive(str(tmp_path))
+    holder, version = shared_state.get_versioned("archive:running")
+    assert shared_state.compare_and_set("archive:running", other.worker_id, version, ttl=60)
+    try:
+        assert archive.run_exclusive(older_than_days=100) is None
+    finally:
+        _, version = shared_state.get_versioned("archive:running")
+        shared_state.compare_and_set("archive:running", None, version)
+    assert archive.run_exclusive(older_than_days=100) is not None
+    assert shared_state.get("archive:running") is None
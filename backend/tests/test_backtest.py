@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+
+from app.ml.backtest import History, format_table, run_backtest, synthetic_transactions
+
+
+def test_history_sums_quantities_per_day_and_item():
+    history = History([
+        {"timestamp": "2026-01-05T09:15:00", "items": [{"item_name": "Tea", "quantity": 2}]},
+        {"timestamp": {"$date": "2026-01-05T18:00:00Z"}, "items": [{"name": "Tea"}, {"item_name": "Samosa", "quantity": 3}]},
+        {"timestamp": datetime(2026, 1, 7, 9), "items": [{"item_name": "Samosa", "quantity": 1}]},
+        {"timestamp": None, "items": [{"item_name": "Ignored"}]},
+    ])
+    assert history.items == ["Samosa", "Tea"]
+    assert history.n_days == 3
+    assert history.daily.tolist() == [[3, 3], [0, 0], [1, 0]]
+    assert history.hourly[0, 9] == 2 and history.hourly[0, 18] == 4
+
+
+def test_synthetic_history_is_reproducible():
+    assert synthetic_transactions(days=10, seed=3) == synthetic_transactions(days=10, seed=3)
+
+
+def test_backtest_scores_the_selected_models():
+    end = datetime(2026, 3, 1)
+    report = run_backtest(
+        synthetic_transactions(days=60, seed=1, end=end), step=14,
+        models=["moving_average_7", "same_weekday_last_week"]
+    )
+    assert report["days"] == 60 and report["origins"] == 3
+    assert {r["model"] for r in report["results"]} == {"moving_average_7", "same_weekday_last_week"}
+    for result in report["results"]:
+        assert result["mape"] is not None and result["rmse"] >= 0
+        assert set(result["per_series"]) == set(report["items"])
+    assert "moving_average_7" in format_table(report)
+
+
+def test_too_little_history_is_an_error():
+    with pytest.raises(ValueError):
+        run_backtest(synthetic_transactions(days=10), min_train=28)
@@ -0,0 +1,66 @@
+import pytest
+
+from app.services.basket_engine import CoOccurrenceIndex
+
+BASKETS = [
+    ["Coffee", "Croissant"],
+    ["Coffee", "Croissant"],
+    ["Coffee", "Muffin"],
+    ["Tea", "Muffin"],
+    ["Coffee"],
+]
+
+
+def built(baskets=BASKETS, max_pairs=1000):
+    index = CoOccurrenceIndex(max_pairs=max_pairs)
+    index.rebuild(baskets)
+    return index
+
+
+def test_counts_are_symmetric():
+    index = built()
+    assert index.pairs["Coffee"]["Croissant"] == index.pairs["Croissant"]["Coffee"] == 2
+    assert index.pair_count == 3
+
+
+def test_duplicate_items_in_a_basket_count_once():
+    index = CoOccurrenceIndex()
+    index.add_basket(["Coffee", "Coffee", "Croissant", None])
+    assert index.item_counts["Coffee"] == 1 and index.pairs["Coffee"]["Croissant"] == 1
+
+
+def test_pair_stats():
+    stats = built().pair_stats("Coffee", "Croissant")
+    assert stats["support"] == pytest.approx(2 / 5)
+    assert stats["confidence"] == pytest.approx(2 / 4)
+    assert stats["lift"] == pytest.approx(0.5 / (2 / 5))
+
+
+def test_recommend_ranks_by_confidence_and_skips_the_cart():
+    suggestions = built().recommend(["Coffee"], k=5, min_count=1)
+    assert [s["item_name"] for s in suggestions] == ["Croissant", "Muffin"]
+    assert suggestions[0]["because_of"] == "Coffee"
+    assert built().recommend(["Coffee", "Croissant"], min_count=1)[0]["item_name"] == "Muffin"
+
+
+def test_min_count_filters_rare_pairs():
+    assert [s["item_name"] for s in built().recommend(["Coffee"], min_count=2)] == ["Croissant"]
+
+
+def test_pruning_keeps_the_matrix_under_its_cap():
+    frequent = [["Coffee", "Croissant"]] * 3
+    rare = [[f"Item {i}", f"Item {i + 1}"] for i in range(0, 40, 2)]
+    index = CoOccurrenceIndex(max_pairs=10)
+    for basket in frequent + rare:
+        index.add_basket(basket)
+
+    assert index.pair_count <= 10
+    assert index.prune_below == 2
+    assert index.pairs["Coffee"]["Croissant"] == 3
+
+
+def test_ensure_built_loads_once():
+    index, loads = CoOccurrenceIndex(), []
+    index.ensure_built(lambda: loads.append(1) or BASKETS)
+    index.ensure_built(lambda: loads.append(1) or BASKETS)
+    assert loads == [1] and index.stats()["baskets"] == 5
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.batch_checkout import aggregate_totals, parse_sale
+
+
+def queued(key, item_id, quantity=1, price=20.0, **extra):
+    return {
+        "idempotency_key": key,
+        "items": [{"id": item_id, "name": "Batch Tea", "price": price, "quantity": quantity}],
+        "total_amount": price * quantity,
+        "payment_method": "cash",
+        **extra,
+    }
+
+
+@pytest.fixture
+def item_id(client, store_id):
+    created = client.post("/items/", headers={"X-Store-Id": store_id}, json={"name": "Batch Tea", "price": 20, "stock": 50})
+    return created.json()["data"]["id"]
+
+
+def test_a_retried_batch_only_records_new_sales(client, store_id, item_id):
+    from app.core.database import mongodb
+    headers = {"X-Store-Id": store_id}
+    client.post("/sessions/open", headers=headers)
+
+    first = client.post("/transactions/batch", headers=headers, json={"transactions": [
+        queued("sale-1", item_id, quantity=2),
+        queued("sale-2", item_id),
+    ]}).json()["data"]
+    assert (first["created"], first["duplicate"]) == (2, 0)
+
+    retry = client.post("/transactions/batch", headers=headers, json={"transactions": [
+        queued("sale-1", item_id, quantity=2),
+        queued("sale-2", item_id),
+        queued("sale-3", item_id),
+    ]}).json()["data"]
+    assert [r["status"] for r in retry["results"]] == ["duplicate", "duplicate", "created"]
+    assert retry["results"][0]["id"] == first["results"][0]["id"]
+
+    item = next(i for i in client.get("/items/", headers=headers).json()["data"] if i["id"] == item_id)
+    assert item["stock"] == 50 - 4
+    session = client.get("/sessions/current", headers=headers).json()["data"]
+    assert session["transaction_count"] == 3
+    assert mongodb.kitchen_orders.count_documents({"store_id": store_id}) == 3
+
+
+def test_bad_sales_are_reported_without_failing_the_batch(client, store_id, item_id):
+    headers = {"X-Store-Id": store_id}
+    client.post("/sessions/open", headers=headers)
+    results = client.post("/transactions/batch", headers=headers, json={"transactions": [
+        queued("ok", item_id),
+        queued("ok", item_id),
+        queued("unknown", "000000000000000000000bad"),
+        queued("", item_id),
+    ]}).json()["data"]["results"]
+
+    assert [r["status"] for r in results] == ["created", "duplicate", "invalid", "invalid"]
+    assert results[1]["duplicate_of"] == 0
+    assert "unknown items" in results[2]["error"]
+
+
+def test_an_empty_batch_is_rejected(client):
+    assert client.post("/transactions/batch", json={"transactions": []}).status_code == 400
+
+
+def test_parse_sale_keeps_the_till_time_and_rejects_the_future():
+    now = datetime(2026, 5, 1, 12, 0)
+    doc = parse_sale(queued("k", "1", timestamp="2026-05-01T09:30:00"), "s1", "session", now)
+    assert doc["timestamp"] == datetime(2026, 5, 1, 9, 30) and doc["idempotency_key"] == "k"
+
+    with pytest.raises(ValueError, match="future"):
+        parse_sale(queued("k", "1", timestamp=(now + timedelta(hours=1)).isoformat()), "s1", "session", now)
+    with pytest.raises(ValueError, match="positive integer"):
+        parse_sale(queued("k", "1", quantity=0), "s1", "session", now)
+
+
+def test_aggregate_totals_folds_the_batch():
+    now = datetime(2026, 5, 1, 12, 0)
+    docs = [
+        parse_sale(queued("a", "1", quantity=2, customer_id="c1"), "s1", "session", now),
+        parse_sale(queued("b", "1", quantity=1, customer_id="c1", timestamp="2026-05-01T08:00:00"), "s1", "session", now),
+    ]
+    stock, customers, session_inc = aggregate_totals(docs)
+    assert stock == {"1": 3}
+    assert customers["c1"]["visit_count"] == 2 and customers["c1"]["total_spent"] == 60
+    assert customers["c1"]["last_visit"] == now
+    assert session_inc["transaction_count"] == 2 and session_inc["total_sales"] == 60
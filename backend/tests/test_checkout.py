@@ -0,0 +1,21 @@
+from tests.test_sessions import sale
+
+
+def test_broken_stock_hooks_do_not_skip_the_kitchen_ticket(client, store_id, monkeypatch):
+    import main
+    from app.core.database import mongodb
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("hook failed")
+
+    headers = {"X-Store-Id": store_id}
+    client.post("/sessions/open", headers=headers)
+    basket_count = main.basket_index.basket_count
+    monkeypatch.setattr(main.stock_alerts, "observe", broken)
+    monkeypatch.setattr(main.stock_ledger, "record_sale", broken)
+
+    response = client.post("/transactions/", json=sale(), headers=headers)
+    assert response.status_code == 200, response.text
+    assert mongodb.kitchen_orders.count_documents({"store_id": store_id}) == 1
+    assert main.basket_index.basket_count == basket_count + 1
+    assert main.sales_window.snapshot(store_id, hours=1, top_k=5)["today_transactions"] == 1
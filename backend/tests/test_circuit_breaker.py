@@ -0,0 +1,54 @@
+import pymongo
+
+from app.core.circuit_breaker import CircuitBreaker
+
+
+def test_opens_after_consecutive_failures_only():
+    opened = []
+    breaker = CircuitBreaker("test", threshold=3, on_open=lambda: opened.append(1))
+    breaker.record_failure("a")
+    breaker.record_failure("b")
+    breaker.record_success()
+    breaker.record_failure("c")
+    breaker.record_failure("d")
+    assert breaker.allow()
+
+    breaker.record_failure("e")
+    assert not breaker.allow() and opened == [1]
+    assert breaker.status()["last_error"] == "e"
+
+
+def test_further_failures_while_open_do_not_reopen():
+    opened = []
+    breaker = CircuitBreaker("test", threshold=1, on_open=lambda: opened.append(1))
+    breaker.trip("down")
+    breaker.record_failure("still down")
+    assert opened == [1] and breaker.trips == 1
+
+
+def test_close_resets_the_count():
+    breaker = CircuitBreaker("test", threshold=2)
+    breaker.trip("down")
+    breaker.close()
+    breaker.record_failure("blip")
+    assert breaker.allow() and breaker.status()["open_for_seconds"] is None
+
+
+def test_only_connection_errors_count_towards_the_mongo_breaker(client):
+    from app.core.database import mongo_breaker, record_mongo_error
+    failures = mongo_breaker.failures
+    record_mongo_error(pymongo.errors.OperationFailure("bad query"))
+    record_mongo_error(pymongo.errors.WaitQueueTimeoutError("pool full"))
+    assert mongo_breaker.failures == failures
+    try:
+        record_mongo_error(pymongo.errors.AutoReconnect("connection reset"))
+        assert mongo_breaker.failures == failures + 1
+    finally:
+        mongo_breaker.close()
+
+
+def test_an_open_breaker_serves_reads_from_the_fallback(client, mongo_outage):
+    health = client.get("/health").json()
+    assert health["status"] == "degraded" and not health["mongodb_connected"]
+    response = client.get("/items/")
+    assert response.status_code == 200 and response.json()["success"]
@@ -0,0 +1,80 @@
+import asyncio
+
+from app.core.coalesce import RequestCoalescer, coalesce, coalescer
+
+
+class Counter:
+    def __init__(self, delay=0.01):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.calls
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    coalescer, compute = RequestCoalescer(), Counter()
+
+    async def run():
+        return await asyncio.gather(*(coalescer.call(("key",), compute, (), {}, 0, 0) for _ in range(5)))
+
+    assert asyncio.run(run()) == [1] * 5
+    assert compute.calls == 1
+
+
+def test_fresh_results_are_reused_and_stale_ones_revalidated():
+    coalescer, compute = RequestCoalescer(), Counter(delay=0)
+
+    async def run():
+        first = await coalescer.call(("key",), compute, (), {}, 0.05, 1)
+        cached = await coalescer.call(("key",), compute, (), {}, 0.05, 1)
+        await asyncio.sleep(0.06)
+        stale = await coalescer.call(("key",), compute, (), {}, 0.05, 1)
+        await asyncio.sleep(0.01)
+        refreshed = await coalescer.call(("key",), compute, (), {}, 0.05, 1)
+        return first, cached, stale, refreshed
+
+    assert asyncio.run(run()) == (1, 1, 1, 2)
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    coalescer, compute = RequestCoalescer(), Counter(delay=0.05)
+
+    async def run():
+        leaving = asyncio.ensure_future(coalescer.call(("key",), compute, (), {}, 0, 0))
+        staying = asyncio.ensure_future(coalescer.call(("key",), compute, (), {}, 0, 0))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(run()) == 1
+
+
+def test_clear_drops_one_endpoint_only():
+    coalescer = RequestCoalescer()
+    coalescer._store(("a", ()), 1)
+    coalescer._store(("b", ()), 2)
+    coalescer.clear("a")
+    assert list(coalescer._results) == [("b", ())]
+
+
+def test_decorator_keys_on_normalized_arguments():
+    compute = Counter(delay=0)
+
+    @coalesce(ttl=60, stale_ttl=0, ignore=("request_id",))
+    async def endpoint(days=7, category=None, request_id=None):
+        return await compute()
+
+    async def run():
+        return [
+            await endpoint(days=7, category=" drinks ", request_id=1),
+            await endpoint(days=7, category="drinks", request_id=2),
+            await endpoint(days=30, category="drinks"),
+        ]
+
+    try:
+        assert asyncio.run(run()) == [1, 1, 2]
+    finally:
+        coalescer.clear(endpoint.coalesce_key)
@@ -0,0 +1,71 @@
+from app.services.customer_search import CustomerSearchIndex, name_trigrams
+
+CUSTOMERS = [
+    {"id": "1", "name": "John Doe", "phone": "+91 98765 43210", "email": "john@email.com"},
+    {"id": "2", "name": "Jane Smith", "phone": "+91 98765 43211", "email": "jane@email.com"},
+    {"id": "3", "name": "Johnathan Whitaker", "phone": "+91 91234 00000", "email": None},
+]
+
+
+def build():
+    index = CustomerSearchIndex()
+    index.build(CUSTOMERS)
+    return index
+
+
+def ids(result):
+    return [customer["id"] for customer in result["results"]]
+
+
+def test_phone_prefix_matches_with_and_without_country_code():
+    index = build()
+    assert ids(index.search("98765")) == ["1", "2"]
+    assert ids(index.search("+91 98765 4321")) == ["1", "2"]
+    assert ids(index.search("9123")) == ["3"]
+
+
+def test_name_fragment_ranks_shorter_names_first():
+    # Exact trigram matches first; "Jane" only shares the leading "  j"
+    assert ids(build().search("joh"))[:2] == ["1", "3"]
+
+
+def test_a_typo_still_finds_the_name():
+    assert ids(build().search("jane smiht"))[0] == "2"
+
+
+def test_pages_report_whether_more_matches_exist():
+    index = build()
+    first = index.search("98765", limit=1)
+    assert ids(first) == ["1"] and first["has_more"]
+    second = index.search("98765", limit=1, offset=1)
+    assert ids(second) == ["2"] and not second["has_more"]
+
+
+def test_upsert_replaces_the_old_entries():
+    index = build()
+    index.upsert({"id": "2", "name": "Jane Baker", "phone": "+91 70000 00000"})
+    assert ids(index.search("98765")) == ["1"]
+    assert ids(index.search("baker"))[0] == "2"
+    assert "2" not in ids(index.search("smith"))
+
+
+def test_a_write_on_another_worker_triggers_a_rebuild():
+    this_worker, other_worker = build(), CustomerSearchIndex()
+    this_worker.ensure_built(lambda: CUSTOMERS)
+    other_worker.ensure_built(lambda: CUSTOMERS)
+    other_worker.upsert({"id": "4", "name": "Priya Nair", "phone": "+91 80000 00000"})
+
+    this_worker.ensure_built(lambda: CUSTOMERS + [{"id": "4", "name": "Priya Nair", "phone": "+91 80000 00000"}])
+    assert ids(this_worker.search("priya")) == ["4"]
+
+
+def test_partial_trigrams_leave_the_last_word_open():
+    assert "oe " in name_trigrams("doe")
+    assert "oe " not in name_trigrams("doe", partial=True)
+
+
+def test_search_endpoint(client):
+    created = client.post("/customers/", json={"name": "Searchable Person", "phone": "+91 99999 12345"}).json()
+    assert created["success"]
+    found = client.get("/customers/search", params={"q": "9999912"}).json()
+    assert "Searchable Person" in [customer["name"] for customer in found["data"]]
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+
+from app.services.customer_segments import CustomerSegmentation
+
+
+class FakeCustomers:
+    """Stands in for the customers collection; mongomock has no $convert"""
+
+    def __init__(self):
+        self.runs = 0
+
+    def aggregate(self, pipeline):
+        self.runs += 1
+        return [{
+            "rfm": [{"_id": {"r": 3, "f": 3, "m": 3}, "count": self.runs, "total_spent": 100.0 * self.runs}],
+            "spend_distribution": [],
+            "totals": [{"customers": self.runs, "total_spent": 100.0 * self.runs, "avg_spent": 100.0, "avg_visits": 1}],
+        }]
+
+
+def test_results_are_cached_until_invalidated():
+    segmentation, customers = CustomerSegmentation(ttl_seconds=60), FakeCustomers()
+    first = segmentation.get_segments(customers)
+    assert segmentation.get_segments(customers) is first
+    segmentation.invalidate()
+    assert segmentation.get_segments(customers)["total_customers"] == 2
+
+
+def test_cached_results_expire():
+    segmentation, customers = CustomerSegmentation(ttl_seconds=0.01), FakeCustomers()
+    segmentation.get_segments(customers)
+    time.sleep(0.02)
+    segmentation.get_segments(customers)
+    assert customers.runs == 2
+
+
+def test_each_run_measures_recency_from_its_own_now():
+    segmentation, customers = CustomerSegmentation(ttl_seconds=0), FakeCustomers()
+    first = segmentation.get_segments(customers)["computed_at"]
+    time.sleep(0.01)
+    assert segmentation.get_segments(customers)["computed_at"] > first
+
+
+def test_endpoint_reflects_an_invalidation_at_once(client, monkeypatch):
+    import main
+    customers = FakeCustomers()
+    monkeypatch.setattr(main.customer_segmentation, "_cache", {})
+    real_get_segments = main.customer_segmentation.get_segments
+    monkeypatch.setattr(main.customer_segmentation, "get_segments", lambda collection, config=None: real_get_segments(customers, config))
+
+    assert client.get("/analytics/customer-segments").json()["data"]["total_customers"] == 1
+    assert client.get("/analytics/customer-segments").json()["data"]["total_customers"] == 1
+    main.customer_segmentation.invalidate()
+    assert client.get("/analytics/customer-segments").json()["data"]["total_customers"] == 2
+
+
+class FakeMotorCustomers(FakeCustomers):
+    def aggregate(self, pipeline):
+        results = FakeCustomers.aggregate(self, pipeline)
+
+        class Cursor:
+            async def to_list(self, length=None):
+                return results
+        return Cursor()
+
+
+def test_async_segments_keep_shared_state_off_the_event_loop(monkeypatch):
+    segmentation, customers = CustomerSegmentation(ttl_seconds=60), FakeMotorCustomers()
+    loop_threads, state_threads = [], []
+    real_version = segmentation._version
+
+    def version():
+        state_threads.append(threading.get_ident())
+        return real_version()
+    monkeypatch.setattr(segmentation, "_version", version)
+
+    async def run():
+        loop_threads.append(threading.get_ident())
+        first = await segmentation.get_segments_async(customers)
+        return first, await segmentation.get_segments_async(customers)
+
+    first, second = asyncio.run(run())
+    assert second is first and customers.runs == 1
+    assert state_threads and loop_threads[0] not in state_threads
@@ -0,0 +1,40 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core.fields import FieldSelection, pick, projection
+
+
+def test_fields_win_over_view_and_id_is_implicit():
+    selection = FieldSelection(summary=("name", "price"))
+    assert selection(fields="price, id,name,price", view="summary") == ("price", "name")
+    assert selection(fields=None, view="summary") == ("name", "price")
+    assert selection(fields=None, view="full") is None
+
+
+def test_unknown_fields_and_views_are_rejected():
+    selection = FieldSelection(summary=("name",), allowed=("name", "price"))
+    with pytest.raises(HTTPException):
+        selection(fields="name,secret", view=None)
+    with pytest.raises(HTTPException):
+        FieldSelection(summary=("name",))(fields="$where", view=None)
+    with pytest.raises(HTTPException):
+        selection(fields=None, view="compact")
+
+
+def test_projection_and_pick():
+    assert projection(None) is None
+    assert projection(("name",), always=("store_id",)) == {"name": 1, "store_id": 1}
+    object_id = ObjectId()
+    assert pick({"_id": object_id, "name": "Tea", "stock": 3}, ("name", "missing")) == {"id": str(object_id), "name": "Tea"}
+
+
+def test_list_endpoints_return_only_the_selected_fields(client, store_id):
+    headers = {"X-Store-Id": store_id}
+    client.post("/items/", headers=headers, json={"name": "Sparse Tea", "price": 12, "category": "Drinks", "stock": 4})
+
+    [item] = client.get("/items/", headers=headers, params={"fields": "name,price"}).json()["data"]
+    assert set(item) == {"id", "name", "price"}
+    [summary] = client.get("/items/", headers=headers, params={"view": "summary"}).json()["data"]
+    assert set(summary) == {"id", "name", "price", "category", "stock"}
+    assert client.get("/items/", headers=headers, params={"view": "tiny"}).status_code == 400
@@ -0,0 +1,42 @@
+from app.core.http_cache import _etag_matches
+
+
+def test_an_unchanged_list_is_answered_with_304(client, store_id):
+    headers = {"X-Store-Id": store_id}
+    first = client.get("/items/", headers=headers)
+    etag = first.headers["etag"]
+
+    again = client.get("/items/", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+
+
+def test_a_write_changes_the_etag(client, store_id):
+    headers = {"X-Store-Id": store_id}
+    etag = client.get("/items/", headers=headers).headers["etag"]
+    client.post("/items/", headers=headers, json={"name": "Fresh Item", "price": 5})
+
+    after = client.get("/items/", headers={**headers, "If-None-Match": etag})
+    assert after.status_code == 200 and after.headers["etag"] != etag
+    assert "Fresh Item" in {item["name"] for item in after.json()["data"]}
+
+
+def test_outlets_get_different_etags(client, store_id):
+    mine = client.get("/items/", headers={"X-Store-Id": store_id}).headers["etag"]
+    theirs = client.get("/items/", headers={"X-Store-Id": store_id + "-other"}).headers["etag"]
+    assert mine != theirs
+
+
+def test_large_bodies_are_compressed(client, store_id):
+    headers = {"X-Store-Id": store_id}
+    for i in range(30):
+        client.post("/items/", headers=headers, json={"name": f"Bulk Item {i}", "price": i})
+    response = client.get("/items/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["data"]) >= 30
+
+
+def test_weak_etags_compare_equal():
+    assert _etag_matches('"abc"', 'W/"abc"')
+    assert _etag_matches('W/"x", W/"abc"', 'W/"abc"')
+    assert _etag_matches("*", 'W/"abc"')
+    assert not _etag_matches(None, 'W/"abc"')
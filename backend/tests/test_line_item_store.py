@@ -0,0 +1,68 @@
+import time
+from datetime import datetime, timedelta
+
+from app.services.line_item_store import LineItemStore
+
+
+def sale(sale_id, items, store_id="main", when=None, total_amount=None):
+    return {
+        "_id": sale_id,
+        "store_id": store_id,
+        "session_id": "s1",
+        "timestamp": when or datetime.now(),
+        "total_amount": sum(i.get("total", 0) for i in items) if total_amount is None else total_amount,
+        "items": items,
+    }
+
+
+def test_revenue_is_the_sum_of_line_totals():
+    store = LineItemStore(days=1)
+    # Two teas at 10 with a 2.00 discount on the line
+    store.record(sale("a", [{"item_id": "1", "item_name": "Tea", "quantity": 2, "price": 10.0, "total": 18.0}]))
+    store.record(sale("b", [{"item_id": "1", "item_name": "Tea", "quantity": 1, "price": 10.0}], total_amount=10.0))
+    assert store.item_totals("main") == {"Tea": (3.0, 28.0)}
+    assert store.totals("main") == (28.0, 2)
+
+
+def test_the_same_sale_is_only_counted_once():
+    store = LineItemStore(days=1)
+    tea = [{"item_id": "1", "item_name": "Tea", "quantity": 1, "price": 10.0, "total": 10.0}]
+    store.record(sale("a", tea))
+    store.record_many([sale("a", tea), sale("b", tea)])
+    assert store.totals("main") == (20.0, 2)
+
+
+def test_writes_expire_old_lines_and_sale_ids():
+    store = LineItemStore(days=1)
+    tea = [{"item_id": "1", "item_name": "Tea", "quantity": 1, "price": 10.0, "total": 10.0}]
+    store.record_many([sale(f"old{i}", tea) for i in range(5)])
+    # Age them past the window, as if the process had been up for days
+    store.columns["minute"][:store.size] -= 3 * 24 * 60
+    store._seen = {key: time.time() - 3 * 86400 for key in store._seen}
+    store._expired_at = 0.0
+
+    store.record(sale("new", tea))
+    assert store.size == 1
+    assert list(store._seen) == ["new"]
+
+
+def test_loading_appends_in_chunks_while_the_cursor_is_read():
+    store = LineItemStore(days=1)
+    sizes_seen = []
+
+    def cursor():
+        for i in range(12):
+            sizes_seen.append(store.size)
+            yield sale(f"s{i}", [{"item_id": "1", "item_name": "Tea", "quantity": 1, "price": 1.0, "total": 1.0}])
+
+    assert store._load(cursor(), chunk_size=5) == 12
+    assert store.size == 12
+    # Earlier chunks were already in the columns while later sales were read
+    assert sizes_seen[5] == 5 and sizes_seen[10] == 10
+
+
+def test_sales_older_than_the_window_are_ignored():
+    store = LineItemStore(days=1)
+    tea = [{"item_id": "1", "item_name": "Tea", "quantity": 1, "price": 10.0, "total": 10.0}]
+    store.record(sale("old", tea, when=datetime.now() - timedelta(days=2)))
+    assert store.totals("main") == (0.0, 0)
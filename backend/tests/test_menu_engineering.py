@@ -0,0 +1,58 @@
+import pytest
+
+from app.ml.menu_engineering import classify_menu
+
+ITEMS = [
+    {"id": "1", "name": "Masala Chai", "price": 20, "category": "drinks"},
+    {"id": "2", "name": "Paneer Tikka", "price": 200, "category": "starters"},
+    {"id": "3", "name": "Truffle Fries", "price": 300, "category": "starters"},
+    {"id": "4", "name": "Plain Rice", "price": 60, "category": "mains"},
+]
+SALES = [
+    {"_id": "Masala Chai", "total_quantity": 100, "total_revenue": 2000},
+    {"_id": "Paneer Tikka", "total_quantity": 80, "total_revenue": 16000},
+    {"_id": "Truffle Fries", "total_quantity": 5, "total_revenue": 1500},
+    {"_id": "Plain Rice", "total_quantity": 5, "total_revenue": 300},
+]
+INVENTORY = [
+    {"item_id": "1", "cost_price": 5},
+    {"item_id": "2", "cost_price": 80},
+    {"item_id": "4", "cost_price": 50},
+]
+
+
+def by_name(df):
+    return df.set_index("name")
+
+
+def test_items_fall_into_the_four_quadrants():
+    quadrants = by_name(classify_menu(ITEMS, SALES, INVENTORY))["quadrant"].to_dict()
+    assert quadrants == {
+        "Masala Chai": "plowhorse",
+        "Paneer Tikka": "star",
+        "Truffle Fries": "puzzle",
+        "Plain Rice": "dog",
+    }
+
+
+def test_missing_costs_use_the_default_ratio():
+    df = by_name(classify_menu(ITEMS, SALES, INVENTORY, default_cost_ratio=0.4))
+    assert not df.loc["Truffle Fries", "cost_known"]
+    assert df.loc["Truffle Fries", "unit_cost"] == pytest.approx(120)
+    assert df.loc["Paneer Tikka", "contribution_margin"] == pytest.approx(120)
+
+
+def test_unsold_items_are_priced_from_the_menu():
+    df = by_name(classify_menu(ITEMS, SALES[:1], INVENTORY))
+    assert df.loc["Plain Rice", "quantity_sold"] == 0
+    assert df.loc["Plain Rice", "unit_price"] == 60
+    assert df["menu_mix_pct"].sum() == pytest.approx(100)
+
+
+def test_popularity_uses_the_seventy_percent_rule():
+    df = classify_menu(ITEMS, SALES, INVENTORY)
+    assert df.attrs["popularity_threshold_pct"] == pytest.approx(17.5)
+
+
+def test_an_empty_menu_is_empty():
+    assert classify_menu([], SALES, INVENTORY).empty
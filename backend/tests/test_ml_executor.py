@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from app.ml.tasks import batch_linear_fit, batch_linear_forecast
+from app.services.ml_executor import MLExecutor, MLQueueFull, MLTaskTimeout
+
+
+def test_batch_fit_recovers_each_items_line():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 10, size=(40, 2)).astype(np.float32)
+    codes = np.repeat(np.arange(2), 20).astype(np.int32)
+    y = np.where(codes == 0, 1 + 2 * X[:, 0] + 3 * X[:, 1], 5 - X[:, 0]).astype(np.float32)
+
+    coefficients, counts = batch_linear_fit(codes, X, y, n_items=3)
+    assert counts.tolist() == [20, 20, 0]
+    assert coefficients[0] == pytest.approx([1, 2, 3], abs=1e-3)
+    assert coefficients[1] == pytest.approx([5, -1, 0], abs=1e-3)
+    assert np.isnan(coefficients[2]).all()
+
+    predictions, _ = batch_linear_forecast(codes, X, y, [1, 1], n_items=3)
+    assert predictions[:2] == pytest.approx([6, 4], abs=1e-3)
+
+
+def test_thread_fallback_runs_the_task():
+    executor = MLExecutor(workers=0)
+    assert asyncio.run(executor.run(pow, 2, 10)) == 1024
+    assert executor.status()["completed"] == 1
+
+
+def test_process_pool_runs_the_task():
+    executor = MLExecutor(workers=1)
+    try:
+        assert asyncio.run(executor.run(pow, 3, 4, timeout=60)) == 81
+    finally:
+        executor.shutdown()
+
+
+def test_a_full_queue_fails_fast():
+    executor = MLExecutor(workers=0, max_pending=1)
+
+    async def run():
+        first = asyncio.ensure_future(executor.run(time.sleep, 0.1))
+        await asyncio.sleep(0)
+        with pytest.raises(MLQueueFull):
+            await executor.run(pow, 2, 2)
+        await first
+
+    asyncio.run(run())
+    assert executor.status()["rejected"] == 1 and executor.status()["pending"] == 0
+
+
+def test_a_slow_task_times_out():
+    executor = MLExecutor(workers=0)
+    with pytest.raises(MLTaskTimeout):
+        asyncio.run(executor.run(time.sleep, 0.2, timeout=0.01))
+    assert executor.status()["timed_out"] == 1
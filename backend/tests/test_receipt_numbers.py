@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from app.services.receipt_numbers import ReceiptNumberAllocator
+
+DAY = datetime(2026, 5, 1, 10)
+
+
+def test_numbers_come_from_one_lease_per_block(client, store_id):
+    allocator = ReceiptNumberAllocator(block_size=5)
+    numbers = [allocator.next(store_id, DAY) for _ in range(7)]
+    assert numbers[:2] == [f"{store_id}-20260501-00001", f"{store_id}-20260501-00002"]
+    assert numbers[-1] == f"{store_id}-20260501-00007"
+    assert allocator.leases == 2
+
+
+def test_workers_hold_disjoint_blocks(client, store_id):
+    first, second = ReceiptNumberAllocator(block_size=3), ReceiptNumberAllocator(block_size=3)
+    numbers = [first.next(store_id, DAY), second.next(store_id, DAY), first.next(store_id, DAY), second.next(store_id, DAY)]
+    assert len(set(numbers)) == 4
+    assert [n[-5:] for n in numbers] == ["00001", "00004", "00002", "00005"]
+
+
+def test_each_day_restarts_the_sequence(client, store_id):
+    allocator = ReceiptNumberAllocator(block_size=5)
+    allocator.next(store_id, DAY)
+    assert allocator.next(store_id, datetime(2026, 5, 2)).endswith("20260502-00001")
+
+
+def test_offline_numbers_carry_the_till_marker(client, store_id, mongo_outage):
+    allocator = ReceiptNumberAllocator(block_size=5, till_id="till-2")
+    assert allocator.next(store_id, DAY) == f"{store_id}-20260501-LTILL2-00001"
+    assert allocator.next(store_id, DAY) == f"{store_id}-20260501-LTILL2-00002"
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from app.ml.replenishment import daily_demand_stats, plan_replenishment
+from app.services.replenishment import ReplenishmentPlanner, UNASSIGNED_SUPPLIER
+
+
+def plan(**overrides):
+    args = dict(
+        stock=[5, 100, 5], daily_demand=[10, 10, 0], demand_std=[0, 0, 0], lead_time_days=[2, 2, 2],
+        unit_cost=[2.0, 2.0, np.nan], minimum_stock=[0, 0, 10], maximum_stock=[np.nan, np.nan, 20],
+        order_cost=50, holding_rate=0.25,
+    )
+    return plan_replenishment(**{**args, **overrides})
+
+
+def test_demand_stats_count_days_without_sales_as_zero():
+    mean, std = daily_demand_stats(np.array([0, 0], dtype=np.int32), np.array([4.0, 2.0]), n_items=2, days=4)
+    assert mean.tolist() == [1.5, 0.0]
+    assert std[0] == pytest.approx(np.std([4, 2, 0, 0]))
+
+
+def test_items_at_their_reorder_point_order_an_eoq():
+    result = plan()
+    assert result["reorder_point"].tolist() == [20, 20, 10]
+    # sqrt(2 * 3650 * 50 / 0.5)
+    assert result["eoq"][0] == 855
+    assert result["order_quantity"].tolist() == [855, 0, 6]
+    assert result["days_of_cover"][0] == 0.5 and np.isinf(result["days_of_cover"][2])
+
+
+def test_safety_stock_grows_with_demand_variability():
+    result = plan(demand_std=[5, 5, 0], service_level=0.95)
+    # 1.645 * 5 * sqrt(2) rounded up
+    assert result["safety_stock"][0] == 12
+    assert result["reorder_point"][0] == 32
+
+
+def test_orders_respect_stock_on_order_and_cover_caps():
+    assert plan(on_order=[50, 0, 0])["order_quantity"][0] == 0
+    assert plan(max_cover_days=3)["order_quantity"][0] == 20 + 1 + 30 - 5
+
+
+def test_drafts_are_grouped_per_supplier_and_replaced(client, store_id, monkeypatch):
+    from app.core.database import mongodb
+    tea = str(mongodb.items.insert_one({"store_id": store_id, "name": "Tea", "price": 10, "stock": 1}).inserted_id)
+    milk = str(mongodb.items.insert_one({"store_id": store_id, "name": "Milk", "price": 10, "stock": 1}).inserted_id)
+    mongodb.items.insert_one({"store_id": store_id, "name": "Plenty", "price": 10, "stock": 500})
+    mongodb.inventory.insert_one({"store_id": store_id, "item_id": tea, "supplier": "Tea Co", "cost_price": 4})
+
+    planner = ReplenishmentPlanner()
+    monkeypatch.setattr(planner, "_demand", lambda store, names: (np.full(len(names), 5.0), np.zeros(len(names))))
+
+    orders = planner.create_drafts(store_id)
+    assert [order["supplier"] for order in orders] == ["Tea Co", UNASSIGNED_SUPPLIER]
+    assert [line["item_id"] for order in orders for line in order["lines"]] == [tea, milk]
+
+    planner.create_drafts(store_id)
+    assert mongodb.purchase_orders.count_documents({"store_id": store_id, "status": "draft"}) == 2
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from app.services.sales_window import MinuteRing, SalesWindow, TopKSketch
+
+
+def sale(id, minutes_ago, amount=10.0, items=(("Tea", 1),), store_id="s1"):
+    return {
+        "_id": id,
+        "store_id": store_id,
+        "timestamp": datetime.now() - timedelta(minutes=minutes_ago),
+        "total_amount": amount,
+        "items": [{"item_name": name, "quantity": quantity} for name, quantity in items],
+    }
+
+
+def test_sketch_is_exact_within_capacity_and_keeps_heavy_hitters():
+    sketch = TopKSketch(capacity=2)
+    sketch.add("Tea", 10)
+    sketch.add("Coffee", 3)
+    assert sketch.top(2) == [("Tea", 10), ("Coffee", 3)]
+
+    # A new item replaces the smallest and inherits its count
+    sketch.add("Samosa", 1)
+    assert sketch.top(2) == [("Tea", 10), ("Samosa", 4)]
+    sketch.remove("Samosa", 4)
+    assert sketch.top(2) == [("Tea", 10)]
+
+
+def test_ring_recycles_slots_from_a_previous_lap():
+    ring = MinuteRing(size=10, sketch_capacity=10)
+    ring.add(100, 5.0, [("Tea", 1)])
+    ring.add(110, 7.0, [("Coffee", 2)])
+    assert ring.totals(101, 110) == (7.0, 1)
+    assert ring.sketch.top(5) == [("Coffee", 2)]
+
+
+def test_advance_expires_minutes_and_their_items():
+    ring = MinuteRing(size=10, sketch_capacity=10)
+    ring.add(100, 5.0, [("Tea", 1)])
+    ring.add(105, 5.0, [("Coffee", 1)])
+    ring.advance(112)
+    assert ring.totals(0, 112) == (5.0, 1)
+    assert ring.sketch.top(5) == [("Coffee", 1)]
+
+
+def test_a_sale_seen_twice_is_counted_once():
+    window = SalesWindow(size=60 * 24, sync_seconds=0)
+    window.record(sale("a", 1))
+    window.record_many([sale("a", 1), sale("b", 2, amount=5.0)])
+    snapshot = window.snapshot("s1", hours=1)
+    assert snapshot["total_transactions"] == 2 and snapshot["window_sales"] == 15.0
+
+
+def test_snapshot_windows_and_top_items():
+    window = SalesWindow(size=60 * 24, sync_seconds=0)
+    window.record_many([
+        sale("recent", 5, amount=20.0, items=(("Tea", 3),)),
+        sale("older", 180, amount=30.0, items=(("Coffee", 5),)),
+        sale("other store", 5, store_id="s2"),
+    ])
+    last_hour = window.snapshot("s1", hours=1, top_k=1)
+    assert last_hour["window_sales"] == 20.0
+    assert last_hour["popular_items"] == [{"name": "Tea", "count": 3}]
+
+    day = window.snapshot("s1", hours=24, top_k=2)
+    assert day["window_sales"] == 50.0
+    assert day["popular_items"][0] == {"name": "Coffee", "count": 5}
+
+
+def test_sales_older_than_the_window_are_ignored():
+    window = SalesWindow(size=60, sync_seconds=0)
+    window.record(sale("old", 120))
+    assert window.snapshot("s1", hours=1)["total_transactions"] == 0
@@ -0,0 +1,58 @@
+def sale(price=50.0, quantity=1):
+    return {
+        "items": [{"id": "000000000000000000000001", "name": "Tea", "price": price, "quantity": quantity}],
+        "total_amount": price * quantity,
+        "payment_method": "cash",
+    }
+
+
+def test_checkout_survives_a_mongo_outage(client, store_id, mongo_outage):
+    mongo_outage.close()
+    headers = {"X-Store-Id": store_id}
+    assert client.post("/sessions/open", headers=headers).json()["success"]
+
+    mongo_outage.trip(ConnectionError("simulated outage"))
+    response = client.post("/transactions/", json=sale(), headers=headers)
+    assert response.status_code == 200, response.text
+
+    current = client.get("/sessions/current", headers=headers).json()
+    assert current["is_active"]
+
+    closed = client.post("/sessions/close", headers=headers)
+    assert closed.status_code == 200, closed.text
+    assert not client.get("/sessions/current", headers=headers).json()["is_active"]
+
+
+def test_close_during_outage_returns_the_z_report(client, store_id, mongo_outage):
+    headers = {"X-Store-Id": store_id}
+    assert client.post("/sessions/open", headers=headers).json()["success"]
+    client.post("/transactions/", json=sale(price=30.0, quantity=2), headers=headers)
+
+    closed = client.post("/sessions/close", headers=headers)
+    assert closed.status_code == 200, closed.text
+    assert closed.json()["snapshot"]["total_sales"] == 60.0
+    assert not client.get("/sessions/current", headers=headers).json()["is_active"]
+
+
+def test_session_stays_open_when_its_snapshot_cannot_be_stored(client, store_id, mongo_outage, monkeypatch):
+    import main
+    from pymongo.errors import ServerSelectionTimeoutError
+
+    headers = {"X-Store-Id": store_id}
+    # Opened while Mongo is down, so only local state knows about it
+    assert client.post("/sessions/open", headers=headers).json()["success"]
+    mongo_outage.close()
+
+    def unreachable(*args, **kwargs):
+        raise ServerSelectionTimeoutError("no servers")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(main, "persist_snapshot", unreachable)
+        closed = client.post("/sessions/close", headers=headers)
+    assert closed.status_code == 503
+    assert client.get("/sessions/current", headers=headers).json()["is_active"]
+
+    closed = client.post("/sessions/close", headers=headers)
+    assert closed.status_code == 200, closed.text
+    assert closed.json()["snapshot"] is not None
+    assert not client.get("/sessions/current", headers=headers).json()["is_active"]
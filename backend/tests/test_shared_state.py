@@ -0,0 +1,58 @@
+import threading
+import time
+
+import mongomock
+import pytest
+
+from app.core.shared_state import MemorySharedState, MongoSharedState, SQLiteSharedState
+
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+def state(request, tmp_path):
+    if request.param == "memory":
+        return MemorySharedState()
+    if request.param == "sqlite":
+        return SQLiteSharedState(str(tmp_path / "state.db"))
+    return MongoSharedState(mongomock.MongoClient()["shared"]["state"])
+
+
+def test_compare_and_set_needs_the_current_version(state):
+    assert state.get_versioned("key") == (None, 0)
+    assert state.compare_and_set("key", {"a": 1}, 0)
+    value, version = state.get_versioned("key")
+    assert value == {"a": 1}
+    assert not state.compare_and_set("key", {"a": 2}, 0)
+    assert state.compare_and_set("key", {"a": 2}, version)
+    assert state.get("key") == {"a": 2}
+
+
+def test_keys_expire_after_their_ttl(state):
+    state.set("lease", "worker-1", ttl=0.05)
+    assert state.get("lease") == "worker-1"
+    time.sleep(0.1)
+    assert state.get("lease") is None
+    # An expired lease can be taken over at its last version
+    _, version = state.get_versioned("lease")
+    assert state.compare_and_set("lease", "worker-2", version)
+
+
+def test_incr_and_pop(state):
+    assert state.incr("counter") == 1
+    assert state.incr("counter", 5) == 6
+    assert state.pop("counter") == 6
+    assert state.get("counter", "gone") == "gone"
+
+
+def test_concurrent_updates_are_not_lost(state):
+    state.set("total", 0)
+
+    def add():
+        for _ in range(20):
+            state.update("total", lambda value: value + 1, retries=1000)
+
+    threads = [threading.Thread(target=add) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state.get("total") == 80
@@ -0,0 +1,84 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from app.core.startup import StartupReport
+
+
+def test_startup_does_not_wait_for_mongo(client, monkeypatch):
+    import main
+    from app.core.database import mongodb
+    release, finished = threading.Event(), threading.Event()
+
+    def slow_start():
+        # Stands in for a connect that sits out the server selection timeout
+        try:
+            release.wait(5)
+        finally:
+            mongodb.connecting = False
+            finished.set()
+    monkeypatch.setattr(main, "start_mongo", slow_start)
+
+    # asyncio.run() would wait on the executor running the connect
+    loop = asyncio.new_event_loop()
+    try:
+        started = time.perf_counter()
+        loop.run_until_complete(main.startup_event())
+        assert time.perf_counter() - started < 0.2
+
+        health = client.get("/health").json()
+        assert health["status"] == "degraded" and health["mongodb_connecting"]
+    finally:
+        release.set()
+        assert finished.wait(5)
+        loop.close()
+    assert client.get("/health").json()["status"] == "healthy"
+
+
+def test_an_unreachable_mongo_trips_the_breaker(client, monkeypatch):
+    import pymongo
+    from app.core import database
+    from app.core.database import mongodb, mongo_breaker
+
+    class UnreachableClient:
+        def __init__(self, *args, **kwargs):
+            self.admin = self
+
+        def command(self, name):
+            raise pymongo.errors.ServerSelectionTimeoutError("no servers found")
+
+        def __getitem__(self, name):
+            return defaultdict(lambda: None)
+
+    for attribute in ("client", "database", "items", "sessions", "transactions", "inventory", "customers",
+                      "employees", "session_snapshots", "kitchen_orders", "counters", "stock_movements",
+                      "stock_snapshots", "purchase_orders", "transaction_buckets", "aggregate_buckets"):
+        monkeypatch.setattr(mongodb, attribute, getattr(mongodb, attribute))
+    monkeypatch.setattr(database.pymongo, "MongoClient", UnreachableClient)
+    # Keep the recovery probe from pinging the stand-in client
+    monkeypatch.setattr(mongo_breaker, "on_open", None)
+
+    assert database.connect_to_mongo() is False
+    assert mongo_breaker.state == "open"
+    assert not database.is_mongo_available()
+
+
+def test_importing_the_app_leaves_the_ml_stack_unloaded():
+    code = "import sys, main; print(sorted(m for m in ('ml_engine', 'sklearn') if m in sys.modules))"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=backend, capture_output=True, text=True, timeout=60)
+    assert output.stdout.strip().splitlines()[-1] == "[]", output.stderr
+
+
+def test_startup_report_names_the_slowest_step(capsys):
+    report = StartupReport(target_ms=0)
+    report.mark("imports")
+    time.sleep(0.01)
+    report.mark("mongo connect")
+    report.ready()
+    assert report.as_dict()["steps"].keys() == {"imports", "mongo connect"}
+    assert "slowest step: mongo connect" in capsys.readouterr().out
@@ -0,0 +1,54 @@
+import threading
+
+from app.services.stock_alerts import StockAlertEngine, LOW_STOCK, OUT_OF_STOCK, RESTORED
+
+
+def test_threshold_crossings_update_the_set_and_the_event_log(store_id):
+    engine = StockAlertEngine(default_minimum=5)
+    engine.observe(store_id, [("1", "Tea", 3)])
+    assert [a["alert_type"] for a in engine.alerts(store_id)] == [LOW_STOCK]
+
+    engine.observe(store_id, [("1", "Tea", 0)])
+    assert engine.alerts(store_id)[0]["alert_type"] == OUT_OF_STOCK
+
+    engine.observe(store_id, [("1", "Tea", 40)])
+    assert engine.alerts(store_id) == []
+    assert [e["alert_type"] for e in engine.events(store_id)] == [LOW_STOCK, OUT_OF_STOCK, RESTORED]
+
+
+def test_per_item_minimum_stock_wins_over_the_default(store_id):
+    engine = StockAlertEngine(default_minimum=5)
+    engine.threshold_loader = lambda store: {"1": 20}
+    engine.observe(store_id, [("1", "Tea", 15), ("2", "Bun", 15)])
+    assert [(a["item_id"], a["minimum_stock"]) for a in engine.alerts(store_id)] == [("1", 20)]
+
+
+def test_periodic_reconcile_runs_in_the_background(store_id):
+    engine = StockAlertEngine(default_minimum=5)
+    release = threading.Event()
+    calls = []
+
+    def levels(store):
+        calls.append(store)
+        if len(calls) > 1:
+            # A slow catalogue scan must not hold up the read
+            release.wait(5)
+        return [("1", "Tea", 2)]
+
+    engine.levels_loader = levels
+    assert len(engine.alerts(store_id)) == 1
+    engine.reconcile_seconds = 0
+    assert len(engine.alerts(store_id)) == 1
+    assert not release.is_set()
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == "stock-alerts-reconcile":
+            thread.join(5)
+    assert len(calls) == 2
+
+
+def test_inventory_alerts_endpoint_reflects_new_low_items(client, store_id):
+    headers = {"X-Store-Id": store_id}
+    created = client.post("/items/", json={"name": "Samosa", "price": 15, "stock": 2}, headers=headers).json()["data"]
+    alerts = client.get("/inventory/alerts", headers=headers).json()["data"]
+    assert [(a["id"], a["alert_type"]) for a in alerts] == [(created["id"], LOW_STOCK)]
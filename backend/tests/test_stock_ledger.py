@@ -0,0 +1,72 @@
+import time
+from datetime import datetime, timedelta
+
+from app.services.stock_ledger import SALE, WASTE, StockLedger
+
+
+def add_item(store_id, name, stock, price=100.0):
+    from app.core.database import mongodb
+    return str(mongodb.items.insert_one({"store_id": store_id, "name": name, "stock": stock, "price": price}).inserted_id)
+
+
+def sell(ledger, store_id, item_id, quantity):
+    ledger.record_sale(store_id, "txn", [{"item_id": item_id, "item_name": "x", "quantity": quantity}])
+
+
+def test_stock_at_adds_movements_to_the_nearest_snapshot(client, store_id):
+    ledger = StockLedger()
+    tea = add_item(store_id, "Tea", 20)
+    assert ledger.take_snapshots(store_id) == 1
+    seeded = datetime.now()
+    time.sleep(0.01)
+
+    sell(ledger, store_id, tea, 3)
+    ledger.record([ledger.movement(store_id, tea, WASTE, -2)])
+    assert ledger.stock_at(store_id) == {tea: 15}
+    assert ledger.stock_at(store_id, seeded) == {tea: 20}
+
+
+def test_later_batches_are_folded_from_the_ledger(client, store_id):
+    ledger = StockLedger()
+    tea = add_item(store_id, "Tea", 10)
+    ledger.take_snapshots(store_id)
+    time.sleep(0.01)
+    sell(ledger, store_id, tea, 4)
+    second = datetime.now()
+    assert ledger.take_snapshots(store_id, at=second) == 1
+    assert ledger._batch(store_id, second) == {tea: 6}
+    # A batch no later than the latest one is skipped
+    assert ledger.take_snapshots(store_id, at=second) == 0
+
+
+def test_times_before_the_first_batch_walk_back(client, store_id):
+    ledger = StockLedger()
+    tea = add_item(store_id, "Tea", 10)
+    before = datetime.now() - timedelta(seconds=1)
+    sell(ledger, store_id, tea, 2)
+    time.sleep(0.01)
+    ledger.take_snapshots(store_id)
+    assert ledger.stock_at(store_id, before) == {tea: 12}
+
+
+def test_stock_take_books_the_variance(client, store_id):
+    from app.core.database import mongodb
+    ledger = StockLedger()
+    tea = add_item(store_id, "Tea", 10, price=100.0)
+    start = datetime.now() - timedelta(seconds=1)
+    sell(ledger, store_id, tea, 2)
+
+    report = ledger.stock_take(store_id, {tea: 7, "000000000000000000000bad": 1})
+    assert report["unknown_items"] == ["000000000000000000000bad"]
+    assert report["items"][0]["expected"] == 10 and report["items"][0]["variance"] == -3
+    assert mongodb.items.find_one({"store_id": store_id})["stock"] == 7
+
+    shrinkage = ledger.shrinkage(store_id, start, datetime.now())
+    row = shrinkage["items"][0]
+    assert row["quantity"] == 3 and row["sold"] == 2
+    assert ledger.movements_summary(store_id, start, datetime.now())[0][tea][SALE] == -2
+
+
+def test_nothing_is_recorded_while_mongo_is_down(client, store_id, mongo_outage):
+    ledger = StockLedger()
+    assert ledger.record([ledger.movement(store_id, "1", SALE, -1)]) == 0
@@ -0,0 +1,37 @@
+import mongomock
+
+from app.core.config import settings
+from app.core.stores import backfill_store_ids, in_store, store_filter
+
+
+def names(response):
+    return {item["name"] for item in response.json()["data"]}
+
+
+def test_items_are_scoped_to_their_outlet(client, store_id):
+    other_store = store_id + "-other"
+    created = client.post("/items/", params={"store_id": store_id}, json={"name": "Outlet Special", "price": 99})
+    assert created.status_code == 200, created.text
+
+    assert "Outlet Special" in names(client.get("/items/", headers={"X-Store-Id": store_id}))
+    assert "Outlet Special" not in names(client.get("/items/", headers={"X-Store-Id": other_store}))
+
+
+def test_the_query_parameter_wins_over_the_header(client, store_id):
+    client.post("/items/", params={"store_id": store_id}, json={"name": "Query Scoped", "price": 10})
+    response = client.get("/items/", params={"store_id": store_id}, headers={"X-Store-Id": "elsewhere"})
+    assert "Query Scoped" in names(response)
+
+
+def test_helpers_default_untagged_documents_to_the_default_store():
+    assert store_filter("s1", {"is_active": True}) == {"store_id": "s1", "is_active": True}
+    assert in_store({}, settings.DEFAULT_STORE_ID)
+    assert not in_store({"store_id": "s1"}, settings.DEFAULT_STORE_ID)
+
+
+def test_backfill_tags_legacy_documents_only():
+    database = mongomock.MongoClient()["backfill"]
+    database.items.insert_many([{"name": "Legacy"}, {"name": "Tagged", "store_id": "s1"}])
+    backfill_store_ids(database)
+    assert database.items.find_one({"name": "Legacy"})["store_id"] == settings.DEFAULT_STORE_ID
+    assert database.items.find_one({"name": "Tagged"})["store_id"] == "s1"
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app.services.transaction_store import BUCKETS, DOCUMENTS, TransactionStore, summary_key
+
+HOUR = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+
+
+def sale(store_id, minute, key=None, quantity=1, name="Tea", hour=HOUR):
+    doc = {
+        "store_id": store_id,
+        "session_id": "session",
+        "timestamp": hour + timedelta(minutes=minute),
+        "items": [{"item_id": "1", "item_name": name, "quantity": quantity, "price": 10.0, "total": 10.0 * quantity}],
+        "total_amount": 10.0 * quantity,
+    }
+    if key:
+        doc["idempotency_key"] = key
+    return doc
+
+
+def buckets(store_id):
+    from app.core.database import mongodb
+    return list(mongodb.transaction_buckets.find({"store_id": store_id}).sort("_id", 1))
+
+
+def test_sales_of_an_hour_share_a_bucket_with_running_totals(client, store_id):
+    store = TransactionStore(layout=BUCKETS, max_sales=10)
+    store.insert(sale(store_id, 5, quantity=2))
+    store.insert(sale(store_id, 50))
+
+    [bucket] = buckets(store_id)
+    assert bucket["hour"] == HOUR and bucket["count"] == 2 and bucket["total_amount"] == 30.0
+    assert bucket["items"]["1"] == {"name": "Tea", "quantity": 3, "revenue": 30.0}
+
+
+def test_a_full_bucket_opens_the_next_one(client, store_id):
+    store = TransactionStore(layout=BUCKETS, max_sales=2)
+    store.insert_many([sale(store_id, minute) for minute in range(5)])
+    assert [bucket["count"] for bucket in buckets(store_id)] == [2, 2, 1]
+
+
+def test_reads_merge_both_layouts_newest_first(client, store_id):
+    TransactionStore(layout=DOCUMENTS).insert(sale(store_id, 1))
+    store = TransactionStore(layout=BUCKETS)
+    store.insert(sale(store_id, 30))
+    store.insert(sale(store_id, 10, hour=HOUR - timedelta(hours=1)))
+
+    minutes = [doc["timestamp"] for doc in store.find(store_id)]
+    assert minutes == sorted(minutes, reverse=True) and len(minutes) == 3
+    assert len(store.find(store_id, start=HOUR)) == 2
+    assert len(list(store.sales_since(start=HOUR, store_id=store_id))) == 2
+
+
+def test_an_idempotency_key_is_stored_once(client, store_id):
+    store = TransactionStore(layout=BUCKETS)
+    first = store.insert(sale(store_id, 1, key="till-1"))
+    with pytest.raises(DuplicateKeyError):
+        store.insert(sale(store_id, 2, key="till-1"))
+
+    assert store.existing_keys(store_id, ["till-1", "till-2"]) == {"till-1": str(first["_id"])}
+    assert store.find_by_key(store_id, "till-1")["_id"] == first["_id"]
+    assert store.get(store_id, str(first["_id"]))["timestamp"] == first["timestamp"]
+
+
+def test_migrate_moves_documents_into_buckets(client, store_id):
+    TransactionStore(layout=DOCUMENTS).insert_many([sale(store_id, minute) for minute in range(3)])
+    store = TransactionStore(layout=BUCKETS)
+    store.migrate(store_id=store_id)
+
+    from app.core.database import mongodb
+    assert mongodb.transactions.count_documents({"store_id": store_id}) == 0
+    assert [bucket["count"] for bucket in buckets(store_id)] == [3]
+
+
+def test_migrate_needs_the_bucket_layout():
+    with pytest.raises(RuntimeError):
+        TransactionStore(layout=DOCUMENTS).migrate()
+
+
+def test_summary_keys_are_safe_field_names():
+    assert summary_key({"item_id": "$a.b"}) == "a_b"
+    assert summary_key({"item_name": "Tea"}) == "Tea"
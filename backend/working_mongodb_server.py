@@ -1,12 +1,16 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 import uuid
+import asyncio
 import motor.motor_asyncio
 import os
 from bson import ObjectId
+from app.core.config import settings
+from app.services.customer_segments import customer_segmentation, SegmentConfig
+from app.services.stock_alerts import stock_alerts
 
 # Initialize FastAPI app
 app = FastAPI(title="SmartPOS AI MongoDB Backend", version="1.0.0")
@@ -43,6 +47,25 @@ async def shutdown_event():
         client.close()
         print("MongoDB connection closed")
 
+# Low-stock alerts: the engine's loaders are synchronous and run in worker
+# threads, so they read through the driver Motor wraps (db.delegate)
+def stock_levels(store_id):
+    """(item_id, name, stock) of every item"""
+    return [
+        (str(item.get("id") or item["_id"]), item.get("name"), item.get("stock", 0))
+        for item in db.delegate.items.find({}, {"id": 1, "name": 1, "stock": 1})
+    ]
+
+def stock_thresholds(store_id):
+    """Per-item minimum_stock from the inventory collection"""
+    return {
+        str(doc["item_id"]): doc["minimum_stock"]
+        for doc in db.delegate.inventory.find({"minimum_stock": {"$ne": None}}, {"item_id": 1, "minimum_stock": 1})
+    }
+
+stock_alerts.levels_loader = stock_levels
+stock_alerts.threshold_loader = stock_thresholds
+
 # Helper function to convert ObjectId to string
 def convert_objectid_to_str(obj):
     if isinstance(obj, dict):
@@ -105,6 +128,8 @@ async def create_item(item: Item):
         item_dict = item.dict()
         if db is not None:
             await db.items.insert_one(item_dict)
+            item_dict.pop("_id", None)
+            await asyncio.to_thread(stock_alerts.observe, settings.DEFAULT_STORE_ID, [(item.id, item.name, item.stock)])
         return {"success": True, "data": item_dict, "message": "Item created successfully"}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -195,7 +220,8 @@ async def get_transactions():
 async def create_transaction(transaction: Transaction):
     try:
         transaction_dict = transaction.dict()
-        transaction_dict["id"] = f"txn_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Timestamp alone collides for two sales in the same second
+        transaction_dict["id"] = f"txn_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
         transaction_dict["timestamp"] = datetime.now().isoformat()
         
         if db is not None:
@@ -222,9 +248,11 @@ async def create_transaction(transaction: Transaction):
                         "$inc": {
                             "total_spent": transaction.total_amount,
                             "visit_count": 1
-                        }
+                        },
+                        "$set": {"last_visit": datetime.now()}
                     }
                 )
+                await asyncio.to_thread(customer_segmentation.invalidate)
         
         return {"success": True, "data": transaction_dict, "message": "Transaction created successfully"}
     except Exception as e:
@@ -244,6 +272,7 @@ async def get_customers():
                     {"id": "3", "name": "Bob Wilson", "email": "bob@email.com", "phone": "+91 9876543212", "total_spent": 320.0, "visit_count": 7, "created_at": datetime.now().isoformat()}
                 ]
                 await db.customers.insert_many(sample_customers)
+                await asyncio.to_thread(customer_segmentation.invalidate)
                 customers = sample_customers
             
             customers = convert_objectid_to_str(customers)
@@ -265,6 +294,7 @@ async def create_customer(customer: Customer):
         if db is not None:
             result = await db.customers.insert_one(customer_dict)
             customer_dict["_id"] = str(result.inserted_id)
+            await asyncio.to_thread(customer_segmentation.invalidate)
         
         return {"success": True, "data": customer_dict, "message": "Customer created successfully"}
     except Exception as e:
@@ -359,11 +389,75 @@ async def get_inventory():
 
 @app.get("/inventory/alerts")
 async def get_inventory_alerts():
+    try:
+        if db is not None:
+            # Maintained as stock changes (same engine and minimum_stock thresholds as main.py)
+            alerts = [
+                {
+                    "type": alert["alert_type"],
+                    "item": {
+                        "id": alert["item_id"],
+                        "name": alert["item_name"],
+                        "stock": alert["stock"],
+                        "min_stock": alert["minimum_stock"]
+                    },
+                    "message": f"{alert['item_name'] or 'Unknown'} is out of stock" if alert["alert_type"] == "out_of_stock"
+                    else f"{alert['item_name'] or 'Unknown'} is running low (only {alert['stock']} left)"
+                }
+                for alert in await asyncio.to_thread(stock_alerts.alerts, settings.DEFAULT_STORE_ID)
+            ]
+            
+            return {
+                "success": True,
+                "data": {
+                    "alerts": alerts,
+                    "alert_count": len(alerts),
+                    "critical_alerts": len([a for a in alerts if a["type"] == "out_of_stock"])
+                }
+            }
+        else:
+            return {"success": True, "data": {"alerts": [], "alert_count": 0, "critical_alerts": 0}}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+# Analytics endpoints
+# Inventory endpoints
+@app.get("/inventory/")
+async def get_inventory():
     try:
         if db is not None:
             items = await db.items.find().to_list(length=1000)
             items = convert_objectid_to_str(items)
             
+            # Calculate inventory summary
+            total_items = len(items)
+            low_stock_items = [i for i in items if i.get("stock", 0) < 10]
+            out_of_stock_items = [i for i in items if i.get("stock", 0) == 0]
+            
+            return {
+                "success": True,
+                "data": {
+                    "total_items": total_items,
+                    "low_stock_count": len(low_stock_items),
+                    "out_of_stock_count": len(out_of_stock_items),
+                    "low_stock_items": low_stock_items,
+                    "out_of_stock_items": out_of_stock_items,
+                    "all_items": items
+                }
+            }
+        else:
+            return {"success": True, "data": {"total_items": 0, "low_stock_count": 0, "out_of_stock_count": 0, "low_stock_items": [], "out_of_stock_items": [], "all_items": []}}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@app.get("/inventory/alerts")
+async def get_inventory_alerts():
+    try:
+        if db is not None:
+            # Let Mongo pick the low items instead of filtering the whole catalogue here
+            items = await db.items.find({"$or": [{"stock": {"$lt": 10}}, {"stock": {"$exists": False}}]}).to_list(length=1000)
+            items = convert_objectid_to_str(items)
+            
             # Get low stock and out of stock alerts
             alerts = []
             for item in items:
@@ -436,19 +530,11 @@ async def get_sales_trend():
         return {"success": False, "error": str(e)}
 
 @app.get("/analytics/customer-segments")
-async def get_customer_segments():
+async def get_customer_segments(config: SegmentConfig = Depends()):
     try:
         if db is not None:
-            customers = await db.customers.find().to_list(length=1000)
-            customers = convert_objectid_to_str(customers)
-            
-            # Segment customers
-            segments = {
-                "high_value": len([c for c in customers if c.get("total_spent", 0) > 500]),
-                "medium_value": len([c for c in customers if 100 <= c.get("total_spent", 0) <= 500]),
-                "low_value": len([c for c in customers if c.get("total_spent", 0) < 100])
-            }
-            
+            # Single aggregation over all customers, cached until a customer changes
+            segments = await customer_segmentation.get_segments_async(db.customers, config)
             return {"success": True, "data": segments}
         else:
             return {"success": True, "data": {"high_value": 0, "medium_value": 0, "low_value": 0}}
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useSession } from '../contexts/SessionContext';
 import { useToast } from '../contexts/ToastContext';
-import { itemsAPI, transactionsAPI, dashboardAPI } from '../services/api';
+import { itemsAPI, transactionsAPI, dashboardAPI, customersAPI, recommendationsAPI } from '../services/api';
 import Receipt from './Receipt';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Package, ShoppingCart, Plus, Minus, X, Banknote, CreditCard, Wallet, UserPlus } from 'lucide-react';
@@ -13,7 +13,9 @@ const Billing = () => {
   const [total, setTotal] = useState(0);
   const [dashboardData, setDashboardData] = useState({ today_sales: 0 });
   const [loading, setLoading] = useState(false);
-  const [customers, setCustomers] = useState([]);
+  const [customerQuery, setCustomerQuery] = useState('');
+  const [customerResults, setCustomerResults] = useState([]);
+  const [suggestions, setSuggestions] = useState([]);
   const [selectedCustomer, setSelectedCustomer] = useState(null);
   const [showCustomerModal, setShowCustomerModal] = useState(false);
   const [newCustomer, setNewCustomer] = useState({ name: '', email: '', phone: '' });
@@ -41,6 +43,48 @@ const Billing = () => {
     return () => clearInterval(interval);
   }, []);
 
+  // Search customers on the server as the cashier types (debounced)
+  useEffect(() => {
+    const query = customerQuery.trim();
+    if (!query || (selectedCustomer && query === selectedCustomer.name)) {
+      setCustomerResults([]);
+      return;
+    }
+
+    const timeout = setTimeout(async () => {
+      try {
+        const response = await customersAPI.search(query, 8);
+        setCustomerResults(response.data.data || []);
+      } catch (error) {
+        console.error('Error searching customers:', error);
+        setCustomerResults([]);
+      }
+    }, 250);
+
+    return () => clearTimeout(timeout);
+  }, [customerQuery]);
+
+  // Suggest items often bought with the cart (only re-asked when the set of items changes)
+  const cartNames = [...new Set(cart.map(item => item.name))].sort().join('\n');
+  useEffect(() => {
+    if (!cartNames) {
+      setSuggestions([]);
+      return;
+    }
+
+    const timeout = setTimeout(async () => {
+      try {
+        const response = await recommendationsAPI.forCart(cartNames.split('\n'), 3);
+        setSuggestions(response.data.data || []);
+      } catch (error) {
+        console.error('Error loading suggestions:', error);
+        setSuggestions([]);
+      }
+    }, 300);
+
+    return () => clearTimeout(timeout);
+  }, [cartNames]);
+
   // Persist cart data to localStorage
   useEffect(() => {
     const savedCart = localStorage.getItem('smartpos_cart');
@@ -62,14 +106,12 @@ const Billing = () => {
     try {
       console.log('Loading initial billing data...');
       
-      const [itemsResponse, customersResponse, dashboardResponse] = await Promise.all([
+      const [itemsResponse, dashboardResponse] = await Promise.all([
         itemsAPI.getAll(),
-        fetch('http://localhost:5000/customers/').then(res => res.json()).catch(() => ({ data: [] })),
         dashboardAPI.getOverview()
       ]);
       
       setItems(itemsResponse.data.data || []);
-      setCustomers(customersResponse.data || []);
       setDashboardData(dashboardResponse.data.data || { today_sales: 0 });
       
       console.log('✅ Billing data loaded successfully');
@@ -125,6 +167,7 @@ const Billing = () => {
   const clearCart = () => {
     setCart([]);
     setSelectedCustomer(null);
+    setCustomerQuery('');
   };
 
   const addNewCustomer = async () => {
@@ -137,8 +180,8 @@ const Billing = () => {
       
       if (response.ok) {
         const customer = await response.json();
-        setCustomers([...customers, customer.data || customer]);
         setSelectedCustomer(customer.data || customer);
+        setCustomerQuery((customer.data || customer).name || '');
         setShowCustomerModal(false);
         setNewCustomer({ name: '', email: '', phone: '' });
         success('Customer added successfully!');
@@ -485,22 +528,47 @@ const Billing = () => {
               Customer
             </label>
             <div style={{ display: 'flex', gap: '0.5rem' }}>
-              <select
-                value={selectedCustomer?.id || ''}
-                onChange={(e) => {
-                  const customer = customers.find(c => c.id === e.target.value);
-                  setSelectedCustomer(customer || null);
-                }}
-                className="form-select"
-                style={{ flex: 1 }}
-              >
-                <option value="">Walk-in Customer</option>
-                {customers.map(customer => (
-                  <option key={customer.id} value={customer.id}>
-                    {customer.name} ({customer.phone})
-                  </option>
-                ))}
-              </select>
+              <div style={{ flex: 1, position: 'relative' }}>
+                <input
+                  type="text"
+                  value={customerQuery}
+                  onChange={(e) => {
+                    setCustomerQuery(e.target.value);
+                    setSelectedCustomer(null);
+                  }}
+                  placeholder="Walk-in Customer (search name or phone)"
+                  className="form-input"
+                  style={{ width: '100%' }}
+                />
+                {customerResults.length > 0 && (
+                  <div style={{
+                    position: 'absolute',
+                    top: '100%',
+                    left: 0,
+                    right: 0,
+                    zIndex: 10,
+                    background: 'white',
+                    border: '1px solid var(--gray-200)',
+                    borderRadius: '0.5rem',
+                    maxHeight: '240px',
+                    overflowY: 'auto'
+                  }}>
+                    {customerResults.map(customer => (
+                      <div
+                        key={customer.id}
+                        onClick={() => {
+                          setSelectedCustomer(customer);
+                          setCustomerQuery(customer.name || '');
+                          setCustomerResults([]);
+                        }}
+                        style={{ padding: '0.5rem 0.75rem', cursor: 'pointer' }}
+                      >
+                        {customer.name} ({customer.phone})
+                      </div>
+                    ))}
+                  </div>
+                )}
+              </div>
               <button
                 onClick={() => setShowCustomerModal(true)}
                 className="btn-secondary"
@@ -646,6 +714,43 @@ const Billing = () => {
             )}
           </div>
 
+          {/* Frequently bought together */}
+          {cart.length > 0 && suggestions.some(s => items.some(item => item.name === s.item_name)) && (
+            <div style={{ marginBottom: '1.5rem' }}>
+              <p style={{
+                margin: '0 0 0.5rem 0',
+                fontSize: '0.75rem',
+                color: 'var(--text-secondary)'
+              }}>
+                Often bought together
+              </p>
+              <div style={{ display: 'flex', flexWrap: 'wrap', gap: '0.5rem' }}>
+                {suggestions.map(suggestion => {
+                  const item = items.find(i => i.name === suggestion.item_name);
+                  if (!item) return null;
+                  return (
+                    <button
+                      key={suggestion.item_name}
+                      onClick={() => isShopOpen && addToCart(item)}
+                      className="btn-secondary"
+                      title={`Bought with ${suggestion.because_of}`}
+                      style={{
+                        padding: '0.25rem 0.5rem',
+                        fontSize: '0.75rem',
+                        display: 'flex',
+                        alignItems: 'center',
+                        gap: '0.25rem'
+                      }}
+                    >
+                      <Plus size={12} />
+                      {item.name} · ₹{item.price}
+                    </button>
+                  );
+                })}
+              </div>
+            </div>
+          )}
+
           {/* Total and Payment */}
           {cart.length > 0 && (
             <>
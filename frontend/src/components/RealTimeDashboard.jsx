@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { transactionsAPI, sessionsAPI } from '../services/api';
+import { dashboardAPI } from '../services/api';
 
 const RealTimeDashboard = () => {
   const [realTimeData, setRealTimeData] = useState({
@@ -17,41 +17,16 @@ const RealTimeDashboard = () => {
 
   const fetchRealTimeData = async () => {
     try {
-      const [transactions, session] = await Promise.all([
-        transactionsAPI.getAll(),
-        sessionsAPI.getCurrent()
-      ]);
-
+      // Totals come from the server's per-minute window; the window covers today's hours
       const now = new Date();
-      const currentHour = now.getHours();
-      const todayTransactions = transactions.data.filter(t => 
-        new Date(t.timestamp).toDateString() === now.toDateString()
-      );
-
-      const hourSales = todayTransactions
-        .filter(t => new Date(t.timestamp).getHours() === currentHour)
-        .reduce((sum, t) => sum + t.total_amount, 0);
-
-      const todaySales = todayTransactions.reduce((sum, t) => sum + t.total_amount, 0);
-
-      // Calculate popular items
-      const itemCounts = {};
-      todayTransactions.forEach(t => {
-        t.items.forEach(item => {
-          itemCounts[item.item_name] = (itemCounts[item.item_name] || 0) + item.quantity;
-        });
-      });
-
-      const popularItems = Object.entries(itemCounts)
-        .sort(([,a], [,b]) => b - a)
-        .slice(0, 5)
-        .map(([name, count]) => ({ name, count }));
+      const response = await dashboardAPI.getRealTime(now.getHours() + 1, 5);
+      const data = response.data.data;
 
       setRealTimeData({
-        currentHourSales: hourSales,
-        todaySales,
-        popularItems,
-        transactionRate: todayTransactions.length / (now.getHours() || 1)
+        currentHourSales: data.current_hour_sales,
+        todaySales: data.today_sales,
+        popularItems: data.popular_items,
+        transactionRate: data.today_transactions / (now.getHours() || 1)
       });
     } catch (error) {
       console.error('Real-time data error:', error);
@@ -3,6 +3,9 @@ import axios from 'axios';
 // API Base URL
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000';
 
+// Outlet this till belongs to; the backend scopes every request by it
+const STORE_ID = localStorage.getItem('storeId') || import.meta.env.VITE_STORE_ID;
+
 // Create axios instance
 const api = axios.create({
   baseURL: API_BASE_URL,
@@ -15,6 +18,9 @@ const api = axios.create({
 // Request interceptor
 api.interceptors.request.use(
   (config) => {
+    if (STORE_ID) {
+      config.headers['X-Store-Id'] = STORE_ID;
+    }
     console.log(`Making ${config.method?.toUpperCase()} request to ${config.url}`);
     return config;
   },
@@ -139,6 +145,7 @@ export const inventoryAPI = {
 
 export const customersAPI = {
   getAll: () => api.get('/customers/'),
+  search: (q, limit = 10, offset = 0) => api.get('/customers/search', { params: { q, limit, offset } }),
   create: (customer) => api.post('/customers/', customer)
 };
 
@@ -151,8 +158,16 @@ export const analyticsAPI = {
   getInventoryPerformance: () => api.get('/analytics/inventory-performance')
 };
 
+export const recommendationsAPI = {
+  forCart: (items, k = 5) => api.get('/recommendations/cart', {
+    params: { items, k },
+    paramsSerializer: { indexes: null }
+  })
+};
+
 export const dashboardAPI = {
-  getOverview: () => api.get('/dashboard/overview')
+  getOverview: () => api.get('/dashboard/overview'),
+  getRealTime: (hours = 24, top = 5) => api.get('/real-time/dashboard', { params: { hours, top } })
 };
 
 export const healthAPI = {